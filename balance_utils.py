@@ -0,0 +1,249 @@
+"""
+勘定科目別月次集計（account_monthly_balances）の管理モジュール
+仕訳帳の変更に合わせて同一トランザクション内で月次の借方・貸方合計を増分更新し、
+期間集計を「月数 × 勘定科目数」の行の合計で求められるようにする
+"""
+
+from sqlalchemy import String, delete, func, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from models import AccountMonthlyBalance, GeneralLedger
+from ledger_utils import register_ledger_change_handler
+
+
+def year_month_of(value):
+    """取引日（文字列または date）から年月（YYYY-MM）を取得"""
+    if value is None:
+        return None
+    return str(value)[:7]
+
+
+class year_month_sql(FunctionElement):
+    """
+    DATE 型のカラムから年月（YYYY-MM）の文字列を求める式
+
+    DB ごとの日付関数に変換する（文字列の切り出しではなく日付として扱う）
+    """
+    type = String()
+    name = 'year_month'
+    inherit_cache = True
+
+
+@compiles(year_month_sql)
+def _compile_year_month(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM')" % compiler.process(element.clauses, **kw)
+
+
+@compiles(year_month_sql, 'sqlite')
+def _compile_year_month_sqlite(element, compiler, **kw):
+    return "strftime('%%Y-%%m', %s)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(year_month_sql, 'mysql')
+def _compile_year_month_mysql(element, compiler, **kw):
+    return "DATE_FORMAT(%s, '%%%%Y-%%%%m')" % compiler.process(element.clauses, **kw)
+
+
+def _collect_deltas(added, removed):
+    """スナップショットから (事業所, 勘定科目, 年月) ごとの増減額を集計"""
+    deltas = {}
+
+    def apply(snapshot, sign):
+        year_month = year_month_of(snapshot['transaction_date'])
+        organization_id = snapshot['organization_id']
+        if year_month is None or organization_id is None:
+            return
+        debit_account_item_id = snapshot['debit_account_item_id']
+        if debit_account_item_id is not None and snapshot['debit_amount']:
+            key = (organization_id, debit_account_item_id, year_month)
+            delta = deltas.setdefault(key, [0, 0])
+            delta[0] += sign * snapshot['debit_amount']
+        credit_account_item_id = snapshot['credit_account_item_id']
+        if credit_account_item_id is not None and snapshot['credit_amount']:
+            key = (organization_id, credit_account_item_id, year_month)
+            delta = deltas.setdefault(key, [0, 0])
+            delta[1] += sign * snapshot['credit_amount']
+
+    for snapshot in added:
+        apply(snapshot, 1)
+    for snapshot in removed:
+        apply(snapshot, -1)
+
+    return {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+
+
+def _upsert_increments(connection, rows):
+    """月次集計行に増減額を加算（無ければ作成）"""
+    table = AccountMonthlyBalance.__table__
+    dialect_name = connection.dialect.name
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['organization_id', 'account_item_id', 'year_month'],
+            set_={
+                'debit_total': table.c.debit_total + stmt.excluded.debit_total,
+                'credit_total': table.c.credit_total + stmt.excluded.credit_total,
+            },
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # その他のDBは UPDATE して対象が無ければ INSERT
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.organization_id == row['organization_id'],
+                table.c.account_item_id == row['account_item_id'],
+                table.c.year_month == row['year_month'],
+            )
+            .values(
+                debit_total=table.c.debit_total + row['debit_total'],
+                credit_total=table.c.credit_total + row['credit_total'],
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), [row])
+
+
+@register_ledger_change_handler
+def apply_ledger_changes(db, added, removed):
+    """仕訳の変更を月次集計に反映"""
+    deltas = _collect_deltas(added, removed)
+    if not deltas:
+        return
+    rows = [
+        {
+            'organization_id': organization_id,
+            'account_item_id': account_item_id,
+            'year_month': year_month,
+            'debit_total': debit_delta,
+            'credit_total': credit_delta,
+        }
+        for (organization_id, account_item_id, year_month), (debit_delta, credit_delta) in sorted(deltas.items())
+    ]
+    _upsert_increments(db.connection(), rows)
+
+
+def aggregate_monthly_totals(db, organization_id, month_from=None, month_to=None):
+    """
+    月次集計から勘定科目ごとの借方合計・貸方合計を取得
+
+    Args:
+        month_from: 開始年月（YYYY-MM、含む）
+        month_to: 終了年月（YYYY-MM、含む）
+
+    Returns:
+        dict: {account_item_id: (借方合計, 貸方合計)}
+    """
+    query = select(
+        AccountMonthlyBalance.account_item_id,
+        func.sum(AccountMonthlyBalance.debit_total),
+        func.sum(AccountMonthlyBalance.credit_total),
+    ).where(AccountMonthlyBalance.organization_id == organization_id)
+    if month_from is not None:
+        query = query.where(AccountMonthlyBalance.year_month >= month_from)
+    if month_to is not None:
+        query = query.where(AccountMonthlyBalance.year_month <= month_to)
+    query = query.group_by(AccountMonthlyBalance.account_item_id)
+
+    return {
+        account_item_id: (debit_total or 0, credit_total or 0)
+        for account_item_id, debit_total, credit_total in db.execute(query).all()
+    }
+
+
+def aggregate_monthly_totals_by_month(db, organization_id, month_from=None, month_to=None):
+    """
+    月次集計から勘定科目・年月ごとの借方合計・貸方合計を取得
+
+    Returns:
+        dict: {(account_item_id, 年月): (借方合計, 貸方合計)}
+    """
+    query = select(
+        AccountMonthlyBalance.account_item_id,
+        AccountMonthlyBalance.year_month,
+        AccountMonthlyBalance.debit_total,
+        AccountMonthlyBalance.credit_total,
+    ).where(AccountMonthlyBalance.organization_id == organization_id)
+    if month_from is not None:
+        query = query.where(AccountMonthlyBalance.year_month >= month_from)
+    if month_to is not None:
+        query = query.where(AccountMonthlyBalance.year_month <= month_to)
+
+    return {
+        (account_item_id, year_month): (debit_total or 0, credit_total or 0)
+        for account_item_id, year_month, debit_total, credit_total in db.execute(query).all()
+    }
+
+
+def rebuild_monthly_balances(db, organization_id=None):
+    """
+    仕訳帳から月次集計を作り直す
+
+    Args:
+        organization_id: 対象の事業所ID（None の場合は全事業所）
+
+    Returns:
+        int: 作成した月次集計の行数
+    """
+    table = AccountMonthlyBalance.__table__
+    connection = db.connection()
+
+    stmt = delete(table)
+    if organization_id is not None:
+        stmt = stmt.where(table.c.organization_id == organization_id)
+    connection.execute(stmt)
+
+    year_month = year_month_sql(GeneralLedger.transaction_date)
+    conditions = [GeneralLedger.organization_id.isnot(None), GeneralLedger.transaction_date.isnot(None)]
+    if organization_id is not None:
+        conditions.append(GeneralLedger.organization_id == organization_id)
+
+    debit_side = select(
+        GeneralLedger.organization_id.label('organization_id'),
+        GeneralLedger.debit_account_item_id.label('account_item_id'),
+        year_month.label('year_month'),
+        func.coalesce(GeneralLedger.debit_amount, 0).label('debit_total'),
+        literal(0).label('credit_total'),
+    ).where(*conditions, GeneralLedger.debit_account_item_id.isnot(None))
+    credit_side = select(
+        GeneralLedger.organization_id.label('organization_id'),
+        GeneralLedger.credit_account_item_id.label('account_item_id'),
+        year_month.label('year_month'),
+        literal(0).label('debit_total'),
+        func.coalesce(GeneralLedger.credit_amount, 0).label('credit_total'),
+    ).where(*conditions, GeneralLedger.credit_account_item_id.isnot(None))
+    sides = union_all(debit_side, credit_side).subquery()
+
+    grouped = select(
+        sides.c.organization_id,
+        sides.c.account_item_id,
+        sides.c.year_month,
+        func.sum(sides.c.debit_total),
+        func.sum(sides.c.credit_total),
+    ).group_by(sides.c.organization_id, sides.c.account_item_id, sides.c.year_month)
+
+    result = connection.execute(
+        table.insert().from_select(
+            ['organization_id', 'account_item_id', 'year_month', 'debit_total', 'credit_total'],
+            grouped,
+        )
+    )
+    return result.rowcount
+
+
+def ensure_monthly_balances(db):
+    """月次集計が空で仕訳が存在する場合（テーブル新規作成直後など）に作り直す"""
+    has_balances = db.execute(select(AccountMonthlyBalance.id).limit(1)).first()
+    if has_balances:
+        return False
+    has_ledger = db.execute(select(GeneralLedger.id).limit(1)).first()
+    if not has_ledger:
+        return False
+    rebuild_monthly_balances(db)
+    db.commit()
+    return True
@@ -517,27 +517,29 @@ def import_accounts():
         db = SessionLocal()
         
         try:
-            # ファイルを読み込み
-            if file_type == 'csv':
-                rows = processor.read_csv_file(file_content)
-            else:
-                rows = processor.read_excel_file(file_content)
+            # ファイルを1行ずつ読み込み（Excelは読み取り専用モード）
+            rows = processor.iter_file_rows(io.BytesIO(file_content), file_type)
             
-            if rows is None or len(rows) == 0:
+            # 最初の行をヘッダーとして使用
+            headers = next(rows, None)
+            if headers is None:
                 return jsonify({
                     'success': False,
                     'message': 'ファイルが空です'
                 }), 400
             
-            # 最初の行をヘッダーとして使用
-            headers = rows[0] if len(rows) > 0 else []
-            data_rows = rows[1:] if len(rows) > 1 else []
-            
             imported_count = 0
             errors = []
             
+            # 同一事業所の既存の口座名（ファイル内の重複も検出できるよう登録した口座名も追加する）
+            existing_names = {
+                name for (name,) in db.query(Account.account_name).filter(
+                    Account.organization_id == organization_id
+                )
+            }
+
             # 各行を処理
-            for row_idx, row in enumerate(data_rows, start=2):
+            for row_idx, row in enumerate(rows, start=2):
                 try:
                     # 最低限必須列数を確認
                     if len(row) < 2:
@@ -551,12 +553,7 @@ def import_accounts():
                         continue
                     
                     # 複数存在をチェック（同一事業所内）
-                    existing = db.query(Account).filter(
-                        Account.organization_id == organization_id,
-                        Account.account_name == account_name
-                    ).first()
-                    
-                    if existing:
+                    if account_name in existing_names:
                         errors.append(f'行 {row_idx}: 口座「{account_name}」は既に存在します')
                         continue
                     
@@ -586,6 +583,7 @@ def import_accounts():
                     )
                     
                     db.add(account)
+                    existing_names.add(account_name)
                     imported_count += 1
                 
                 except Exception as e:
@@ -2,7 +2,7 @@
 cash_books Blueprint
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session, jsonify, send_file
 from sqlalchemy import or_, func
 from sqlalchemy.orm import Session
 from db import SessionLocal, engine
@@ -11,7 +11,24 @@ from app.models_login import TKanrisha, TJugyoin, TTenant, TTenpo, TTenantAdminT
 import os
 from datetime import datetime
 import json
+import hashlib
 from import_utils import ImportProcessor
+from closing_utils import ClosedPeriodError
+from cash_book_balance_utils import attach_running_balances, get_cash_book_versions
+from cash_book_utils import (
+    CASH_BOOK_API_DEFAULT_LIMIT,
+    CASH_BOOK_API_FIELDS,
+    CASH_BOOK_API_MAX_LIMIT,
+    CASH_BOOK_PER_PAGE,
+    account_item_id_for_account,
+    aggregate_account_source_stats,
+    cash_book_entries_to_dicts,
+    count_cash_books_by_account,
+    fetch_cash_book_entries,
+    fetch_cash_book_pages,
+    parse_cash_book_cursor,
+    post_cash_book_batch,
+)
 from functools import wraps
 import csv
 import io
@@ -53,47 +70,27 @@ def batch_create_cash_books_page():
         # 口座フィルター（動定科目ID）
         account_item_id = request.args.get('account_item_id', type=int)
         
-        # 登録済みの出納帳データを取得（最新50件）
-        cash_books_query = db.query(CashBook).join(
-            AccountItem, CashBook.account_item_id == AccountItem.id, isouter=True
-        ).join(
-            TaxCategory, CashBook.tax_category_id == TaxCategory.id, isouter=True
-        )
-        
         # 口座フィルターを適用（account_item_idから口座名を取得してpayment_accountでフィルタ）
+        # 出納帳APIと同じく payment_account が空文字列のデータも含める
+        payment_accounts = None
         if account_item_id:
             # account_item_idから口座を取得
             account = db.query(Account).filter(Account.account_item_id == account_item_id).first()
             if account:
-                cash_books_query = cash_books_query.filter(
-                    CashBook.payment_account == account.account_name
-                )
-        
-        cash_books_query = cash_books_query.order_by(
-            CashBook.transaction_date.desc(), CashBook.id.desc()
-        ).limit(50).all()
+                payment_accounts = [account.account_name, '']
         
-        cash_books = []
-        for cb in cash_books_query:
-            # amount_with_taxが正の値なら入金、負の値なら出金
-            deposit_amount = cb.amount_with_tax if cb.amount_with_tax > 0 else None
-            withdrawal_amount = abs(cb.amount_with_tax) if cb.amount_with_tax < 0 else None
-            
-            cash_books.append({
-                'id': cb.id,
-                'transaction_date': cb.transaction_date,
-                'account_name': cb.payment_account or '',
-                'account_item_name': cb.account_item.account_name if cb.account_item else '',
-                'tax_category': cb.tax_category.name if cb.tax_category else cb.tax_rate or '',
-                'counterparty': cb.counterparty,
-                'item_name': cb.item_name,
-                'deposit_amount': deposit_amount,
-                'withdrawal_amount': withdrawal_amount,
-                'tax_amount': cb.tax_amount,
-                'remarks': cb.remarks
-            })
+        # 登録済みの出納帳データを取得（最新1ページ分。古いデータはスクロール時にAPIから取得）
+        rows, registered_next_cursor = fetch_cash_book_entries(
+            db, get_current_organization_id(), payment_accounts, limit=CASH_BOOK_API_DEFAULT_LIMIT
+        )
+        cash_books = cash_book_entries_to_dicts(db, get_current_organization_id(), rows)
         
-        return render_template('cash_books/batch_form.html', cash_books=cash_books, account_item_id=account_item_id)
+        return render_template(
+            'cash_books/batch_form.html',
+            cash_books=cash_books,
+            account_item_id=account_item_id,
+            registered_next_cursor=registered_next_cursor,
+        )
     finally:
         db.close()
 
@@ -220,6 +217,11 @@ def cash_book_create():
             return redirect(url_for('cash_books_list'))
         
         return render_template('cash_books/form.html')
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('cash_books_list'))
     except Exception as e:
         db.rollback()
         flash(f'エラーが発生しました: {str(e)}', 'error')
@@ -285,6 +287,11 @@ def cash_book_edit(item_id):
             return redirect(url_for('cash_books_list'))
         
         return render_template('cash_books/form.html', item=item)
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('cash_book_edit', item_id=item_id))
     except Exception as e:
         db.rollback()
         flash(f'エラーが発生しました: {str(e)}', 'error')
@@ -316,6 +323,10 @@ def cash_book_delete(item_id):
         db.delete(item)
         db.commit()
         return jsonify({'success': True, 'message': '取引を削除しました'})
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
@@ -329,121 +340,71 @@ def cash_book_delete(item_id):
 def cash_books_list():
     db = SessionLocal()
     try:
+        organization_id = get_current_organization_id()
+
         # 表示が有効な口座を取得（boolean カラムなので is_(True) で判定）
         accounts = db.query(Account).filter(
+            Account.organization_id == organization_id,
             Account.is_visible_in_list.is_(True)
         ).order_by(Account.id.asc()).all()
-        
-        # 口座ごとの取引を格納する辞書
-        grouped_cash_books = {}
-        
+        account_names = sorted({account.account_name for account in accounts})
+
         # 検索フィルター
         search_query = request.args.get('search', '', type=str)
-        
-        # 口座ごとの登録数内訳を格納する辞書
+        # ページ指定（指定した口座のみ。その他の口座は1ページ目）
+        page_account_id = request.args.get('account_id', type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+
+        # 口座ごとの件数と1ページ目の取引（口座の数によらずクエリ数は一定）
+        cash_book_counts = count_cash_books_by_account(db, organization_id, account_names, search_query)
+        grouped_cash_books = fetch_cash_book_pages(db, organization_id, account_names, search_query=search_query)
+        current_pages = {account.id: 1 for account in accounts}
+        page_account = next((account for account in accounts if account.id == page_account_id), None)
+        if page_account is not None and page > 1:
+            grouped_cash_books[page_account.account_name] = fetch_cash_book_pages(
+                db, organization_id, [page_account.account_name], page=page, search_query=search_query
+            ).get(page_account.account_name, [])
+            current_pages[page_account.id] = page
+
+        # 表示する行の口座残高（月次集計 + 月初からの累計）
+        running_balances = attach_running_balances(
+            db, organization_id, [row for rows in grouped_cash_books.values() for row in rows]
+        )
+
+        # 口座ごとの登録数内訳（連続仕訳・取引明細・振替）
+        account_item_ids = {account.id: account_item_id_for_account(account) for account in accounts}
+        source_stats = aggregate_account_source_stats(
+            db, organization_id, {item_id for item_id in account_item_ids.values() if item_id}
+        )
         account_stats = {}
-        
         for account in accounts:
-            # まず、この口座に紐づく出納帳を取得
-            query = db.query(CashBook).filter(
-                CashBook.organization_id == account.organization_id,
-                CashBook.payment_account == account.account_name,
-            )
-            
-            # 検索キーワードがあれば、摘要や取引先などに対して部分一致検索
-            if search_query:
-                query = query.filter(
-                    (CashBook.remarks.ilike(f'%{search_query}%')) |
-                    (CashBook.counterparty.ilike(f'%{search_query}%')) |
-                    (CashBook.item_name.ilike(f'%{search_query}%')) |
-                    (CashBook.department.ilike(f'%{search_query}%')) |
-                    (CashBook.memo_tag.ilike(f'%{search_query}%'))
-                )
-            
-            # 日付降順でソート
-            items = query.order_by(CashBook.transaction_date.desc()).all()
-            
-            # 口座名と取引リストを辞書に格納
-            grouped_cash_books[account.account_name] = items
-            
-            # ===== ここから登録数内訳（連続仕訳・取引明細・振替）の集計 =====
-            from sqlalchemy import func
-            
-            # この口座に対応する勘定科目IDを特定
-            account_item_ids = []
-            if account.account_item_id:
-                account_item_ids.append(account.account_item_id)
-            else:
-                # 勘定科目が未設定の場合は口座名から推測（現金・普通預金など）
-                if account.account_name == '現金':
-                    account_item_ids.append(1)  # 現金
-                elif account.account_name in ['三井住友銀行', '三菱ＵＦＪ銀行']:
-                    account_item_ids.append(2)  # 普通預金 など、必要に応じて調整
-            
-            # 連続仕訳の件数（借方または貸方がこの口座の勘定科目）
-            batch_count = db.query(func.count(func.distinct(GeneralLedger.source_id))).filter(
-                GeneralLedger.organization_id == account.organization_id,
-                GeneralLedger.source_type.in_(['batch_entry', 'batch_entry_net', 'batch_entry_tax']),
-                ((GeneralLedger.debit_account_item_id.in_(account_item_ids)) |
-                 (GeneralLedger.credit_account_item_id.in_(account_item_ids)))
-            ).scalar() or 0 if account_item_ids else 0
-            
-            # 取引明細（インポート元）のIDリスト
-            transaction_ids = db.query(func.distinct(GeneralLedger.source_id)).filter(
-                GeneralLedger.organization_id == account.organization_id,
-                GeneralLedger.source_type == 'imported_transaction',
-                ((GeneralLedger.debit_account_item_id.in_(account_item_ids)) |
-                 (GeneralLedger.credit_account_item_id.in_(account_item_ids)))
-            ).all() if account_item_ids else []
-            
-            transaction_ids = [t[0] for t in transaction_ids if t[0] is not None]
-            
-            # 未処理取引明細の件数
-            transaction_unprocessed_count = db.query(func.count(ImportedTransaction.id)).filter(
-                ImportedTransaction.id.in_(transaction_ids),
-                ImportedTransaction.status == 0
-            ).scalar() or 0 if transaction_ids else 0
-            
-            # 処理済み取引明細の件数
-            transaction_processed_count = db.query(func.count(ImportedTransaction.id)).filter(
-                ImportedTransaction.id.in_(transaction_ids),
-                ImportedTransaction.status == 1
-            ).scalar() or 0 if transaction_ids else 0
-            
-            # 振替伝票の件数
-            journal_count = db.query(func.count(func.distinct(GeneralLedger.source_id))).filter(
-                GeneralLedger.organization_id == account.organization_id,
-                GeneralLedger.source_type == 'journal_entry',
-                ((GeneralLedger.debit_account_item_id.in_(account_item_ids)) |
-                 (GeneralLedger.credit_account_item_id.in_(account_item_ids)))
-            ).scalar() or 0 if account_item_ids else 0
-            
-            account_stats[account.account_name] = {
-                'batch': batch_count,
-                'transaction_unprocessed': transaction_unprocessed_count,
-                'transaction_processed': transaction_processed_count,
-                'journal': journal_count,
-            }
-        
-        # ページネーションは現状未実装（全件表示）
+            account_item_id = account_item_ids[account.id]
+            if account_item_id:
+                account_stats[account.account_name] = source_stats[account_item_id]
+
         return render_template(
             'cash_books/list.html',
             accounts=accounts,
             grouped_cash_books=grouped_cash_books,
+            cash_book_counts=cash_book_counts,
+            total_transactions=sum(cash_book_counts.values()),
+            current_pages=current_pages,
+            per_page=CASH_BOOK_PER_PAGE,
             account_stats=account_stats,
-            search_query=search_query
+            running_balances=running_balances,
+            search_query=search_query,
+            has_transactions_page='transactions' in current_app.blueprints,
         )
     finally:
         db.close()
 
 
-
 # 勘定科目一覧ページ
 
 
 @bp.route('/api/cash-books/batch', methods=['POST'])
 def batch_create_cash_books():
-    """複数の出納帳データを一括で作成するAPI"""
+    """複数の出納帳データを一括で作成するAPI（全行を検証してから一括登録）"""
     db = SessionLocal()
     try:
         data = request.get_json()
@@ -455,293 +416,14 @@ def batch_create_cash_books():
         
         if not isinstance(transactions, list) or len(transactions) == 0:
             return jsonify({'success': False, 'message': '最低1件の取引データが必要です'}), 400
-        
-        created_count = 0      # 実際に仕訳（GeneralLedger）を作成できた件数
-        cashbook_count = 0     # 出納帳（CashBook）を作成した件数
-        errors = []            # 行ごとのエラーメッセージ
+        if not all(isinstance(transaction, dict) for transaction in transactions):
+            return jsonify({'success': False, 'message': '取引データの形式が不正です'}), 400
         
         organization_id = get_current_organization_id() or 1
+        current_app.logger.debug(f"出納帳の一括登録: {len(transactions)} 件 (事業所ID {organization_id})")
         
-        for idx, transaction in enumerate(transactions):
-            try:
-                # デバッグ用ログ
-                app.logger.info(f"処理中の取引データ (行 {idx + 1}): {transaction}")
-                
-                # 必須フィールドのチェック
-                if not transaction.get('transaction_date'):
-                    errors.append(f'行 {idx + 1}: 取引日が必要です')
-                    continue
-                
-                if not transaction.get('account_item_id'):
-                    errors.append(f'行 {idx + 1}: 勘定科目が必要です')
-                    continue
-                
-                if not transaction.get('account_id'):
-                    errors.append(f'行 {idx + 1}: 口座が必要です')
-                    continue
-                
-                # 入金または出金のどちらかが必須
-                deposit_amount = transaction.get('deposit_amount')
-                withdrawal_amount = transaction.get('withdrawal_amount')
-                
-                if (not deposit_amount or deposit_amount == '') and (not withdrawal_amount or withdrawal_amount == ''):
-                    errors.append(f'行 {idx + 1}: 入金または出金のどちらかが必須です')
-                    continue
-                
-                # 入金は正の値、出金は負の値として amount_with_tax に設定
-                if deposit_amount and deposit_amount != '':
-                    amount_with_tax = int(deposit_amount)
-                else:
-                    amount_with_tax = -int(withdrawal_amount)
-                
-                # account_item_id を整数に変換
-                try:
-                    account_item_id = int(transaction.get('account_item_id'))
-                except (ValueError, TypeError):
-                    errors.append(f'行 {idx + 1}: 勘定科目IDが不正です')
-                    continue
-                
-                # 勘定科目の存在確認
-                account_item = db.query(AccountItem).filter(
-                    AccountItem.id == account_item_id
-                ).first()
-                
-                if not account_item:
-                    errors.append(f'行 {idx + 1}: 勘定科目が見つかりません')
-                    continue
-                
-                # transaction_date を date オブジェクトに変換
-                transaction_date_str = transaction.get('transaction_date')
-                try:
-                    transaction_date = datetime.strptime(transaction_date_str, '%Y-%m-%d').date()
-                except ValueError:
-                    errors.append(f'行 {idx + 1}: 取引日の形式が不正です')
-                    continue
-                
-                # 金額の変換
-                try:
-                    amount_with_tax_int = int(amount_with_tax)
-                    # tax_amount は現状フロントで計算されていないため 0
-                    tax_amount_int = 0
-                    # 税抜金額（絶対値から税額分を引く）
-                    amount_without_tax_int = abs(amount_with_tax_int) - abs(tax_amount_int)
-                except (ValueError, TypeError):
-                    errors.append(f'行 {idx + 1}: 金額の形式が不正です')
-                    continue
-                
-                # tax_category_id を取得し、空文字列の場合は None に変換
-                tax_category_id = transaction.get('tax_category_id')
-                if tax_category_id == '':
-                    tax_category_id = None
-                else:
-                    try:
-                        tax_category_id = int(tax_category_id)
-                    except (ValueError, TypeError):
-                        errors.append(f'行 {idx + 1}: 税区分IDの形式が不正です')
-                        continue
-                
-                # 追加情報（現状は名称は空で保持）
-                counterparty_id = transaction.get('counterparty_id')
-                item_id = transaction.get('item_id')
-                department_id = transaction.get('department_id')
-                project_tag_id = transaction.get('project_tag_id')
-                memo_tag_id = transaction.get('memo_tag_id')
-                
-                counterparty = ''
-                item_name = ''
-                department = ''
-                memo_tag = ''
-                
-                # 口座情報を取得
-                account_id = transaction.get('account_id')
-                account = None
-                
-                if account_id not in (None, ''):
-                    try:
-                        account_id_int = int(account_id)
-                    except (TypeError, ValueError):
-                        errors.append(f'行 {idx + 1}: 口座IDが不正です')
-                        continue
-
-                    account = db.query(Account).filter(
-                        Account.id == account_id_int
-                    ).first()
-                else:
-                    account = db.query(Account).filter(
-                        Account.organization_id == organization_id
-                    ).first()
-                
-                if not account:
-                    errors.append(f'行 {idx + 1}: 口座が見つかりません')
-                    continue
-                
-                # まず CashBook を作成
-                cash_book = CashBook(
-                    organization_id=organization_id,
-                    transaction_date=transaction_date,
-                    account_item_id=account_item_id,
-                    counterparty=counterparty,
-                    item_name=item_name,
-                    tax_category_id=tax_category_id,
-                    tax_rate='',
-                    department=department,
-                    memo_tag=memo_tag,
-                    payment_account=account.account_name,
-                    remarks=transaction.get('remarks', '').strip(),
-                    amount_with_tax=amount_with_tax_int,
-                    amount_without_tax=amount_without_tax_int,
-                    tax_amount=tax_amount_int,
-                    balance=0,
-                )
-                
-                db.add(cash_book)
-                db.flush()  # cash_book.id を取得するために flush
-                cashbook_count += 1
-                
-                # source_id を自分自身の ID に設定
-                cash_book.source_id = cash_book.id
-                
-                # 口座の勘定科目IDを取得（NULL の場合はエラー）
-                account_item_id_for_account = None
-                if account.account_item_id:
-                    account_item_id_for_account = account.account_item_id
-                else:
-                    # 口座種別から推測して取得（従来ロジックを残しつつ、失敗したらエラー）
-                    if account.account_type:
-                        atype = account.account_type.lower()
-                        if 'cash' in atype:
-                            cash_account_item = db.query(AccountItem).filter(
-                                AccountItem.organization_id == organization_id,
-                                AccountItem.account_name == '現金'
-                            ).first()
-                            if cash_account_item:
-                                account_item_id_for_account = cash_account_item.id
-                        elif 'bank' in atype:
-                            bank_account_item = db.query(AccountItem).filter(
-                                AccountItem.organization_id == organization_id,
-                                AccountItem.account_name == '普通預金'
-                            ).first()
-                            if bank_account_item:
-                                account_item_id_for_account = bank_account_item.id
-                
-                if not account_item_id_for_account:
-                    # ここで仕訳を作ることができないので、この行はエラーとしてスキップ
-                    db.delete(cash_book)
-                    cashbook_count -= 1
-                    errors.append(
-                        f'行 {idx + 1}: 口座に紐づく勘定科目が設定されていません。'
-                        '口座マスタで勘定科目を設定してください。'
-                    )
-                    continue
-                
-                # ここから仕訳帳（GeneralLedger）登録処理
-                # 既存の GeneralLedger エントリを削除（更新の場合を考慮）
-                db.query(GeneralLedger).filter(
-                    GeneralLedger.source_type.in_(['batch_entry', 'batch_entry_net', 'batch_entry_tax']),
-                    GeneralLedger.source_id == cash_book.id
-                ).delete()
-                
-                # 仮払消費税 / 仮受消費税 の勘定科目を取得（将来税額対応時用）
-                tax_account_item = db.query(AccountItem).filter(
-                    AccountItem.organization_id == organization_id,
-                    AccountItem.account_name.in_(['仮払消費税', '仮受消費税'])
-                ).first()
-                
-                remarks = transaction.get('remarks', '')
-                
-                # 1. 税金分の仕訳を考慮した登録（現状 tax_amount_int は 0 のはずなので通常は通らない）
-                if tax_amount_int != 0 and tax_account_item:
-                    tax_account_item_id = tax_account_item.id
-                    tax_amount_abs = abs(tax_amount_int)
-                    
-                    # 1-1. 取引勘定科目と口座勘定科目の仕訳 (税抜金額)
-                    amount_to_use = amount_without_tax_int
-                    
-                    if amount_to_use != 0:
-                        if amount_with_tax_int >= 0:
-                            # 入金: 借方=口座、貸方=取引勘定科目
-                            debit_account_id_net = account_item_id_for_account
-                            credit_account_id_net = account_item_id
-                        else:
-                            # 出金: 借方=取引勘定科目、貸方=口座
-                            debit_account_id_net = account_item_id
-                            credit_account_id_net = account_item_id_for_account
-                        
-                        general_ledger_entry_net = GeneralLedger(
-                            organization_id=organization_id,
-                            transaction_date=transaction_date,
-                            debit_account_item_id=debit_account_id_net,
-                            debit_amount=abs(amount_to_use),
-                            credit_account_item_id=credit_account_id_net,
-                            credit_amount=abs(amount_to_use),
-                            summary=remarks,
-                            source_type='batch_entry_net',
-                            source_id=cash_book.id,
-                            created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                            updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        )
-                        db.add(general_ledger_entry_net)
-                    
-                    # 1-2. 税金分の仕訳 (税額)
-                    if tax_amount_int != 0:
-                        if amount_with_tax_int >= 0:
-                            # 入金（売上など）: 借方: 口座 / 貸方: 仮受消費税
-                            debit_account_id_tax = account_item_id_for_account
-                            credit_account_id_tax = tax_account_item_id
-                        else:
-                            # 出金（費用など）: 借方: 仮払消費税 / 貸方: 口座
-                            debit_account_id_tax = tax_account_item_id
-                            credit_account_id_tax = account_item_id_for_account
-                        
-                        general_ledger_entry_tax = GeneralLedger(
-                            organization_id=organization_id,
-                            transaction_date=transaction_date,
-                            debit_account_item_id=debit_account_id_tax,
-                            debit_amount=tax_amount_abs,
-                            credit_account_item_id=credit_account_id_tax,
-                            credit_amount=tax_amount_abs,
-                            summary=remarks + ' (消費税)',
-                            source_type='batch_entry_tax',
-                            source_id=cash_book.id,
-                            created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                            updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        )
-                        db.add(general_ledger_entry_tax)
-                    
-                    created_count += 1  # 税分仕訳まで作れた場合もカウント
-                
-                # 2. 税金勘定科目がない、または税金がない場合は、税込1本の仕訳を登録
-                elif amount_with_tax_int != 0:
-                    if amount_with_tax_int >= 0:
-                        # 入金: 借方=口座、貸方=取引勘定科目
-                        debit_account_id = account_item_id_for_account
-                        credit_account_id = account_item_id
-                    else:
-                        # 出金: 借方=取引勘定科目、貸方=口座
-                        debit_account_id = account_item_id
-                        credit_account_id = account_item_id_for_account
-                        
-                    general_ledger_entry = GeneralLedger(
-                        organization_id=organization_id,
-                        transaction_date=transaction_date,
-                        debit_account_item_id=debit_account_id,
-                        debit_amount=abs(amount_with_tax_int),
-                        credit_account_item_id=credit_account_id,
-                        credit_amount=abs(amount_with_tax_int),
-                        summary=remarks,
-                        source_type='batch_entry',
-                        source_id=cash_book.id,
-                        created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        updated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    )
-                    db.add(general_ledger_entry)
-                    created_count += 1  # 仕訳を1本作成できたのでカウント
-            
-            except Exception as e:
-                import traceback
-                error_msg = f'行 {idx + 1}: {str(e)}'
-                app.logger.error(f'{error_msg}\n{traceback.format_exc()}')
-                errors.append(error_msg)
+        # created_count: 仕訳（GeneralLedger）を作成できた件数、cashbook_count: 出納帳（CashBook）を作成した件数
+        created_count, cashbook_count, errors = post_cash_book_batch(db, organization_id, transactions)
         
         # 1件も仕訳が作成できなかった場合はロールバックしてエラー
         if created_count == 0:
@@ -764,8 +446,13 @@ def batch_create_cash_books():
             'message': f'{created_count}件の仕訳を登録しました'
         })
     
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
     except Exception as e:
         db.rollback()
+        current_app.logger.exception('出納帳の一括登録エラー')
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
     finally:
         db.close()
@@ -777,53 +464,75 @@ def batch_create_cash_books():
 
 @bp.route('/api/cash-books/list', methods=['GET'])
 def get_cash_books_list():
-    """登録済み出納帳データのリストを取得するAPI"""
+    """
+    登録済み出納帳データのリストを取得するAPI（新しい順、カーソルページング）
+
+    クエリパラメーター:
+        account_id: 口座ID（必須）
+        limit: 取得件数（既定 50、上限 500）
+        cursor: 前回のレスポンスの next_cursor（指定した行より古い行を返す）
+        fields: 返す項目（カンマ区切り、省略時はすべて）
+
+    口座の出納帳バージョンから ETag を作成し、If-None-Match が一致する場合は 304 を返す
+    """
     db = SessionLocal()
     try:
         account_id = request.args.get('account_id', type=int)
-        limit = request.args.get('limit', default=50, type=int)
+        limit = min(max(request.args.get('limit', default=CASH_BOOK_API_DEFAULT_LIMIT, type=int), 1), CASH_BOOK_API_MAX_LIMIT)
+        cursor = request.args.get('cursor', '', type=str)
+        fields_param = request.args.get('fields', '', type=str)
         
         if not account_id:
             return jsonify({'success': False, 'message': 'account_idが必要です'}), 400
         
+        before = None
+        if cursor:
+            before = parse_cash_book_cursor(cursor)
+            if before is None:
+                return jsonify({'success': False, 'message': 'cursorが不正です'}), 400
+        
+        fields = CASH_BOOK_API_FIELDS
+        if fields_param:
+            fields = tuple(field.strip() for field in fields_param.split(',') if field.strip())
+            unknown = [field for field in fields if field not in CASH_BOOK_API_FIELDS]
+            if unknown:
+                return jsonify({'success': False, 'message': f'不明な項目です: {", ".join(unknown)}'}), 400
+        
         # 口座情報を取得
         account = db.query(Account).filter(Account.id == account_id).first()
         if not account:
             return jsonify({'success': False, 'message': '口座が見つかりません'}), 404
         
-        # 出納帳データを取得（最新順）
         # payment_accountが空文字列のデータも含める
-        cash_books = db.query(CashBook).filter(
-            (CashBook.payment_account == account.account_name) | (CashBook.payment_account == '')
-        ).order_by(
-            CashBook.transaction_date.desc(),
-            CashBook.id.desc()
-        ).limit(limit).all()
+        payment_accounts = [account.account_name, '']
+        
+        # 口座の出納帳が変更されていなければ 304（バージョンとパラメーターから ETag を作成）
+        versions = get_cash_book_versions(db, account.organization_id, payment_accounts)
+        etag = hashlib.sha1(json.dumps(
+            [account.id, account.account_name, sorted(versions.items()), limit, cursor, fields],
+            ensure_ascii=False,
+        ).encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
         
-        # データを整形
-        result_data = []
-        for cb in cash_books:
-            # 入金・出金を判定
-            deposit_amount = cb.amount_with_tax if cb.amount_with_tax > 0 else None
-            withdrawal_amount = abs(cb.amount_with_tax) if cb.amount_with_tax < 0 else None
-            
-            result_data.append({
-                'id': cb.id,
-                'transaction_date': str(cb.transaction_date),
-                'account_name': cb.payment_account,
-                'account_item_name': cb.account_item.account_name if cb.account_item else '',
-                'tax_category': cb.tax_category.name if cb.tax_category else cb.tax_rate or '',
-                'counterparty': cb.counterparty or '',
-                'item_name': cb.item_name or '',
-                'department': cb.department or '',
-                'memo_tag': cb.memo_tag or '',
-                'deposit_amount': deposit_amount,
-                'withdrawal_amount': withdrawal_amount,
-                'tax_amount': cb.tax_amount or 0,
-                'remarks': cb.remarks or ''
-            })
+        # 出納帳データを取得（最新順）
+        rows, next_cursor = fetch_cash_book_entries(
+            db, account.organization_id, payment_accounts, limit=limit, before=before
+        )
+        result_data = cash_book_entries_to_dicts(db, account.organization_id, rows, fields)
         
-        return jsonify({'success': True, 'data': result_data})
+        response = jsonify({
+            'success': True,
+            'data': result_data,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        })
+        response.set_etag(etag)
+        # ブラウザにはキャッシュさせつつ、毎回 ETag で確認させる
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
     finally:
@@ -943,6 +652,10 @@ def update_cash_book(item_id):
         db.commit()
         
         return jsonify({'success': True, 'message': 'データを更新しました'})
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
@@ -1037,6 +750,10 @@ def update_cash_book_batch(cash_book_id):
         db.commit()
         
         return jsonify({'success': True})
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -12,6 +12,7 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from closing_utils import FiscalPeriodCloseError, close_fiscal_period
 from functools import wraps
 import csv
 import io
@@ -251,8 +252,6 @@ def fiscal_period_close(fiscal_period_id):
     """会計期間を締める"""
     db = SessionLocal()
     try:
-        from datetime import datetime
-        
         fiscal_period = db.query(FiscalPeriod).filter(
             FiscalPeriod.id == fiscal_period_id,
             FiscalPeriod.organization_id == session['organization_id']
@@ -260,14 +259,17 @@ def fiscal_period_close(fiscal_period_id):
         if not fiscal_period:
             return jsonify({'success': False, 'message': '会計期間が見つかりません'}), 404
         
-        if fiscal_period.status == 'closed':
-            return jsonify({'success': False, 'message': 'この会計期間は既に締められています'}), 400
-        
-        fiscal_period.status = 'closed'
-        fiscal_period.updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            next_period = close_fiscal_period(db, fiscal_period)
+        except FiscalPeriodCloseError as e:
+            db.rollback()
+            return jsonify({'success': False, 'message': str(e)}), 400
         db.commit()
         
-        return jsonify({'success': True, 'message': f'会計期間「{fiscal_period.name}」を締めました'})
+        return jsonify({
+            'success': True,
+            'message': f'会計期間「{fiscal_period.name}」を締め、「{next_period.name}」の期首残高を作成しました'
+        })
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
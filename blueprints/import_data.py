@@ -12,12 +12,17 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from job_utils import enqueue_job
+from import_spool_utils import delete_spooled_upload, get_spooled_upload, open_spooled_upload, spool_upload
 from functools import wraps
 import csv
 import io
 
 bp = Blueprint('import_data', __name__, url_prefix='')
 
+# プレビューに表示する行数
+IMPORT_PREVIEW_ROWS = 20
+
 # ヘルパー関数
 def login_required(f):
     """ログインが必要なルートに付与するデコレーター"""
@@ -52,23 +57,34 @@ def import_page():
             # ファイルアップロード処理
             if 'file' not in request.files:
                 flash('ファイルが選択されていません', 'error')
-                return redirect(url_for('import_page'))
+                return redirect(url_for('import_data.import_page'))
             
             file = request.files['file']
             if file.filename == '':
                 flash('ファイルが選択されていません', 'error')
-                return redirect(url_for('import_page'))
+                return redirect(url_for('import_data.import_page'))
             
-            # ファイルタイプを判定
+            # ファイルタイプを判定（拡張子が Excel の場合は Excel として読み込む）
             file_type = request.form.get('file_type', 'csv')
+            if file.filename.lower().endswith(('.xlsx', '.xls')):
+                file_type = 'excel'
             
-            # ファイル内容を読み込み
-            file_content = file.read()
+            # ファイルをサーバー側に一時保存し、以降はトークンで参照する
+            token = spool_upload(
+                db,
+                file.stream,
+                get_current_organization_id(),
+                file.filename,
+                file_type,
+                user_id=session.get('user_id'),
+            )
+            db.commit()
             
             # プレビューを表示するページにリダイレクト
             return redirect(url_for(
-                'import_preview',
-                file_type=file_type
+                'import_data.import_preview',
+                token=token,
+                template_id=request.form.get('template_id', type=int)
             ))
         
         # 保存済みテンプレートを取得
@@ -85,11 +101,19 @@ def import_page():
 def import_preview():
     db = SessionLocal()
     try:
+        # 一時保存したファイルを取得
+        token = request.values.get('token', '')
+        upload = get_spooled_upload(db, token, get_current_organization_id())
+        if upload is None:
+            flash('アップロードされたファイルが見つかりません。もう一度アップロードしてください', 'error')
+            return redirect(url_for('import_data.import_page'))
+        file_type = upload['file_type']
+        
         if request.method == 'POST':
             # マッピング情報を取得
-            file_type = request.form.get('file_type')
-            file_content = request.form.get('file_content')
             skip_rows = int(request.form.get('skip_rows', 0))
+            # 途中で失敗したインポートを再開する場合の開始行（コミット済みの行数）
+            start_row = request.form.get('start_row', 0, type=int)
             template_name = request.form.get('template_name', '').strip()
             account_item_id = request.form.get('account_item_id', type=int)
             
@@ -130,26 +154,80 @@ def import_preview():
                     db.add(new_template)
                 db.commit()
             
-            # インポートを実行
+            # バックグラウンドで実行する場合はジョブを登録してステータス画面へ
+            # （一時保存したファイルをそのままジョブの入力ファイルにする）
+            if request.form.get('background') == '1':
+                job = enqueue_job(
+                    db,
+                    'import_data',
+                    get_current_organization_id(),
+                    user_id=session.get('user_id'),
+                    params={
+                        'file_type': file_type,
+                        'mapping': mapping,
+                        'skip_rows': skip_rows,
+                        'account_item_id': account_item_id,
+                        'start_row': start_row,
+                    },
+                    input_file_id=token,
+                )
+                return redirect(url_for('jobs.job_status', job_id=job.id))
+            
+            # インポートを実行（一時保存したファイルから一定件数ごとにコミット）
             processor = ImportProcessor()
-            result = processor.import_data(
-                file_content.encode() if isinstance(file_content, str) else file_content,
-                file_type,
-                mapping,
-                skip_rows,
-                account_item_id
-            )
+            with open_spooled_upload(token) as f:
+                result = processor.import_data_stream(
+                    f,
+                    file_type,
+                    mapping,
+                    get_current_organization_id(),
+                    skip_rows=skip_rows,
+                    account_item_id=account_item_id,
+                    start_row=start_row,
+                )
+            # 失敗した場合は一時保存したファイルを残し、コミット済みの行の続きから再開できるようにする
+            if result['success']:
+                delete_spooled_upload(db, token)
+                db.commit()
             
             # 結果を表示
             return render_template(
                 'import/result.html',
                 result=result,
-                template_name=template_name
+                template_name=template_name,
+                token=None if result['success'] else token,
+                mapping=mapping,
+                skip_rows=skip_rows,
             )
         
-        # GETリクエストの場合、セッションからファイル情報を取得
-        # ここでは実装を粗くしています
-        return redirect(url_for('import_page'))
+        # 先頭の行だけを読み込んでプレビューを表示
+        # （CSVは読んだ分だけを保存先から取得する。Excelは読み込みにシークが必要なため一時ファイルにコピーする）
+        processor = ImportProcessor()
+        with open_spooled_upload(token, streaming=file_type == 'csv') as f:
+            preview_rows = processor.get_preview_data(f, file_type, limit=IMPORT_PREVIEW_ROWS) or []
+        
+        # テンプレートが指定された場合はマッピングの初期値にする
+        template = None
+        template_id = request.args.get('template_id', type=int)
+        if template_id:
+            template = db.query(ImportTemplate).filter(ImportTemplate.id == template_id).first()
+        mapping = json.loads(template.mapping_json) if template and template.mapping_json else {}
+        
+        account_items = db.query(AccountItem).filter(
+            AccountItem.organization_id == get_current_organization_id()
+        ).order_by(AccountItem.id).all()
+        
+        return render_template(
+            'import/preview.html',
+            token=token,
+            upload=upload,
+            preview_rows=preview_rows,
+            column_count=max((len(row) for row in preview_rows), default=0),
+            mapping=mapping,
+            skip_rows=template.skip_rows if template and template.skip_rows else 0,
+            account_items=account_items,
+            errors=processor.errors,
+        )
     finally:
         db.close()
 
@@ -0,0 +1,143 @@
+"""
+jobs Blueprint
+バックグラウンドジョブのステータス確認・結果ダウンロード
+"""
+
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, session, jsonify
+from db import SessionLocal
+from models import BackgroundJob
+from file_store_utils import iter_file_chunks
+from job_utils import job_to_dict, resume_job
+# ジョブハンドラーを登録するモジュール
+import export_utils  # noqa: F401
+import import_utils  # noqa: F401
+import transaction_import_routes  # noqa: F401
+from functools import wraps
+from urllib.parse import quote
+
+bp = Blueprint('jobs', __name__, url_prefix='')
+
+# ヘルパー関数
+def login_required(f):
+    """ログインが必要なルートに付与するデコレーター"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('auth.login'))
+        if 'organization_id' not in session:
+            return redirect(url_for('auth.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def get_current_organization_id():
+    """現在ログイン中の事業所IDを取得"""
+    return session.get('organization_id')
+
+
+def _get_job(db, job_id):
+    """現在の事業所のジョブを取得"""
+    return (
+        db.query(BackgroundJob)
+        .filter(
+            BackgroundJob.id == job_id,
+            BackgroundJob.organization_id == get_current_organization_id(),
+        )
+        .first()
+    )
+
+
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """ジョブのステータス画面（APIをポーリングして進捗を表示）"""
+    db = SessionLocal()
+    try:
+        job = _get_job(db, job_id)
+        if job is None:
+            flash('ジョブが見つかりません。', 'danger')
+            return redirect(url_for('home.home'))
+        return render_template('jobs/status.html', job=job_to_dict(job))
+    finally:
+        db.close()
+
+
+@bp.route('/api/jobs', methods=['GET'])
+@login_required
+def api_jobs():
+    """現在の事業所のジョブ一覧（新しい順）"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    db = SessionLocal()
+    try:
+        jobs = (
+            db.query(BackgroundJob)
+            .filter(BackgroundJob.organization_id == get_current_organization_id())
+            .order_by(BackgroundJob.id.desc())
+            .limit(limit)
+            .all()
+        )
+        return jsonify({'success': True, 'jobs': [job_to_dict(job) for job in jobs]})
+    finally:
+        db.close()
+
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def api_job_status(job_id):
+    """ジョブのステータス（進捗率・結果）"""
+    db = SessionLocal()
+    try:
+        job = _get_job(db, job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'ジョブが見つかりません'}), 404
+        data = job_to_dict(job)
+        if job.result_file_id:
+            data['download_url'] = url_for('jobs.api_job_download', job_id=job.id)
+        if data['resume_row'] is not None:
+            data['resume_url'] = url_for('jobs.api_job_resume', job_id=job.id)
+        return jsonify({'success': True, 'job': data})
+    finally:
+        db.close()
+
+
+@bp.route('/api/jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+def api_job_resume(job_id):
+    """途中で失敗したジョブを続きから実行するジョブを登録"""
+    db = SessionLocal()
+    try:
+        job = _get_job(db, job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'ジョブが見つかりません'}), 404
+        new_job = resume_job(db, job)
+        if new_job is None:
+            return jsonify({'success': False, 'message': 'このジョブは再開できません'}), 400
+        return jsonify({
+            'success': True,
+            'job_id': new_job.id,
+            'status_url': url_for('jobs.job_status', job_id=new_job.id),
+        }), 202
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+@bp.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+@login_required
+def api_job_download(job_id):
+    """ジョブの結果ファイルをダウンロード"""
+    db = SessionLocal()
+    try:
+        job = _get_job(db, job_id)
+        if job is None or job.status != 'succeeded' or not job.result_file_id:
+            return jsonify({'success': False, 'message': '結果ファイルが見つかりません'}), 404
+        # 保存先から少しずつ読み込んで返す（ファイル全体をメモリに読み込まない）
+        filename = job.result_filename or 'result'
+        return Response(
+            iter_file_chunks(job.result_file_id),
+            mimetype=job.result_mimetype,
+            headers={'Content-Disposition': f"attachment; filename=\"result\"; filename*=UTF-8''{quote(filename)}"},
+        )
+    finally:
+        db.close()
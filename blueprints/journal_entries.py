@@ -12,6 +12,8 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from closing_utils import ClosedPeriodError
+from search_utils import matching_source_ids
 from functools import wraps
 import csv
 import io
@@ -72,9 +74,9 @@ def journal_entries_list():
             )
         
         if search_query:
+            # 摘要・備考に対して全文検索インデックスで部分一致検索
             query = query.filter(
-                (JournalEntry.summary.ilike(f'%{search_query}%')) |
-                (JournalEntry.remarks.ilike(f'%{search_query}%'))
+                JournalEntry.id.in_(matching_source_ids(db, None, 'journal_entry', search_query))
             )
         
         # 取引日降順でソート
@@ -206,6 +208,11 @@ def journal_entry_create():
         
         return render_template('journal_entries/form.html', 
                              today=today)
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('journal_entries_list'))
     except Exception as e:
         db.rollback()
         flash(f'エラーが発生しました: {str(e)}', 'error')
@@ -322,6 +329,11 @@ def journal_entry_edit(entry_id):
         # GETリクエスト時のデータ取得
         return render_template('journal_entries/form.html', 
                              entry=entry)
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('journal_entry_edit', entry_id=entry_id))
     except Exception as e:
         db.rollback()
         flash(f'エラーが発生しました: {str(e)}', 'error')
@@ -343,6 +355,10 @@ def journal_entry_delete(entry_id):
         db.delete(entry)
         db.commit()
         return jsonify({'success': True, 'message': '振替伝票を削除しました'})
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
@@ -12,6 +12,7 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from report_cache import delete_versioned_rows
 from functools import wraps
 import csv
 import io
@@ -474,10 +475,10 @@ def save_organization_opening_balances():
             return jsonify({'success': False, 'error': '会計期間が設定されていません。'})
         
         # 既存の期首残高を削除
-        db.query(OpeningBalance).filter(
-            OpeningBalance.organization_id == org_id,
+        delete_versioned_rows(
+            db, OpeningBalance, org_id,
             OpeningBalance.fiscal_period_id == fiscal_period.id
-        ).delete()
+        )
         
         # 新しい期首残高を追加
         for ob_data in opening_balances_data:
@@ -12,12 +12,25 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from report_utils import DIMENSIONS, PL_CATEGORY_ORDER, account_item_row, bs_account_sort_key, calculate_closing_balance, compute_account_balances, compute_dimension_breakdown, compute_monthly_trend, fetch_journal_page, fetch_ledger_page, get_pl_category, normalize_major_category, pl_account_sort_key, select_journal_entries
+from report_cache import get_ledger_version, report_cache
+from closing_utils import ClosedPeriodError
+from ledger_columns import ledger_column_cache
+from export_utils import EXPORT_FORMATS, export_filename, export_response, iter_copy_csv, iter_journal_rows, iter_ledger_rows, iter_trial_balance_rows
+from job_utils import enqueue_job
 from functools import wraps
 import csv
 import io
 
 bp = Blueprint('reports', __name__, url_prefix='')
 
+# 総勘定元帳の1ページの件数
+LEDGER_PAGE_SIZE = 100
+LEDGER_MAX_PAGE_SIZE = 500
+# 仕訳帳の1ページの件数
+GENERAL_LEDGER_PAGE_SIZE = 100
+GENERAL_LEDGER_MAX_PAGE_SIZE = 500
+
 # ヘルパー関数
 def login_required(f):
     """ログインが必要なルートに付与するデコレーター"""
@@ -223,6 +236,18 @@ def trial_balance():
         if not selected_period_id and fiscal_periods:
             selected_period_id = fiscal_periods[0].id
 
+        # 仕訳帳が変更されていなければキャッシュした集計結果を使う
+        cache_key = report_cache.make_key(organization_id, selected_period_id, "trial_balance")
+        ledger_version = get_ledger_version(db, organization_id)
+        report = report_cache.get(cache_key, ledger_version)
+        if report is not None:
+            return render_template(
+                "trial_balance/index.html",
+                fiscal_periods=fiscal_periods,
+                selected_period_id=selected_period_id,
+                **report,
+            )
+
         # ------------------------------
         # 初期化
         # ------------------------------
@@ -243,16 +268,6 @@ def trial_balance():
         bs_tree = OrderedDict()
         pl_tree = OrderedDict()
 
-        # --------- ★ P/Lカテゴリ判定ヘルパー（ここがポイント） ----------
-        def get_pl_cat(ai):
-            """
-            P/L 上のカテゴリを決めるカラム
-            1. pl_category が入っていればそれを優先
-            2. なければ mid_category（中分類）
-            3. それも無ければ sub_category（小分類）
-            """
-            return (ai.pl_category or ai.mid_category or ai.sub_category or "").strip()
-
         if selected_period_id:
             # 選択された会計期間を取得
             selected_period = (
@@ -266,125 +281,12 @@ def trial_balance():
 
             if selected_period:
                 # ------------------------------
-                # 期首残高の取得
+                # 勘定科目ごとに集計（DB側で GROUP BY）
                 # ------------------------------
-                opening_balances_db = (
-                    db.query(OpeningBalance)
-                    .filter(
-                        OpeningBalance.organization_id == organization_id,
-                        OpeningBalance.fiscal_period_id == selected_period_id,
-                    )
-                    .all()
-                )
-
-                # 期首残高が登録されていない場合は、前期の仕訳から計算
-                if not opening_balances_db:
-                    opening_balance_entries = (
-                        db.query(GeneralLedger)
-                        .filter(
-                            GeneralLedger.organization_id == organization_id,
-                            GeneralLedger.transaction_date < selected_period.start_date,
-                        )
-                        .all()
-                    )
-                else:
-                    opening_balance_entries = []
-
-                # 当期仕訳を取得
-                current_period_entries = (
-                    db.query(GeneralLedger)
-                    .filter(
-                        GeneralLedger.organization_id == organization_id,
-                        GeneralLedger.transaction_date >= selected_period.start_date,
-                        GeneralLedger.transaction_date <= selected_period.end_date,
-                    )
-                    .all()
+                account_summary = compute_account_balances(
+                    db, organization_id, selected_period
                 )
 
-                # ------------------------------
-                # 勘定科目ごとに集計
-                # ------------------------------
-                account_summary = {}
-
-                # 期首残高テーブルから期首残高を設定
-                for ob in opening_balances_db:
-                    account_id = ob.account_item_id
-                    if account_id not in account_summary:
-                        account_summary[account_id] = {
-                            "account_item": ob.account_item,
-                            "opening_balance": 0,
-                            "current_debit": 0,
-                            "current_credit": 0,
-                        }
-
-                    major_category = ob.account_item.major_category or ""
-                    if major_category == "財産":
-                        major_category = "負債"
-
-                    if major_category == "資産":
-                        # 資産科目: 借方がプラス
-                        account_summary[account_id]["opening_balance"] += (
-                            float(ob.debit_amount) - float(ob.credit_amount)
-                        )
-                    elif major_category in ["負債", "純資産"]:
-                        # 負債・純資産科目: 貸方がプラス
-                        account_summary[account_id]["opening_balance"] += (
-                            float(ob.credit_amount) - float(ob.debit_amount)
-                        )
-                    else:
-                        # その他: 借方がプラス
-                        account_summary[account_id]["opening_balance"] += (
-                            float(ob.debit_amount) - float(ob.credit_amount)
-                        )
-
-                # 前期の仕訳から期首残高を計算（期首残高テーブルが空の場合）
-                for entry in opening_balance_entries:
-                    # 借方
-                    debit_account_id = entry.debit_account_item_id
-                    if debit_account_id not in account_summary:
-                        account_summary[debit_account_id] = {
-                            "account_item": entry.debit_account_item,
-                            "opening_balance": 0,
-                            "current_debit": 0,
-                            "current_credit": 0,
-                        }
-                    account_summary[debit_account_id]["opening_balance"] += entry.debit_amount
-
-                    # 貸方
-                    credit_account_id = entry.credit_account_item_id
-                    if credit_account_id not in account_summary:
-                        account_summary[credit_account_id] = {
-                            "account_item": entry.credit_account_item,
-                            "opening_balance": 0,
-                            "current_debit": 0,
-                            "current_credit": 0,
-                        }
-                    account_summary[credit_account_id]["opening_balance"] -= entry.credit_amount
-
-                # 当期借方・貸方を集計
-                for entry in current_period_entries:
-                    # 借方
-                    debit_account_id = entry.debit_account_item_id
-                    if debit_account_id not in account_summary:
-                        account_summary[debit_account_id] = {
-                            "account_item": entry.debit_account_item,
-                            "opening_balance": 0,
-                            "current_debit": 0,
-                            "current_credit": 0,
-                        }
-                    account_summary[debit_account_id]["current_debit"] += entry.debit_amount
-
-                    # 貸方
-                    credit_account_id = entry.credit_account_item_id
-                    if credit_account_id not in account_summary:
-                        account_summary[credit_account_id] = {
-                            "account_item": entry.credit_account_item,
-                            "opening_balance": 0,
-                            "current_debit": 0,
-                            "current_credit": 0,
-                        }
-                    account_summary[credit_account_id]["current_credit"] += entry.credit_amount
-
                 # ------------------------------
                 # 試算表データを作成 (B/S と P/L に分ける)
                 #   P/L は「major_category = 損益」の科目のみ
@@ -398,25 +300,14 @@ def trial_balance():
                     # account_itemがNoneの場合はスキップ
                     if account_item is None:
                         continue
-                    major_category = account_item.major_category or ""
 
                     # major_category が '財産' の場合は '負債'
-                    if major_category == "財産":
-                        major_category = "負債"
+                    major_category = normalize_major_category(account_item.major_category)
 
                     # 残高計算（元のロジックを踏襲）
-                    if major_category in ["收入", "収益"]:
-                        # 収益科目: 貸方プラス、借方マイナス
-                        closing = opening - current_debit + current_credit
-                    elif major_category == "資産":
-                        # 資産科目: 借方プラス
-                        closing = opening + current_debit - current_credit
-                    elif major_category in ["負債", "純資産"]:
-                        # 負債・純資産科目: 貸方プラス
-                        closing = opening - current_debit + current_credit
-                    else:
-                        # その他（費用・損益など）: 借方プラス
-                        closing = opening + current_debit - current_credit
+                    closing = calculate_closing_balance(
+                        major_category, opening, current_debit, current_credit
+                    )
 
                     data_item = {
                         "account_item": account_item,
@@ -542,49 +433,7 @@ def trial_balance():
                 # ------------------------------
                 # P/L 生データ側の並び
                 # ------------------------------
-                pl_cat_order = {
-                    "売上高": 10,
-                    # 売上原価の詳細（小分類の値）
-                    "期首商品棚卸": 11,
-                    "当期商品仕入": 12,
-                    "他勘定振替高(商)": 13,
-                    "期末商品棚卸": 14,
-                    "売上原価": 20,
-                    "売上総利益": 30,
-                    "販売管理費": 40,
-                    "販管費": 40,
-                    "販売費及び一般管理費": 40,
-                    "営業利益": 50,
-                    "営業外収益": 60,
-                    "営業外費用": 70,
-                    "経常利益": 80,
-                    "特別利益": 90,
-                    "特別損失": 100,
-                    "税引前当期純利益": 110,
-                    "法人税等": 120,
-                    "法人税等調整額": 130,
-                    "当期純利益": 140,
-                }
-
-                def pl_sort_key(item):
-                    ai = item["account_item"]
-                    # 小分類を優先的にチェック
-                    sub = (ai.sub_category or "").strip()
-                    mid = (ai.mid_category or "").strip()
-                    cat = get_pl_cat(ai)
-                    
-                    # 小分類が pl_cat_order にあればそれを使用、なければ中分類、最後にカテゴリ
-                    order = pl_cat_order.get(sub, pl_cat_order.get(mid, pl_cat_order.get(cat, 999)))
-                    
-                    return (
-                        order,
-                        ai.pl_rank
-                        if getattr(ai, "pl_rank", None) is not None
-                        else 9999,
-                        ai.account_name or "",
-                    )
-
-                pl_data.sort(key=pl_sort_key)
+                pl_data.sort(key=lambda item: pl_account_sort_key(item["account_item"]))
 
                 # ------------------------------
                 # 旧ステップ風集計（B/S・P/L 集計値）
@@ -631,7 +480,7 @@ def trial_balance():
 
                 for item in pl_data:
                     ai = item["account_item"]
-                    category = get_pl_cat(ai)   # ★ ここもヘルパーで判定
+                    category = get_pl_category(ai)   # ★ ここもヘルパーで判定
                     amount = item["closing_balance"] or 0
 
                     if category == "売上高":
@@ -707,12 +556,13 @@ def trial_balance():
                 bs_map = {row["account_item"].id: row for row in bs_data}
                 
                 # 大分類が「資産」「負債」「純資産」「負債及び純資産」の全勘定科目を取得
-                all_bs_accounts = (
-                    db.query(AccountItem)
+                all_bs_accounts = [
+                    account_item_row(ai)
+                    for ai in db.query(AccountItem)
                     .filter(AccountItem.organization_id == organization_id)
                     .filter(AccountItem.major_category.in_(["資産", "負債", "純資産", "負債及び純資産"]))
                     .all()
-                )
+                ]
                 
                 # 全科目を含むbs_data_fullを作成
                 bs_data_full = []
@@ -743,111 +593,7 @@ def trial_balance():
                         })
                 
                 # bs_data_fullを流動性配列（流動性の高い順）で並び替え
-                def bs_sort_key_full(item):
-                    ai = item["account_item"]
-                    
-                    # 大分類の順序
-                    bs_major_order = {
-                        "資産": 1,
-                        "負債": 2,
-                        "純資産": 3,
-                        "負債及び純資産": 2,
-                    }
-                    
-                    # 中分類の順序（流動性ベース）
-                    mid_category_order = {
-                        # 資産：流動資産 → 固定資産 → 繰延資産
-                        "流動資産": 1,
-                        "固定資産": 2,
-                        "繰延資産": 3,
-                        # 負債：流動負債 → 固定負債
-                        "流動負債": 1,
-                        "固定負債": 2,
-                        # 純資産：資本金 → 資本剰余金 → 利益剰余金 → 自己株式 → 評価換算差額等 → 新株予約権
-                        "資本金": 1,
-                        "資本剰余金": 2,
-                        "利益剰余金": 3,
-                        "自己株式": 4,
-                        "評価換算差額等": 5,
-                        "新株予約権": 6,
-                        # 損益：P/Lの順序
-                        "売上高": 1,
-                        "売上原価": 2,
-                        "販売費及び一般管理費": 3,
-                        "営業外収益": 4,
-                        "営業外費用": 5,
-                        "特別利益": 6,
-                        "特別損失": 7,
-                        "法人税等": 8,
-                        "法人税等調整額": 9,
-                    }
-                    
-                    # 小分類の順序（流動性配列法：流動性が高い順）
-                    sub_category_order = {
-                        # 流動資産：現金化しやすい順
-                        "現金及び預金": 1,
-                        "売上債権": 2,
-                        "有価証券": 3,
-                        "棚卸資産": 4,
-                        "その他流動資産": 5,
-                        # 固定資産
-                        "有形固定資産": 1,
-                        "無形固定資産": 2,
-                        "投資その他の資産": 3,
-                        # 繰延資産
-                        "繰延資産": 1,
-                        # 流動負債
-                        "仕入債務": 1,
-                        "その他流動負債": 2,
-                        # 固定負債
-                        "固定負債": 1,
-                        # 純資産：資本金
-                        "資本金": 1,
-                        # 純資産：資本剰余金
-                        "新株式申込証拠金": 1,
-                        "資本準備金": 2,
-                        "その他資本剰余金": 3,
-                        # 純資産：利益剰余金
-                        "利益準備金": 1,
-                        "その他利益剰余金": 2,
-                        # 純資産：自己株式
-                        "自己株式": 1,
-                        "自己株式申込証拠金": 2,
-                        # 純資産：評価換算差額等
-                        "他有価証券評価差額金": 1,
-                        "繰延ヘッジ損益": 2,
-                        "土地再評価差額金": 3,
-                        # 純資産：新株予約権
-                        "新株予約権": 1,
-                        # 損益
-                        "売上高": 1,
-                        "期首商品棚卸": 1,
-                        "当期商品仕入": 2,
-                        "他勘定振替高(商)": 3,
-                        "期末商品棚卸": 4,
-                        "販売管理費": 1,
-                        "営業外収益": 1,
-                        "営業外費用": 1,
-                        "特別利益": 1,
-                        "特別損失": 1,
-                        "法人税等": 1,
-                        "法人税等調整額": 1,
-                    }
-                    
-                    major = ai.major_category or ""
-                    middle = ai.mid_category or ""
-                    small = ai.sub_category or ""
-                    
-                    return (
-                        bs_major_order.get(major, 99),
-                        mid_category_order.get(middle, 99),
-                        sub_category_order.get(small, 99),
-                        ai.bs_rank if getattr(ai, "bs_rank", None) is not None
-                        else (ai.liquidity_rank if getattr(ai, "liquidity_rank", None) is not None else 9999),
-                        ai.account_name,
-                    )
-                
-                bs_data_full.sort(key=bs_sort_key_full)
+                bs_data_full.sort(key=lambda item: bs_account_sort_key(item["account_item"]))
                 
                 def build_bs_tree(data_list, major_order=None):
                     tmp = {}
@@ -921,12 +667,13 @@ def trial_balance():
                 pl_map = {row["account_item"].id: row for row in pl_data}
 
                 # 大分類=損益 の全勘定科目を取得
-                all_pl_accounts = (
-                    db.query(AccountItem)
+                all_pl_accounts = [
+                    account_item_row(ai)
+                    for ai in db.query(AccountItem)
                     .filter(AccountItem.organization_id == organization_id)
                     .filter(AccountItem.major_category == "損益")
                     .all()
-                )
+                ]
 
                 pl_tree = OrderedDict()
                 sub_priority = {}
@@ -964,9 +711,9 @@ def trial_balance():
                     # 並び替え用のカテゴリ優先順位（小分類優先）
                     sub_cat = (ai.sub_category or "").strip()
                     mid_cat = (ai.mid_category or "").strip()
-                    cat = get_pl_cat(ai)
+                    cat = get_pl_category(ai)
                     # 小分類 → 中分類 → カテゴリの順で優先的にチェック
-                    cat_ord = pl_cat_order.get(sub_cat, pl_cat_order.get(mid_cat, pl_cat_order.get(cat, 999)))
+                    cat_ord = PL_CATEGORY_ORDER.get(sub_cat, PL_CATEGORY_ORDER.get(mid_cat, PL_CATEGORY_ORDER.get(cat, 999)))
                     if sub not in sub_priority or cat_ord < sub_priority[sub]:
                         sub_priority[sub] = cat_ord
 
@@ -1049,10 +796,7 @@ def trial_balance():
                 net_profit = pretax_profit - tax_total
                 pl_subtotals['当期純利益'] = net_profit
 
-        return render_template(
-            "trial_balance/index.html",
-            fiscal_periods=fiscal_periods,
-            selected_period_id=selected_period_id,
+        report = dict(
             # 明細データ
             bs_data=bs_data_full,
             pl_data=pl_data,
@@ -1071,6 +815,184 @@ def trial_balance():
             pl_debit_total=pl_debit_total,
             pl_credit_total=pl_credit_total,
         )
+        report_cache.set(cache_key, ledger_version, report)
+
+        return render_template(
+            "trial_balance/index.html",
+            fiscal_periods=fiscal_periods,
+            selected_period_id=selected_period_id,
+            **report,
+        )
+    finally:
+        db.close()
+
+
+# ========== 部門別・取引先別内訳 ==========
+
+
+def _dimension_breakdown(db, organization_id, fiscal_period, dimension, account_item_id):
+    """集計軸別内訳を取得（仕訳帳が変更されていなければキャッシュを使う）"""
+    cache_key = report_cache.make_key(
+        organization_id, fiscal_period.id, "dimension_breakdown",
+        {"dimension": dimension, "account_item_id": account_item_id},
+    )
+    ledger_version = get_ledger_version(db, organization_id)
+    breakdown = report_cache.get(cache_key, ledger_version)
+    if breakdown is None:
+        breakdown = compute_dimension_breakdown(
+            db, organization_id, fiscal_period, dimension, account_item_id=account_item_id
+        )
+        report_cache.set(cache_key, ledger_version, breakdown)
+    return breakdown
+
+
+@bp.route('/trial-balance/breakdown', methods=['GET'])
+@login_required
+def trial_balance_breakdown():
+    """試算表の集計軸別内訳表示（部門別損益・取引先別残高など）"""
+    organization_id = get_current_organization_id()
+    dimension = request.args.get('dimension', 'department')
+    if dimension not in DIMENSIONS:
+        flash('集計軸が正しくありません。', 'danger')
+        return redirect(url_for('reports.trial_balance'))
+
+    db = SessionLocal()
+    try:
+        fiscal_periods = (
+            db.query(FiscalPeriod)
+            .filter(FiscalPeriod.organization_id == organization_id)
+            .order_by(FiscalPeriod.start_date.desc())
+            .all()
+        )
+        account_items = (
+            db.query(AccountItem)
+            .filter(AccountItem.organization_id == organization_id)
+            .order_by(AccountItem.account_name)
+            .all()
+        )
+
+        selected_period_id = request.args.get('fiscal_period_id', type=int)
+        if not selected_period_id and fiscal_periods:
+            selected_period_id = fiscal_periods[0].id
+        selected_account_item_id = request.args.get('account_item_id', type=int)
+
+        selected_period = next((fp for fp in fiscal_periods if fp.id == selected_period_id), None)
+        breakdown = []
+        if selected_period:
+            breakdown = _dimension_breakdown(
+                db, organization_id, selected_period, dimension, selected_account_item_id
+            )
+
+        return render_template(
+            "trial_balance/breakdown.html",
+            dimensions=DIMENSIONS,
+            dimension=dimension,
+            dimension_label=DIMENSIONS[dimension][0],
+            fiscal_periods=fiscal_periods,
+            account_items=account_items,
+            selected_period_id=selected_period_id,
+            selected_period=selected_period,
+            selected_account_item_id=selected_account_item_id,
+            breakdown=breakdown,
+        )
+    finally:
+        db.close()
+
+
+@bp.route('/api/trial-balance/breakdown', methods=['GET'])
+@login_required
+def api_trial_balance_breakdown():
+    """勘定科目 × 集計軸（部門・取引先・品目・案件タグ・メモタグ）の合計を返すAPI"""
+    organization_id = get_current_organization_id()
+    dimension = request.args.get('dimension', 'department')
+    if dimension not in DIMENSIONS:
+        return jsonify({'success': False, 'message': '集計軸が正しくありません'}), 400
+
+    db = SessionLocal()
+    try:
+        fiscal_period = (
+            db.query(FiscalPeriod)
+            .filter(
+                FiscalPeriod.id == request.args.get('fiscal_period_id', type=int),
+                FiscalPeriod.organization_id == organization_id,
+            )
+            .first()
+        )
+        if not fiscal_period:
+            return jsonify({'success': False, 'message': '会計期間が見つかりません'}), 404
+
+        breakdown = _dimension_breakdown(
+            db, organization_id, fiscal_period, dimension, request.args.get('account_item_id', type=int)
+        )
+        return jsonify({
+            'success': True,
+            'dimension': dimension,
+            'fiscal_period_id': fiscal_period.id,
+            'accounts': [
+                {
+                    'account_item_id': row['account_item'].id,
+                    'account_name': row['account_item'].account_name,
+                    'major_category': row['account_item'].major_category,
+                    'values': row['values'],
+                }
+                for row in breakdown
+            ],
+        })
+    finally:
+        db.close()
+
+
+# ========== 月次推移表 ==========
+
+
+@bp.route('/monthly-trend', methods=['GET'])
+@login_required
+def monthly_trend():
+    """月次推移表表示（B/S は各月末残高、P/L は各月の発生額）"""
+    organization_id = get_current_organization_id()
+    db = SessionLocal()
+    try:
+        # 会計期間一覧を取得
+        fiscal_periods = (
+            db.query(FiscalPeriod)
+            .filter(FiscalPeriod.organization_id == organization_id)
+            .order_by(FiscalPeriod.start_date.desc())
+            .all()
+        )
+
+        # 選択された会計期間ID（デフォルトは最新）
+        selected_period_id = request.args.get("fiscal_period_id", type=int)
+        if not selected_period_id and fiscal_periods:
+            selected_period_id = fiscal_periods[0].id
+
+        selected_period = None
+        if selected_period_id:
+            selected_period = (
+                db.query(FiscalPeriod)
+                .filter(
+                    FiscalPeriod.id == selected_period_id,
+                    FiscalPeriod.organization_id == organization_id,
+                )
+                .first()
+            )
+
+        trend = None
+        if selected_period:
+            # 仕訳帳が変更されていなければキャッシュした集計結果を使う
+            cache_key = report_cache.make_key(organization_id, selected_period.id, "monthly_trend")
+            ledger_version = get_ledger_version(db, organization_id)
+            trend = report_cache.get(cache_key, ledger_version)
+            if trend is None:
+                trend = compute_monthly_trend(db, organization_id, selected_period)
+                report_cache.set(cache_key, ledger_version, trend)
+
+        return render_template(
+            "monthly_trend/index.html",
+            fiscal_periods=fiscal_periods,
+            selected_period_id=selected_period_id,
+            selected_period=selected_period,
+            trend=trend,
+        )
     finally:
         db.close()
 
@@ -1096,9 +1018,14 @@ def general_ledger():
         # 選択された会計期間ID（デフォルトは最新）
         selected_period_id = request.args.get('fiscal_period_id', type=int)
 
-        general_ledger_entries = []
         selected_period = None
 
+        # ページング（取引日・仕訳IDのキーセット）
+        after = request.args.get('after') or None
+        before = request.args.get('before') or None
+        per_page = request.args.get('per_page', GENERAL_LEDGER_PAGE_SIZE, type=int)
+        per_page = max(1, min(per_page, GENERAL_LEDGER_MAX_PAGE_SIZE))
+
         # 会計期間が登録されているか確認し、デフォルトを選択
         if fiscal_periods:
             if not selected_period_id:
@@ -1114,57 +1041,32 @@ def general_ledger():
                 .first()
             )
 
-        # クエリの基本形
-        query = db.query(GeneralLedger).filter(
-            GeneralLedger.organization_id == organization_id
+        # 仕訳帳が変更されていなければキャッシュしたページを使う
+        cache_key = report_cache.make_key(
+            organization_id,
+            selected_period.id if selected_period else None,
+            "general_ledger",
+            {"after": after, "before": before, "per_page": per_page},
         )
-
-        if selected_period:
-            # 会計期間内の仕訳帳データを取得
-            query = query.filter(
-                GeneralLedger.transaction_date >= selected_period.start_date,
-                GeneralLedger.transaction_date <= selected_period.end_date,
+        ledger_version = get_ledger_version(db, organization_id)
+        page = report_cache.get(cache_key, ledger_version)
+        if page is None:
+            page = fetch_journal_page(
+                db, organization_id, selected_period,
+                after=after, before=before, per_page=per_page,
             )
-
-        # 仕訳帳データを取得
-        general_ledger_entries = query.order_by(
-            GeneralLedger.transaction_date, GeneralLedger.id
-        ).all()
-
-        # 口座の場合は口座名を上書き
-        for entry in general_ledger_entries:
-            # 借方が口座の場合、口座名を取得
-            if entry.debit_account_item_id:
-                account = (
-                    db.query(Account)
-                    .filter(
-                        Account.account_item_id == entry.debit_account_item_id,
-                        Account.organization_id == organization_id,
-                    )
-                    .first()
-                )
-                if account and entry.debit_account_item:
-                    entry.debit_account_item.account_name = account.account_name
-
-            # 貸方が口座の場合、口座名を取得
-            if entry.credit_account_item_id:
-                account = (
-                    db.query(Account)
-                    .filter(
-                        Account.account_item_id == entry.credit_account_item_id,
-                        Account.organization_id == organization_id,
-                    )
-                    .first()
-                )
-                if account and entry.credit_account_item:
-                    entry.credit_account_item.account_name = account.account_name
+            report_cache.set(cache_key, ledger_version, page)
 
         return render_template(
             "general_ledger/index.html",
             fiscal_periods=fiscal_periods,
             selected_period_id=selected_period_id,
             selected_period=selected_period,
-            general_ledger_entries=general_ledger_entries,
+            general_ledger_entries=page["entries"],
+            total_count=page["total_count"],
+            next_cursor=page["next_cursor"],
+            prev_cursor=page["prev_cursor"],
+            per_page=per_page,
         )
     except Exception as e:
         flash(f"エラーが発生しました: {str(e)}", "error")
@@ -1200,6 +1102,10 @@ def delete_orphaned_journal_entry(cash_book_id):
         
         db.commit()
         return jsonify({'success': True, 'message': f'{len(general_ledger_entries)}件の仕訳データを削除しました'})
+    except ClosedPeriodError as e:
+        # 締め済みの会計期間の仕訳は変更できない
+        db.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
@@ -1208,6 +1114,15 @@ def delete_orphaned_journal_entry(cash_book_id):
 
 
 
+@bp.route('/api/report-cache/stats', methods=['GET'])
+@login_required
+def report_cache_stats():
+    """帳票キャッシュのヒット率・列指向キャッシュの使用量などを返すAPI（監視用）"""
+    stats = report_cache.stats()
+    stats['ledger_columns'] = ledger_column_cache.stats()
+    return jsonify(stats)
+
+
 @bp.route('/ledger', methods=['GET'])
 @login_required
 def ledger():
@@ -1234,9 +1149,19 @@ def ledger():
         selected_fiscal_period_id = request.args.get('fiscal_period_id', type=int)
         selected_account_item_id = request.args.get('account_item_id', type=int)
 
-        transactions = []
-        monthly_totals = []
-        opening_balance = 0
+        # ページング（取引日・仕訳IDのキーセット）
+        after = request.args.get('after') or None
+        before = request.args.get('before') or None
+        per_page = request.args.get('per_page', LEDGER_PAGE_SIZE, type=int)
+        per_page = max(1, min(per_page, LEDGER_MAX_PAGE_SIZE))
+
+        page = {
+            "opening_balance": 0,
+            "transactions": [],
+            "monthly_totals": [],
+            "next_cursor": None,
+            "prev_cursor": None,
+        }
         selected_fiscal_period = None
         selected_account_item = None
 
@@ -1253,113 +1178,26 @@ def ledger():
             )
 
             if selected_fiscal_period and selected_account_item:
-                # 期首残高を計算（会計期間開始日より前の仕訳）
-                opening_entries = (
-                    db.query(GeneralLedger)
-                    .filter(
-                        GeneralLedger.organization_id == org_id,
-                        GeneralLedger.transaction_date < selected_fiscal_period.start_date,
-                        or_(
-                            GeneralLedger.debit_account_item_id
-                            == selected_account_item_id,
-                            GeneralLedger.credit_account_item_id
-                            == selected_account_item_id,
-                        ),
-                    )
-                    .all()
-                )
-
-                for entry in opening_entries:
-                    if entry.debit_account_item_id == selected_account_item_id:
-                        opening_balance += entry.debit_amount
-                    if entry.credit_account_item_id == selected_account_item_id:
-                        opening_balance -= entry.credit_amount
-
-                # 勘定科目の種類に応じて期首残高の符号を調整
-                if selected_account_item.major_category in ['收入']:
-                    opening_balance = -opening_balance
-
-                # 当期の仕訳を取得
-                current_entries = (
-                    db.query(GeneralLedger)
-                    .filter(
-                        GeneralLedger.organization_id == org_id,
-                        GeneralLedger.transaction_date
-                        >= selected_fiscal_period.start_date,
-                        GeneralLedger.transaction_date
-                        <= selected_fiscal_period.end_date,
-                        or_(
-                            GeneralLedger.debit_account_item_id
-                            == selected_account_item_id,
-                            GeneralLedger.credit_account_item_id
-                            == selected_account_item_id,
-                        ),
-                    )
-                    .order_by(GeneralLedger.transaction_date)
-                    .all()
+                # 仕訳帳が変更されていなければキャッシュしたページを使う
+                cache_key = report_cache.make_key(
+                    org_id, selected_fiscal_period_id, "ledger",
+                    {
+                        "account_item_id": selected_account_item_id,
+                        "after": after,
+                        "before": before,
+                        "per_page": per_page,
+                    },
                 )
-
-                # 取引データを作成
-                running_balance = opening_balance
-                current_month = None
-                month_debit_total = 0
-                month_credit_total = 0
-
-                for entry in current_entries:
-                    # transaction_date は文字列想定なので先頭7桁(YYYY-MM) を取得
-                    entry_month = entry.transaction_date[:7]
-                    if current_month and current_month != entry_month:
-                        monthly_totals.append(
-                            {
-                                "month": current_month,
-                                "debit_total": month_debit_total,
-                                "credit_total": month_credit_total,
-                            }
-                        )
-                        month_debit_total = 0
-                        month_credit_total = 0
-                    current_month = entry_month
-
-                    # 相手勘定科目と金額を決定
-                    if entry.debit_account_item_id == selected_account_item_id:
-                        counterpart_account = entry.credit_account_item.account_name
-                        debit_amount = entry.debit_amount
-                        credit_amount = 0
-                        if selected_account_item.major_category in ['收入']:
-                            running_balance -= debit_amount
-                        else:
-                            running_balance += debit_amount
-                        month_debit_total += debit_amount
-                    else:
-                        counterpart_account = entry.debit_account_item.account_name
-                        debit_amount = 0
-                        credit_amount = entry.credit_amount
-                        if selected_account_item.major_category in ['收入']:
-                            running_balance += credit_amount
-                        else:
-                            running_balance -= credit_amount
-                        month_credit_total += credit_amount
-
-                    transactions.append(
-                        {
-                            "date": entry.transaction_date,
-                            "counterpart_account": counterpart_account,
-                            "summary": entry.summary or "",
-                            "debit": debit_amount,
-                            "credit": credit_amount,
-                            "balance": running_balance,
-                        }
-                    )
-
-                # 最後の月の合計を追加
-                if current_month:
-                    monthly_totals.append(
-                        {
-                            "month": current_month,
-                            "debit_total": month_debit_total,
-                            "credit_total": month_credit_total,
-                        }
+                ledger_version = get_ledger_version(db, org_id)
+                cached_page = report_cache.get(cache_key, ledger_version)
+                if cached_page is not None:
+                    page = cached_page
+                else:
+                    page = fetch_ledger_page(
+                        db, org_id, selected_account_item, selected_fiscal_period,
+                        after=after, before=before, per_page=per_page,
                     )
+                    report_cache.set(cache_key, ledger_version, page)
 
         return render_template(
             "ledger/index.html",
@@ -1367,9 +1205,12 @@ def ledger():
             account_items=account_items,
             selected_fiscal_period=selected_fiscal_period,
             selected_account_item=selected_account_item,
-            opening_balance=opening_balance,
-            transactions=transactions,
-            monthly_totals=monthly_totals,
+            opening_balance=page["opening_balance"],
+            transactions=page["transactions"],
+            monthly_totals=page["monthly_totals"],
+            next_cursor=page["next_cursor"],
+            prev_cursor=page["prev_cursor"],
+            per_page=per_page,
             current_organization=get_current_organization(),
         )
     finally:
@@ -1377,6 +1218,161 @@ def ledger():
 
 
 
+# ========== エクスポート ==========
+
+
+def _get_export_period(db, organization_id, fiscal_period_id):
+    """エクスポート対象の会計期間を取得"""
+    if not fiscal_period_id:
+        return None
+    return (
+        db.query(FiscalPeriod)
+        .filter(
+            FiscalPeriod.id == fiscal_period_id,
+            FiscalPeriod.organization_id == organization_id,
+        )
+        .first()
+    )
+
+
+def _enqueue_export(db, report, export_format, fiscal_period, account_item=None):
+    """エクスポートをバックグラウンドジョブとして登録し、ステータスURLを返す"""
+    try:
+        job = enqueue_job(
+            db,
+            'report_export',
+            fiscal_period.organization_id,
+            user_id=session.get('user_id'),
+            params={
+                'report': report,
+                'format': export_format,
+                'fiscal_period_id': fiscal_period.id,
+                'account_item_id': account_item.id if account_item else None,
+            },
+        )
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': url_for('jobs.api_job_status', job_id=job.id),
+        }), 202
+    finally:
+        db.close()
+
+
+@bp.route('/general-ledger/export', methods=['GET'])
+@login_required
+def general_ledger_export():
+    """仕訳帳をエクスポート（CSV / Shift-JIS CSV / XLSX）"""
+    organization_id = get_current_organization_id()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash('エクスポート形式が正しくありません。', 'danger')
+        return redirect(url_for('reports.general_ledger'))
+
+    db = SessionLocal()
+    try:
+        fiscal_period = _get_export_period(db, organization_id, request.args.get('fiscal_period_id', type=int))
+        if fiscal_period is None:
+            db.close()
+            flash('会計期間を選択してください。', 'danger')
+            return redirect(url_for('reports.general_ledger'))
+
+        if request.args.get('background') == '1':
+            return _enqueue_export(db, 'journal', export_format, fiscal_period)
+
+        # PostgreSQL（psycopg）では仕訳の生データを COPY TO で出力できる
+        csv_chunks = None
+        if request.args.get('raw') == '1':
+            csv_chunks = iter_copy_csv(db, select_journal_entries(organization_id, fiscal_period))
+
+        filename, sheet_title = export_filename('journal', fiscal_period)
+        return export_response(
+            iter_journal_rows(db, organization_id, fiscal_period),
+            export_format,
+            filename=filename,
+            sheet_title=sheet_title,
+            on_close=db.close,
+            csv_chunks=csv_chunks,
+        )
+    except Exception:
+        db.close()
+        raise
+
+
+@bp.route('/ledger/export', methods=['GET'])
+@login_required
+def ledger_export():
+    """総勘定元帳をエクスポート（CSV / Shift-JIS CSV / XLSX）"""
+    org_id = get_current_organization_id()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash('エクスポート形式が正しくありません。', 'danger')
+        return redirect(url_for('reports.ledger'))
+
+    db = SessionLocal()
+    try:
+        fiscal_period = _get_export_period(db, org_id, request.args.get('fiscal_period_id', type=int))
+        account_item = (
+            db.query(AccountItem)
+            .filter_by(id=request.args.get('account_item_id', type=int), organization_id=org_id)
+            .first()
+        )
+        if fiscal_period is None or account_item is None:
+            db.close()
+            flash('会計期間と勘定科目を選択してください。', 'danger')
+            return redirect(url_for('reports.ledger'))
+
+        if request.args.get('background') == '1':
+            return _enqueue_export(db, 'ledger', export_format, fiscal_period, account_item)
+
+        filename, sheet_title = export_filename('ledger', fiscal_period, account_item)
+        return export_response(
+            iter_ledger_rows(db, org_id, account_item, fiscal_period),
+            export_format,
+            filename=filename,
+            sheet_title=sheet_title,
+            on_close=db.close,
+        )
+    except Exception:
+        db.close()
+        raise
+
+
+@bp.route('/trial-balance/export', methods=['GET'])
+@login_required
+def trial_balance_export():
+    """試算表をエクスポート（CSV / Shift-JIS CSV / XLSX）"""
+    organization_id = get_current_organization_id()
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash('エクスポート形式が正しくありません。', 'danger')
+        return redirect(url_for('reports.trial_balance'))
+
+    db = SessionLocal()
+    try:
+        fiscal_period = _get_export_period(db, organization_id, request.args.get('fiscal_period_id', type=int))
+        if fiscal_period is None:
+            db.close()
+            flash('会計期間を選択してください。', 'danger')
+            return redirect(url_for('reports.trial_balance'))
+
+        if request.args.get('background') == '1':
+            return _enqueue_export(db, 'trial_balance', export_format, fiscal_period)
+
+        filename, sheet_title = export_filename('trial_balance', fiscal_period)
+        return export_response(
+            iter_trial_balance_rows(db, organization_id, fiscal_period),
+            export_format,
+            filename=filename,
+            sheet_title=sheet_title,
+            on_close=db.close,
+        )
+    except Exception:
+        db.close()
+        raise
+
+
+
 # ========== タグマスターAPI =========
 
 # 取引先全件取得API (Tom Select用)
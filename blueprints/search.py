@@ -0,0 +1,108 @@
+"""
+search Blueprint
+出納帳・振替伝票・仕訳帳・取引明細の横断検索API
+"""
+
+from flask import Blueprint, request, redirect, url_for, session, jsonify
+from db import SessionLocal
+from search_utils import (
+    MAX_SEARCH_PER_PAGE,
+    SEARCH_PER_PAGE,
+    SEARCH_SOURCE_TYPES,
+    make_snippet,
+    search_documents,
+)
+from functools import wraps
+
+bp = Blueprint('search', __name__, url_prefix='')
+
+# 元データの種類 → 編集画面のエンドポイントとIDの引数名
+SOURCE_ENDPOINTS = {
+    'cash_book': ('cash_books.cash_book_edit', 'item_id'),
+    'journal_entry': ('journal_entries.journal_entry_edit', 'entry_id'),
+}
+
+# ヘルパー関数
+def login_required(f):
+    """ログインが必要なルートに付与するデコレーター"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('auth.login'))
+        if 'organization_id' not in session:
+            return redirect(url_for('auth.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def get_current_organization_id():
+    """現在ログイン中の事業所IDを取得"""
+    return session.get('organization_id')
+
+
+def _source_url(source_type, source_id):
+    """元データの編集画面のURL（画面がない種類は None）"""
+    endpoint = SOURCE_ENDPOINTS.get(source_type)
+    if endpoint is None:
+        return None
+    endpoint_name, argument = endpoint
+    return url_for(endpoint_name, **{argument: source_id})
+
+
+@bp.route('/api/search', methods=['GET'])
+@login_required
+def search_api():
+    """
+    横断検索API
+
+    クエリパラメーター:
+        q: 検索語（空白区切りで AND 検索）
+        types: 対象の元データの種類（カンマ区切り、省略時はすべて）
+        page, per_page: ページ番号・1ページの件数
+    """
+    query = request.args.get('q', '', type=str).strip()
+    page = max(request.args.get('page', default=1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', default=SEARCH_PER_PAGE, type=int), 1), MAX_SEARCH_PER_PAGE)
+
+    source_types = None
+    types_param = request.args.get('types', '', type=str)
+    if types_param:
+        source_types = [source_type.strip() for source_type in types_param.split(',') if source_type.strip()]
+        unknown = [source_type for source_type in source_types if source_type not in SEARCH_SOURCE_TYPES]
+        if unknown:
+            return jsonify({'success': False, 'message': f'不明な検索対象です: {", ".join(unknown)}'}), 400
+
+    if not query:
+        return jsonify({'success': False, 'message': '検索語を入力してください'}), 400
+
+    db = SessionLocal()
+    try:
+        documents, has_next = search_documents(
+            db,
+            get_current_organization_id(),
+            query,
+            source_types=source_types,
+            page=page,
+            per_page=per_page,
+        )
+        hits = [
+            {
+                'source_type': document.source_type,
+                'source_id': document.source_id,
+                'transaction_date': document.transaction_date.isoformat() if document.transaction_date else None,
+                'snippet': make_snippet(document.content, query),
+                'url': _source_url(document.source_type, document.source_id),
+            }
+            for document in documents
+        ]
+        return jsonify({
+            'success': True,
+            'query': query,
+            'page': page,
+            'per_page': per_page,
+            'has_next': has_next,
+            'hits': hits,
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'エラーが発生しました: {str(e)}'}), 500
+    finally:
+        db.close()
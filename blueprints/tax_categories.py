@@ -252,27 +252,22 @@ def import_tax_categories():
         db = SessionLocal()
         
         try:
-            # ファイルを読み込み
-            if file_type == 'csv':
-                rows = processor.read_csv_file(file_content)
-            else:
-                rows = processor.read_excel_file(file_content)
+            # ファイルを1行ずつ読み込み（Excelは読み取り専用モード）
+            rows = processor.iter_file_rows(io.BytesIO(file_content), file_type)
             
-            if rows is None or len(rows) == 0:
+            # 最初の行をヘッダーとして使用
+            headers = next(rows, None)
+            if headers is None:
                 return jsonify({
                     'success': False,
                     'message': 'ファイルが空です'
                 }), 400
             
-            # 最初の行をヘッダーとして使用
-            headers = rows[0] if len(rows) > 0 else []
-            data_rows = rows[1:] if len(rows) > 1 else []
-            
             imported_count = 0
             errors = []
-            
+
             # 各行を処理
-            for row_idx, row in enumerate(data_rows, start=2):
+            for row_idx, row in enumerate(rows, start=2):
                 try:
                     # 最低限必須列数を確認
                     if len(row) < 1:
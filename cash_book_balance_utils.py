@@ -0,0 +1,416 @@
+"""
+出納帳の残高（cash_books.balance / cash_book_monthly_balances）の管理モジュール
+口座（事業所・支払口座）ごとの残高を「前月までの月次合計 + 月初からの累計」に分けて保持する
+出納帳の追加・更新・削除では、その取引の月（区間）の月次合計に増減額を加算し、
+月次合計の行をロックしてから月初からの累計を計算し直すため、過去の日付への登録でも以降の全行を
+書き換えず、同じ口座・同じ月への同時の登録でも残高がずれない。残高の表示はページの行数と月数に比例する
+あわせて口座ごとの出納帳バージョン（cash_book_account_versions）を加算する（出納帳APIの ETag 用）
+"""
+
+from datetime import date
+from sqlalchemy import bindparam, delete, event, func, inspect as sa_inspect, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.attributes import set_committed_value
+from db import SessionLocal
+from models import CashBook, CashBookAccountVersion, CashBookMonthlyBalance, coerce_date
+from balance_utils import year_month_of, year_month_sql
+
+
+# 残高に影響するカラム（これ以外の変更では計算し直さない）
+BALANCE_FIELDS = ('organization_id', 'payment_account', 'transaction_date', 'amount_with_tax')
+
+
+def _segment(organization_id, payment_account, transaction_date):
+    """(事業所, 支払口座, 年月) の区間（支払口座の未設定は空文字にまとめる）"""
+    year_month = year_month_of(coerce_date(transaction_date))
+    if organization_id is None or year_month is None:
+        return None
+    return (organization_id, payment_account or '', year_month)
+
+
+def _payment_account_condition(payment_account):
+    """支払口座の条件（空文字は NULL も含める）"""
+    if payment_account:
+        return CashBook.payment_account == payment_account
+    return or_(CashBook.payment_account.is_(None), CashBook.payment_account == '')
+
+
+def _month_range(year_month):
+    """年月（YYYY-MM）の初日と翌月の初日"""
+    year, month = int(year_month[:4]), int(year_month[5:7])
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def _add_delta(deltas, segment, amount):
+    """区間の増減額を加算（区間が無い行は無視）"""
+    if segment is not None:
+        deltas[segment] = deltas.get(segment, 0) + (amount or 0)
+
+
+def _upsert_monthly_deltas(connection, rows):
+    """
+    月次合計に増減額を加算（無ければ作成）
+
+    加算した行はトランザクションの終了までロックされるため、同じ区間への同時の書き込みは
+    先のトランザクションのコミットを待ってから加算する
+    """
+    table = CashBookMonthlyBalance.__table__
+    dialect_name = connection.dialect.name
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['organization_id', 'payment_account', 'year_month'],
+            set_={'net_amount': table.c.net_amount + stmt.excluded.net_amount},
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # その他のDBは UPDATE して対象が無ければ INSERT
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.organization_id == row['organization_id'],
+                table.c.payment_account == row['payment_account'],
+                table.c.year_month == row['year_month'],
+            )
+            .values(net_amount=table.c.net_amount + row['net_amount'])
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), [row])
+
+
+def recompute_cash_book_segments(db, deltas):
+    """
+    区間（事業所, 支払口座, 年月）ごとの増減額を月次合計に加算し、月初からの累計を計算し直す
+
+    月次合計は増減額の加算（upsert）で更新し、区間の行を SELECT ... FOR UPDATE でロックしてから
+    その月の累計を計算し直す（同じ区間への同時の書き込みは順番に処理される）。
+    累計が変わった行だけを更新し、セッション内のインスタンスの残高も合わせる
+
+    Args:
+        deltas: {区間: 入出金の増減額}（月内の並び替えだけの場合は0）
+    """
+    segments = sorted(segment for segment in deltas if segment is not None)
+    if not segments:
+        return
+    connection = db.connection()
+    table = CashBook.__table__
+    monthly_table = CashBookMonthlyBalance.__table__
+
+    # デッドロックを避けるため、常に区間の順に加算・ロックする
+    _upsert_monthly_deltas(connection, [
+        {
+            'organization_id': organization_id,
+            'payment_account': payment_account,
+            'year_month': year_month,
+            'net_amount': deltas[(organization_id, payment_account, year_month)],
+        }
+        for organization_id, payment_account, year_month in segments
+    ])
+
+    updates = []
+    for organization_id, payment_account, year_month in segments:
+        segment_condition = (
+            monthly_table.c.organization_id == organization_id,
+            monthly_table.c.payment_account == payment_account,
+            monthly_table.c.year_month == year_month,
+        )
+        connection.execute(select(monthly_table.c.id).where(*segment_condition).with_for_update())
+
+        start, end = _month_range(year_month)
+        rows = connection.execute(
+            select(CashBook.id, CashBook.amount_with_tax, CashBook.balance)
+            .where(
+                CashBook.organization_id == organization_id,
+                _payment_account_condition(payment_account),
+                CashBook.transaction_date >= start,
+                CashBook.transaction_date < end,
+            )
+            .order_by(CashBook.transaction_date, CashBook.id)
+        ).all()
+        running = 0
+        for cash_book_id, amount_with_tax, balance in rows:
+            running += amount_with_tax or 0
+            if balance != running:
+                updates.append({'cash_book_id': cash_book_id, 'new_balance': running})
+        if not rows:
+            # 出納帳が無くなった月の月次合計は削除する
+            connection.execute(delete(monthly_table).where(*segment_condition))
+
+    if updates:
+        connection.execute(
+            update(table).where(table.c.id == bindparam('cash_book_id')).values(balance=bindparam('new_balance')),
+            updates,
+        )
+        # 更新した行がセッションに読み込まれていれば、残高を変更なしの状態で書き換える
+        for row in updates:
+            obj = db.identity_map.get(db.identity_key(CashBook, row['cash_book_id']))
+            if obj is not None:
+                set_committed_value(obj, 'balance', row['new_balance'])
+
+
+def get_cash_book_versions(db, organization_id, payment_accounts):
+    """
+    口座ごとの出納帳バージョンを取得（未作成の場合は0）
+
+    Returns:
+        dict: {支払口座: バージョン}
+    """
+    keys = sorted({payment_account or '' for payment_account in payment_accounts})
+    versions = {key: 0 for key in keys}
+    if keys:
+        versions.update(db.execute(
+            select(CashBookAccountVersion.payment_account, CashBookAccountVersion.version)
+            .where(
+                CashBookAccountVersion.organization_id == organization_id,
+                CashBookAccountVersion.payment_account.in_(keys),
+            )
+        ).all())
+    return versions
+
+
+def bump_cash_book_versions(db, accounts):
+    """口座（事業所, 支払口座）ごとの出納帳バージョンを加算（無ければ作成）"""
+    accounts = sorted({(organization_id, payment_account or '') for organization_id, payment_account in accounts
+                       if organization_id is not None})
+    if not accounts:
+        return
+    table = CashBookAccountVersion.__table__
+    connection = db.connection()
+    dialect_name = connection.dialect.name
+    rows = [
+        {'organization_id': organization_id, 'payment_account': payment_account, 'version': 1}
+        for organization_id, payment_account in accounts
+    ]
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['organization_id', 'payment_account'],
+            set_={'version': table.c.version + 1},
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # その他のDBは UPDATE して対象が無ければ INSERT
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(
+                table.c.organization_id == row['organization_id'],
+                table.c.payment_account == row['payment_account'],
+            )
+            .values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), [row])
+
+
+def _segment_of_instance(obj):
+    return _segment(obj.organization_id, obj.payment_account, obj.transaction_date)
+
+
+def _balance_changed(obj):
+    state = sa_inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in BALANCE_FIELDS)
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _collect_cash_book_segments(session, flush_context, instances):
+    """フラッシュ前に更新・削除される出納帳の変更前の区間・金額・口座をDBから取得"""
+    modified = [
+        obj
+        for obj in session.dirty
+        if isinstance(obj, CashBook) and obj.id is not None and session.is_modified(obj, include_collections=False)
+    ]
+    balance_ids = {obj.id for obj in modified if _balance_changed(obj)}
+    deleted_ids = {obj.id for obj in session.deleted if isinstance(obj, CashBook) and obj.id is not None}
+    ids = {obj.id for obj in modified} | deleted_ids
+
+    deltas = {}
+    accounts = set()
+    if ids:
+        rows = session.connection().execute(
+            select(
+                CashBook.id,
+                CashBook.organization_id,
+                CashBook.payment_account,
+                CashBook.transaction_date,
+                CashBook.amount_with_tax,
+            )
+            .where(CashBook.id.in_(sorted(ids)))
+        )
+        for cash_book_id, organization_id, payment_account, transaction_date, amount_with_tax in rows:
+            accounts.add((organization_id, payment_account))
+            if cash_book_id in balance_ids or cash_book_id in deleted_ids:
+                # 変更前の区間から変更前の金額を差し引く
+                _add_delta(deltas, _segment(organization_id, payment_account, transaction_date), -(amount_with_tax or 0))
+    session.info['cash_book_deltas'] = deltas
+    session.info['cash_book_accounts'] = accounts
+    session.info['cash_book_modified_ids'] = {obj.id for obj in modified}
+    session.info['cash_book_balance_ids'] = balance_ids
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _recompute_cash_book_balances_on_flush(session, flush_context):
+    """出納帳の追加・更新・削除の前後の区間の残高を計算し直し、口座のバージョンを加算"""
+    deltas = session.info.pop('cash_book_deltas', {})
+    accounts = session.info.pop('cash_book_accounts', set())
+    modified_ids = session.info.pop('cash_book_modified_ids', set())
+    balance_ids = session.info.pop('cash_book_balance_ids', set())
+    for obj in session.new:
+        if isinstance(obj, CashBook):
+            _add_delta(deltas, _segment_of_instance(obj), obj.amount_with_tax)
+            accounts.add((obj.organization_id, obj.payment_account))
+    for obj in session.dirty:
+        if isinstance(obj, CashBook) and obj.id in modified_ids:
+            accounts.add((obj.organization_id, obj.payment_account))
+            if obj.id in balance_ids:
+                # 変更後の区間に変更後の金額を加える
+                _add_delta(deltas, _segment_of_instance(obj), obj.amount_with_tax)
+    recompute_cash_book_segments(session, deltas)
+    bump_cash_book_versions(session, accounts)
+
+
+def cash_book_segment_deltas(rows):
+    """出納帳の行（辞書）の区間ごとの増減額（一括登録後の計算し直し用）"""
+    deltas = {}
+    for row in rows:
+        _add_delta(
+            deltas,
+            _segment(row['organization_id'], row.get('payment_account'), row['transaction_date']),
+            row.get('amount_with_tax'),
+        )
+    return deltas
+
+
+def opening_balances_by_month(db, organization_id, payment_accounts, month_to):
+    """
+    口座・年月ごとの月初残高（前月までの月次合計の累計）を求める
+
+    Args:
+        payment_accounts: 支払口座のリスト
+        month_to: 対象の最後の年月（YYYY-MM、含む）
+
+    Returns:
+        dict: {支払口座: [(年月, 月初残高), ...]}（年月の昇順、月次集計のある月のみ）
+    """
+    keys = sorted({payment_account or '' for payment_account in payment_accounts})
+    if not keys:
+        return {}
+    rows = db.execute(
+        select(CashBookMonthlyBalance.payment_account, CashBookMonthlyBalance.year_month, CashBookMonthlyBalance.net_amount)
+        .where(
+            CashBookMonthlyBalance.organization_id == organization_id,
+            CashBookMonthlyBalance.payment_account.in_(keys),
+            CashBookMonthlyBalance.year_month <= month_to,
+        )
+        .order_by(CashBookMonthlyBalance.payment_account, CashBookMonthlyBalance.year_month)
+    ).all()
+    openings = {key: [] for key in keys}
+    totals = {}
+    for payment_account, year_month, net_amount in rows:
+        opening = totals.get(payment_account, 0)
+        openings[payment_account].append((year_month, opening))
+        totals[payment_account] = opening + (net_amount or 0)
+    return openings
+
+
+def attach_running_balances(db, organization_id, rows):
+    """
+    出納帳の行の口座残高（その行までの累計）を求める
+
+    行は id・payment_account・transaction_date・balance（月初からの累計）を持つもの
+    月次集計の読み込み1回で、ページの行数によらず求められる
+
+    Returns:
+        dict: {出納帳ID: 残高}
+    """
+    rows = [row for row in rows if row.transaction_date is not None]
+    if not rows:
+        return {}
+    month_to = max(year_month_of(coerce_date(row.transaction_date)) for row in rows)
+    openings = opening_balances_by_month(db, organization_id, [row.payment_account for row in rows], month_to)
+    opening_lookup = {
+        (payment_account, year_month): opening
+        for payment_account, months in openings.items()
+        for year_month, opening in months
+    }
+    return {
+        row.id: opening_lookup.get(
+            (row.payment_account or '', year_month_of(coerce_date(row.transaction_date))), 0
+        ) + (row.balance or 0)
+        for row in rows
+    }
+
+
+def rebuild_cash_book_balances(db, organization_id=None):
+    """
+    出納帳の月初からの累計と月次集計を作り直す
+
+    Args:
+        organization_id: 対象の事業所ID（None の場合は全事業所）
+
+    Returns:
+        int: 作成した月次集計の行数
+    """
+    table = CashBook.__table__
+    monthly_table = CashBookMonthlyBalance.__table__
+    connection = db.connection()
+    payment_account = func.coalesce(table.c.payment_account, '')
+    year_month = year_month_sql(table.c.transaction_date)
+
+    conditions = []
+    if organization_id is not None:
+        conditions.append(table.c.organization_id == organization_id)
+
+    running = (
+        select(
+            table.c.id,
+            func.sum(table.c.amount_with_tax).over(
+                partition_by=(table.c.organization_id, payment_account, year_month),
+                order_by=(table.c.transaction_date, table.c.id),
+            ).label('running'),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+    connection.execute(
+        update(table)
+        .where(table.c.id == running.c.id)
+        .values(balance=running.c.running)
+    )
+
+    stmt = delete(monthly_table)
+    if organization_id is not None:
+        stmt = stmt.where(monthly_table.c.organization_id == organization_id)
+    connection.execute(stmt)
+
+    result = connection.execute(
+        monthly_table.insert().from_select(
+            ['organization_id', 'payment_account', 'year_month', 'net_amount'],
+            select(table.c.organization_id, payment_account, year_month, func.sum(table.c.amount_with_tax))
+            .where(*conditions)
+            .group_by(table.c.organization_id, payment_account, year_month),
+        )
+    )
+    return result.rowcount
+
+
+def ensure_cash_book_balances(db):
+    """月次集計が空で出納帳が存在する場合（テーブル新規作成直後など）に作り直す"""
+    has_balances = db.execute(select(CashBookMonthlyBalance.id).limit(1)).first()
+    if has_balances:
+        return False
+    has_cash_books = db.execute(select(CashBook.id).limit(1)).first()
+    if not has_cash_books:
+        return False
+    rebuild_cash_book_balances(db)
+    db.commit()
+    return True
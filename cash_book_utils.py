@@ -0,0 +1,544 @@
+"""
+出納帳のユーティリティモジュール
+口座ごとの出納帳の件数・ページ・登録数内訳（連続仕訳・取引明細・振替伝票）を
+口座の数によらず一定回数の GROUP BY / ウィンドウ関数のクエリで求める
+連続仕訳の一括登録も、行数によらず一定回数の一括 INSERT で行う
+"""
+
+from datetime import datetime
+from sqlalchemy import and_, case, func, or_, select
+from models import Account, AccountItem, CashBook, GeneralLedger, ImportedTransaction, LedgerLine, TaxCategory
+from ledger_utils import BATCH_ENTRY_SOURCE_TYPES, delete_ledger_entries, insert_ledger_entries, insert_rows_returning_ids
+from search_utils import apply_search_document_changes, matching_source_ids
+from closing_utils import closed_period_message, find_closed_period, load_closed_periods
+from cash_book_balance_utils import attach_running_balances, bump_cash_book_versions, cash_book_segment_deltas, recompute_cash_book_segments
+from report_utils import format_ledger_cursor, parse_ledger_cursor
+
+
+# 口座ごとの1ページの件数
+CASH_BOOK_PER_PAGE = 20
+
+# 出納帳APIの1回の取得件数（既定値・上限）
+CASH_BOOK_API_DEFAULT_LIMIT = 50
+CASH_BOOK_API_MAX_LIMIT = 500
+
+# 出納帳APIで返す項目（fields パラメーターで選択できる）
+CASH_BOOK_API_FIELDS = (
+    'id',
+    'transaction_date',
+    'account_name',
+    'account_item_id',
+    'account_item_name',
+    'tax_category_id',
+    'tax_category',
+    'counterparty',
+    'item_name',
+    'department',
+    'memo_tag',
+    'deposit_amount',
+    'withdrawal_amount',
+    'tax_amount',
+    'balance',
+    'remarks',
+)
+
+# 勘定科目が未設定の口座は口座名から勘定科目を推測する（現金・普通預金など）
+DEFAULT_ACCOUNT_ITEM_IDS = {
+    '現金': 1,
+    '三井住友銀行': 2,
+    '三菱ＵＦＪ銀行': 2,
+}
+
+
+def account_item_id_for_account(account):
+    """口座に対応する勘定科目IDを取得（不明な場合は None）"""
+    if account.account_item_id:
+        return account.account_item_id
+    return DEFAULT_ACCOUNT_ITEM_IDS.get(account.account_name)
+
+
+def _cash_book_conditions(db, organization_id, account_names, search_query=None):
+    conditions = [
+        CashBook.organization_id == organization_id,
+        CashBook.payment_account.in_(account_names),
+    ]
+    if search_query:
+        # 備考や取引先などに対して全文検索インデックスで部分一致検索
+        conditions.append(CashBook.id.in_(matching_source_ids(db, organization_id, 'cash_book', search_query)))
+    return conditions
+
+
+def count_cash_books_by_account(db, organization_id, account_names, search_query=None):
+    """
+    口座ごとの出納帳の件数
+
+    Returns:
+        dict: {口座名: 件数}
+    """
+    if not account_names:
+        return {}
+    rows = db.execute(
+        select(CashBook.payment_account, func.count(CashBook.id))
+        .where(*_cash_book_conditions(db, organization_id, account_names, search_query))
+        .group_by(CashBook.payment_account)
+    ).all()
+    return {payment_account: count for payment_account, count in rows}
+
+
+def fetch_cash_book_pages(db, organization_id, account_names, page=1, per_page=CASH_BOOK_PER_PAGE, search_query=None):
+    """
+    口座ごとの出納帳の1ページ分（取引日の降順）を1回のクエリで取得
+
+    口座ごとに ROW_NUMBER() で連番を付け、ページの範囲の行だけを返す
+
+    Returns:
+        dict: {口座名: [行, ...]}（行は id, transaction_date, account_item_name, counterparty,
+              item_name, remarks, amount_with_tax, tax_amount, balance（月初からの累計）を持つ）
+    """
+    if not account_names:
+        return {}
+    row_number = func.row_number().over(
+        partition_by=CashBook.payment_account,
+        order_by=(CashBook.transaction_date.desc(), CashBook.id.desc()),
+    ).label('row_number')
+    numbered = (
+        select(
+            CashBook.id,
+            CashBook.payment_account,
+            CashBook.transaction_date,
+            CashBook.account_item_id,
+            CashBook.counterparty,
+            CashBook.item_name,
+            CashBook.remarks,
+            CashBook.amount_with_tax,
+            CashBook.tax_amount,
+            CashBook.balance,
+            row_number,
+        )
+        .where(*_cash_book_conditions(db, organization_id, account_names, search_query))
+        .subquery()
+    )
+    offset = (page - 1) * per_page
+    rows = db.execute(
+        select(numbered, AccountItem.account_name.label('account_item_name'))
+        .outerjoin(AccountItem, AccountItem.id == numbered.c.account_item_id)
+        .where(numbered.c.row_number > offset, numbered.c.row_number <= offset + per_page)
+        .order_by(numbered.c.payment_account, numbered.c.row_number)
+    ).all()
+
+    pages = {}
+    for row in rows:
+        pages.setdefault(row.payment_account, []).append(row)
+    return pages
+
+
+def format_cash_book_cursor(row):
+    """出納帳APIのカーソル文字列（YYYY-MM-DD_出納帳ID）"""
+    return format_ledger_cursor(row.transaction_date, row.id)
+
+
+def parse_cash_book_cursor(cursor):
+    """出納帳APIのカーソル文字列を (取引日, 出納帳ID) に変換（不正な場合は None）"""
+    return parse_ledger_cursor(cursor)
+
+
+def fetch_cash_book_entries(db, organization_id, payment_accounts, limit=CASH_BOOK_API_DEFAULT_LIMIT, before=None):
+    """
+    口座の出納帳を新しい順（取引日・IDの降順）に1ページ分取得（キーセットページング）
+
+    Args:
+        payment_accounts: 支払口座のリスト（空文字は未設定の行も含める。None の場合はすべての口座）
+        before: カーソル (取引日, 出納帳ID)。指定した行より古い行を返す
+
+    Returns:
+        tuple: (行のリスト, 次のページのカーソル（最後のページの場合は None）)
+              行は CASH_BOOK_API_FIELDS の値を作るための項目（account_item_name, tax_category_name を含む）を持つ
+    """
+    conditions = [CashBook.organization_id == organization_id]
+    if payment_accounts is not None:
+        account_conditions = [CashBook.payment_account.in_([name for name in payment_accounts if name])]
+        if '' in payment_accounts or None in payment_accounts:
+            account_conditions.append(CashBook.payment_account.is_(None))
+            account_conditions.append(CashBook.payment_account == '')
+        conditions.append(or_(*account_conditions))
+    if before is not None:
+        transaction_date, cash_book_id = before
+        conditions.append(or_(
+            CashBook.transaction_date < transaction_date,
+            and_(CashBook.transaction_date == transaction_date, CashBook.id < cash_book_id),
+        ))
+
+    # 1件多く取得して次のページの有無を判定する
+    rows = db.execute(
+        select(
+            CashBook.id,
+            CashBook.transaction_date,
+            CashBook.payment_account,
+            CashBook.account_item_id,
+            AccountItem.account_name.label('account_item_name'),
+            CashBook.tax_category_id,
+            TaxCategory.name.label('tax_category_name'),
+            CashBook.tax_rate,
+            CashBook.counterparty,
+            CashBook.item_name,
+            CashBook.department,
+            CashBook.memo_tag,
+            CashBook.amount_with_tax,
+            CashBook.tax_amount,
+            CashBook.balance,
+            CashBook.remarks,
+        )
+        .outerjoin(AccountItem, AccountItem.id == CashBook.account_item_id)
+        .outerjoin(TaxCategory, TaxCategory.id == CashBook.tax_category_id)
+        .where(*conditions)
+        .order_by(CashBook.transaction_date.desc(), CashBook.id.desc())
+        .limit(limit + 1)
+    ).all()
+    next_cursor = format_cash_book_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def cash_book_entries_to_dicts(db, organization_id, rows, fields=CASH_BOOK_API_FIELDS):
+    """fetch_cash_book_entries の行を出納帳APIの辞書に変換（残高は口座残高）"""
+    running_balances = attach_running_balances(db, organization_id, rows) if 'balance' in fields else {}
+    entries = []
+    for row in rows:
+        amount = row.amount_with_tax or 0
+        values = {
+            'id': row.id,
+            'transaction_date': str(row.transaction_date),
+            'account_name': row.payment_account or '',
+            'account_item_id': row.account_item_id,
+            'account_item_name': row.account_item_name or '',
+            'tax_category_id': row.tax_category_id,
+            'tax_category': row.tax_category_name or row.tax_rate or '',
+            'counterparty': row.counterparty or '',
+            'item_name': row.item_name or '',
+            'department': row.department or '',
+            'memo_tag': row.memo_tag or '',
+            # 入金・出金を判定
+            'deposit_amount': amount if amount > 0 else None,
+            'withdrawal_amount': abs(amount) if amount < 0 else None,
+            'tax_amount': row.tax_amount or 0,
+            'balance': running_balances.get(row.id),
+            'remarks': row.remarks or '',
+        }
+        entries.append({field: values[field] for field in fields})
+    return entries
+
+
+def aggregate_account_source_stats(db, organization_id, account_item_ids):
+    """
+    勘定科目ごとの登録数内訳（元データの件数）を1回のクエリで集計
+
+    仕訳明細（ledger_lines）から勘定科目の仕訳を引き、元データの種類ごとに
+    source_id の重複を除いて数える。取引明細は処理状況（未処理・処理済み）別に数える
+
+    Returns:
+        dict: {account_item_id: {'batch', 'transaction_unprocessed', 'transaction_processed', 'journal'}}
+    """
+    stats = {
+        account_item_id: {'batch': 0, 'transaction_unprocessed': 0, 'transaction_processed': 0, 'journal': 0}
+        for account_item_id in account_item_ids
+    }
+    if not stats:
+        return stats
+
+    category = case(
+        (GeneralLedger.source_type.in_(BATCH_ENTRY_SOURCE_TYPES), 'batch'),
+        (GeneralLedger.source_type == 'journal_entry', 'journal'),
+        else_='transaction',
+    ).label('category')
+    rows = db.execute(
+        select(
+            LedgerLine.account_item_id,
+            category,
+            ImportedTransaction.status,
+            func.count(func.distinct(GeneralLedger.source_id)),
+        )
+        .join(GeneralLedger, GeneralLedger.id == LedgerLine.general_ledger_id)
+        .outerjoin(
+            ImportedTransaction,
+            (GeneralLedger.source_type == 'imported_transaction')
+            & (ImportedTransaction.id == GeneralLedger.source_id),
+        )
+        .where(
+            LedgerLine.organization_id == organization_id,
+            LedgerLine.account_item_id.in_(sorted(stats)),
+            GeneralLedger.source_type.in_(BATCH_ENTRY_SOURCE_TYPES + ['journal_entry', 'imported_transaction']),
+        )
+        .group_by(LedgerLine.account_item_id, category, ImportedTransaction.status)
+    ).all()
+
+    for account_item_id, source_category, status, count in rows:
+        if source_category == 'transaction':
+            if status == 0:
+                stats[account_item_id]['transaction_unprocessed'] += count
+            elif status == 1:
+                stats[account_item_id]['transaction_processed'] += count
+        else:
+            stats[account_item_id][source_category] += count
+    return stats
+
+
+# 連続仕訳の一括登録で事業所の勘定科目名から引く勘定科目
+CASH_ACCOUNT_ITEM_NAME = '現金'
+BANK_ACCOUNT_ITEM_NAME = '普通預金'
+TAX_ACCOUNT_ITEM_NAMES = ('仮払消費税', '仮受消費税')
+
+
+def _to_int(value):
+    """整数に変換（変換できない場合は None）"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_batch_lookups(db, organization_id, transactions):
+    """
+    一括登録の検証に使う勘定科目・口座をまとめて取得
+
+    Returns:
+        tuple: (存在する勘定科目IDの集合, {口座ID: 口座の行}, {勘定科目名: 勘定科目ID})
+    """
+    account_item_ids = {_to_int(transaction.get('account_item_id')) for transaction in transactions} - {None}
+    account_ids = {_to_int(transaction.get('account_id')) for transaction in transactions} - {None}
+
+    existing_account_item_ids = set()
+    if account_item_ids:
+        existing_account_item_ids = set(db.execute(
+            select(AccountItem.id).where(AccountItem.id.in_(sorted(account_item_ids)))
+        ).scalars())
+
+    accounts = {}
+    if account_ids:
+        accounts = {
+            row.id: row
+            for row in db.execute(
+                select(Account.id, Account.account_name, Account.account_item_id, Account.account_type)
+                .where(Account.id.in_(sorted(account_ids)))
+            )
+        }
+
+    # 同名の勘定科目が複数ある場合は最も古いものを使う
+    named_account_item_ids = dict(db.execute(
+        select(AccountItem.account_name, func.min(AccountItem.id))
+        .where(
+            AccountItem.organization_id == organization_id,
+            AccountItem.account_name.in_((CASH_ACCOUNT_ITEM_NAME, BANK_ACCOUNT_ITEM_NAME) + TAX_ACCOUNT_ITEM_NAMES),
+        )
+        .group_by(AccountItem.account_name)
+    ).all())
+    return existing_account_item_ids, accounts, named_account_item_ids
+
+
+def _account_item_id_for_batch_account(account, named_account_item_ids):
+    """口座の勘定科目ID（未設定の場合は口座種別から現金・普通預金を推測、不明な場合は None）"""
+    if account.account_item_id:
+        return account.account_item_id
+    if account.account_type:
+        account_type = account.account_type.lower()
+        if 'cash' in account_type:
+            return named_account_item_ids.get(CASH_ACCOUNT_ITEM_NAME)
+        if 'bank' in account_type:
+            return named_account_item_ids.get(BANK_ACCOUNT_ITEM_NAME)
+    return None
+
+
+def _validate_batch_row(idx, transaction, existing_account_item_ids, accounts, named_account_item_ids):
+    """
+    一括登録の1行を検証して出納帳の登録内容に変換
+
+    Returns:
+        tuple: (登録内容の辞書, None) または (None, エラーメッセージ)
+    """
+    row_label = f'行 {idx + 1}'
+
+    # 必須フィールドのチェック
+    if not transaction.get('transaction_date'):
+        return None, f'{row_label}: 取引日が必要です'
+    if not transaction.get('account_item_id'):
+        return None, f'{row_label}: 勘定科目が必要です'
+    if not transaction.get('account_id'):
+        return None, f'{row_label}: 口座が必要です'
+
+    # 入金または出金のどちらかが必須（入金は正の値、出金は負の値）
+    deposit_amount = transaction.get('deposit_amount')
+    withdrawal_amount = transaction.get('withdrawal_amount')
+    if not deposit_amount and not withdrawal_amount:
+        return None, f'{row_label}: 入金または出金のどちらかが必須です'
+    amount_with_tax = _to_int(deposit_amount) if deposit_amount else _to_int(withdrawal_amount)
+    if amount_with_tax is None:
+        return None, f'{row_label}: 金額の形式が不正です'
+    if not deposit_amount:
+        amount_with_tax = -amount_with_tax
+
+    account_item_id = _to_int(transaction.get('account_item_id'))
+    if account_item_id is None:
+        return None, f'{row_label}: 勘定科目IDが不正です'
+    if account_item_id not in existing_account_item_ids:
+        return None, f'{row_label}: 勘定科目が見つかりません'
+
+    try:
+        transaction_date = datetime.strptime(transaction.get('transaction_date'), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None, f'{row_label}: 取引日の形式が不正です'
+
+    tax_category_id = transaction.get('tax_category_id')
+    if tax_category_id == '':
+        tax_category_id = None
+    else:
+        tax_category_id = _to_int(tax_category_id)
+        if tax_category_id is None:
+            return None, f'{row_label}: 税区分IDの形式が不正です'
+
+    account_id = _to_int(transaction.get('account_id'))
+    if account_id is None:
+        return None, f'{row_label}: 口座IDが不正です'
+    account = accounts.get(account_id)
+    if account is None:
+        return None, f'{row_label}: 口座が見つかりません'
+
+    account_item_id_for_account = _account_item_id_for_batch_account(account, named_account_item_ids)
+    if not account_item_id_for_account:
+        return None, (
+            f'{row_label}: 口座に紐づく勘定科目が設定されていません。'
+            '口座マスタで勘定科目を設定してください。'
+        )
+
+    # tax_amount は現状フロントで計算されていないため 0
+    tax_amount = 0
+    return {
+        'transaction_date': transaction_date,
+        'account_item_id': account_item_id,
+        'account_item_id_for_account': account_item_id_for_account,
+        'tax_category_id': tax_category_id,
+        'payment_account': account.account_name,
+        'remarks': transaction.get('remarks') or '',
+        'amount_with_tax': amount_with_tax,
+        'amount_without_tax': abs(amount_with_tax) - abs(tax_amount),
+        'tax_amount': tax_amount,
+    }, None
+
+
+def _batch_ledger_rows(organization_id, row, cash_book_id, tax_account_item_id, now):
+    """
+    一括登録の1行から仕訳（辞書）のリストを作成
+
+    税額がある場合は税抜金額と税額の2本、ない場合は税込金額の1本（金額が0の場合は作成しない）
+    入金は借方=口座・貸方=取引勘定科目、出金は借方=取引勘定科目・貸方=口座
+    """
+    amount_with_tax = row['amount_with_tax']
+    is_deposit = amount_with_tax >= 0
+    account_side = row['account_item_id_for_account']
+
+    def ledger_row(counter_side, amount, summary, source_type):
+        debit, credit = (account_side, counter_side) if is_deposit else (counter_side, account_side)
+        return {
+            'organization_id': organization_id,
+            'transaction_date': row['transaction_date'],
+            'debit_account_item_id': debit,
+            'debit_amount': amount,
+            'credit_account_item_id': credit,
+            'credit_amount': amount,
+            'summary': summary,
+            'source_type': source_type,
+            'source_id': cash_book_id,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    if row['tax_amount'] != 0 and tax_account_item_id:
+        rows = []
+        if row['amount_without_tax'] != 0:
+            rows.append(ledger_row(row['account_item_id'], abs(row['amount_without_tax']), row['remarks'], 'batch_entry_net'))
+        rows.append(ledger_row(tax_account_item_id, abs(row['tax_amount']), row['remarks'] + ' (消費税)', 'batch_entry_tax'))
+        return rows
+    if amount_with_tax != 0:
+        return [ledger_row(row['account_item_id'], abs(amount_with_tax), row['remarks'], 'batch_entry')]
+    return []
+
+
+def post_cash_book_batch(db, organization_id, transactions):
+    """
+    出納帳の一括登録（連続仕訳）
+
+    勘定科目・口座をまとめて取得して全行を検証してから、出納帳と仕訳を
+    それぞれ1回の一括 INSERT（RETURNING で ID を取得）で登録する
+    エラーの行（締め済みの会計期間の行を含む）は登録せず、エラーメッセージを返す（コミットは呼び出し側で行う）
+
+    Returns:
+        tuple: (仕訳を作成した件数, 出納帳を作成した件数, 行ごとのエラーメッセージのリスト)
+    """
+    existing_account_item_ids, accounts, named_account_item_ids = _load_batch_lookups(db, organization_id, transactions)
+    closed_periods = load_closed_periods(db, organization_id)
+
+    valid_rows = []
+    errors = []
+    for idx, transaction in enumerate(transactions):
+        row, error = _validate_batch_row(idx, transaction, existing_account_item_ids, accounts, named_account_item_ids)
+        if error is None:
+            # 締め済みの会計期間の行は登録しない（他の行は登録する）
+            closed_period = find_closed_period(closed_periods, row['transaction_date'])
+            if closed_period is not None:
+                error = f'行 {idx + 1}: {closed_period_message(closed_period, row["transaction_date"])}'
+        if error:
+            errors.append(error)
+        else:
+            valid_rows.append(row)
+    if not valid_rows:
+        return 0, 0, errors
+
+    cash_book_rows = [
+        {
+            'organization_id': organization_id,
+            'transaction_date': row['transaction_date'],
+            'account_item_id': row['account_item_id'],
+            'counterparty': '',
+            'item_name': '',
+            'tax_category_id': row['tax_category_id'],
+            'tax_rate': '',
+            'department': '',
+            'memo_tag': '',
+            'payment_account': row['payment_account'],
+            'remarks': row['remarks'].strip(),
+            'amount_with_tax': row['amount_with_tax'],
+            'amount_without_tax': row['amount_without_tax'],
+            'tax_amount': row['tax_amount'],
+            'balance': 0,
+        }
+        for row in valid_rows
+    ]
+    cash_book_ids = insert_rows_returning_ids(db, CashBook.__table__, cash_book_rows)
+    recompute_cash_book_segments(db, cash_book_segment_deltas(cash_book_rows))
+    bump_cash_book_versions(db, {(organization_id, row['payment_account']) for row in cash_book_rows})
+    apply_search_document_changes(
+        db,
+        'cash_book',
+        added=[dict(cash_book_row, id=cash_book_id) for cash_book_row, cash_book_id in zip(cash_book_rows, cash_book_ids)],
+    )
+
+    # 削除済みの出納帳のIDが再利用された場合に備え、同じIDの連続仕訳を削除
+    delete_ledger_entries(
+        db,
+        GeneralLedger.source_type.in_(BATCH_ENTRY_SOURCE_TYPES),
+        GeneralLedger.source_id.in_(cash_book_ids),
+    )
+
+    # 仮払消費税 / 仮受消費税 の勘定科目（将来税額対応時用）
+    tax_account_item_id = next(
+        (named_account_item_ids[name] for name in TAX_ACCOUNT_ITEM_NAMES if name in named_account_item_ids),
+        None,
+    )
+    now = datetime.now().replace(microsecond=0)
+    created_count = 0
+    ledger_rows = []
+    for row, cash_book_id in zip(valid_rows, cash_book_ids):
+        rows = _batch_ledger_rows(organization_id, row, cash_book_id, tax_account_item_id, now)
+        if rows:
+            created_count += 1
+            ledger_rows.extend(rows)
+    insert_ledger_entries(db, ledger_rows)
+
+    return created_count, len(cash_book_ids), errors
@@ -0,0 +1,307 @@
+"""
+帳票・出納帳・振替伝票の画面が発行するクエリの実行計画をチェックするスクリプト
+
+reports / cash_books / journal_entries の画面（GET）をテストクライアントで実際に呼び出し、
+発行された general_ledger・ledger_lines・cash_books への SELECT をすべて記録して実行計画を確認する
+全表スキャン（SQLite の EXPLAIN QUERY PLAN の「SCAN テーブル」、PostgreSQL の EXPLAIN の
+「Seq Scan」）が1つでもあれば終了コード 1 を返す（インデックスの追加漏れ・クエリの退行の検知用）
+
+PostgreSQL ではテーブルが小さいと常に Seq Scan が選ばれるため、enable_seqscan を off にして確認する
+SQLite で少量のテストデータに ANALYZE を実行していると、統計情報により全表スキャンが選ばれることがある
+（本番相当のデータで確認するか、sqlite_stat1 を削除してから確認する）
+
+回帰テストは tests/test_query_plans.py（統計情報のない空のデータベースで同じチェックを行う）
+このスクリプトは DATABASE_URL のデータベースで確認する（最新のマイグレーションを適用しておく）
+
+使い方:
+    alembic upgrade head
+    python check_query_plans.py                      # 最初の事業所で確認
+    python check_query_plans.py --organization-id 1  # 指定した事業所で確認
+    python check_query_plans.py --verbose            # すべてのクエリの実行計画を表示
+"""
+
+import argparse
+import os
+import re
+import sys
+
+# チェック中にバックグラウンドジョブを実行しない
+os.environ.setdefault('JOB_WORKERS', '0')
+
+from sqlalchemy import event, select
+from db import SessionLocal, engine
+from models import Account, AccountItem, CashBook, FiscalPeriod, GeneralLedger, JournalEntry, Organization
+from ledger_utils import BATCH_ENTRY_SOURCE_TYPES
+
+
+# 全表スキャンを禁止するテーブル
+TARGET_TABLES = ('general_ledger', 'ledger_lines', 'cash_books')
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+"?(%s)"?' % '|'.join(TARGET_TABLES), re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?$')
+_POSTGRESQL_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def _target_table(name):
+    """エイリアス（general_ledger_1 など）を含めて対象テーブル名に変換"""
+    for table in TARGET_TABLES:
+        if name == table or re.fullmatch(rf'{table}_\d+', name):
+            return table
+    return None
+
+
+def _default_arguments(db, organization_id):
+    """画面のパラメーターに使うデータ（会計期間・勘定科目など）を選ぶ"""
+    fiscal_period = (
+        db.query(FiscalPeriod)
+        .filter(FiscalPeriod.organization_id == organization_id)
+        .order_by(FiscalPeriod.start_date.desc())
+        .first()
+    )
+    ledger_account_id = db.execute(
+        select(GeneralLedger.debit_account_item_id)
+        .where(GeneralLedger.organization_id == organization_id, GeneralLedger.debit_account_item_id.isnot(None))
+        .limit(1)
+    ).scalar()
+    if ledger_account_id is None:
+        ledger_account_id = db.execute(
+            select(AccountItem.id).where(AccountItem.organization_id == organization_id).limit(1)
+        ).scalar()
+    account = db.query(Account).filter(Account.organization_id == organization_id).order_by(Account.id).first()
+    cash_book = db.query(CashBook).filter(CashBook.organization_id == organization_id).order_by(CashBook.id).first()
+    journal_entry = db.query(JournalEntry).order_by(JournalEntry.id).first()
+    return {
+        'fiscal_period_id': fiscal_period.id if fiscal_period else None,
+        'account_item_id': ledger_account_id,
+        'account_id': account.id if account else None,
+        'cash_book_id': cash_book.id if cash_book else None,
+        'journal_entry_id': journal_entry.id if journal_entry else None,
+    }
+
+
+def _read_urls(args):
+    """チェックする画面（GET）の一覧"""
+    fp = args['fiscal_period_id']
+    account_item_id = args['account_item_id']
+    urls = [
+        # reports
+        f'/accounting/opening-balances?fiscal_period_id={fp}',
+        f'/accounting/trial-balance?fiscal_period_id={fp}',
+        f'/accounting/monthly-trend?fiscal_period_id={fp}',
+        f'/accounting/general-ledger?fiscal_period_id={fp}',
+        f'/accounting/general-ledger/export?fiscal_period_id={fp}&format=csv',
+        f'/accounting/trial-balance/export?fiscal_period_id={fp}&format=csv',
+    ]
+    for dimension in ('department', 'counterparty', 'item', 'project_tag', 'memo_tag'):
+        urls.append(f'/accounting/trial-balance/breakdown?fiscal_period_id={fp}&dimension={dimension}')
+    if account_item_id:
+        urls.extend([
+            f'/accounting/ledger?fiscal_period_id={fp}&account_item_id={account_item_id}',
+            f'/accounting/ledger/export?fiscal_period_id={fp}&account_item_id={account_item_id}&format=csv',
+            f'/accounting/trial-balance/breakdown?fiscal_period_id={fp}&dimension=department&account_item_id={account_item_id}',
+        ])
+
+    # cash_books
+    urls.extend(['/accounting/cash-books', '/accounting/cash-books/batch', '/accounting/cash-books/new'])
+    if account_item_id:
+        urls.append(f'/accounting/cash-books/batch?account_item_id={account_item_id}')
+    if args['account_id']:
+        urls.append(f"/accounting/api/cash-books/list?account_id={args['account_id']}")
+    if args['cash_book_id']:
+        urls.extend([
+            f"/accounting/cash-books/{args['cash_book_id']}/edit",
+            f"/accounting/api/cash-books/{args['cash_book_id']}",
+        ])
+
+    # journal_entries
+    urls.append('/accounting/journal-entries')
+    if account_item_id:
+        urls.append(f'/accounting/journal-entries?account_item_id={account_item_id}')
+    if args['journal_entry_id']:
+        urls.append(f"/accounting/journal-entries/{args['journal_entry_id']}/edit")
+    return urls
+
+
+def _write_path_queries(args):
+    """更新・削除時に発行される検索（画面を呼び出すとデータが変わるためクエリを直接組み立てる）"""
+    source_id = args['cash_book_id'] or 1
+    return [
+        (
+            'cash_books.cash_book_delete / cash_book_update（出納帳から作成された仕訳）',
+            select(GeneralLedger).where(
+                GeneralLedger.source_type.in_(BATCH_ENTRY_SOURCE_TYPES),
+                GeneralLedger.source_id == source_id,
+            ),
+        ),
+        (
+            'journal_entries.journal_entry_edit（振替伝票から作成された仕訳）',
+            select(GeneralLedger).where(
+                GeneralLedger.source_type == 'journal_entry',
+                GeneralLedger.source_id == (args['journal_entry_id'] or 1),
+            ),
+        ),
+    ]
+
+
+def explain(connection, statement, parameters):
+    """
+    実行計画を取得
+
+    Returns:
+        (実行計画の行のリスト, 全表スキャンしているテーブル名のリスト)
+    """
+    dialect_name = connection.dialect.name
+    if dialect_name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        plan = [row[-1] for row in rows]
+        scans = []
+        for detail in plan:
+            match = _SQLITE_SCAN.match(detail)
+            if match and _target_table(match.group(1)):
+                scans.append(_target_table(match.group(1)))
+        return plan, scans
+
+    if dialect_name == 'postgresql':
+        transaction = connection.begin_nested() if connection.in_transaction() else connection.begin()
+        try:
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            plan = [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {statement}', parameters).all()]
+        finally:
+            transaction.rollback()
+        scans = [
+            _target_table(match.group(1))
+            for line in plan
+            for match in [_POSTGRESQL_SEQ_SCAN.search(line)]
+            if match and _target_table(match.group(1))
+        ]
+        return plan, scans
+
+    raise SystemExit(f'{dialect_name} の実行計画のチェックには対応していません')
+
+
+def _require_latest_migration():
+    """データベースに最新のマイグレーションが適用されているか確認（未適用の場合は終了する）"""
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    root_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(root_dir, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(root_dir, 'migrations'))
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    with engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    if current != heads:
+        raise SystemExit(
+            'データベースに最新のマイグレーションが適用されていません。'
+            '先に alembic upgrade head を実行してください'
+        )
+
+
+def collect_query_plans(app, organization_id, user_id=1):
+    """
+    画面を呼び出して発行された SELECT と更新時の検索の実行計画を取得
+
+    Returns:
+        tuple: ([(ラベル, SQL, 実行計画の行のリスト, 全表スキャンしているテーブル名のリスト), ...],
+                [(URL, ステータスコード), ...]（エラーを返した画面）)
+    """
+    from report_cache import report_cache
+    from ledger_columns import ledger_column_cache
+
+    db = SessionLocal()
+    try:
+        defaults = _default_arguments(db, organization_id)
+    finally:
+        db.close()
+
+    # 画面を呼び出して発行された SELECT を記録
+    recorded = []
+    failed_urls = []
+    current_label = [None]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and _TABLE_PATTERN.search(statement):
+            recorded.append((current_label[0], statement, parameters))
+
+    # キャッシュを使うと DB にクエリが発行されないため無効にする
+    max_entries, max_rows = report_cache.max_entries, ledger_column_cache.max_rows
+    report_cache.max_entries = 0
+    ledger_column_cache.max_rows = 0
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+            session['organization_id'] = organization_id
+        for url in _read_urls(defaults):
+            current_label[0] = f'GET {url}'
+            response = client.get(url)
+            # ストリーミングレスポンスは最後まで読んでクエリを発行させる
+            response.get_data()
+            if response.status_code >= 400:
+                failed_urls.append((url, response.status_code))
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+        report_cache.max_entries, ledger_column_cache.max_rows = max_entries, max_rows
+
+    queries = []
+    seen = set()
+    for label, statement, parameters in recorded:
+        if statement in seen:
+            continue
+        seen.add(statement)
+        queries.append((label, statement, parameters))
+
+    results = []
+    with engine.connect() as connection:
+        for label, query in _write_path_queries(defaults):
+            compiled = query.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+            queries.append((label, str(compiled), ()))
+
+        for label, statement, parameters in queries:
+            plan, scans = explain(connection, statement, parameters)
+            results.append((label, statement, plan, scans))
+    return results, failed_urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description='帳票・出納帳・振替伝票のクエリの実行計画をチェックする')
+    parser.add_argument('--organization-id', type=int, default=None, help='対象の事業所ID（省略時は最初の事業所）')
+    parser.add_argument('--verbose', action='store_true', help='すべてのクエリの実行計画を表示')
+    args = parser.parse_args()
+
+    _require_latest_migration()
+    from wsgi import app
+
+    organization_id = args.organization_id
+    if organization_id is None:
+        db = SessionLocal()
+        try:
+            organization_id = db.execute(select(Organization.id).order_by(Organization.id).limit(1)).scalar()
+        finally:
+            db.close()
+    if organization_id is None:
+        raise SystemExit('事業所が登録されていません')
+
+    results, failed_urls = collect_query_plans(app, organization_id)
+    for url, status_code in failed_urls:
+        print(f'警告: {url} が {status_code} を返しました')
+
+    failures = 0
+    for label, statement, plan, scans in results:
+        if scans:
+            failures += 1
+            print(f"NG 全表スキャン（{', '.join(sorted(set(scans)))}）: {label}")
+        elif args.verbose:
+            print(f'OK: {label}')
+        if scans or args.verbose:
+            print('    ' + ' '.join(statement.split()))
+            for line in plan:
+                print(f'    | {line}')
+
+    print(f'{len(results)} 件のクエリを確認し、{failures} 件で全表スキャンが見つかりました')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+決算締め処理用のユーティリティモジュール
+会計期間の締め時に貸借対照表科目の期末残高を翌期の期首残高として繰り越し、
+損益を繰越利益剰余金（個人は元入金）に振り替える
+締め済みの会計期間に属する仕訳の追加・変更・削除は受け付けない
+"""
+
+from datetime import datetime
+from models import AccountItem, FiscalPeriod, OpeningBalance
+from ledger_utils import register_ledger_change_handler
+from report_cache import delete_versioned_rows
+from report_utils import aggregate_account_totals, compute_opening_totals, normalize_major_category, to_date
+
+
+BS_MAJOR_CATEGORIES = ["資産", "負債", "純資産"]
+
+
+class ClosedPeriodError(ValueError):
+    """締め済みの会計期間への記帳エラー"""
+    pass
+
+
+class FiscalPeriodCloseError(ValueError):
+    """会計期間の締め処理エラー"""
+    pass
+
+
+def find_next_fiscal_period(db, fiscal_period):
+    """翌期の会計期間を取得"""
+    return (
+        db.query(FiscalPeriod)
+        .filter(
+            FiscalPeriod.organization_id == fiscal_period.organization_id,
+            FiscalPeriod.start_date > fiscal_period.end_date,
+        )
+        .order_by(FiscalPeriod.start_date)
+        .first()
+    )
+
+
+def _find_retained_earnings_account(db, fiscal_period):
+    """損益の振替先（法人: 繰越利益剰余金、個人: 元入金）の勘定科目を取得"""
+    query = db.query(AccountItem).filter(AccountItem.organization_id == fiscal_period.organization_id)
+    if fiscal_period.business_type == 'individual':
+        return query.filter(AccountItem.account_name == '元入金').first()
+
+    account_item = query.filter(AccountItem.account_name == '繰越利益剰余金').first()
+    if account_item is None:
+        account_item = (
+            query.filter(AccountItem.sub_category == 'その他利益剰余金')
+            .order_by(AccountItem.id)
+            .first()
+        )
+    return account_item
+
+
+def calculate_closing_balances(db, fiscal_period):
+    """
+    会計期間の貸借対照表科目の期末残高と、振替先に加算する損益を集計
+
+    期末残高は期首残高の借方・貸方と当期の借方・貸方の合計から求める（借方プラス）。
+    損益科目の期首残高（前期以前に振り替えられていない損益）も当期純利益と合わせて振り替える
+
+    Returns:
+        tuple: ({account_item_id: (AccountItem, 期末残高（借方プラス・貸方マイナス）)}, 振り替える損益（貸方プラス）)
+    """
+    organization_id = fiscal_period.organization_id
+    opening_totals = compute_opening_totals(db, organization_id, fiscal_period)
+    current_totals = aggregate_account_totals(
+        db,
+        organization_id,
+        date_from=fiscal_period.start_date,
+        date_to=fiscal_period.end_date,
+    )
+
+    account_ids = set(opening_totals) | set(current_totals)
+    if not account_ids:
+        return {}, 0
+    account_items = {
+        ai.id: ai
+        for ai in db.query(AccountItem).filter(AccountItem.id.in_(account_ids)).all()
+    }
+
+    bs_balances = {}
+    net_income = 0
+    for account_item_id in account_ids:
+        account_item = account_items.get(account_item_id)
+        if account_item is None:
+            continue
+        opening_debit, opening_credit = opening_totals.get(account_item_id, (0, 0))
+        current_debit, current_credit = current_totals.get(account_item_id, (0, 0))
+        closing = (opening_debit + current_debit) - (opening_credit + current_credit)
+        if normalize_major_category(account_item.major_category) in BS_MAJOR_CATEGORIES:
+            bs_balances[account_item_id] = (account_item, closing)
+        else:
+            # 損益科目は貸方 - 借方を利益とする
+            net_income -= closing
+    return bs_balances, net_income
+
+
+def close_fiscal_period(db, fiscal_period):
+    """
+    会計期間を締め、翌期の期首残高を作成
+
+    Returns:
+        FiscalPeriod: 期首残高を作成した翌期の会計期間
+    """
+    if fiscal_period.status == 'closed':
+        raise FiscalPeriodCloseError('この会計期間は既に締められています')
+
+    next_period = find_next_fiscal_period(db, fiscal_period)
+    if next_period is None:
+        raise FiscalPeriodCloseError('翌期の会計期間が登録されていません。先に翌期の会計期間を作成してください')
+
+    retained_earnings = _find_retained_earnings_account(db, fiscal_period)
+    if retained_earnings is None:
+        name = '元入金' if fiscal_period.business_type == 'individual' else '繰越利益剰余金'
+        raise FiscalPeriodCloseError(f'損益の振替先となる勘定科目「{name}」が見つかりません')
+
+    bs_balances, net_income = calculate_closing_balances(db, fiscal_period)
+
+    # 損益を振替先の残高に加算（利益は貸方）
+    _, retained_closing = bs_balances.get(retained_earnings.id, (retained_earnings, 0))
+    retained_closing -= net_income
+
+    # 個人の場合、事業主貸・事業主借は元入金に振り替えて翌期は0から始める
+    if fiscal_period.business_type == 'individual':
+        for account_item_id, (account_item, closing) in list(bs_balances.items()):
+            if account_item.account_name in ('事業主借', '事業主貸'):
+                retained_closing += closing
+                del bs_balances[account_item_id]
+
+    bs_balances[retained_earnings.id] = (retained_earnings, retained_closing)
+
+    # 期末残高の符号で借方・貸方を決める
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    opening_balances = []
+    for account_item_id, (account_item, closing) in bs_balances.items():
+        if closing == 0 and account_item_id != retained_earnings.id:
+            continue
+        opening_balances.append(OpeningBalance(
+            organization_id=fiscal_period.organization_id,
+            fiscal_period_id=next_period.id,
+            account_item_id=account_item_id,
+            debit_amount=closing if closing > 0 else 0,
+            credit_amount=-closing if closing < 0 else 0,
+            created_at=now,
+            updated_at=now,
+        ))
+
+    debit_total = sum(ob.debit_amount for ob in opening_balances)
+    credit_total = sum(ob.credit_amount for ob in opening_balances)
+    if round(debit_total - credit_total, 2) != 0:
+        raise FiscalPeriodCloseError(
+            f'翌期の期首残高の借方合計（{debit_total:,.0f}）と貸方合計（{credit_total:,.0f}）が一致しません。'
+            '期首残高・仕訳の勘定科目を確認してください'
+        )
+
+    # 翌期の期首残高を作り直す
+    delete_versioned_rows(
+        db, OpeningBalance, fiscal_period.organization_id,
+        OpeningBalance.fiscal_period_id == next_period.id,
+    )
+    db.add_all(opening_balances)
+
+    fiscal_period.status = 'closed'
+    fiscal_period.updated_at = now
+    return next_period
+
+
+def load_closed_periods(db, *organization_ids):
+    """事業所の締め済みの会計期間を取得"""
+    return (
+        db.query(FiscalPeriod)
+        .filter(
+            FiscalPeriod.organization_id.in_(list(organization_ids)),
+            FiscalPeriod.status == 'closed',
+        )
+        .all()
+    )
+
+
+def find_closed_period(closed_periods, transaction_date):
+    """取引日を含む締め済みの会計期間を取得（無ければ None）"""
+    transaction_date = to_date(transaction_date)
+    for period in closed_periods:
+        if to_date(period.start_date) <= transaction_date <= to_date(period.end_date):
+            return period
+    return None
+
+
+def closed_period_message(period, transaction_date):
+    """締め済みの会計期間への記帳エラーのメッセージ"""
+    return f'会計期間「{period.name}」は締め済みのため、{transaction_date} の仕訳は登録・変更できません'
+
+
+@register_ledger_change_handler
+def reject_closed_period_postings(db, added, removed):
+    """締め済みの会計期間に属する仕訳の変更を拒否"""
+    targets = {}
+    for snapshot in list(added) + list(removed):
+        if snapshot['organization_id'] is None or snapshot['transaction_date'] is None:
+            continue
+        targets.setdefault(snapshot['organization_id'], set()).add(to_date(snapshot['transaction_date']))
+    if not targets:
+        return
+
+    for period in load_closed_periods(db, *targets):
+        for transaction_date in targets.get(period.organization_id, ()):
+            if find_closed_period([period], transaction_date) is not None:
+                raise ClosedPeriodError(closed_period_message(period, transaction_date))
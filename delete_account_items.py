@@ -1,6 +1,8 @@
 # delete_account_items.py
 
-from app import SessionLocal, AccountItem
+from db import SessionLocal
+from models import AccountItem
+from report_cache import delete_versioned_rows
 
 # ★ 直接 organization_id を指定
 ORGANIZATION_ID = 1
@@ -8,9 +10,7 @@ ORGANIZATION_ID = 1
 def delete_all_account_items():
     db = SessionLocal()
     try:
-        deleted_count = db.query(AccountItem).filter(
-            AccountItem.organization_id == ORGANIZATION_ID
-        ).delete(synchronize_session=False)
+        deleted_count = delete_versioned_rows(db, AccountItem, ORGANIZATION_ID)
 
         db.commit()
         print(f"{deleted_count} 件の勘定科目を削除しました（organization_id={ORGANIZATION_ID}）")
@@ -0,0 +1,334 @@
+"""
+帳票エクスポート用のユーティリティモジュール
+仕訳帳・総勘定元帳・試算表を CSV（UTF-8 / Shift-JIS）または XLSX でストリーミング出力する
+仕訳は yield_per でチャンクごとに読み込むため、件数によらずメモリ使用量は一定
+"""
+
+import csv
+import tempfile
+from io import StringIO
+from urllib.parse import quote
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+from db import SessionLocal
+from job_utils import register_job_handler
+from models import AccountItem, FiscalPeriod, GeneralLedger, LedgerLine
+from report_utils import (
+    account_balance_sign,
+    bs_account_sort_key,
+    calculate_closing_balance,
+    compute_account_balances,
+    ledger_opening_balance,
+    load_account_display_names,
+    normalize_major_category,
+    pl_account_sort_key,
+    select_journal_entries,
+    select_ledger_entries,
+)
+
+
+# 1回に読み込む仕訳の件数
+EXPORT_CHUNK_SIZE = 1000
+
+# 出力形式: (拡張子, MIMEタイプ, 文字コード)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv', 'utf-8-sig'),
+    'csv_sjis': ('csv', 'text/csv', 'cp932'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', None),
+}
+
+SOURCE_TYPE_LABELS = {
+    'journal_entry': '振替伝票',
+    'cash_book': '出納帳',
+    'batch_entry': '連続仕訳',
+    'batch_entry_net': '連続仕訳',
+    'batch_entry_tax': '連続仕訳',
+    'imported_transaction': '取引明細',
+}
+
+
+# ========== 行の生成 ==========
+
+
+def iter_journal_rows(db, organization_id, fiscal_period=None):
+    """仕訳帳の行（見出し行を含む）を生成"""
+    yield ['取引日', '借方勘定科目', '借方金額', '貸方勘定科目', '貸方金額', '摘要', '元データ', '備考']
+
+    account_names = load_account_display_names(db, organization_id)
+    query = (
+        select_journal_entries(organization_id, fiscal_period)
+        .order_by(GeneralLedger.transaction_date, GeneralLedger.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for row in db.execute(query):
+        yield [
+            str(row.transaction_date),
+            account_names.get(row.debit_account_item_id) or row.debit_account_name or '',
+            row.debit_amount or 0,
+            account_names.get(row.credit_account_item_id) or row.credit_account_name or '',
+            row.credit_amount or 0,
+            row.summary or '',
+            SOURCE_TYPE_LABELS.get(row.source_type, 'その他'),
+            row.remarks or '',
+        ]
+
+
+def iter_ledger_rows(db, organization_id, account_item, fiscal_period):
+    """総勘定元帳の行（見出し行・期首残高行を含む）を生成"""
+    yield ['取引日', '相手勘定科目', '摘要', '借方金額', '貸方金額', '残高']
+
+    sign = account_balance_sign(account_item.major_category)
+    running_balance = ledger_opening_balance(db, organization_id, account_item, fiscal_period)
+    yield ['', '', '期首残高', '', '', running_balance]
+
+    query = (
+        select_ledger_entries(organization_id, account_item.id, fiscal_period)
+        .order_by(LedgerLine.transaction_date, LedgerLine.general_ledger_id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    for row in db.execute(query):
+        running_balance += sign * (row.debit - row.credit)
+        yield [
+            str(row.transaction_date),
+            row.counterpart_account_name or '',
+            row.summary or '',
+            row.debit,
+            row.credit,
+            running_balance,
+        ]
+
+
+def _trial_balance_sort_key(account_item):
+    """試算表画面と同じく B/S → P/L の順に、それぞれの表示順で並べる"""
+    if normalize_major_category(account_item.major_category) in ['資産', '負債', '純資産']:
+        return (0, bs_account_sort_key(account_item))
+    return (1, pl_account_sort_key(account_item))
+
+
+def iter_trial_balance_rows(db, organization_id, fiscal_period):
+    """試算表（勘定科目ごとの期首残高・借方・貸方・期末残高）の行を生成"""
+    yield ['大分類', '中分類', '小分類', '勘定科目', '期首残高', '借方金額', '貸方金額', '期末残高']
+
+    account_summary = compute_account_balances(db, organization_id, fiscal_period)
+    summaries = [summary for summary in account_summary.values() if summary['account_item'] is not None]
+    summaries.sort(key=lambda summary: _trial_balance_sort_key(summary['account_item']))
+    for summary in summaries:
+        account_item = summary['account_item']
+        major_category = normalize_major_category(account_item.major_category)
+        closing = calculate_closing_balance(
+            major_category,
+            summary['opening_balance'],
+            summary['current_debit'],
+            summary['current_credit'],
+        )
+        yield [
+            major_category,
+            account_item.mid_category or '',
+            account_item.sub_category or '',
+            account_item.account_name,
+            summary['opening_balance'],
+            summary['current_debit'],
+            summary['current_credit'],
+            closing,
+        ]
+
+
+# ========== 出力形式 ==========
+
+
+def _numeric(value):
+    """Decimal などを出力用の数値に変換"""
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return float(value)
+
+
+def stream_csv(rows, encoding='utf-8-sig', chunk_rows=EXPORT_CHUNK_SIZE):
+    """行を CSV に変換し、一定行数ごとにエンコード済みのバイト列を生成"""
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    # BOM は先頭に1回だけ付ける
+    if encoding == 'utf-8-sig':
+        yield '\ufeff'.encode('utf-8')
+        encoding = 'utf-8'
+
+    pending = 0
+    for row in rows:
+        writer.writerow([_numeric(value) for value in row])
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode(encoding, errors='replace')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode(encoding, errors='replace')
+
+
+def stream_xlsx(rows, sheet_title, chunk_size=64 * 1024):
+    """
+    行を XLSX に変換してバイト列を生成
+
+    openpyxl の write-only モードで一時ファイルに書き出すため、
+    ワークブック全体をメモリに保持しない
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=sheet_title[:31])
+    for row in rows:
+        worksheet.append([_numeric(value) for value in row])
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_copy_csv(db, query):
+    """
+    PostgreSQL の COPY TO STDOUT で SELECT 結果を CSV（UTF-8）として生成
+
+    psycopg（バージョン3）以外のドライバーでは None を返す
+    """
+    connection = db.connection()
+    if connection.dialect.name != 'postgresql' or connection.dialect.driver != 'psycopg':
+        return None
+
+    sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+    def generate():
+        yield '\ufeff'.encode('utf-8')
+        cursor = connection.connection.cursor()
+        try:
+            with cursor.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)") as copy:
+                for data in copy:
+                    yield bytes(data)
+        finally:
+            cursor.close()
+
+    return generate()
+
+
+def export_filename(report, fiscal_period, account_item=None):
+    """エクスポートファイル名（拡張子を除く）とシート名"""
+    if report == 'journal':
+        return f'仕訳帳_{fiscal_period.name}', '仕訳帳'
+    if report == 'ledger':
+        return f'総勘定元帳_{account_item.account_name}_{fiscal_period.name}', account_item.account_name
+    return f'試算表_{fiscal_period.name}', '試算表'
+
+
+def export_response(rows, export_format, filename, sheet_title, on_close=None, csv_chunks=None):
+    """
+    エクスポート用のストリーミングレスポンスを作成
+
+    Args:
+        rows: 出力する行のイテラブル（先頭は見出し行）
+        export_format: 'csv' / 'csv_sjis' / 'xlsx'
+        filename: 拡張子を除いたファイル名
+        sheet_title: XLSX のシート名
+        on_close: 出力完了後（中断時を含む）に呼ぶ関数（DBセッションのクローズなど）
+        csv_chunks: CSV（UTF-8）を直接生成するイテラブル（COPY TO を使う場合）
+    """
+    extension, mimetype, encoding = EXPORT_FORMATS[export_format]
+    if export_format == 'xlsx':
+        chunks = stream_xlsx(rows, sheet_title)
+    elif csv_chunks is not None and export_format == 'csv':
+        chunks = csv_chunks
+    else:
+        chunks = stream_csv(rows, encoding)
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            if on_close is not None:
+                on_close()
+
+    full_name = f"{filename}.{extension}"
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=\"export.{extension}\"; filename*=UTF-8''{quote(full_name)}"
+    )
+    return response
+
+
+# ========== バックグラウンドジョブ ==========
+
+
+def _count_progress(rows, total, context, header_rows=1):
+    """行を出力しながらジョブの進捗率を更新"""
+    for index, row in enumerate(rows):
+        if total and index > header_rows and index % EXPORT_CHUNK_SIZE == 0:
+            context.update_progress((index - header_rows) * 100 // total)
+        yield row
+
+
+@register_job_handler('report_export')
+def run_report_export_job(context):
+    """
+    帳票エクスポートのバックグラウンドジョブ
+
+    params: report（'journal' / 'ledger' / 'trial_balance'）, format,
+            fiscal_period_id, account_item_id（総勘定元帳のみ）
+    """
+    params = context.params
+    report = params['report']
+    export_format = params['format']
+    organization_id = context.organization_id
+    extension, mimetype, encoding = EXPORT_FORMATS[export_format]
+
+    db = SessionLocal()
+    try:
+        fiscal_period = (
+            db.query(FiscalPeriod)
+            .filter_by(id=params['fiscal_period_id'], organization_id=organization_id)
+            .first()
+        )
+        if fiscal_period is None:
+            raise ValueError('会計期間が見つかりません')
+
+        account_item = None
+        total = 0
+        if report == 'journal':
+            rows = iter_journal_rows(db, organization_id, fiscal_period)
+            total = db.execute(
+                select(func.count()).select_from(select_journal_entries(organization_id, fiscal_period).subquery())
+            ).scalar()
+            rows = _count_progress(rows, total, context)
+        elif report == 'ledger':
+            account_item = (
+                db.query(AccountItem)
+                .filter_by(id=params.get('account_item_id'), organization_id=organization_id)
+                .first()
+            )
+            if account_item is None:
+                raise ValueError('勘定科目が見つかりません')
+            rows = iter_ledger_rows(db, organization_id, account_item, fiscal_period)
+            total = db.execute(
+                select(func.count()).select_from(
+                    select_ledger_entries(organization_id, account_item.id, fiscal_period).subquery()
+                )
+            ).scalar()
+            rows = _count_progress(rows, total, context, header_rows=2)
+        elif report == 'trial_balance':
+            rows = iter_trial_balance_rows(db, organization_id, fiscal_period)
+        else:
+            raise ValueError(f'帳票の種類が正しくありません: {report}')
+
+        filename, sheet_title = export_filename(report, fiscal_period, account_item)
+        if export_format == 'xlsx':
+            chunks = stream_xlsx(rows, sheet_title)
+        else:
+            chunks = stream_csv(rows, encoding)
+        with context.open_result(f"{filename}.{extension}", mimetype) as output:
+            for chunk in chunks:
+                output.write(chunk)
+        return {'rows': total} if report != 'trial_balance' else None
+    finally:
+        db.close()
@@ -0,0 +1,197 @@
+"""
+ファイル保存モジュール
+アップロードされたファイル・バックグラウンドジョブの入出力ファイルをデータベースに
+一定サイズごとに分割して保存する（stored_files / stored_file_chunks）
+Webプロセスとワーカープロセスが別のサーバー（複数の dyno など）で動いていても、
+どのプロセスからでも同じファイルを参照できる
+有効期限を過ぎたファイルは purge_expired_files で削除する
+"""
+
+import io
+import json
+import secrets
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+from db import SessionLocal
+from models import BackgroundJob, StoredFile, StoredFileChunk
+
+
+# 1件の行に保存するバイト数
+FILE_CHUNK_SIZE = 1024 * 1024
+
+
+def _format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def save_file(db, stream, purpose, organization_id=None, filename=None, info=None, ttl=None):
+    """
+    ファイルを保存（コミットは呼び出し元で行う）
+
+    Args:
+        stream: 読み込み用のファイルオブジェクト（少しずつ読み込んで保存する）
+        purpose: 用途（job_input, job_result, import_spool）
+        info: 用途ごとの付加情報（JSONに変換できる値、任意）
+        ttl: 有効期限（秒、省略時は期限なし）
+
+    Returns:
+        StoredFile: 保存したファイル
+    """
+    now = datetime.now()
+    stored_file = StoredFile(
+        id=secrets.token_urlsafe(24),
+        organization_id=organization_id,
+        purpose=purpose,
+        filename=filename,
+        size=0,
+        info_json=json.dumps(info, ensure_ascii=False) if info is not None else None,
+        created_at=_format_datetime(now),
+        expires_at=_format_datetime(now + timedelta(seconds=ttl)) if ttl else None,
+    )
+    db.add(stored_file)
+    db.flush()
+
+    # 分割した内容はフラッシュしたらセッションから外す（ファイル全体をメモリに持たない）
+    size = 0
+    for seq, data in enumerate(iter(lambda: stream.read(FILE_CHUNK_SIZE), b'')):
+        chunk = StoredFileChunk(file_id=stored_file.id, seq=seq, data=data)
+        db.add(chunk)
+        db.flush()
+        db.expunge(chunk)
+        size += len(data)
+    stored_file.size = size
+    return stored_file
+
+
+def get_file_info(stored_file):
+    """保存時の付加情報を取得"""
+    return json.loads(stored_file.info_json) if stored_file.info_json else {}
+
+
+def iter_file_chunks(file_id):
+    """保存したファイルの内容を先頭から順に生成（ダウンロードのストリーミング用。専用のセッションで読む）"""
+    db = SessionLocal()
+    try:
+        seq = 0
+        while True:
+            data = db.execute(
+                select(StoredFileChunk.data).where(
+                    StoredFileChunk.file_id == file_id,
+                    StoredFileChunk.seq == seq,
+                )
+            ).scalar()
+            if data is None:
+                return
+            yield bytes(data)
+            seq += 1
+    finally:
+        db.close()
+
+
+class StoredFileReader(io.RawIOBase):
+    """保存したファイルを先頭から順に読み込むファイルオブジェクト（読んだ位置までの分割だけを取得する。シークはできない）"""
+
+    def __init__(self, file_id):
+        self._chunks = iter_file_chunks(file_id)
+        self._data = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._data:
+            data = next(self._chunks, None)
+            if data is None:
+                return 0
+            self._data = memoryview(data)
+        size = min(len(buffer), len(self._data))
+        buffer[:size] = self._data[:size]
+        self._data = self._data[size:]
+        return size
+
+    def close(self):
+        # 読み込み用のセッションを閉じる
+        self._chunks.close()
+        super().close()
+
+
+def open_file_stream(file_id):
+    """保存したファイルを先頭から順に読み込み用に開く（ファイルの先頭だけを読む場合に使う）"""
+    return io.BufferedReader(StoredFileReader(file_id), buffer_size=FILE_CHUNK_SIZE)
+
+
+def copy_to_temporary_file(file_id, named=False):
+    """
+    保存したファイルをローカルの一時ファイルにコピー（シークが必要な読み込み用）
+
+    Args:
+        named: True の場合はパスを持つ一時ファイル（呼び出し元で削除する）
+
+    Returns:
+        先頭に戻した読み込み用の一時ファイル
+    """
+    temporary = tempfile.NamedTemporaryFile(delete=False) if named else tempfile.TemporaryFile()
+    for data in iter_file_chunks(file_id):
+        temporary.write(data)
+    temporary.flush()
+    temporary.seek(0)
+    return temporary
+
+
+def reassign_file(db, file_id, purpose, ttl=None):
+    """保存したファイルの用途と有効期限を変更（一時保存したファイルをジョブの入力にする場合など）"""
+    now = datetime.now()
+    db.execute(
+        update(StoredFile)
+        .where(StoredFile.id == file_id)
+        .values(
+            purpose=purpose,
+            expires_at=_format_datetime(now + timedelta(seconds=ttl)) if ttl else None,
+        )
+    )
+
+
+def save_local_file(db, path, purpose, **kwargs):
+    """ローカルのファイルを保存（ジョブの結果ファイル用）"""
+    with open(path, 'rb') as f:
+        return save_file(db, f, purpose, **kwargs)
+
+
+def delete_file(db, file_id):
+    """保存したファイルを削除（コミットは呼び出し元で行う）"""
+    if not file_id:
+        return
+    db.execute(delete(StoredFileChunk).where(StoredFileChunk.file_id == file_id))
+    db.execute(delete(StoredFile).where(StoredFile.id == file_id))
+
+
+def purge_expired_files(db):
+    """
+    有効期限を過ぎたファイルを削除（コミットは呼び出し元で行う）
+    削除するファイルを参照しているジョブの参照は外す
+
+    Returns:
+        int: 削除した件数
+    """
+    expired_ids = db.execute(
+        select(StoredFile.id).where(
+            StoredFile.expires_at.isnot(None),
+            StoredFile.expires_at < _format_datetime(datetime.now()),
+        )
+    ).scalars().all()
+    if not expired_ids:
+        return 0
+    db.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.result_file_id.in_(expired_ids))
+        .values(result_file_id=None)
+    )
+    db.execute(
+        update(BackgroundJob)
+        .where(BackgroundJob.input_file_id.in_(expired_ids))
+        .values(input_file_id=None)
+    )
+    db.execute(delete(StoredFileChunk).where(StoredFileChunk.file_id.in_(expired_ids)))
+    db.execute(delete(StoredFile).where(StoredFile.id.in_(expired_ids)))
+    return len(expired_ids)
@@ -0,0 +1,234 @@
+"""
+インポートファイルの列の書式判定モジュール
+
+取引日・金額の列ごとに先頭の数行から書式（日付の並び順・和暦・桁区切り・括弧の負数・
+全角数字など）を1つに決め、その書式専用の変換関数を作る。
+残りの行は変換関数で変換し、書式に合わない行だけを従来どおりすべての書式で判定する
+
+取り込んだ行の重複判定用のフィンガープリント（row_fingerprint）もここで作成する
+"""
+
+import hashlib
+import re
+import unicodedata
+from datetime import date, datetime
+
+
+# 書式の判定に使う先頭の行数
+SNIFF_ROWS = 200
+
+# 和暦の元号 → 元年の前年（西暦 = 前年 + 和暦の年）
+ERA_OFFSETS = {
+    '令和': 2018, 'R': 2018,
+    '平成': 1988, 'H': 1988,
+    '昭和': 1925, 'S': 1925,
+    '大正': 1911, 'T': 1911,
+}
+
+
+def _wareki_year(match):
+    year = match.group(2)
+    return ERA_OFFSETS[match.group(1)] + (1 if year == '元' else int(year))
+
+
+# 日付の書式: (名前, 正規表現, 一致した結果から (年, 月, 日) を返す関数)
+# 判定で同じ件数になった場合はリストの順（従来の strptime の順）を優先する
+DATE_FORMATS = [
+    ('ymd', re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$'),
+     lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)))),
+    ('ymd_kanji', re.compile(r'^(\d{4})年(\d{1,2})月(\d{1,2})日$'),
+     lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)))),
+    ('ymd_compact', re.compile(r'^(\d{4})(\d{2})(\d{2})$'),
+     lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3)))),
+    ('mdy', re.compile(r'^(\d{1,2})[-/](\d{1,2})[-/](\d{4})$'),
+     lambda m: (int(m.group(3)), int(m.group(1)), int(m.group(2)))),
+    ('dmy', re.compile(r'^(\d{1,2})[-/](\d{1,2})[-/](\d{4})$'),
+     lambda m: (int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+    ('wareki', re.compile(r'^(令和|平成|昭和|大正|[RHST])\s*(\d{1,2}|元)[年./-](\d{1,2})[月./-](\d{1,2})日?$'),
+     lambda m: (_wareki_year(m), int(m.group(3)), int(m.group(4)))),
+]
+DATE_FORMATS_BY_NAME = {name: (pattern, build) for name, pattern, build in DATE_FORMATS}
+
+# 金額から取り除く文字（桁区切り・通貨記号・空白）
+AMOUNT_REMOVE_CHARS = ',¥\\円 '
+# 負数を表す先頭の記号（会計帳票の三角）
+AMOUNT_NEGATIVE_MARKS = '△▲'
+
+
+def normalize_text(value):
+    """セルの値を前後の空白を除いた文字列にし、全角の数字・記号を半角にする"""
+    text = str(value).strip()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKC', text)
+    return text
+
+
+def parse_date_with_format(text, format_name):
+    """
+    正規化済みの文字列を指定の書式で日付に変換
+
+    Returns:
+        str: 'YYYY-MM-DD'（書式に合わない・存在しない日付の場合は None）
+    """
+    pattern, build = DATE_FORMATS_BY_NAME[format_name]
+    match = pattern.match(text)
+    if match is None:
+        return None
+    try:
+        return date(*build(match)).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_date_any_format(value):
+    """すべての書式を順に試して日付に変換（変換できない場合は None）"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    text = normalize_text(value)
+    for format_name, _, _ in DATE_FORMATS:
+        result = parse_date_with_format(text, format_name)
+        if result is not None:
+            return result
+    return None
+
+
+def sniff_date_format(samples):
+    """
+    取引日の列の書式を判定
+
+    Args:
+        samples: 列の先頭の値のリスト
+
+    Returns:
+        str: 最も多くの値を変換できた書式の名前（判定できない場合は None）
+    """
+    texts = [normalize_text(value) for value in samples
+             if value and not isinstance(value, (datetime, date))]
+    best_name, best_count = None, 0
+    for format_name, _, _ in DATE_FORMATS:
+        count = sum(1 for text in texts if parse_date_with_format(text, format_name) is not None)
+        if count > best_count:
+            best_name, best_count = format_name, count
+    return best_name
+
+
+def compile_date_converter(format_name):
+    """
+    判定した書式専用の日付変換関数を作成
+
+    変換関数は 'YYYY-MM-DD' を返し、書式に合わない値は None を返す
+    （呼び出し元ですべての書式を試す）
+    """
+    pattern, build = DATE_FORMATS_BY_NAME[format_name] if format_name else (None, None)
+
+    def convert(value):
+        if isinstance(value, (datetime, date)):
+            return value.strftime('%Y-%m-%d')
+        if pattern is None or not value:
+            return None
+        text = str(value).strip()
+        if not text.isascii():
+            text = unicodedata.normalize('NFKC', text)
+        match = pattern.match(text)
+        if match is None:
+            return None
+        try:
+            return date(*build(match)).isoformat()
+        except ValueError:
+            return None
+    return convert
+
+
+def sniff_amount_format(samples):
+    """
+    金額の列の書式を判定
+
+    Returns:
+        dict: normalize（全角文字あり）, remove（値に含まれていた桁区切り・通貨記号・空白）,
+              paren（括弧の負数）, negative_mark（△▲の負数）, decimal（小数点あり）
+    """
+    amount_format = {'normalize': False, 'remove': '', 'paren': False, 'negative_mark': False, 'decimal': False}
+    for value in samples:
+        if value is None or isinstance(value, (int, float)):
+            continue
+        text = str(value).strip()
+        if not text.isascii():
+            amount_format['normalize'] = True
+            text = unicodedata.normalize('NFKC', text)
+        for char in AMOUNT_REMOVE_CHARS:
+            if char in text and char not in amount_format['remove']:
+                amount_format['remove'] += char
+        if text.startswith('(') and text.endswith(')'):
+            amount_format['paren'] = True
+        if text and text[0] in AMOUNT_NEGATIVE_MARKS:
+            amount_format['negative_mark'] = True
+        if '.' in text:
+            amount_format['decimal'] = True
+    return amount_format
+
+
+def compile_amount_converter(amount_format):
+    """
+    判定した書式専用の金額変換関数を作成
+
+    判定で見つからなかった処理（全角の変換・負数の記号など）は行わない。
+    書式に合わない値は ValueError を送出する（呼び出し元ですべての書式を試す）
+    """
+    normalize = amount_format['normalize']
+    remove_chars = amount_format['remove']
+    # 桁区切りだけの場合は translate より replace の方が速い
+    remove_table = str.maketrans('', '', remove_chars) if len(remove_chars) > 1 else None
+    paren = amount_format['paren']
+    negative_mark = amount_format['negative_mark']
+    number = float if amount_format['decimal'] else int
+
+    def convert(value):
+        if value.__class__ is not str:
+            if not value:
+                return 0
+            if isinstance(value, (int, float)):
+                return int(value)
+            value = str(value)
+        text = value.strip()
+        if not text:
+            return 0
+        if normalize and not text.isascii():
+            text = unicodedata.normalize('NFKC', text)
+        if remove_table is not None:
+            text = text.translate(remove_table)
+        elif remove_chars:
+            text = text.replace(remove_chars, '')
+        if paren and text[0] == '(' and text[-1] == ')':
+            return -int(number(text[1:-1]))
+        if negative_mark and text[0] in AMOUNT_NEGATIVE_MARKS:
+            return -int(number(text[1:]))
+        return int(number(text))
+    return convert
+
+
+# すべての書式に対応する金額変換関数（書式の判定に合わない値の変換に使う）
+parse_amount_any_format = compile_amount_converter({
+    'normalize': True, 'remove': AMOUNT_REMOVE_CHARS, 'paren': True, 'negative_mark': True, 'decimal': True,
+})
+
+
+def row_fingerprint(organization_id, account, transaction_date, amount, description, occurrence=0):
+    """
+    取り込んだ行の重複判定用のフィンガープリント（正規化した値の SHA-256、64文字）
+
+    Args:
+        account: 口座名または勘定科目ID
+        description: 摘要・取引先（全角・半角や連続する空白の違いは同じとみなす）
+        occurrence: 同じファイル内で同じ内容の行が何回目に出てきたか（0始まり）
+    """
+    if isinstance(transaction_date, (datetime, date)):
+        transaction_date = transaction_date.strftime('%Y-%m-%d')
+    key = '\x1f'.join((
+        str(organization_id),
+        normalize_text(account if account is not None else ''),
+        str(transaction_date),
+        str(int(amount or 0)),
+        ' '.join(normalize_text(description or '').split()),
+        str(occurrence),
+    ))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
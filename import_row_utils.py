@@ -0,0 +1,148 @@
+"""
+インポートファイルの行の変換モジュール
+ファイルの1行を出納帳の項目（取引日・金額・取引先・備考）に変換する
+
+並列インポートのプロセスプールはこのモジュールの parse_csv_chunk を実行する
+（プールのプロセスではこのモジュールと書式判定のモジュールだけを読み込み、
+データベースやアプリケーションの初期化は行わない）
+"""
+
+import csv
+from io import StringIO
+from import_format_utils import (
+    compile_amount_converter,
+    compile_date_converter,
+    parse_amount_any_format,
+    parse_date_any_format,
+)
+
+
+class RowConverter:
+    """ファイルの行を出納帳の項目に変換するクラス（警告・エラーは warnings / errors に追加する）"""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def parse_date(self, date_str):
+        """日付文字列をパース（すべての書式を順に試す）"""
+        if not date_str:
+            return None
+
+        # 年月日・和暦・全角数字などの書式を試す（Excelの日付セルは datetime / date）
+        result = parse_date_any_format(date_str)
+        if result is not None:
+            return result
+
+        self.warnings.append(f"日付形式が不正です: {date_str}")
+        return None
+
+    def parse_amount(self, amount_str):
+        """金額文字列をパース（桁区切り・括弧や△の負数・全角数字・通貨記号に対応）"""
+        if not amount_str:
+            return 0
+
+        try:
+            return parse_amount_any_format(amount_str)
+        except ValueError:
+            self.warnings.append(f"金額形式が不正です: {amount_str}")
+            return 0
+
+    def _apply_column_formats(self, columns):
+        """columns の date_format / amount_format から列ごとの変換関数を作成して設定"""
+        convert_date = compile_date_converter(columns['date_format'])
+        convert_amount = compile_amount_converter(columns['amount_format'])
+
+        def parse_date(value):
+            result = convert_date(value)
+            return result if result is not None else self.parse_date(value)
+
+        def parse_amount(value):
+            try:
+                return convert_amount(value)
+            except (ValueError, TypeError):
+                return self.parse_amount(value)
+
+        columns['parse_date'] = parse_date
+        columns['parse_amount'] = parse_amount
+
+    def _convert_row(self, row, row_idx, columns):
+        """
+        ファイルの1行を出納帳の項目に変換
+
+        Returns:
+            dict: transaction_date, amount_with_tax, counterparty, remarks（投入しない行は None）
+        """
+        date_col = columns['date_col']
+        amount_col = columns['amount_col']
+        counterparty_col = columns['counterparty_col']
+        remarks_col = columns['remarks_col']
+
+        # 列が足りない場合はスキップ
+        if len(row) <= max(date_col, amount_col):
+            self.warnings.append(f"行 {row_idx}: 列数が不足しています")
+            return None
+
+        # 取引日を取得（列の書式を判定済みの場合は列ごとの変換関数を使う）
+        transaction_date = columns.get('parse_date', self.parse_date)(row[date_col])
+        if not transaction_date:
+            self.warnings.append(f"行 {row_idx}: 取引日が無効です")
+            return None
+
+        # 金額を取得
+        amount = columns.get('parse_amount', self.parse_amount)(row[amount_col])
+        if amount == 0:
+            self.warnings.append(f"行 {row_idx}: 金額が無効です")
+            return None
+
+        # オプション項目を取得
+        counterparty = None
+        if counterparty_col is not None and len(row) > counterparty_col:
+            counterparty = str(row[counterparty_col]).strip() if row[counterparty_col] else None
+
+        remarks = None
+        if remarks_col is not None and len(row) > remarks_col:
+            remarks = str(row[remarks_col]).strip() if row[remarks_col] else None
+
+        return {
+            'transaction_date': transaction_date,
+            'amount_with_tax': amount,
+            'counterparty': counterparty,
+            'remarks': remarks,
+        }
+
+
+def parse_csv_chunk(task):
+    """
+    並列インポートのプロセスで実行: CSVファイルのバイト範囲を読み込んで行を変換
+
+    Returns:
+        dict: rows（[(行番号, 変換結果), ...]）, last_row（範囲の最後の行番号）, warnings, errors
+    """
+    file_path, start, end, first_row, skip_until, encoding, worker_columns = task
+    converter = RowConverter()
+    columns = dict(worker_columns)
+    converter._apply_column_formats(columns)
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode(encoding)
+
+    converted = []
+    row_idx = first_row - 1
+    for row_idx, row in enumerate(csv.reader(StringIO(text, newline='')), start=first_row):
+        if row_idx <= skip_until:
+            continue
+        try:
+            values = converter._convert_row(row, row_idx, columns)
+        except Exception as e:
+            converter.errors.append(f"行 {row_idx}: {str(e)}")
+            continue
+        if values is not None:
+            converted.append((row_idx, values))
+    return {
+        'rows': converted,
+        'last_row': row_idx,
+        'warnings': converter.warnings,
+        'errors': converter.errors,
+    }
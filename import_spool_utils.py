@@ -0,0 +1,89 @@
+"""
+インポートファイルの一時保存モジュール
+アップロードされたファイルをサーバー側に1回だけ保存してトークンを発行し、
+プレビュー・インポート実行ではトークンからファイルを開く（ファイル内容をフォームで往復させない）
+保存先はデータベース（stored_files）のため、複数のWebプロセス・サーバーのどこからでも参照できる
+保存したファイルは有効期限（IMPORT_SPOOL_TTL 秒）を過ぎると削除する
+インポートが途中で失敗した場合は削除せず、同じトークンで続きから再開できる
+"""
+
+import os
+import re
+from datetime import datetime
+from file_store_utils import copy_to_temporary_file, delete_file, get_file_info, open_file_stream, purge_expired_files, save_file
+from models import StoredFile
+
+
+# 有効期限（秒）
+IMPORT_SPOOL_TTL = int(os.environ.get('IMPORT_SPOOL_TTL', '3600'))
+
+_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+def spool_upload(db, stream, organization_id, filename, file_type, user_id=None):
+    """
+    アップロードされたファイルを一時保存（コミットは呼び出し元で行う）
+
+    Args:
+        stream: アップロードされたファイルの読み込み用ストリーム（少しずつ保存する）
+
+    Returns:
+        str: トークン
+    """
+    purge_expired_files(db)
+    stored_file = save_file(
+        db,
+        stream,
+        'import_spool',
+        organization_id=organization_id,
+        filename=filename,
+        info={'file_type': file_type, 'user_id': user_id},
+        ttl=IMPORT_SPOOL_TTL,
+    )
+    return stored_file.id
+
+
+def get_spooled_upload(db, token, organization_id):
+    """
+    トークンから一時保存したファイルの情報を取得
+
+    Returns:
+        dict: token, filename, file_type, size, user_id（トークンが不正・期限切れ・別の事業所の場合は None）
+    """
+    if not token or not _TOKEN_PATTERN.match(token):
+        return None
+    stored_file = db.get(StoredFile, token)
+    if stored_file is None or stored_file.purpose != 'import_spool':
+        return None
+    if stored_file.organization_id != organization_id:
+        return None
+    if stored_file.expires_at and stored_file.expires_at < datetime.now().strftime('%Y-%m-%d %H:%M:%S'):
+        return None
+    info = get_file_info(stored_file)
+    return {
+        'token': stored_file.id,
+        'filename': stored_file.filename,
+        'file_type': info.get('file_type'),
+        'user_id': info.get('user_id'),
+        'size': stored_file.size,
+    }
+
+
+def open_spooled_upload(token, streaming=False):
+    """
+    一時保存したファイルを読み込み用に開く
+
+    Args:
+        streaming: True の場合は保存先から先頭から順に読み込む（シークできない。CSVのプレビュー用）。
+            False の場合はシーク可能なローカルの一時ファイルにコピーする（閉じると削除される）
+    """
+    if streaming:
+        return open_file_stream(token)
+    return copy_to_temporary_file(token)
+
+
+def delete_spooled_upload(db, token):
+    """一時保存したファイルを削除（コミットは呼び出し元で行う）"""
+    if not token or not _TOKEN_PATTERN.match(token):
+        return
+    delete_file(db, token)
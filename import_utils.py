@@ -1,24 +1,136 @@
 """
 インポート処理用のユーティリティモジュール
 CSV/Excelファイルの読み込み、データ変換、出納帳への投入を行う
+
+大きなファイルは import_data_stream で読み込む（少しずつデコードして1行ずつ処理し、
+一定件数ごとにコミットする。途中で失敗した場合は結果の next_row から再開できる）
 """
 
+import codecs
 import csv
 import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from datetime import datetime
-from io import StringIO, BytesIO
+from io import StringIO, BytesIO, TextIOWrapper
 from openpyxl import load_workbook
 from db import SessionLocal
-from models import CashBook, AccountItem
+from models import CashBook, AccountItem, coerce_date
+from job_utils import register_job_handler
+from import_format_utils import SNIFF_ROWS, row_fingerprint, sniff_amount_format, sniff_date_format
+from import_row_utils import RowConverter, parse_csv_chunk
+
+
+# ストリーミングインポートで1回にコミットする行数
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '1000'))
+# 文字コードの判定で一度に読むバイト数
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# 並列インポートのプロセス数（1 以下の場合は並列化しない）
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', str(os.cpu_count() or 1)))
+# 並列インポートで1プロセスに渡すバイト数の目安
+PARALLEL_CHUNK_BYTES = int(os.environ.get('PARALLEL_CHUNK_BYTES', str(4 * 1024 * 1024)))
+# このサイズ以上のCSVは並列でインポートする（バックグラウンドジョブ）
+PARALLEL_IMPORT_MIN_BYTES = int(os.environ.get('PARALLEL_IMPORT_MIN_BYTES', str(32 * 1024 * 1024)))
+
+
+def detect_encoding(file_obj, encoding='utf-8'):
+    """
+    ファイルの文字コードを判定（ファイル全体を指定の文字コードで読めない場合は Shift-JIS）
+
+    先頭だけ ASCII で途中から Shift-JIS の行があるファイルを途中でエラーにしないよう、
+    インポートの前にファイル全体を少しずつデコードして確認する（読み込み位置は先頭に戻す）
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    file_obj.seek(0)
+    try:
+        for block in iter(lambda: file_obj.read(ENCODING_SAMPLE_SIZE), b''):
+            decoder.decode(block)
+        decoder.decode(b'', final=True)
+        return encoding
+    except UnicodeDecodeError:
+        return 'shift_jis'
+    finally:
+        file_obj.seek(0)
+
 
+def detect_head_encoding(file_obj, encoding='utf-8'):
+    """
+    シークできないファイルの文字コードを先読みした範囲だけで判定（読めない場合は Shift-JIS）
 
-class ImportProcessor:
-    """インポート処理を管理するクラス"""
+    先頭の行だけを読むプレビュー用（インポートでは detect_encoding でファイル全体を確認する）
+
+    Args:
+        file_obj: peek できるファイルオブジェクト（io.BufferedReader）
+    """
+    head = file_obj.peek(ENCODING_SAMPLE_SIZE)[:ENCODING_SAMPLE_SIZE]
+    try:
+        # 末尾で途切れたマルチバイト文字はエラーにしない
+        codecs.getincrementaldecoder(encoding)().decode(head)
+        return encoding
+    except UnicodeDecodeError:
+        return 'shift_jis'
+
+
+def plan_csv_chunks(file_obj, chunk_bytes=PARALLEL_CHUNK_BYTES, block_size=1024 * 1024):
+    """
+    CSVファイルを行の区切り（引用符で囲まれた値の中の改行は除く）でバイト範囲に分割
+
+    引用符の数の偶奇で値の中かどうかを判定する（Shift-JIS・UTF-8 とも '"' と改行は
+    マルチバイト文字の一部にならないため、デコードせずに判定できる）
+
+    Returns:
+        list: [(開始位置, 終了位置, 範囲の最初の行番号（1始まり）), ...]
+    """
+    chunks = []
+    chunk_start = 0
+    chunk_first_row = 1
+    next_target = chunk_bytes
+    rows = 0
+    in_quotes = False
+    offset = 0
+    
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(block_size), b''):
+        part_offset = offset
+        for index, part in enumerate(block.split(b'"')):
+            if index > 0:
+                # 引用符を1つ挟むごとに値の中・外が入れ替わる
+                in_quotes = not in_quotes
+                part_offset += 1
+            if not in_quotes:
+                position = 0
+                while part_offset + len(part) > next_target:
+                    newline = part.find(b'\n', max(next_target - part_offset, position))
+                    if newline < 0:
+                        break
+                    rows_in_part = part.count(b'\n', position, newline + 1)
+                    rows += rows_in_part
+                    chunk_end = part_offset + newline + 1
+                    chunks.append((chunk_start, chunk_end, chunk_first_row))
+                    chunk_start, chunk_first_row = chunk_end, rows + 1
+                    next_target = chunk_end + chunk_bytes
+                    position = newline + 1
+                rows += part.count(b'\n', position)
+            part_offset += len(part)
+        offset += len(block)
+    
+    if offset > chunk_start:
+        chunks.append((chunk_start, offset, chunk_first_row))
+    file_obj.seek(0)
+    return chunks
+
+
+class ImportProcessor(RowConverter):
+    """インポート処理を管理するクラス（行の変換は RowConverter）"""
     
     def __init__(self):
-        self.errors = []
-        self.warnings = []
+        super().__init__()
         self.imported_count = 0
+        # ファイル内で同じ内容の行が出てきた回数（キーは occurrence=0 のフィンガープリント）
+        self.occurrences = {}
     
     def read_csv_file(self, file_content, encoding='utf-8'):
         """CSVファイルを読み込む"""
@@ -50,83 +162,127 @@ class ImportProcessor:
             else:
                 file_obj = file_content
             
-            # Excelを読み込む
-            wb = load_workbook(file_obj)
-            ws = wb.active
-            
-            rows = []
-            for row in ws.iter_rows(values_only=True):
-                rows.append(list(row))
-            
-            return rows
+            return list(self.iter_excel_rows(file_obj))
         except Exception as e:
             self.errors.append(f"Excel読み込みエラー: {str(e)}")
             return None
     
+    def iter_csv_rows(self, file_obj, encoding=None):
+        """
+        CSVファイルを1行ずつ読み込むジェネレーター（ファイル全体をメモリに読み込まない）
+
+        Args:
+            file_obj: バイナリモードのファイルオブジェクト
+            encoding: 文字コード（省略した場合はファイル全体を UTF-8 で読めるかで判定する。
+                シークできないファイルは先読みした範囲で判定する）
+        """
+        if encoding is None:
+            encoding = detect_encoding(file_obj) if file_obj.seekable() else detect_head_encoding(file_obj)
+        text = TextIOWrapper(file_obj, encoding=encoding, newline='')
+        try:
+            yield from csv.reader(text)
+        finally:
+            # 呼び出し元のファイルオブジェクトは閉じない
+            text.detach()
+    
+    def iter_excel_rows(self, file_obj):
+        """
+        Excelファイルを1行ずつ読み込むジェネレーター
+
+        読み取り専用モードで開き、シートのXMLを先頭から順に読む（セルのオブジェクトを
+        まとめて作らないため、使用メモリは行数に依存しない）
+        """
+        wb = load_workbook(file_obj, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            for row in ws.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            wb.close()
+    
+    def iter_file_rows(self, file_obj, file_type):
+        """ファイル形式（'csv' or 'excel'）に応じて1行ずつ読み込むジェネレーターを返す"""
+        if file_type == 'csv':
+            return self.iter_csv_rows(file_obj)
+        if file_type == 'excel':
+            return self.iter_excel_rows(file_obj)
+        raise ValueError("サポートされていないファイル形式です")
+    
     def get_preview_data(self, file_content, file_type, skip_rows=0, limit=5):
-        """ファイルのプレビューデータを取得（最初の数行）"""
+        """ファイルのプレビューデータを取得（最初の数行だけを読み込む）"""
         try:
-            if file_type == 'csv':
-                rows = self.read_csv_file(file_content)
-            elif file_type == 'excel':
-                rows = self.read_excel_file(file_content)
-            else:
+            if file_type not in ('csv', 'excel'):
                 self.errors.append("サポートされていないファイル形式です")
                 return None
             
-            if rows is None:
-                return None
+            if isinstance(file_content, str):
+                file_content = file_content.encode()
+            file_obj = BytesIO(file_content) if isinstance(file_content, bytes) else file_content
             
             # スキップ行を除外
-            preview_rows = rows[skip_rows:skip_rows + limit]
-            return preview_rows
+            rows = self.iter_file_rows(file_obj, file_type)
+            try:
+                return list(islice(rows, skip_rows, skip_rows + limit))
+            finally:
+                rows.close()
         except Exception as e:
             self.errors.append(f"プレビュー取得エラー: {str(e)}")
             return None
     
-    def parse_date(self, date_str):
-        """日付文字列をパース"""
-        if not date_str:
-            return None
-        
-        # 複数の日付フォーマットを試す
-        date_formats = [
-            '%Y-%m-%d',
-            '%Y/%m/%d',
-            '%Y年%m月%d日',
-            '%m-%d-%Y',
-            '%m/%d/%Y',
-            '%d-%m-%Y',
-            '%d/%m/%Y',
-        ]
-        
-        for fmt in date_formats:
-            try:
-                dt = datetime.strptime(str(date_str).strip(), fmt)
-                return dt.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
+    def _sniff_column_parsers(self, columns, sample_rows):
+        """
+        先頭の行から取引日・金額の列の書式を判定し、列ごとの変換関数を columns に設定
+
+        変換関数は判定した書式だけを試し、合わない値（外れ値）の場合のみ
+        parse_date / parse_amount ですべての書式を試す
+        """
+        date_col = columns['date_col']
+        amount_col = columns['amount_col']
+        date_samples = [row[date_col] for row in sample_rows if len(row) > date_col]
+        amount_samples = [row[amount_col] for row in sample_rows if len(row) > amount_col]
         
-        self.warnings.append(f"日付形式が不正です: {date_str}")
-        return None
+        # 判定結果は別プロセスにも渡せるよう書式の名前・辞書として保持する
+        columns['date_format'] = sniff_date_format(date_samples)
+        columns['amount_format'] = sniff_amount_format(amount_samples)
+        self._apply_column_formats(columns)
     
-    def parse_amount(self, amount_str):
-        """金額文字列をパース"""
-        if not amount_str:
-            return 0
+    def _mapping_columns(self, mapping):
+        """マッピング情報から列番号を取得（必須の列がない場合は None）"""
+        columns = {
+            'date_col': mapping.get('date_col'),
+            'amount_col': mapping.get('amount_col'),
+            'counterparty_col': mapping.get('counterparty_col'),
+            'remarks_col': mapping.get('remarks_col'),
+        }
+        # 必須マッピングの確認
+        if columns['date_col'] is None or columns['amount_col'] is None:
+            self.errors.append("取引日と金額のマッピングは必須です")
+            return None
+        return columns
+    
+    def _resolve_account_item_id(self, db, mapping, account_item_id):
+        """投入先の勘定科目IDを決定して存在を確認（見つからない場合は None）"""
+        # 勘定科目の決定
+        mapped_account_id = mapping.get('account_item_id')
+        if mapped_account_id:
+            final_account_id = mapped_account_id
+        elif account_item_id:
+            final_account_id = account_item_id
+        else:
+            self.errors.append("勘定科目が指定されていません")
+            return None
         
-        try:
-            # カンマを削除
-            amount_str = str(amount_str).replace(',', '').strip()
-            # 括弧で囲まれた負数に対応
-            if amount_str.startswith('(') and amount_str.endswith(')'):
-                return -int(float(amount_str[1:-1]))
-            return int(float(amount_str))
-        except ValueError:
-            self.warnings.append(f"金額形式が不正です: {amount_str}")
-            return 0
+        # 勘定科目の存在確認
+        account = db.query(AccountItem).filter(
+            AccountItem.id == final_account_id
+        ).first()
+        if not account:
+            self.errors.append(f"勘定科目ID {final_account_id} が見つかりません")
+            return None
+        return final_account_id
     
-    def import_data(self, file_content, file_type, mapping, skip_rows=0, account_item_id=None):
+    def import_data(self, file_content, file_type, mapping, skip_rows=0, account_item_id=None, progress_callback=None,
+                    organization_id=None):
         """
         ファイルから出納帳データをインポート
         
@@ -143,6 +299,8 @@ class ImportProcessor:
                 }
             skip_rows: スキップするヘッダー行数
             account_item_id: 勘定科目ID（マッピングで指定されない場合）
+            progress_callback: 進捗通知用の関数（処理済み行数, 全行数）（任意）
+            organization_id: 事業所ID（重複チェックと登録する出納帳に使用）
         
         Returns:
             dict: インポート結果
@@ -151,6 +309,7 @@ class ImportProcessor:
         self.errors = []
         self.warnings = []
         self.imported_count = 0
+        self.occurrences = {}
         
         try:
             # ファイルを読み込む
@@ -168,97 +327,48 @@ class ImportProcessor:
             # スキップ行を除外
             data_rows = rows[skip_rows:]
             
-            # マッピング情報を取得
-            date_col = mapping.get('date_col')
-            amount_col = mapping.get('amount_col')
-            counterparty_col = mapping.get('counterparty_col')
-            remarks_col = mapping.get('remarks_col')
-            mapped_account_id = mapping.get('account_item_id')
-            
-            # 必須マッピングの確認
-            if date_col is None or amount_col is None:
-                self.errors.append("取引日と金額のマッピングは必須です")
+            # マッピング情報・勘定科目を確認
+            columns = self._mapping_columns(mapping)
+            if columns is None:
                 return self._get_result()
-            
-            # 勘定科目の決定
-            if mapped_account_id:
-                final_account_id = mapped_account_id
-            elif account_item_id:
-                final_account_id = account_item_id
-            else:
-                self.errors.append("勘定科目が指定されていません")
+            final_account_id = self._resolve_account_item_id(db, mapping, account_item_id)
+            if final_account_id is None:
                 return self._get_result()
             
-            # 勘定科目の存在確認
-            account = db.query(AccountItem).filter(
-                AccountItem.id == final_account_id
-            ).first()
-            if not account:
-                self.errors.append(f"勘定科目ID {final_account_id} が見つかりません")
-                return self._get_result()
+            # 先頭の行から列の書式を判定
+            self._sniff_column_parsers(columns, data_rows[:SNIFF_ROWS])
             
-            # データを投入
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # データを変換
+            total_rows = len(data_rows)
+            converted = []
             
             for row_idx, row in enumerate(data_rows, start=skip_rows + 1):
+                if progress_callback is not None and (row_idx - skip_rows) % 100 == 0:
+                    progress_callback(row_idx - skip_rows, total_rows)
                 try:
-                    # 列が足りない場合はスキップ
-                    if len(row) <= max(date_col, amount_col):
-                        self.warnings.append(f"行 {row_idx}: 列数が不足しています")
-                        continue
-                    
-                    # 取引日を取得
-                    transaction_date = self.parse_date(row[date_col])
-                    if not transaction_date:
-                        self.warnings.append(f"行 {row_idx}: 取引日が無効です")
-                        continue
-                    
-                    # 金額を取得
-                    amount = self.parse_amount(row[amount_col])
-                    if amount == 0:
-                        self.warnings.append(f"行 {row_idx}: 金額が無効です")
-                        continue
-                    
-                    # オプション項目を取得
-                    counterparty = None
-                    if counterparty_col is not None and len(row) > counterparty_col:
-                        counterparty = str(row[counterparty_col]).strip() if row[counterparty_col] else None
-                    
-                    remarks = None
-                    if remarks_col is not None and len(row) > remarks_col:
-                        remarks = str(row[remarks_col]).strip() if row[remarks_col] else None
-                    
-                    # 重複チェック（同じ日付・金額・取引先の組み合わせ）
-                    existing = db.query(CashBook).filter(
-                        CashBook.transaction_date == transaction_date,
-                        CashBook.amount_with_tax == amount,
-                        CashBook.account_item_id == final_account_id,
-                        CashBook.counterparty == counterparty
-                    ).first()
-                    
-                    if existing:
-                        self.warnings.append(
-                            f"行 {row_idx}: 同じ日付・金額・取引先のデータが既に存在します"
-                        )
-                        continue
-                    
-                    # 出納帳に投入
-                    cash_book = CashBook(
-                        transaction_date=transaction_date,
-                        account_item_id=final_account_id,
-                        counterparty=counterparty,
-                        remarks=remarks,
-                        amount_with_tax=amount,
-                        created_at=now,
-                        updated_at=now
-                    )
-                    db.add(cash_book)
-                    self.imported_count += 1
-                
+                    values = self._convert_row(row, row_idx, columns)
+                    if values is not None:
+                        converted.append((row_idx, values))
                 except Exception as e:
                     self.errors.append(f"行 {row_idx}: {str(e)}")
                     continue
             
+            # 重複チェック（同じ日付・金額・取引先の組み合わせ）はファイルの取引日の範囲で1回だけ検索する
+            existing_fingerprints = self._existing_cash_book_fingerprints(
+                db, organization_id, final_account_id,
+                [coerce_date(values['transaction_date']) for _, values in converted],
+            )
+            
+            # データを投入
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for row_idx, values in converted:
+                cash_book = self._new_cash_book(
+                    row_idx, values, organization_id, final_account_id, existing_fingerprints, now
+                )
+                if cash_book is not None:
+                    db.add(cash_book)
+                    self.imported_count += 1
+            
             # コミット
             db.commit()
             
@@ -270,6 +380,383 @@ class ImportProcessor:
         
         return self._get_result()
     
+    def import_data_stream(self, file_obj, file_type, mapping, organization_id, skip_rows=0,
+                           account_item_id=None, chunk_size=IMPORT_CHUNK_SIZE, start_row=0,
+                           progress_callback=None):
+        """
+        ファイルから出納帳データをストリーミングでインポート
+
+        ファイルを少しずつ読み込んで1行ずつ変換し、chunk_size 行ごとにコミットする
+        （使用メモリはファイルサイズに依存しない）。コミットに失敗した場合はそこで中断し、
+        結果の next_row を start_row に指定して呼び出すと続きから再開できる
+
+        Args:
+            file_obj: バイナリモードのファイルオブジェクト（シーク可能なもの）
+            file_type: ファイル形式（'csv' or 'excel'）
+            mapping: マッピング情報（import_data と同じ）
+            organization_id: 事業所ID
+            skip_rows: スキップするヘッダー行数
+            account_item_id: 勘定科目ID（マッピングで指定されない場合）
+            chunk_size: 1回にコミットする行数
+            start_row: 再開位置（ファイルの先頭からこの行数までは処理済みとして読み飛ばす）
+            progress_callback: 進捗通知用の関数（読み込んだバイト数, ファイルサイズ）（任意）
+
+        Returns:
+            dict: インポート結果（next_row: コミット済みの行数。再開時の start_row）
+        """
+        db = SessionLocal()
+        self.errors = []
+        self.warnings = []
+        self.imported_count = 0
+        # 同じ内容の行の出現回数はファイルの先頭から数える（再開する場合は処理済みの行を数え直す）
+        self.occurrences = {}
+        next_row = start_row
+        
+        try:
+            if file_type == 'csv':
+                rows = self.iter_csv_rows(file_obj)
+            elif file_type == 'excel':
+                rows = self.iter_excel_rows(file_obj)
+            else:
+                self.errors.append("サポートされていないファイル形式です")
+                return self._get_stream_result(next_row)
+            
+            # マッピング情報・勘定科目を確認
+            columns = self._mapping_columns(mapping)
+            if columns is None:
+                return self._get_stream_result(next_row)
+            final_account_id = self._resolve_account_item_id(db, mapping, account_item_id)
+            if final_account_id is None:
+                return self._get_stream_result(next_row)
+            
+            # 進捗はファイルの読み込み位置から求める
+            file_obj.seek(0, os.SEEK_END)
+            total_bytes = file_obj.tell()
+            file_obj.seek(0)
+            
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            chunk = []
+            chunk_last_row = next_row
+            
+            # スキップ行は変換せずに読み飛ばす
+            numbered_rows = enumerate(rows, start=1)
+            for _ in islice(numbered_rows, skip_rows):
+                pass
+            
+            # 先頭の行から列の書式を判定（判定に使った行もそのまま投入する）
+            sample_rows = list(islice(numbered_rows, SNIFF_ROWS))
+            self._sniff_column_parsers(columns, [row for _, row in sample_rows])
+            
+            # 処理済みの行は投入せずに出現回数だけを数える
+            numbered_rows = self._replay_occurrences(
+                chain(sample_rows, numbered_rows), start_row, columns, organization_id, final_account_id
+            )
+            
+            for row_idx, row in numbered_rows:
+                chunk_last_row = row_idx
+                try:
+                    values = self._convert_row(row, row_idx, columns)
+                except Exception as e:
+                    self.errors.append(f"行 {row_idx}: {str(e)}")
+                    values = None
+                if values is not None:
+                    chunk.append((row_idx, values))
+                
+                if chunk_last_row - next_row >= chunk_size:
+                    if not self._commit_import_chunk(db, chunk, organization_id, final_account_id, now):
+                        return self._get_stream_result(next_row)
+                    chunk = []
+                    next_row = chunk_last_row
+                    if progress_callback is not None:
+                        progress_callback(file_obj.tell(), total_bytes)
+            
+            if not self._commit_import_chunk(db, chunk, organization_id, final_account_id, now):
+                return self._get_stream_result(next_row)
+            next_row = chunk_last_row
+            if progress_callback is not None:
+                progress_callback(total_bytes, total_bytes)
+        
+        except Exception as e:
+            db.rollback()
+            self.errors.append(f"インポート処理エラー: {str(e)}")
+        finally:
+            db.close()
+        
+        return self._get_stream_result(next_row)
+    
+    def import_data_parallel(self, file_path, mapping, organization_id, skip_rows=0,
+                             account_item_id=None, chunk_size=IMPORT_CHUNK_SIZE, start_row=0,
+                             workers=IMPORT_WORKERS, chunk_bytes=PARALLEL_CHUNK_BYTES,
+                             progress_callback=None):
+        """
+        CSVファイルを複数プロセスで変換してインポート
+
+        ファイルを行の区切りでバイト範囲に分割し、プロセスプールで範囲ごとに読み込み・変換する。
+        変換済みの行はこのプロセスだけがファイルの順に chunk_size 行ずつコミットする
+        （書き込みは1か所のため、行番号・重複チェック・再開位置は import_data_stream と同じ）。
+        分割した範囲の行数が変換結果と一致しない場合は、そこから import_data_stream で続きを読み込む
+
+        Args:
+            file_path: CSVファイルのパス（各プロセスがファイルを開く）
+            workers: プロセス数
+            chunk_bytes: 1プロセスに渡すバイト数の目安
+            その他: import_data_stream と同じ
+
+        Returns:
+            dict: インポート結果（next_row: コミット済みの行数。再開時の start_row）
+        """
+        self.errors = []
+        self.warnings = []
+        self.imported_count = 0
+        # 同じ内容の行の出現回数はファイルの先頭から数える（再開する場合は処理済みの行を数え直す）
+        self.occurrences = {}
+        next_row = start_row
+        
+        columns = self._mapping_columns(mapping)
+        if columns is None:
+            return self._get_stream_result(next_row)
+        db = SessionLocal()
+        try:
+            final_account_id = self._resolve_account_item_id(db, mapping, account_item_id)
+            if final_account_id is None:
+                return self._get_stream_result(next_row)
+            
+            skip_until = max(skip_rows, start_row)
+            with open(file_path, 'rb') as f:
+                encoding = detect_encoding(f)
+                # 先頭の行から列の書式を判定（各プロセスには判定結果だけを渡す）
+                rows = self.iter_csv_rows(f, encoding)
+                try:
+                    numbered_rows = enumerate(rows, start=1)
+                    for _ in islice(numbered_rows, skip_rows):
+                        pass
+                    sample_rows = list(islice(numbered_rows, SNIFF_ROWS))
+                    self._sniff_column_parsers(columns, [row for _, row in sample_rows])
+                    # 処理済みの行は出現回数だけをこのプロセスで数える
+                    if start_row > skip_rows:
+                        self._replay_occurrences(
+                            chain(sample_rows, numbered_rows), start_row, columns, organization_id, final_account_id
+                        )
+                finally:
+                    rows.close()
+                chunks = plan_csv_chunks(f, chunk_bytes)
+                total_bytes = f.seek(0, os.SEEK_END)
+            
+            worker_columns = {key: columns[key] for key in (
+                'date_col', 'amount_col', 'counterparty_col', 'remarks_col', 'date_format', 'amount_format',
+            )}
+            # 範囲ごとの処理内容と最後の行番号の見込み（最後の範囲は None）
+            # 処理済みの行だけの範囲は読み込まない
+            tasks = []
+            for index, (start, end, first_row) in enumerate(chunks):
+                expected_last_row = chunks[index + 1][2] - 1 if index + 1 < len(chunks) else None
+                if expected_last_row is not None and expected_last_row <= skip_until:
+                    continue
+                tasks.append((
+                    (file_path, start, end, first_row, skip_until, encoding, worker_columns),
+                    expected_last_row,
+                ))
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            
+            # 変換結果がメモリに溜まらないよう、先読みはプロセス数の2倍までにする
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context) as pool:
+                pending = deque()
+                task_iter = iter(tasks)
+                for task, expected_last_row in islice(task_iter, max(workers, 1) * 2):
+                    pending.append((task, expected_last_row, pool.submit(parse_csv_chunk, task)))
+                
+                while pending:
+                    task, expected_last_row, future = pending.popleft()
+                    for next_task, next_expected_last_row in islice(task_iter, 1):
+                        pending.append((next_task, next_expected_last_row, pool.submit(parse_csv_chunk, next_task)))
+                    
+                    result = future.result()
+                    self.warnings.extend(result['warnings'])
+                    self.errors.extend(result['errors'])
+                    converted = result['rows']
+                    for batch_start in range(0, len(converted), chunk_size):
+                        batch = converted[batch_start:batch_start + chunk_size]
+                        if not self._commit_import_chunk(db, batch, organization_id, final_account_id, now):
+                            return self._get_stream_result(next_row)
+                        next_row = batch[-1][0]
+                    next_row = max(next_row, result['last_row'])
+                    if progress_callback is not None:
+                        progress_callback(task[2], total_bytes)
+                    
+                    # 範囲の区切りの判定がCSVの読み込みと食い違った場合は続きを順に読み込む
+                    if expected_last_row is not None and result['last_row'] != expected_last_row:
+                        for _, _, pending_future in pending:
+                            pending_future.cancel()
+                        return self._continue_with_stream(
+                            file_path, mapping, organization_id, skip_rows, account_item_id,
+                            chunk_size, next_row, progress_callback,
+                        )
+        except Exception as e:
+            db.rollback()
+            self.errors.append(f"インポート処理エラー: {str(e)}")
+        finally:
+            db.close()
+        
+        return self._get_stream_result(next_row)
+    
+    def _continue_with_stream(self, file_path, mapping, organization_id, skip_rows, account_item_id,
+                              chunk_size, start_row, progress_callback):
+        """並列インポートを途中から import_data_stream で続ける（結果はこれまでの分と合算）"""
+        errors, warnings, imported_count = self.errors, self.warnings, self.imported_count
+        with open(file_path, 'rb') as f:
+            result = self.import_data_stream(
+                f, 'csv', mapping, organization_id, skip_rows=skip_rows, account_item_id=account_item_id,
+                chunk_size=chunk_size, start_row=start_row, progress_callback=progress_callback,
+            )
+        self.errors = errors + self.errors
+        self.warnings = warnings + self.warnings
+        self.imported_count += imported_count
+        return self._get_stream_result(result['next_row'])
+    
+    def _commit_import_chunk(self, db, chunk, organization_id, account_item_id, now):
+        """
+        変換済みの行を出納帳に投入してコミット（失敗した場合はロールバックして False）
+
+        重複チェック（同じ日付・金額・取引先の組み合わせ）はチャンクの取引日の範囲で1回だけ検索する
+        """
+        if not chunk:
+            return True
+        try:
+            existing_fingerprints = self._existing_cash_book_fingerprints(
+                db, organization_id, account_item_id,
+                [coerce_date(values['transaction_date']) for _, values in chunk],
+            )
+            cash_books = []
+            for row_idx, values in chunk:
+                cash_book = self._new_cash_book(
+                    row_idx, values, organization_id, account_item_id, existing_fingerprints, now
+                )
+                if cash_book is not None:
+                    cash_books.append(cash_book)
+            
+            db.add_all(cash_books)
+            db.commit()
+            # コミット済みのオブジェクトをセッションから外してメモリを解放する
+            db.expunge_all()
+            self.imported_count += len(cash_books)
+            return True
+        except Exception as e:
+            db.rollback()
+            self.errors.append(f"行 {chunk[0][0]}〜{chunk[-1][0]} の登録エラー: {str(e)}")
+            return False
+    
+    def _existing_cash_book_fingerprints(self, db, organization_id, account_item_id, dates):
+        """
+        取引日の範囲内の既存の出納帳のフィンガープリントを1回のクエリで取得
+
+        手入力の行（fingerprint が NULL）も重複とみなすため、取引日・金額・取引先から作成した
+        occurrence=0 のフィンガープリントごとの件数と、保存済みのフィンガープリントを返す
+
+        Returns:
+            tuple: ({occurrence=0 のフィンガープリント: 件数}, 保存済みのフィンガープリントの set)
+        """
+        counts = {}
+        stored = set()
+        if not dates:
+            return counts, stored
+        query = db.query(
+            CashBook.transaction_date, CashBook.amount_with_tax, CashBook.counterparty, CashBook.fingerprint
+        ).filter(
+            CashBook.account_item_id == account_item_id,
+            CashBook.transaction_date.between(min(dates), max(dates)),
+        )
+        if organization_id is not None:
+            query = query.filter(CashBook.organization_id == organization_id)
+        for transaction_date, amount, counterparty, fingerprint in query:
+            base = row_fingerprint(organization_id, account_item_id, transaction_date, amount, counterparty)
+            counts[base] = counts.get(base, 0) + 1
+            if fingerprint is not None:
+                stored.add(fingerprint)
+        return counts, stored
+    
+    def _new_cash_book(self, row_idx, values, organization_id, account_item_id, existing_fingerprints, now):
+        """
+        変換済みの行から出納帳を作成（既存の行と重複する場合は警告を追加して None）
+
+        同じファイル内の同じ内容の行（同じ日に同じ店で同じ金額の支払いが2回など）は
+        何回目に出てきたかをフィンガープリントに含めて別の行として登録する。
+        n 回目の行は、既存の出納帳に同じ内容の行が n 件以上ある場合に重複とみなす
+        （同じファイルを再度インポートした場合はすべての行をスキップする）
+        """
+        counts, stored = existing_fingerprints
+        transaction_date, base, occurrence = self._next_occurrence(organization_id, account_item_id, values)
+        fingerprint = base if occurrence == 0 else row_fingerprint(
+            organization_id, account_item_id, transaction_date, values['amount_with_tax'], values['counterparty'],
+            occurrence,
+        )
+        if occurrence < counts.get(base, 0) or fingerprint in stored:
+            self.warnings.append(
+                f"行 {row_idx}: 同じ日付・金額・取引先のデータが既に存在します"
+            )
+            return None
+        stored.add(fingerprint)
+        return CashBook(
+            organization_id=organization_id,
+            transaction_date=transaction_date,
+            account_item_id=account_item_id,
+            counterparty=values['counterparty'],
+            remarks=values['remarks'],
+            amount_with_tax=values['amount_with_tax'],
+            fingerprint=fingerprint,
+            created_at=now,
+            updated_at=now
+        )
+    
+    def _replay_occurrences(self, numbered_rows, start_row, columns, organization_id, account_item_id):
+        """
+        再開位置（start_row）までの処理済みの行を変換して出現回数だけを数える（出納帳には投入しない）
+
+        同じ内容の行が何回目かはファイルの先頭から数えるため、途中から再開する場合は
+        処理済みの行を数え直してから続きの行を投入する（数えないと再開後の行が
+        コミット済みの行と同じ1回目として扱われ、重複としてスキップされる）
+
+        Returns:
+            iterator: 再開位置より後ろの (行番号, 行)
+        """
+        # 処理済みの行の警告・エラーは前回のインポートで通知済みのため追加しない
+        warnings, errors = self.warnings, self.errors
+        self.warnings, self.errors = [], []
+        try:
+            for row_idx, row in numbered_rows:
+                if row_idx > start_row:
+                    return chain([(row_idx, row)], numbered_rows)
+                try:
+                    values = self._convert_row(row, row_idx, columns)
+                except Exception:
+                    values = None
+                if values is not None:
+                    self._next_occurrence(organization_id, account_item_id, values)
+            return iter(())
+        finally:
+            self.warnings, self.errors = warnings, errors
+    
+    def _next_occurrence(self, organization_id, account_item_id, values):
+        """
+        変換済みの行がファイル内で何回目に出てきた内容かを数える
+
+        Returns:
+            tuple: (取引日, occurrence=0 のフィンガープリント, 何回目か（0始まり）)
+        """
+        transaction_date = coerce_date(values['transaction_date'])
+        base = row_fingerprint(
+            organization_id, account_item_id, transaction_date, values['amount_with_tax'], values['counterparty']
+        )
+        occurrence = self.occurrences.get(base, 0)
+        self.occurrences[base] = occurrence + 1
+        return transaction_date, base, occurrence
+    
+    def _get_stream_result(self, next_row):
+        """ストリーミングインポートの結果（再開位置を含む）"""
+        result = self._get_result()
+        result['next_row'] = next_row
+        return result
+    
     def _get_result(self):
         """結果を辞書形式で返す"""
         return {
@@ -278,3 +765,43 @@ class ImportProcessor:
             'errors': self.errors,
             'warnings': self.warnings
         }
+
+
+@register_job_handler('import_data')
+def run_import_data_job(context):
+    """出納帳インポートのバックグラウンドジョブ"""
+    params = context.params
+    processor = ImportProcessor()
+    
+    def progress_callback(done, total):
+        context.update_progress(done * 100 // max(total, 1))
+    
+    # 大きなCSVは複数プロセスで変換する
+    if (params['file_type'] == 'csv' and IMPORT_WORKERS > 1
+            and os.path.getsize(context.input_path) >= PARALLEL_IMPORT_MIN_BYTES):
+        return processor.import_data_parallel(
+            context.input_path,
+            params['mapping'],
+            context.organization_id,
+            skip_rows=params.get('skip_rows', 0),
+            account_item_id=params.get('account_item_id'),
+            chunk_size=params.get('chunk_size', IMPORT_CHUNK_SIZE),
+            start_row=params.get('start_row', 0),
+            progress_callback=progress_callback,
+        )
+    
+    # 入力ファイルは一括で読み込まず、ストリーミングで一定件数ごとにコミットする
+    with context.open_input() as f:
+        result = processor.import_data_stream(
+            f,
+            params['file_type'],
+            params['mapping'],
+            context.organization_id,
+            skip_rows=params.get('skip_rows', 0),
+            account_item_id=params.get('account_item_id'),
+            chunk_size=params.get('chunk_size', IMPORT_CHUNK_SIZE),
+            start_row=params.get('start_row', 0),
+            progress_callback=progress_callback,
+        )
+    # 失敗した場合は結果の next_row を params の start_row に指定して再実行すると続きから再開できる
+    return result
@@ -0,0 +1,432 @@
+"""
+バックグラウンドジョブの実行モジュール
+ジョブは background_jobs テーブルをキューとして登録し、ワーカープロセス（job_worker.py）の
+ワーカースレッドが条件付き UPDATE で1件ずつ取得して実行する（外部のメッセージブローカーは不要）
+進捗率・結果はテーブルに、入力ファイル・結果ファイルは stored_files に記録し、
+Webプロセスとワーカープロセスが別のサーバーで動いていても参照できるようにする
+実行中のまま止まったジョブ（ワーカーの停止・再デプロイなど）は再実行待ちに戻すか失敗にする
+"""
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, select, update
+from db import SessionLocal
+from file_store_utils import (
+    copy_to_temporary_file,
+    delete_file,
+    purge_expired_files,
+    reassign_file,
+    save_file,
+    save_local_file,
+)
+from models import BackgroundJob
+
+
+# ワーカースレッド数（0 の場合はこのプロセスではジョブを実行しない）
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Webプロセス（gunicorn の各ワーカー）でもジョブを実行するか（通常はワーカープロセスだけで実行する）
+JOB_WORKERS_IN_WEB = os.environ.get('JOB_WORKERS_IN_WEB', '0') == '1'
+# キューを確認する間隔（秒）
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+# 実行中のジョブが生存を記録する間隔（秒）
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', '30'))
+# この秒数のあいだ生存の記録がない実行中のジョブは止まったとみなす
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '600'))
+# 止まったジョブを再実行する上限（実行を開始した回数）
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '2'))
+# 結果ファイル・入力ファイルの保存期間（秒）
+JOB_FILE_TTL = int(os.environ.get('JOB_FILE_TTL', str(7 * 24 * 3600)))
+# 止まったジョブの確認・期限切れファイルの削除を行う間隔（秒）
+JOB_MAINTENANCE_INTERVAL = int(os.environ.get('JOB_MAINTENANCE_INTERVAL', '60'))
+
+_job_handlers = {}
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_last_maintenance = 0.0
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def register_job_handler(job_type):
+    """
+    ジョブ種別のハンドラーを登録するデコレーター
+
+    ハンドラーは handler(context) の形で呼び出され、
+    戻り値（JSONに変換できる値）は結果として保存される
+    """
+    def decorator(handler):
+        _job_handlers[job_type] = handler
+        return handler
+    return decorator
+
+
+class JobContext:
+    """実行中のジョブからの進捗更新・結果ファイル作成用"""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.organization_id = job.organization_id
+        self.user_id = job.user_id
+        self.params = json.loads(job.params_json) if job.params_json else {}
+        self.input_file_id = job.input_file_id
+        self.result_path = None
+        self.result_filename = None
+        self.result_mimetype = None
+        self._input_path = None
+        self._last_progress = None
+
+    @property
+    def input_path(self):
+        """入力ファイルのローカルのパス（初回に保存先から一時ファイルにコピーする）"""
+        if self._input_path is None and self.input_file_id:
+            with copy_to_temporary_file(self.input_file_id, named=True) as f:
+                self._input_path = f.name
+        return self._input_path
+
+    def read_input(self):
+        """アップロードされた入力ファイルの内容を取得"""
+        with open(self.input_path, 'rb') as f:
+            return f.read()
+
+    def open_input(self):
+        """アップロードされた入力ファイルを読み込み用に開く（大きなファイルを少しずつ読む場合）"""
+        return open(self.input_path, 'rb')
+
+    def update_progress(self, progress, message=None):
+        """進捗率（0〜100）を更新（変化がない場合は書き込まない）"""
+        progress = max(0, min(100, int(progress)))
+        if progress == self._last_progress and message is None:
+            return
+        self._last_progress = progress
+        values = {'progress': progress, 'heartbeat_at': _now()}
+        if message is not None:
+            values['message'] = message[:255]
+        db = SessionLocal()
+        try:
+            db.execute(update(BackgroundJob).where(BackgroundJob.id == self.job_id).values(**values))
+            db.commit()
+        finally:
+            db.close()
+
+    def open_result(self, filename, mimetype):
+        """結果ファイルを書き込み用に開く（ジョブの完了後に保存先へ移す）"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='_result') as f:
+            self.result_path = f.name
+        self.result_filename = filename
+        self.result_mimetype = mimetype
+        return open(self.result_path, 'wb')
+
+    def cleanup(self):
+        """ローカルの一時ファイルを削除"""
+        for path in (self._input_path, self.result_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def enqueue_job(db, job_type, organization_id, user_id=None, params=None, input_content=None, input_file=None,
+                input_file_id=None):
+    """
+    ジョブを登録
+
+    Args:
+        input_content: ジョブに渡すファイルの内容（bytes、任意）
+        input_file: ジョブに渡すファイル（読み込み用のファイルオブジェクト、任意。少しずつコピーする）
+        input_file_id: ジョブに渡す保存済みのファイルのID（任意。コピーせずにジョブの入力ファイルにする）
+
+    Returns:
+        BackgroundJob: 登録したジョブ（コミット済み）
+    """
+    if job_type not in _job_handlers:
+        raise ValueError(f"ジョブ種別 {job_type} は登録されていません")
+
+    if input_file_id is not None:
+        reassign_file(db, input_file_id, 'job_input', ttl=JOB_FILE_TTL)
+    elif input_content is not None or input_file is not None:
+        stored_file = save_file(
+            db,
+            input_file if input_file is not None else io.BytesIO(input_content),
+            'job_input',
+            organization_id=organization_id,
+            ttl=JOB_FILE_TTL,
+        )
+        input_file_id = stored_file.id
+
+    job = BackgroundJob(
+        organization_id=organization_id,
+        user_id=user_id,
+        job_type=job_type,
+        status='queued',
+        params_json=json.dumps(params or {}, ensure_ascii=False),
+        progress=0,
+        input_file_id=input_file_id,
+        attempts=0,
+        created_at=_now(),
+    )
+    db.add(job)
+    db.commit()
+    _wakeup.set()
+    return job
+
+
+def get_resume_row(job):
+    """
+    失敗したジョブを続きから再開する行（ハンドラーが結果に next_row を返し、入力ファイルが残っている場合）
+
+    Returns:
+        int: 再開時に params の start_row に指定する値（再開できない場合は None）
+    """
+    if job.status != 'failed' or not job.input_file_id or not job.result_json:
+        return None
+    return json.loads(job.result_json).get('next_row')
+
+
+def resume_job(db, job):
+    """
+    失敗したジョブを続きから実行するジョブを登録（入力ファイルは新しいジョブに引き継ぐ）
+
+    Returns:
+        BackgroundJob: 登録したジョブ（再開できない場合は None）
+    """
+    start_row = get_resume_row(job)
+    if start_row is None:
+        return None
+    params = json.loads(job.params_json) if job.params_json else {}
+    params['start_row'] = start_row
+    input_file_id = job.input_file_id
+    job.input_file_id = None
+    db.flush()
+    return enqueue_job(
+        db,
+        job.job_type,
+        job.organization_id,
+        user_id=job.user_id,
+        params=params,
+        input_file_id=input_file_id,
+    )
+
+
+def job_to_dict(job):
+    """ステータスAPI用の辞書に変換"""
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': json.loads(job.result_json) if job.result_json else None,
+        'has_file': bool(job.result_file_id),
+        'resume_row': get_resume_row(job),
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def _claim_next_job(db):
+    """待機中のジョブを1件取得して実行中にする（他のワーカーと競合した場合は次を探す）"""
+    candidates = db.execute(
+        select(BackgroundJob.id)
+        .where(BackgroundJob.status == 'queued')
+        .order_by(BackgroundJob.id)
+        .limit(5)
+    ).scalars().all()
+    for job_id in candidates:
+        result = db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.status == 'queued')
+            .values(
+                status='running',
+                started_at=_now(),
+                heartbeat_at=_now(),
+                attempts=BackgroundJob.attempts + 1,
+                message='実行中',
+            )
+        )
+        db.commit()
+        if result.rowcount == 1:
+            return db.get(BackgroundJob, job_id)
+    return None
+
+
+def _heartbeat_loop(job_id, stopped):
+    """実行中のジョブの生存を一定間隔で記録（進捗の更新がない長い処理でも止まったとみなされないように）"""
+    while not stopped.wait(JOB_HEARTBEAT_INTERVAL):
+        db = SessionLocal()
+        try:
+            db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(heartbeat_at=_now()))
+            db.commit()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            db.close()
+
+
+def run_job(job):
+    """ジョブを実行して結果を記録"""
+    context = JobContext(job)
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(job.id, stopped), daemon=True)
+    heartbeat.start()
+    values = {}
+    try:
+        handler = _job_handlers.get(job.job_type)
+        if handler is None:
+            raise ValueError(f"ジョブ種別 {job.job_type} は登録されていません")
+        result = handler(context)
+        values = {
+            'status': 'succeeded',
+            'progress': 100,
+            'message': '完了しました',
+            'result_json': json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+        }
+        # 結果に success: False を返した場合は失敗（途中まで処理した結果と入力ファイルは残す）
+        if isinstance(result, dict) and result.get('success') is False:
+            values.update(
+                status='failed',
+                progress=context._last_progress or 0,
+                message='エラーが発生しました',
+                error='\n'.join(str(error) for error in result.get('errors') or []) or '処理に失敗しました',
+            )
+    except Exception as e:
+        traceback.print_exc()
+        values = {
+            'status': 'failed',
+            'message': 'エラーが発生しました',
+            'error': str(e),
+        }
+    finally:
+        stopped.set()
+
+    db = SessionLocal()
+    try:
+        if values['status'] == 'succeeded' and context.result_path:
+            stored_file = save_local_file(
+                db,
+                context.result_path,
+                'job_result',
+                organization_id=job.organization_id,
+                filename=context.result_filename,
+                ttl=JOB_FILE_TTL,
+            )
+            values['result_file_id'] = stored_file.id
+        # 入力ファイルは実行が終わったら不要（続きから再開できる場合は残す）
+        keep_input = values['status'] == 'failed' and 'result_json' in values
+        values.update(
+            finished_at=_now(),
+            result_filename=context.result_filename,
+            result_mimetype=context.result_mimetype,
+        )
+        if not keep_input:
+            values['input_file_id'] = None
+        db.execute(update(BackgroundJob).where(BackgroundJob.id == job.id).values(**values))
+        if not keep_input:
+            delete_file(db, job.input_file_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        context.cleanup()
+
+
+def recover_stale_jobs(db):
+    """
+    実行中のまま生存の記録が途絶えたジョブを再実行待ちに戻す（コミットは呼び出し元で行う）
+    実行を開始した回数が JOB_MAX_ATTEMPTS に達している場合は失敗にする
+
+    Returns:
+        tuple: (再実行待ちに戻した件数, 失敗にした件数)
+    """
+    cutoff = (datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    stale = and_(
+        BackgroundJob.status == 'running',
+        func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.started_at) < cutoff,
+    )
+    requeued = db.execute(
+        update(BackgroundJob)
+        .where(stale, BackgroundJob.attempts < JOB_MAX_ATTEMPTS)
+        .values(status='queued', progress=0, message='中断されたため再実行を待っています')
+    ).rowcount
+    failed = db.execute(
+        update(BackgroundJob)
+        .where(stale)
+        .values(
+            status='failed',
+            message='エラーが発生しました',
+            error='ジョブの実行中にワーカーが停止しました',
+            finished_at=_now(),
+        )
+    ).rowcount
+    return requeued, failed
+
+
+def _run_maintenance():
+    """止まったジョブの確認と期限切れファイルの削除（JOB_MAINTENANCE_INTERVAL 秒ごと）"""
+    global _last_maintenance
+    now = time.monotonic()
+    if now - _last_maintenance < JOB_MAINTENANCE_INTERVAL:
+        return
+    _last_maintenance = now
+    db = SessionLocal()
+    try:
+        requeued, _ = recover_stale_jobs(db)
+        purge_expired_files(db)
+        db.commit()
+        if requeued:
+            _wakeup.set()
+    except Exception:
+        db.rollback()
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+def _worker_loop():
+    while True:
+        _run_maintenance()
+        db = SessionLocal()
+        try:
+            job = _claim_next_job(db)
+        except Exception:
+            traceback.print_exc()
+            job = None
+        finally:
+            db.close()
+
+        if job is None:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        try:
+            run_job(job)
+        except Exception:
+            traceback.print_exc()
+
+
+def start_job_workers(count=JOB_WORKERS):
+    """ワーカースレッドを起動（起動済みの場合は何もしない）"""
+    with _workers_lock:
+        if _workers or count <= 0:
+            return
+        for index in range(count):
+            worker = threading.Thread(target=_worker_loop, name=f"job-worker-{index}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def run_job_workers(count=JOB_WORKERS):
+    """ワーカースレッドを起動して終了まで待つ（ワーカープロセス用）"""
+    start_job_workers(max(count, 1))
+    for worker in list(_workers):
+        worker.join()
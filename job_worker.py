@@ -0,0 +1,37 @@
+"""
+バックグラウンドジョブのワーカープロセス
+background_jobs テーブルのキューからジョブを取得して実行する（Webプロセスとは別に起動する）
+
+使い方:
+    python job_worker.py              # JOB_WORKERS（既定 2）のスレッドで実行
+    python job_worker.py --workers 4
+"""
+
+import argparse
+from job_utils import JOB_WORKERS, run_job_workers
+
+
+def register_handlers():
+    """
+    Webプロセスと同じモジュールを読み込む（ジョブハンドラーと、出納帳の残高・検索用の文書・
+    締め済み期間のチェックなどのフラッシュ時のリスナーを登録する）
+
+    並列インポートのプロセスプール（spawn）はこのファイルを __mp_main__ として読み込み直すため、
+    モジュールの読み込み時ではなく main() から呼び出す（プールのプロセスでアプリを初期化しない）
+    """
+    import wsgi  # noqa: F401
+
+
+def main():
+    parser = argparse.ArgumentParser(description='バックグラウンドジョブを実行する')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='ワーカースレッド数')
+    args = parser.parse_args()
+
+    register_handlers()
+
+    print(f"バックグラウンドジョブのワーカーを {max(args.workers, 1)} スレッドで起動します")
+    run_job_workers(args.workers)
+
+
+if __name__ == '__main__':
+    main()
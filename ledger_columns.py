@@ -0,0 +1,386 @@
+"""
+仕訳帳（general_ledger）の列指向キャッシュ
+事業所ごとの仕訳を ORM オブジェクトではなく列ごとの配列（NumPy があれば ndarray、
+無ければ標準ライブラリの array）としてメモリに保持し、帳票の集計を配列演算で行う
+
+- 初回は事業所の仕訳をまとめて読み込み、以降は追加された仕訳（ID が最大値より大きいもの）だけを追記する
+- 仕訳の更新・削除（ledger_versions.rewrite_version の加算）を検知した場合は全件を読み直す
+- 保持する行数の合計が上限を超えた場合は、最近使われていない事業所から破棄する
+"""
+
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date
+from sqlalchemy import event, func, select
+from db import SessionLocal
+from models import GeneralLedger
+from ledger_utils import register_ledger_change_handler
+from report_cache import get_ledger_rewrite_version
+
+try:
+    import numpy as np
+except ImportError:  # NumPy が無い環境では array と Python のループで集計する
+    np = None
+
+
+# 1回に読み込む仕訳の件数
+LOAD_CHUNK_SIZE = 5000
+
+# 集計軸（report_utils.DIMENSIONS のキー）と仕訳帳のカラム名
+DIMENSION_FIELDS = {
+    'department': 'department_id',
+    'counterparty': 'counterparty_id',
+    'item': 'item_id',
+    'project_tag': 'project_tag_id',
+    'memo_tag': 'memo_tag_id',
+}
+
+# 保持する列: (列名, array の型コード)
+# 取引日は date の序数、年月は 年 * 12 + (月 - 1)、ID の NULL は 0 で保持する
+COLUMNS = (
+    ('id', 'q'),
+    ('date', 'l'),
+    ('month', 'l'),
+    ('debit_account', 'q'),
+    ('credit_account', 'q'),
+    ('debit_amount', 'q'),
+    ('credit_amount', 'q'),
+) + tuple((field, 'q') for field in DIMENSION_FIELDS.values())
+
+# 集計キーの合成に使うビット数
+_ACCOUNT_SHIFT = 32
+
+
+def _select_rows(organization_id, *conditions):
+    return (
+        select(
+            GeneralLedger.id,
+            GeneralLedger.transaction_date,
+            GeneralLedger.debit_account_item_id,
+            GeneralLedger.credit_account_item_id,
+            GeneralLedger.debit_amount,
+            GeneralLedger.credit_amount,
+            *(getattr(GeneralLedger, field) for field in DIMENSION_FIELDS.values()),
+        )
+        .where(GeneralLedger.organization_id == organization_id, *conditions)
+        .order_by(GeneralLedger.id)
+        .execution_options(yield_per=LOAD_CHUNK_SIZE)
+    )
+
+
+def _to_date(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _ordinal(value):
+    """取引日（文字列または date）を序数に変換（変換できない場合は None）"""
+    if value is None:
+        return None
+    try:
+        return _to_date(value).toordinal()
+    except ValueError:
+        return None
+
+
+def _format_month(month_index):
+    year, month = divmod(month_index, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+class LedgerColumns:
+    """1事業所分の仕訳帳を列ごとの配列で保持"""
+
+    def __init__(self, organization_id):
+        self.organization_id = organization_id
+        self.version = None
+        self.rewrite_version = None
+        self.max_id = 0
+        self.columns = {name: self._empty(typecode) for name, typecode in COLUMNS}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty(typecode):
+        if np is not None:
+            return np.empty(0, dtype=np.int64)
+        return array(typecode)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    @property
+    def nbytes(self):
+        """保持している配列のバイト数"""
+        if np is not None:
+            return sum(column.nbytes for column in self.columns.values())
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def append_rows(self, rows):
+        """_select_rows の結果行を追記"""
+        new_columns = {name: array(typecode) for name, typecode in COLUMNS}
+        names = [name for name, _ in COLUMNS if name not in ('date', 'month')]
+        for row in rows:
+            entry_id, transaction_date, *values = row
+            day = _ordinal(transaction_date)
+            if day is None:
+                # 取引日が不正な仕訳は集計の対象外とする
+                day = 0
+                month = 0
+            else:
+                parsed = date.fromordinal(day)
+                month = parsed.year * 12 + parsed.month - 1
+            new_columns['id'].append(entry_id)
+            new_columns['date'].append(day)
+            new_columns['month'].append(month)
+            for name, value in zip(names[1:], values):
+                new_columns[name].append(value or 0)
+        if not new_columns['id']:
+            return 0
+
+        with self._lock:
+            for name, values in new_columns.items():
+                if np is not None:
+                    self.columns[name] = np.concatenate([self.columns[name], np.frombuffer(values, dtype=values.typecode).astype(np.int64)])
+                else:
+                    self.columns[name].extend(values)
+            self.max_id = max(self.max_id, max(new_columns['id']))
+        return len(new_columns['id'])
+
+    # ========== 集計 ==========
+
+    def _selection(self, date_from=None, date_to=None, date_before=None):
+        """期間に含まれる行（NumPy はブールマスク、array は行番号のリスト）"""
+        low = _ordinal(date_from)
+        high = _ordinal(date_to)
+        before = _ordinal(date_before)
+        if before is not None:
+            high = before - 1 if high is None else min(high, before - 1)
+        dates = self.columns['date']
+        if np is not None:
+            mask = dates > 0
+            if low is not None:
+                mask &= dates >= low
+            if high is not None:
+                mask &= dates <= high
+            return mask
+        low = 1 if low is None else max(low, 1)
+        if high is None:
+            return [index for index, day in enumerate(dates) if day >= low]
+        return [index for index, day in enumerate(dates) if low <= day <= high]
+
+    @staticmethod
+    def _grouped_sums(keys, amounts, selection):
+        """選択した行の金額をキーごとに合計"""
+        if np is not None:
+            keys = keys[selection]
+            if len(keys) == 0:
+                return {}
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            sums = np.zeros(len(unique_keys), dtype=np.int64)
+            np.add.at(sums, inverse, amounts[selection])
+            return dict(zip(unique_keys.tolist(), sums.tolist()))
+        sums = {}
+        for index in selection:
+            key = keys[index]
+            sums[key] = sums.get(key, 0) + amounts[index]
+        return sums
+
+    def _side_keys(self, side, extra=None):
+        """借方・貸方の勘定科目ID（と集計軸の値）を合成したキーの配列"""
+        accounts = self.columns[f'{side}_account']
+        if extra is None:
+            return accounts
+        if np is not None:
+            return (accounts << _ACCOUNT_SHIFT) | extra
+        return [(account << _ACCOUNT_SHIFT) | value for account, value in zip(accounts, extra)]
+
+    def _totals(self, selection, extra=None):
+        """借方側・貸方側を合計して {合成キー: (借方合計, 貸方合計)} を返す"""
+        debit_sums = self._grouped_sums(self._side_keys('debit', extra), self.columns['debit_amount'], selection)
+        credit_sums = self._grouped_sums(self._side_keys('credit', extra), self.columns['credit_amount'], selection)
+        totals = {}
+        for key, amount in debit_sums.items():
+            totals[key] = (amount, 0)
+        for key, amount in credit_sums.items():
+            totals[key] = (totals.get(key, (0, 0))[0], amount)
+        return totals
+
+    def account_totals(self, date_from=None, date_to=None, date_before=None):
+        """
+        勘定科目ごとの借方合計・貸方合計（report_utils.aggregate_ledger_totals と同じ形式）
+
+        Returns:
+            dict: {account_item_id: (借方合計, 貸方合計)}
+        """
+        with self._lock:
+            totals = self._totals(self._selection(date_from, date_to, date_before))
+        totals.pop(0, None)
+        return totals
+
+    def account_month_totals(self, date_from=None, date_to=None):
+        """
+        勘定科目・年月ごとの借方合計・貸方合計
+
+        Returns:
+            dict: {(account_item_id, 年月): (借方合計, 貸方合計)}
+        """
+        with self._lock:
+            totals = self._totals(self._selection(date_from, date_to), extra=self.columns['month'])
+        mask = (1 << _ACCOUNT_SHIFT) - 1
+        return {
+            (key >> _ACCOUNT_SHIFT, _format_month(key & mask)): amounts
+            for key, amounts in totals.items()
+            if key >> _ACCOUNT_SHIFT
+        }
+
+    def dimension_totals(self, dimension, date_from=None, date_to=None, account_item_id=None):
+        """
+        勘定科目 × 集計軸の値ごとの借方合計・貸方合計
+
+        Returns:
+            dict: {(account_item_id, 集計軸の値ID): (借方合計, 貸方合計)}
+        """
+        with self._lock:
+            totals = self._totals(
+                self._selection(date_from, date_to),
+                extra=self.columns[DIMENSION_FIELDS[dimension]],
+            )
+        mask = (1 << _ACCOUNT_SHIFT) - 1
+        result = {}
+        for key, amounts in totals.items():
+            account = key >> _ACCOUNT_SHIFT
+            if not account or (account_item_id is not None and account != account_item_id):
+                continue
+            result[(account, (key & mask) or None)] = amounts
+        return result
+
+
+class LedgerColumnCache:
+    """事業所ごとの LedgerColumns を保持する LRU キャッシュ（保持する行数の合計で上限を設ける）"""
+
+    def __init__(self, max_rows=500000):
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+        self.evictions = 0
+
+    def get(self, db, organization_id):
+        """
+        事業所の最新の LedgerColumns を取得
+
+        キャッシュが無効な場合、事業所の仕訳が上限を超える場合、
+        セッションに未コミットの仕訳の変更がある場合は None を返す（呼び出し元は DB で集計する）
+        """
+        if self.max_rows <= 0 or db.info.get('ledger_columns_dirty'):
+            return None
+
+        version, rewrite_version = get_ledger_rewrite_version(db, organization_id)
+        columns = self._lookup(organization_id)
+        if columns is not None and columns.version == version and columns.rewrite_version == rewrite_version:
+            return columns
+
+        # 読み込み・追記は同時に1つだけ行う（同じ仕訳の二重追記を防ぐ）
+        with self._load_lock:
+            columns = self._lookup(organization_id)
+            if columns is not None and columns.version == version and columns.rewrite_version == rewrite_version:
+                return columns
+            if columns is None or columns.rewrite_version != rewrite_version or not self._append_new_rows(db, columns):
+                columns = self._load(db, organization_id)
+                if columns is None:
+                    return None
+            columns.version = version
+            columns.rewrite_version = rewrite_version
+            self._store(organization_id, columns)
+        return columns
+
+    def _lookup(self, organization_id):
+        with self._lock:
+            columns = self._entries.get(organization_id)
+            if columns is not None:
+                self._entries.move_to_end(organization_id)
+            return columns
+
+    def _load(self, db, organization_id):
+        """事業所の仕訳を全件読み込む（上限を超える場合は None）"""
+        total = db.execute(
+            select(func.count(GeneralLedger.id)).where(GeneralLedger.organization_id == organization_id)
+        ).scalar() or 0
+        if total > self.max_rows:
+            self.invalidate(organization_id)
+            return None
+        columns = LedgerColumns(organization_id)
+        columns.append_rows(db.execute(_select_rows(organization_id)))
+        self.full_loads += 1
+        return columns
+
+    def _append_new_rows(self, db, columns):
+        """
+        前回の読み込み以降に追加された仕訳を追記
+
+        追記後の件数が DB の件数と一致しない場合（ID 順にコミットされなかった場合など）は False
+        """
+        new_rows = db.execute(
+            _select_rows(columns.organization_id, GeneralLedger.id > columns.max_id)
+        ).all()
+        total = db.execute(
+            select(func.count(GeneralLedger.id)).where(GeneralLedger.organization_id == columns.organization_id)
+        ).scalar() or 0
+        if len(columns) + len(new_rows) != total or total > self.max_rows:
+            return False
+        columns.append_rows(new_rows)
+        self.incremental_loads += 1
+        return True
+
+    def _store(self, organization_id, columns):
+        """キャッシュに登録し、上限を超えた分を古い順に破棄"""
+        with self._lock:
+            self._entries[organization_id] = columns
+            self._entries.move_to_end(organization_id)
+            total_rows = sum(len(entry) for entry in self._entries.values())
+            while total_rows > self.max_rows and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                total_rows -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, organization_id):
+        with self._lock:
+            self._entries.pop(organization_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """監視用の統計情報"""
+        with self._lock:
+            return {
+                'organizations': len(self._entries),
+                'rows': sum(len(entry) for entry in self._entries.values()),
+                'bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'max_rows': self.max_rows,
+                'backend': 'numpy' if np is not None else 'array',
+                'full_loads': self.full_loads,
+                'incremental_loads': self.incremental_loads,
+                'evictions': self.evictions,
+            }
+
+
+@register_ledger_change_handler
+def mark_session_ledger_dirty(db, added, removed):
+    """未コミットの仕訳の変更があるセッションでは列指向キャッシュを使わない"""
+    db.info['ledger_columns_dirty'] = True
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+@event.listens_for(SessionLocal, 'after_rollback')
+def _clear_session_ledger_dirty(session):
+    session.info.pop('ledger_columns_dirty', None)
+
+
+ledger_column_cache = LedgerColumnCache(max_rows=int(os.environ.get('LEDGER_COLUMN_CACHE_MAX_ROWS', '500000')))
@@ -0,0 +1,165 @@
+"""
+仕訳明細（ledger_lines）の管理モジュール
+仕訳帳の1仕訳を勘定科目ごとの明細（符号付き金額）に分けて保持し、
+勘定科目別の元帳・残高を (事業所, 勘定科目, 取引日) のインデックスの範囲検索だけで求められるようにする
+仕訳帳の変更に合わせて同一トランザクション内で同期する
+"""
+
+from sqlalchemy import case, delete, func, literal, or_, select, union_all
+from models import GeneralLedger, LedgerLine
+from ledger_utils import register_ledger_change_handler
+
+
+# 一度に削除する仕訳IDの数（IN 句のパラメーター数の上限対策）
+DELETE_CHUNK_SIZE = 500
+
+
+def build_ledger_lines(snapshot):
+    """
+    仕訳のスナップショットから明細（辞書）のリストを作成
+
+    借方・貸方それぞれ1行（同じ勘定科目の場合は1行にまとめる）
+    事業所が未設定の仕訳は明細を作らない
+    """
+    organization_id = snapshot['organization_id']
+    if organization_id is None or snapshot['id'] is None:
+        return []
+
+    debit_account_item_id = snapshot['debit_account_item_id']
+    credit_account_item_id = snapshot['credit_account_item_id']
+    debit_amount = snapshot['debit_amount'] or 0
+    credit_amount = snapshot['credit_amount'] or 0
+
+    lines = {}
+    if debit_account_item_id is not None:
+        lines[debit_account_item_id] = {
+            'counterpart_account_item_id': credit_account_item_id,
+            'debit_amount': debit_amount,
+            'credit_amount': 0,
+        }
+    if credit_account_item_id is not None:
+        line = lines.setdefault(credit_account_item_id, {
+            'counterpart_account_item_id': debit_account_item_id,
+            'debit_amount': 0,
+            'credit_amount': 0,
+        })
+        line['credit_amount'] += credit_amount
+
+    return [
+        {
+            'organization_id': organization_id,
+            'general_ledger_id': snapshot['id'],
+            'account_item_id': account_item_id,
+            'counterpart_account_item_id': line['counterpart_account_item_id'],
+            'transaction_date': snapshot['transaction_date'],
+            'debit_amount': line['debit_amount'],
+            'credit_amount': line['credit_amount'],
+            'amount': line['debit_amount'] - line['credit_amount'],
+        }
+        for account_item_id, line in lines.items()
+    ]
+
+
+@register_ledger_change_handler
+def apply_ledger_line_changes(db, added, removed):
+    """仕訳の変更を明細に反映（更新は削除してから作り直す）"""
+    connection = db.connection()
+    removed_ids = sorted({snapshot['id'] for snapshot in removed if snapshot['id'] is not None})
+    for start in range(0, len(removed_ids), DELETE_CHUNK_SIZE):
+        connection.execute(
+            delete(LedgerLine).where(LedgerLine.general_ledger_id.in_(removed_ids[start:start + DELETE_CHUNK_SIZE]))
+        )
+
+    rows = [line for snapshot in added for line in build_ledger_lines(snapshot)]
+    if rows:
+        connection.execute(LedgerLine.__table__.insert(), rows)
+
+
+def _select_ledger_lines(conditions):
+    """仕訳帳から明細を作成する SELECT 文（借方側と貸方側の UNION ALL）"""
+    same_account = GeneralLedger.credit_account_item_id == GeneralLedger.debit_account_item_id
+    debit_amount = func.coalesce(GeneralLedger.debit_amount, 0)
+    credit_amount = func.coalesce(GeneralLedger.credit_amount, 0)
+    # 借方と貸方が同じ勘定科目の場合は、借方側の行に貸方金額もまとめる
+    merged_credit = case((same_account, credit_amount), else_=0)
+
+    debit_side = select(
+        GeneralLedger.organization_id,
+        GeneralLedger.id,
+        GeneralLedger.debit_account_item_id,
+        GeneralLedger.credit_account_item_id,
+        GeneralLedger.transaction_date,
+        debit_amount,
+        merged_credit,
+        debit_amount - merged_credit,
+    ).where(*conditions, GeneralLedger.debit_account_item_id.isnot(None))
+    credit_side = select(
+        GeneralLedger.organization_id,
+        GeneralLedger.id,
+        GeneralLedger.credit_account_item_id,
+        GeneralLedger.debit_account_item_id,
+        GeneralLedger.transaction_date,
+        literal(0),
+        credit_amount,
+        -credit_amount,
+    ).where(
+        *conditions,
+        GeneralLedger.credit_account_item_id.isnot(None),
+        or_(GeneralLedger.debit_account_item_id.is_(None), ~same_account),
+    )
+    return union_all(debit_side, credit_side)
+
+
+def rebuild_ledger_lines(db, organization_id=None):
+    """
+    仕訳帳から明細を作り直す
+
+    Args:
+        organization_id: 対象の事業所ID（None の場合は全事業所）
+
+    Returns:
+        int: 作成した明細の行数
+    """
+    table = LedgerLine.__table__
+    connection = db.connection()
+
+    stmt = delete(table)
+    if organization_id is not None:
+        stmt = stmt.where(table.c.organization_id == organization_id)
+    connection.execute(stmt)
+
+    conditions = [GeneralLedger.organization_id.isnot(None)]
+    if organization_id is not None:
+        conditions.append(GeneralLedger.organization_id == organization_id)
+
+    result = connection.execute(
+        table.insert().from_select(
+            [
+                'organization_id',
+                'general_ledger_id',
+                'account_item_id',
+                'counterpart_account_item_id',
+                'transaction_date',
+                'debit_amount',
+                'credit_amount',
+                'amount',
+            ],
+            _select_ledger_lines(conditions),
+        )
+    )
+    return result.rowcount
+
+
+def ensure_ledger_lines(db):
+    """明細が空で仕訳が存在する場合（テーブル新規作成直後など）に作り直す"""
+    has_lines = db.execute(select(LedgerLine.id).limit(1)).first()
+    if has_lines:
+        return False
+    has_ledger = db.execute(
+        select(GeneralLedger.id).where(GeneralLedger.organization_id.isnot(None)).limit(1)
+    ).first()
+    if not has_ledger:
+        return False
+    rebuild_ledger_lines(db)
+    db.commit()
+    return True
@@ -0,0 +1,181 @@
+"""
+仕訳帳（general_ledger）の変更通知モジュール
+GeneralLedger の追加・更新・削除をフラッシュ時に検知し、
+登録されたハンドラー（月次残高の更新など）を同一トランザクション内で呼び出す
+"""
+
+from sqlalchemy import delete, event, insert, select
+from db import SessionLocal
+from models import GeneralLedger, coerce_date
+
+
+# ハンドラーに渡すスナップショットの項目
+LEDGER_FIELDS = (
+    'id',
+    'organization_id',
+    'transaction_date',
+    'debit_account_item_id',
+    'debit_amount',
+    'credit_account_item_id',
+    'credit_amount',
+    'summary',
+    'remarks',
+    'source_type',
+    'source_id',
+    'counterparty_id',
+    'department_id',
+    'item_id',
+    'project_tag_id',
+    'memo_tag_id',
+)
+
+# 出納帳（連続仕訳）から作成される仕訳の source_type
+BATCH_ENTRY_SOURCE_TYPES = ['batch_entry', 'batch_entry_net', 'batch_entry_tax']
+
+_ledger_change_handlers = []
+
+
+def register_ledger_change_handler(handler):
+    """
+    仕訳帳の変更ハンドラーを登録
+
+    ハンドラーは handler(db, added, removed) の形で呼び出される
+    added / removed はスナップショット（辞書）のリストで、
+    更新は「更新前を removed、更新後を added」として通知される
+    """
+    _ledger_change_handlers.append(handler)
+    return handler
+
+
+def snapshot_ledger_entry(entry):
+    """GeneralLedger インスタンスからスナップショットを作成"""
+    snapshot = {field: getattr(entry, field) for field in LEDGER_FIELDS}
+    # フラッシュ前のインスタンスには文字列の取引日が代入されていることがあるため date に揃える
+    snapshot['transaction_date'] = coerce_date(snapshot['transaction_date'])
+    return snapshot
+
+
+def _ledger_columns():
+    return [getattr(GeneralLedger, field) for field in LEDGER_FIELDS]
+
+
+def load_ledger_snapshots(db, *conditions):
+    """条件に一致する仕訳のスナップショットをDBから取得"""
+    rows = db.connection().execute(select(*_ledger_columns()).where(*conditions))
+    return [dict(zip(LEDGER_FIELDS, row)) for row in rows]
+
+
+def notify_ledger_changes(db, added=(), removed=()):
+    """登録済みハンドラーに仕訳の変更を通知"""
+    added = list(added)
+    removed = list(removed)
+    if not added and not removed:
+        return
+    for handler in _ledger_change_handlers:
+        handler(db, added, removed)
+
+
+def delete_ledger_entries(db, *conditions):
+    """
+    条件に一致する仕訳を一括削除し、ハンドラーに通知
+
+    Query.delete() はフラッシュを経由しないため、一括削除はこの関数を使う
+
+    Returns:
+        int: 削除件数
+    """
+    removed = load_ledger_snapshots(db, *conditions)
+    if not removed:
+        return 0
+    ids = [row['id'] for row in removed]
+    db.connection().execute(delete(GeneralLedger).where(GeneralLedger.id.in_(ids)))
+    notify_ledger_changes(db, removed=removed)
+    return len(removed)
+
+
+def insert_rows_returning_ids(db, table, rows):
+    """
+    行（辞書のリスト）を一括 INSERT し、各行のIDを rows と同じ順序で返す
+
+    RETURNING の行の順序はデータベースによっては保証されないため
+    （sort_by_parameter_order を指定すると SQLite では1行ずつの INSERT になる）、
+    登録した値も一緒に返させて行と対応付ける。すべての値が同じ行はどのIDを対応付けても同じ内容になる
+    executemany のため、各行は同じキーを持つ必要がある
+    """
+    keys = list(rows[0])
+    result = db.connection().execute(
+        insert(table).returning(table.c.id, *[table.c[key] for key in keys]),
+        rows,
+    )
+    ids_by_values = {}
+    for returned in result:
+        ids_by_values.setdefault(tuple(returned[1:]), []).append(returned[0])
+    return [ids_by_values[tuple(row[key] for key in keys)].pop() for row in rows]
+
+
+def insert_ledger_entries(db, rows):
+    """
+    仕訳（辞書のリスト）を1回の一括 INSERT で登録し、ハンドラーに通知
+
+    ORM のインスタンスを経由しない一括登録はこの関数を使う
+    executemany のため、各行は同じキーを持つ必要がある
+
+    Returns:
+        list: 登録した仕訳のID（rows と同じ順序）
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    ids = insert_rows_returning_ids(db, GeneralLedger.__table__, rows)
+    added = []
+    for entry_id, row in zip(ids, rows):
+        snapshot = {field: row.get(field) for field in LEDGER_FIELDS}
+        snapshot['id'] = entry_id
+        snapshot['transaction_date'] = coerce_date(snapshot['transaction_date'])
+        added.append(snapshot)
+    notify_ledger_changes(db, added=added)
+    return ids
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _collect_ledger_changes(session, flush_context, instances):
+    """フラッシュ前に削除・更新される仕訳の変更前の値を退避"""
+    removed = [
+        snapshot_ledger_entry(obj)
+        for obj in session.deleted
+        if isinstance(obj, GeneralLedger)
+    ]
+
+    # 更新される仕訳は、変更前の値をDBから読み直す
+    dirty_ids = [
+        obj.id
+        for obj in session.dirty
+        if isinstance(obj, GeneralLedger)
+        and obj.id is not None
+        and session.is_modified(obj, include_collections=False)
+    ]
+    if dirty_ids:
+        removed.extend(load_ledger_snapshots(session, GeneralLedger.id.in_(dirty_ids)))
+
+    session.info['ledger_removed'] = removed
+    session.info['ledger_dirty_ids'] = set(dirty_ids)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _dispatch_ledger_changes(session, flush_context):
+    """フラッシュ後（ID確定後）に仕訳の変更をハンドラーへ通知"""
+    removed = session.info.pop('ledger_removed', [])
+    dirty_ids = session.info.pop('ledger_dirty_ids', set())
+
+    added = [
+        snapshot_ledger_entry(obj)
+        for obj in session.new
+        if isinstance(obj, GeneralLedger)
+    ]
+    added.extend(
+        snapshot_ledger_entry(obj)
+        for obj in session.dirty
+        if isinstance(obj, GeneralLedger) and obj.id in dirty_ids
+    )
+
+    notify_ledger_changes(session, added=added, removed=removed)
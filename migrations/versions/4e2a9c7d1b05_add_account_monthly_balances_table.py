@@ -0,0 +1,91 @@
+"""add account_monthly_balances table
+
+Revision ID: 4e2a9c7d1b05
+Revises: aa853848f22b
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4e2a9c7d1b05"
+down_revision: Union[str, Sequence[str], None] = "aa853848f22b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "account_monthly_balances"):
+        return
+
+    op.create_table(
+        "account_monthly_balances",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("account_item_id", sa.Integer(), nullable=False),
+        sa.Column("year_month", sa.String(length=7), nullable=False),
+        sa.Column("debit_total", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("credit_total", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.ForeignKeyConstraint(["account_item_id"], ["account_items.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "organization_id", "account_item_id", "year_month",
+            name="uq_account_monthly_balances",
+        ),
+    )
+
+    # 既存の仕訳帳から月次集計を作成
+    if _has_table(inspector, "general_ledger"):
+        op.execute(
+            """
+            INSERT INTO account_monthly_balances
+                (organization_id, account_item_id, year_month, debit_total, credit_total)
+            SELECT organization_id, account_item_id, year_month,
+                   SUM(debit_total), SUM(credit_total)
+            FROM (
+                SELECT organization_id,
+                       debit_account_item_id AS account_item_id,
+                       SUBSTR(CAST(transaction_date AS VARCHAR(10)), 1, 7) AS year_month,
+                       COALESCE(debit_amount, 0) AS debit_total,
+                       0 AS credit_total
+                FROM general_ledger
+                WHERE organization_id IS NOT NULL
+                  AND transaction_date IS NOT NULL
+                  AND debit_account_item_id IS NOT NULL
+                UNION ALL
+                SELECT organization_id,
+                       credit_account_item_id AS account_item_id,
+                       SUBSTR(CAST(transaction_date AS VARCHAR(10)), 1, 7) AS year_month,
+                       0 AS debit_total,
+                       COALESCE(credit_amount, 0) AS credit_total
+                FROM general_ledger
+                WHERE organization_id IS NOT NULL
+                  AND transaction_date IS NOT NULL
+                  AND credit_account_item_id IS NOT NULL
+            ) AS sides
+            GROUP BY organization_id, account_item_id, year_month
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "account_monthly_balances"):
+        op.drop_table("account_monthly_balances")
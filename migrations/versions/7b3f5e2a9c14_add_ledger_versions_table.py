@@ -0,0 +1,49 @@
+"""add ledger_versions table
+
+Revision ID: 7b3f5e2a9c14
+Revises: 4e2a9c7d1b05
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7b3f5e2a9c14"
+down_revision: Union[str, Sequence[str], None] = "4e2a9c7d1b05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_versions"):
+        return
+
+    op.create_table(
+        "ledger_versions",
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.PrimaryKeyConstraint("organization_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_versions"):
+        op.drop_table("ledger_versions")
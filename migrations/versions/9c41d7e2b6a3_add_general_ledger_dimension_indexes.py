@@ -0,0 +1,64 @@
+"""add general_ledger dimension indexes
+
+Revision ID: 9c41d7e2b6a3
+Revises: 7b3f5e2a9c14
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c41d7e2b6a3"
+down_revision: Union[str, Sequence[str], None] = "7b3f5e2a9c14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# 部門別・取引先別などの内訳集計用インデックス
+INDEXES = [
+    ("ix_general_ledger_org_department_date", ["organization_id", "department_id", "transaction_date"]),
+    ("ix_general_ledger_org_counterparty_date", ["organization_id", "counterparty_id", "transaction_date"]),
+    ("ix_general_ledger_org_item_date", ["organization_id", "item_id", "transaction_date"]),
+    ("ix_general_ledger_org_project_tag_date", ["organization_id", "project_tag_id", "transaction_date"]),
+    ("ix_general_ledger_org_memo_tag_date", ["organization_id", "memo_tag_id", "transaction_date"]),
+]
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _has_index(inspector, table_name: str, index_name: str) -> bool:
+    """インデックスが存在するかチェック"""
+    return any(index["name"] == index_name for index in inspector.get_indexes(table_name))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _has_table(inspector, "general_ledger"):
+        return
+
+    for index_name, columns in INDEXES:
+        if not _has_index(inspector, "general_ledger", index_name):
+            op.create_index(index_name, "general_ledger", columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _has_table(inspector, "general_ledger"):
+        return
+
+    for index_name, _ in INDEXES:
+        if _has_index(inspector, "general_ledger", index_name):
+            op.drop_index(index_name, table_name="general_ledger")
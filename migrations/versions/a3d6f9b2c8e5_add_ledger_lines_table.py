@@ -0,0 +1,96 @@
+"""add ledger_lines table
+
+Revision ID: a3d6f9b2c8e5
+Revises: f2a9c4e7b3d8
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3d6f9b2c8e5"
+down_revision: Union[str, Sequence[str], None] = "f2a9c4e7b3d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_lines"):
+        return
+
+    op.create_table(
+        "ledger_lines",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("general_ledger_id", sa.Integer(), nullable=False),
+        sa.Column("account_item_id", sa.Integer(), nullable=False),
+        sa.Column("counterpart_account_item_id", sa.Integer(), nullable=True),
+        sa.Column("transaction_date", sa.Date(), nullable=True),
+        sa.Column("debit_amount", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("credit_amount", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("amount", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.ForeignKeyConstraint(["account_item_id"], ["account_items.id"]),
+        sa.ForeignKeyConstraint(["counterpart_account_item_id"], ["account_items.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("general_ledger_id", "account_item_id", name="uq_ledger_lines_entry_account"),
+    )
+    op.create_index(
+        "ix_ledger_lines_org_account_date",
+        "ledger_lines",
+        ["organization_id", "account_item_id", "transaction_date", "general_ledger_id", "amount"],
+    )
+
+    # 既存の仕訳帳から明細を作成（借方と貸方が同じ勘定科目の仕訳は借方側の1行にまとめる）
+    if _has_table(inspector, "general_ledger"):
+        op.execute(
+            """
+            INSERT INTO ledger_lines
+                (organization_id, general_ledger_id, account_item_id, counterpart_account_item_id,
+                 transaction_date, debit_amount, credit_amount, amount)
+            SELECT organization_id, id, debit_account_item_id, credit_account_item_id,
+                   transaction_date,
+                   COALESCE(debit_amount, 0),
+                   CASE WHEN credit_account_item_id = debit_account_item_id
+                        THEN COALESCE(credit_amount, 0) ELSE 0 END,
+                   COALESCE(debit_amount, 0)
+                   - CASE WHEN credit_account_item_id = debit_account_item_id
+                          THEN COALESCE(credit_amount, 0) ELSE 0 END
+            FROM general_ledger
+            WHERE organization_id IS NOT NULL
+              AND debit_account_item_id IS NOT NULL
+            UNION ALL
+            SELECT organization_id, id, credit_account_item_id, debit_account_item_id,
+                   transaction_date,
+                   0,
+                   COALESCE(credit_amount, 0),
+                   -COALESCE(credit_amount, 0)
+            FROM general_ledger
+            WHERE organization_id IS NOT NULL
+              AND credit_account_item_id IS NOT NULL
+              AND (debit_account_item_id IS NULL OR debit_account_item_id <> credit_account_item_id)
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_lines"):
+        op.drop_index("ix_ledger_lines_org_account_date", table_name="ledger_lines")
+        op.drop_table("ledger_lines")
@@ -0,0 +1,68 @@
+"""add background_jobs table
+
+Revision ID: b5e8f1c3d2a7
+Revises: 9c41d7e2b6a3
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b5e8f1c3d2a7"
+down_revision: Union[str, Sequence[str], None] = "9c41d7e2b6a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "background_jobs"):
+        return
+
+    op.create_table(
+        "background_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("job_type", sa.String(length=50), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="queued"),
+        sa.Column("params_json", sa.Text(), nullable=True),
+        sa.Column("progress", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("message", sa.String(length=255), nullable=True),
+        sa.Column("input_path", sa.String(length=500), nullable=True),
+        sa.Column("result_path", sa.String(length=500), nullable=True),
+        sa.Column("result_filename", sa.String(length=255), nullable=True),
+        sa.Column("result_mimetype", sa.String(length=100), nullable=True),
+        sa.Column("result_json", sa.Text(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.String(length=19), nullable=True),
+        sa.Column("started_at", sa.String(length=19), nullable=True),
+        sa.Column("finished_at", sa.String(length=19), nullable=True),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_background_jobs_status_id", "background_jobs", ["status", "id"])
+    op.create_index("ix_background_jobs_org_created", "background_jobs", ["organization_id", "created_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "background_jobs"):
+        op.drop_index("ix_background_jobs_org_created", table_name="background_jobs")
+        op.drop_index("ix_background_jobs_status_id", table_name="background_jobs")
+        op.drop_table("background_jobs")
@@ -0,0 +1,126 @@
+"""add search_documents table and full-text index
+
+Revision ID: b7e2d5a9c4f1
+Revises: a3d6f9b2c8e5
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e2d5a9c4f1"
+down_revision: Union[str, Sequence[str], None] = "a3d6f9b2c8e5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# 元データのテーブル → (source_type, 検索対象のカラム)
+SEARCH_SOURCES = {
+    "cash_books": ("cash_book", ["payment_account", "counterparty", "item_name", "department", "memo_tag", "remarks"]),
+    "journal_entries": ("journal_entry", ["summary", "remarks"]),
+    "general_ledger": ("general_ledger", ["summary", "remarks"]),
+    "imported_transactions": ("imported_transaction", ["account_name", "description"]),
+}
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5("
+    "content, content='search_documents', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO search_documents_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+POSTGRESQL_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_content_trgm "
+    "ON search_documents USING gin (content gin_trgm_ops)",
+]
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _content_sql(columns) -> str:
+    """検索対象のカラムを空白区切りで連結する SQL 式"""
+    return " || ' ' || ".join(f"COALESCE({column}, '')" for column in columns)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    is_sqlite = bind.dialect.name == "sqlite"
+    is_postgresql = bind.dialect.name == "postgresql"
+
+    if _has_table(inspector, "search_documents"):
+        return
+
+    op.create_table(
+        "search_documents",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("source_type", sa.String(length=50), nullable=False),
+        sa.Column("source_id", sa.Integer(), nullable=False),
+        sa.Column("transaction_date", sa.Date(), nullable=True),
+        sa.Column("content", sa.Text(), nullable=False, server_default=""),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("source_type", "source_id", name="uq_search_documents_source"),
+    )
+    op.create_index(
+        "ix_search_documents_org_source_type",
+        "search_documents",
+        ["organization_id", "source_type"],
+    )
+
+    # 全文検索インデックス（SQLite は FTS5 の trigram、PostgreSQL は pg_trgm）
+    if is_sqlite:
+        for ddl in SQLITE_FTS_DDL:
+            op.execute(ddl)
+    elif is_postgresql:
+        for ddl in POSTGRESQL_TRGM_DDL:
+            op.execute(ddl)
+
+    # 既存の元データから文書を作成（インデックスはトリガー・GIN インデックスで同時に作られる）
+    for table_name, (source_type, columns) in SEARCH_SOURCES.items():
+        if not _has_table(inspector, table_name):
+            continue
+        transaction_date = "transaction_date"
+        if table_name == "imported_transactions" and not is_sqlite:
+            # 取引明細の取引日は文字列のため DATE に変換する
+            transaction_date = "CAST(NULLIF(transaction_date, '') AS DATE)"
+        op.execute(
+            f"""
+            INSERT INTO search_documents (organization_id, source_type, source_id, transaction_date, content)
+            SELECT organization_id, '{source_type}', id, {transaction_date}, {_content_sql(columns)}
+            FROM {table_name}
+            WHERE organization_id IS NOT NULL
+            """
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _has_table(inspector, "search_documents"):
+        return
+
+    if bind.dialect.name == "sqlite":
+        for trigger in ["search_documents_ai", "search_documents_ad", "search_documents_au"]:
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS search_documents_fts")
+    elif bind.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_search_documents_content_trgm")
+    op.drop_index("ix_search_documents_org_source_type", table_name="search_documents")
+    op.drop_table("search_documents")
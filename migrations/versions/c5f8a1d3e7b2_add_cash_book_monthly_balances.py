@@ -0,0 +1,94 @@
+"""add cash_book_monthly_balances and running balances
+
+Revision ID: c5f8a1d3e7b2
+Revises: b7e2d5a9c4f1
+Create Date: 2026-10-16 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5f8a1d3e7b2"
+down_revision: Union[str, Sequence[str], None] = "b7e2d5a9c4f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _year_month_sql(dialect_name: str) -> str:
+    """取引日から年月（YYYY-MM）を求める SQL 式"""
+    if dialect_name == "sqlite":
+        return "strftime('%Y-%m', transaction_date)"
+    return "to_char(transaction_date, 'YYYY-MM')"
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    出納帳の口座別月次集計テーブルを作成し、
+    cash_books.balance を口座・月ごとの月初からの累計で埋める
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "cash_book_monthly_balances"):
+        return
+
+    op.create_table(
+        "cash_book_monthly_balances",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("payment_account", sa.String(length=255), nullable=False, server_default=""),
+        sa.Column("year_month", sa.String(length=7), nullable=False),
+        sa.Column("net_amount", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("organization_id", "payment_account", "year_month", name="uq_cash_book_monthly_balances"),
+    )
+
+    if not _has_table(inspector, "cash_books"):
+        return
+
+    year_month = _year_month_sql(bind.dialect.name)
+    op.execute(
+        f"""
+        UPDATE cash_books
+        SET balance = r.running
+        FROM (
+            SELECT id, SUM(amount_with_tax) OVER (
+                PARTITION BY organization_id, COALESCE(payment_account, ''), {year_month}
+                ORDER BY transaction_date, id
+            ) AS running
+            FROM cash_books
+        ) AS r
+        WHERE cash_books.id = r.id
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO cash_book_monthly_balances (organization_id, payment_account, year_month, net_amount)
+        SELECT organization_id, COALESCE(payment_account, ''), {year_month}, SUM(amount_with_tax)
+        FROM cash_books
+        GROUP BY organization_id, COALESCE(payment_account, ''), {year_month}
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "cash_book_monthly_balances"):
+        op.drop_table("cash_book_monthly_balances")
+    if _has_table(inspector, "cash_books"):
+        # 以前と同じく残高は 0 に戻す
+        op.execute("UPDATE cash_books SET balance = 0")
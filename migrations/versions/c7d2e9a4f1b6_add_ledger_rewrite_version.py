@@ -0,0 +1,60 @@
+"""add rewrite_version to ledger_versions
+
+Revision ID: c7d2e9a4f1b6
+Revises: b5e8f1c3d2a7
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c7d2e9a4f1b6"
+down_revision: Union[str, Sequence[str], None] = "b5e8f1c3d2a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _has_column(inspector, table_name: str, column_name: str) -> bool:
+    """指定カラムが存在するかチェック"""
+    cols = [c["name"] for c in inspector.get_columns(table_name)]
+    return column_name in cols
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_versions") and not _has_column(
+        inspector, "ledger_versions", "rewrite_version"
+    ):
+        with op.batch_alter_table("ledger_versions", schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column(
+                    "rewrite_version",
+                    sa.BigInteger(),
+                    nullable=False,
+                    server_default="0",
+                )
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "ledger_versions") and _has_column(
+        inspector, "ledger_versions", "rewrite_version"
+    ):
+        with op.batch_alter_table("ledger_versions", schema=None) as batch_op:
+            batch_op.drop_column("rewrite_version")
@@ -0,0 +1,50 @@
+"""add cash_book_account_versions table
+
+Revision ID: d2a7c4e9f1b3
+Revises: c5f8a1d3e7b2
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d2a7c4e9f1b3"
+down_revision: Union[str, Sequence[str], None] = "c5f8a1d3e7b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "cash_book_account_versions"):
+        return
+
+    op.create_table(
+        "cash_book_account_versions",
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column("payment_account", sa.String(length=255), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+        sa.PrimaryKeyConstraint("organization_id", "payment_account"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "cash_book_account_versions"):
+        op.drop_table("cash_book_account_versions")
@@ -0,0 +1,63 @@
+"""add general_ledger and cash_books composite indexes
+
+Revision ID: e4f8a2c6b9d1
+Revises: c7d2e9a4f1b6
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e4f8a2c6b9d1"
+down_revision: Union[str, Sequence[str], None] = "c7d2e9a4f1b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (テーブル名, インデックス名, カラム)
+INDEXES = [
+    # 期間指定の集計・仕訳帳のページング用
+    ("general_ledger", "ix_general_ledger_org_date", ["organization_id", "transaction_date", "id"]),
+    # 総勘定元帳（借方・貸方の勘定科目別）用
+    ("general_ledger", "ix_general_ledger_org_debit_date", ["organization_id", "debit_account_item_id", "transaction_date", "id"]),
+    ("general_ledger", "ix_general_ledger_org_credit_date", ["organization_id", "credit_account_item_id", "transaction_date", "id"]),
+    # 出納帳・振替伝票などの元データからの検索用
+    ("general_ledger", "ix_general_ledger_source", ["source_type", "source_id"]),
+    # 口座別の出納帳一覧用
+    ("cash_books", "ix_cash_books_org_payment_account_date", ["organization_id", "payment_account", "transaction_date", "id"]),
+    ("cash_books", "ix_cash_books_org_date", ["organization_id", "transaction_date", "id"]),
+]
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _has_index(inspector, table_name: str, index_name: str) -> bool:
+    """インデックスが存在するかチェック"""
+    return any(index["name"] == index_name for index in inspector.get_indexes(table_name))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for table_name, index_name, columns in INDEXES:
+        if _has_table(inspector, table_name) and not _has_index(inspector, table_name, index_name):
+            op.create_index(index_name, table_name, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for table_name, index_name, _ in INDEXES:
+        if _has_table(inspector, table_name) and _has_index(inspector, table_name, index_name):
+            op.drop_index(index_name, table_name=table_name)
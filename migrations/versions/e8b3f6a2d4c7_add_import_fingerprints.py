@@ -0,0 +1,127 @@
+"""add fingerprint columns to cash_books and imported_transactions
+
+Revision ID: e8b3f6a2d4c7
+Revises: d2a7c4e9f1b3
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import hashlib
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e8b3f6a2d4c7"
+down_revision: Union[str, Sequence[str], None] = "d2a7c4e9f1b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (テーブル名, 一意インデックス名)
+TABLES = [
+    ("cash_books", "uq_cash_books_org_fingerprint"),
+    ("imported_transactions", "uq_imported_transactions_org_fingerprint"),
+]
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _has_column(inspector, table_name: str, column_name: str) -> bool:
+    """指定カラムが存在するかチェック"""
+    cols = [c["name"] for c in inspector.get_columns(table_name)]
+    return column_name in cols
+
+
+def _has_index(inspector, table_name: str, index_name: str) -> bool:
+    """インデックスが存在するかチェック"""
+    return any(index["name"] == index_name for index in inspector.get_indexes(table_name))
+
+
+def _normalize_text(value) -> str:
+    text = str(value).strip()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    return text
+
+
+def _fingerprint(organization_id, account, transaction_date, amount, description, occurrence) -> str:
+    """import_format_utils.row_fingerprint と同じ値（マイグレーション時点の実装を固定するため複製）"""
+    key = "\x1f".join((
+        str(organization_id),
+        _normalize_text(account if account is not None else ""),
+        str(transaction_date),
+        str(int(amount or 0)),
+        " ".join(_normalize_text(description or "").split()),
+        str(occurrence),
+    ))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _backfill_imported_transactions(bind) -> None:
+    """
+    既存の取引明細のフィンガープリントを設定
+    同じ内容の明細は登録順に何回目かを含めるため、一意インデックスと重複しない
+    """
+    rows = bind.execute(sa.text(
+        "SELECT id, organization_id, account_name, transaction_date, description, "
+        "income_amount, expense_amount FROM imported_transactions ORDER BY id"
+    )).fetchall()
+    occurrences = {}
+    updates = []
+    for row_id, organization_id, account_name, transaction_date, description, income, expense in rows:
+        amount = (income or 0) - (expense or 0)
+        base = _fingerprint(organization_id, account_name, transaction_date, amount, description, 0)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+        updates.append({
+            "id": row_id,
+            "fingerprint": _fingerprint(
+                organization_id, account_name, transaction_date, amount, description, occurrence
+            ),
+        })
+    if updates:
+        bind.execute(
+            sa.text("UPDATE imported_transactions SET fingerprint = :fingerprint WHERE id = :id"),
+            updates,
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for table_name, _ in TABLES:
+        if _has_table(inspector, table_name) and not _has_column(inspector, table_name, "fingerprint"):
+            with op.batch_alter_table(table_name, schema=None) as batch_op:
+                batch_op.add_column(sa.Column("fingerprint", sa.String(length=64), nullable=True))
+
+    # 出納帳は手入力の行に同じ内容の行があり得るため、既存の行は NULL のままにする
+    if _has_table(inspector, "imported_transactions"):
+        _backfill_imported_transactions(bind)
+
+    inspector = sa.inspect(bind)
+    for table_name, index_name in TABLES:
+        if _has_table(inspector, table_name) and not _has_index(inspector, table_name, index_name):
+            op.create_index(index_name, table_name, ["organization_id", "fingerprint"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for table_name, index_name in TABLES:
+        if not _has_table(inspector, table_name):
+            continue
+        if _has_index(inspector, table_name, index_name):
+            op.drop_index(index_name, table_name=table_name)
+        if _has_column(inspector, table_name, "fingerprint"):
+            with op.batch_alter_table(table_name, schema=None) as batch_op:
+                batch_op.drop_column("fingerprint")
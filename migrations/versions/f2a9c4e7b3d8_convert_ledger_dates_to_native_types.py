@@ -0,0 +1,192 @@
+"""convert ledger / cash book / journal dates to native DATE / TIMESTAMP
+
+Revision ID: f2a9c4e7b3d8
+Revises: e4f8a2c6b9d1
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f2a9c4e7b3d8"
+down_revision: Union[str, Sequence[str], None] = "e4f8a2c6b9d1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# テーブル名 → {カラム名: NOT NULL か}
+DATE_COLUMNS = {
+    "cash_books": {"transaction_date": True},
+    "general_ledger": {"transaction_date": False},
+    "journal_entries": {"transaction_date": True},
+    "fiscal_periods": {"start_date": True, "end_date": True},
+}
+TIMESTAMP_TABLES = ["cash_books", "general_ledger", "journal_entries", "fiscal_periods"]
+TIMESTAMP_COLUMNS = ["created_at", "updated_at"]
+
+DATE_PATTERN = "____-__-__"
+TIMESTAMP_PATTERN = "____-__-__ __:__:__"
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _column_types(inspector, table_name: str) -> dict:
+    """カラム名 → 型 の辞書"""
+    return {column["name"]: column["type"] for column in inspector.get_columns(table_name)}
+
+
+def _is_string(column_type) -> bool:
+    return isinstance(column_type, sa.String)
+
+
+def _parse_date(value):
+    text = value.strip().replace("/", "-").replace("T", " ").split(" ")[0]
+    return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def _parse_timestamp(value):
+    text = value.strip().replace("/", "-")
+    return datetime.fromisoformat(text).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _backfill(bind, table_name: str, column_name: str, pattern: str, parse, not_null: bool) -> None:
+    """
+    文字列の日付・日時を型変換できる形式（YYYY-MM-DD / YYYY-MM-DD HH:MM:SS）に揃える
+
+    空文字は NULL にし、'YYYY/MM/DD' や月日が1桁の値は正規化する
+    変換できない値は NULL にする（NOT NULL のカラムではエラーにする）
+    """
+    table = sa.table(table_name, sa.column(column_name, sa.String()))
+    column = table.c[column_name]
+
+    if not not_null:
+        bind.execute(sa.update(table).where(column == "").values({column_name: None}))
+
+    values = bind.execute(
+        sa.select(column).distinct().where(column.isnot(None), column.notlike(pattern))
+    ).scalars().all()
+    # パターンに一致しても日付として不正な値（'2024-13-01' など）は確認しない（型変換時にエラーになる）
+    invalid = []
+    for value in values:
+        try:
+            normalized = parse(value)
+        except ValueError:
+            invalid.append(value)
+            continue
+        bind.execute(sa.update(table).where(column == value).values({column_name: normalized}))
+
+    if invalid:
+        if not_null:
+            raise RuntimeError(
+                f"{table_name}.{column_name} に日付に変換できない値があります: {', '.join(map(repr, invalid[:10]))}"
+            )
+        print(f"{table_name}.{column_name}: 日付に変換できない値 {len(invalid)} 件を NULL にします")
+        bind.execute(sa.update(table).where(column.in_(invalid)).values({column_name: None}))
+
+
+def _change_types(table_name: str, types: dict, targets: list, is_postgresql: bool, is_sqlite: bool) -> None:
+    """カラムの型を変更（targets: [(カラム名, 新しい型, NOT NULL か, PostgreSQL の USING 式)]）"""
+    if is_sqlite:
+        # SQLite の batch の alter_column は CAST(... AS DATE) でデータを移すため、
+        # 'YYYY-MM-DD' が数値（年）に変換されてしまう。型の宣言だけを差し替えてテーブルを作り直す
+        with op.batch_alter_table(
+            table_name,
+            recreate="always",
+            reflect_args=[
+                sa.Column(column_name, new_type, nullable=not not_null)
+                for column_name, new_type, not_null, _ in targets
+            ],
+        ):
+            pass
+        return
+
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        for column_name, new_type, not_null, using in targets:
+            kwargs = {}
+            if is_postgresql:
+                kwargs["postgresql_using"] = using
+            batch_op.alter_column(
+                column_name,
+                existing_type=types[column_name],
+                type_=new_type,
+                existing_nullable=not not_null,
+                **kwargs,
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    取引日・会計期間の開始日/終了日を DATE 型に、作成日時・更新日時を TIMESTAMP 型に変更する
+    型変換の前に、既存の文字列データを変換できる形式に揃える
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    is_postgresql = bind.dialect.name == "postgresql"
+    is_sqlite = bind.dialect.name == "sqlite"
+
+    for table_name in TIMESTAMP_TABLES:
+        if not _has_table(inspector, table_name):
+            continue
+        types = _column_types(inspector, table_name)
+        date_columns = DATE_COLUMNS.get(table_name, {})
+        targets = []
+        for column_name, not_null in date_columns.items():
+            if column_name in types and _is_string(types[column_name]):
+                _backfill(bind, table_name, column_name, DATE_PATTERN, _parse_date, not_null)
+                targets.append((column_name, sa.Date(), not_null, f"{column_name}::date"))
+        for column_name in TIMESTAMP_COLUMNS:
+            if column_name in types and _is_string(types[column_name]):
+                _backfill(bind, table_name, column_name, TIMESTAMP_PATTERN, _parse_timestamp, False)
+                targets.append((column_name, sa.DateTime(), False, f"{column_name}::timestamp"))
+        if not targets:
+            continue
+
+        _change_types(table_name, types, targets, is_postgresql, is_sqlite)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    is_postgresql = bind.dialect.name == "postgresql"
+    is_sqlite = bind.dialect.name == "sqlite"
+
+    for table_name in TIMESTAMP_TABLES:
+        if not _has_table(inspector, table_name):
+            continue
+        types = _column_types(inspector, table_name)
+        date_columns = DATE_COLUMNS.get(table_name, {})
+        targets = []
+        for column_name, not_null in date_columns.items():
+            if column_name in types and not _is_string(types[column_name]):
+                targets.append((column_name, sa.String(length=10), not_null, f"to_char({column_name}, 'YYYY-MM-DD')"))
+        for column_name in TIMESTAMP_COLUMNS:
+            if column_name in types and not _is_string(types[column_name]):
+                targets.append(
+                    (column_name, sa.String(length=19), False, f"to_char({column_name}, 'YYYY-MM-DD HH24:MI:SS')")
+                )
+        if not targets:
+            continue
+
+        _change_types(table_name, types, targets, is_postgresql, is_sqlite)
+
+        if is_sqlite:
+            # SQLite の日時はマイクロ秒付きで保存されるため、元の形式（19文字）に戻す
+            table = sa.table(table_name, *[sa.column(name, sa.String()) for name in TIMESTAMP_COLUMNS if name in types])
+            for column_name in TIMESTAMP_COLUMNS:
+                if column_name in types:
+                    column = table.c[column_name]
+                    bind.execute(
+                        sa.update(table)
+                        .where(sa.func.length(column) > 19)
+                        .values({column_name: sa.func.substr(column, 1, 19)})
+                    )
@@ -0,0 +1,115 @@
+"""store job files in database and track job heartbeats
+
+Revision ID: f6c1d9a4b2e8
+Revises: e8b3f6a2d4c7
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f6c1d9a4b2e8"
+down_revision: Union[str, Sequence[str], None] = "e8b3f6a2d4c7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(inspector, table_name: str) -> bool:
+    """テーブルが存在するかチェック"""
+    return table_name in inspector.get_table_names()
+
+
+def _has_column(inspector, table_name: str, column_name: str) -> bool:
+    """指定カラムが存在するかチェック"""
+    cols = [c["name"] for c in inspector.get_columns(table_name)]
+    return column_name in cols
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if not _has_table(inspector, "stored_files"):
+        op.create_table(
+            "stored_files",
+            sa.Column("id", sa.String(length=64), nullable=False),
+            sa.Column("organization_id", sa.Integer(), nullable=True),
+            sa.Column("purpose", sa.String(length=20), nullable=False),
+            sa.Column("filename", sa.String(length=255), nullable=True),
+            sa.Column("size", sa.BigInteger(), nullable=False, server_default="0"),
+            sa.Column("info_json", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.String(length=19), nullable=True),
+            sa.Column("expires_at", sa.String(length=19), nullable=True),
+            sa.ForeignKeyConstraint(["organization_id"], ["organizations.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_stored_files_expires_at", "stored_files", ["expires_at"])
+
+    if not _has_table(inspector, "stored_file_chunks"):
+        op.create_table(
+            "stored_file_chunks",
+            sa.Column("file_id", sa.String(length=64), nullable=False),
+            sa.Column("seq", sa.Integer(), nullable=False),
+            sa.Column("data", sa.LargeBinary(), nullable=False),
+            sa.ForeignKeyConstraint(["file_id"], ["stored_files.id"]),
+            sa.PrimaryKeyConstraint("file_id", "seq"),
+        )
+
+    if not _has_table(inspector, "background_jobs"):
+        return
+
+    # ローカルディスクのファイルを参照していた列は stored_files の参照に置き換える
+    # （実行待ちのジョブの入力ファイルは引き継がない）
+    with op.batch_alter_table("background_jobs", schema=None) as batch_op:
+        if not _has_column(inspector, "background_jobs", "input_file_id"):
+            batch_op.add_column(sa.Column("input_file_id", sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key(
+                "fk_background_jobs_input_file_id", "stored_files", ["input_file_id"], ["id"]
+            )
+        if not _has_column(inspector, "background_jobs", "result_file_id"):
+            batch_op.add_column(sa.Column("result_file_id", sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key(
+                "fk_background_jobs_result_file_id", "stored_files", ["result_file_id"], ["id"]
+            )
+        if not _has_column(inspector, "background_jobs", "heartbeat_at"):
+            batch_op.add_column(sa.Column("heartbeat_at", sa.String(length=19), nullable=True))
+        if not _has_column(inspector, "background_jobs", "attempts"):
+            batch_op.add_column(sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+        if _has_column(inspector, "background_jobs", "input_path"):
+            batch_op.drop_column("input_path")
+        if _has_column(inspector, "background_jobs", "result_path"):
+            batch_op.drop_column("result_path")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if _has_table(inspector, "background_jobs"):
+        with op.batch_alter_table("background_jobs", schema=None) as batch_op:
+            if not _has_column(inspector, "background_jobs", "input_path"):
+                batch_op.add_column(sa.Column("input_path", sa.String(length=500), nullable=True))
+            if not _has_column(inspector, "background_jobs", "result_path"):
+                batch_op.add_column(sa.Column("result_path", sa.String(length=500), nullable=True))
+            if _has_column(inspector, "background_jobs", "input_file_id"):
+                batch_op.drop_constraint("fk_background_jobs_input_file_id", type_="foreignkey")
+                batch_op.drop_column("input_file_id")
+            if _has_column(inspector, "background_jobs", "result_file_id"):
+                batch_op.drop_constraint("fk_background_jobs_result_file_id", type_="foreignkey")
+                batch_op.drop_column("result_file_id")
+            if _has_column(inspector, "background_jobs", "heartbeat_at"):
+                batch_op.drop_column("heartbeat_at")
+            if _has_column(inspector, "background_jobs", "attempts"):
+                batch_op.drop_column("attempts")
+
+    if _has_table(inspector, "stored_file_chunks"):
+        op.drop_table("stored_file_chunks")
+    if _has_table(inspector, "stored_files"):
+        op.drop_index("ix_stored_files_expires_at", table_name="stored_files")
+        op.drop_table("stored_files")
@@ -1,8 +1,55 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, Text, Numeric, Date
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, Enum, Text, Numeric, Date, DateTime, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+from datetime import date, datetime
 import enum
 
+
+def coerce_date(value):
+    """日付（date・datetime・'YYYY-MM-DD' / 'YYYY/MM/DD' 形式の文字列）を date に変換（空文字は None）"""
+    if value is None or (isinstance(value, date) and not isinstance(value, datetime)):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    text = str(value).strip()
+    if not text:
+        return None
+    # 'YYYY-MM-DD HH:MM:SS' などの時刻部分は無視する
+    text = text.replace('/', '-').replace('T', ' ').split(' ')[0]
+    return datetime.strptime(text, '%Y-%m-%d').date()
+
+
+def coerce_datetime(value):
+    """日時（datetime・date・'YYYY-MM-DD HH:MM:SS' 形式の文字列）を datetime に変換（空文字は None）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    text = str(value).strip()
+    if not text:
+        return None
+    return datetime.fromisoformat(text.replace('/', '-'))
+
+
+class DateType(TypeDecorator):
+    """DATE 型のカラム（従来どおり 'YYYY-MM-DD' 形式の文字列も代入・比較できる）"""
+    impl = Date
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return coerce_date(value)
+
+
+class TimestampType(TypeDecorator):
+    """TIMESTAMP 型のカラム（従来どおり 'YYYY-MM-DD HH:MM:SS' 形式の文字列も代入できる）"""
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return coerce_datetime(value)
+
+
 # ベースクラス
 class Base(declarative_base()):
     __abstract__ = True
@@ -70,12 +117,19 @@ class ImportTemplate(Base):
 
 class CashBook(Base):
     __tablename__ = 'cash_books'
+    __table_args__ = (
+        # 口座別の出納帳一覧用
+        Index('ix_cash_books_org_payment_account_date', 'organization_id', 'payment_account', 'transaction_date', 'id'),
+        Index('ix_cash_books_org_date', 'organization_id', 'transaction_date', 'id'),
+        # インポートの重複防止用
+        Index('uq_cash_books_org_fingerprint', 'organization_id', 'fingerprint', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     # 事業所ID
     organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
     # 取引日
-    transaction_date = Column(String(10), nullable=False)  # YYYY-MM-DD形式
+    transaction_date = Column(DateType, nullable=False)
     # 勘定科目（AccountItemのidを参照）
     account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=False)
     # 消費税区分（TaxCategoryのidを参照）
@@ -100,12 +154,15 @@ class CashBook(Base):
     amount_without_tax = Column(Integer)
     # 消費税額
     tax_amount = Column(Integer)
-    # 残高
+    # 残高（口座・月ごとの月初からの累計、取引日・ID順。口座の残高は月次集計の前月までの合計を加える
+    # cash_book_balance_utils で同期される）
     balance = Column(Integer)
+    # インポートした行のフィンガープリント（import_format_utils.row_fingerprint、手入力の行は NULL）
+    fingerprint = Column(String(64))
     # 作成日時
-    created_at = Column(String(19))  # YYYY-MM-DD HH:MM:SS形式
+    created_at = Column(TimestampType)
     # 更新日時
-    updated_at = Column(String(19))
+    updated_at = Column(TimestampType)
 
     # リレーションシップ
     account_item = relationship("AccountItem", foreign_keys=[account_item_id])
@@ -289,7 +346,7 @@ class JournalEntry(Base):
     # 事業所ID
     organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
     # 伝票日付
-    transaction_date = Column(String(10), nullable=False)  # YYYY-MM-DD形式
+    transaction_date = Column(DateType, nullable=False)
     # 借方勘定科目（AccountItemのidを参照）
     debit_account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=False)
     # 借方金額
@@ -307,9 +364,9 @@ class JournalEntry(Base):
     # 備考
     remarks = Column(Text)
     # 作成日時
-    created_at = Column(String(19))  # YYYY-MM-DD HH:MM:SS形式
+    created_at = Column(TimestampType)
     # 更新日時
-    updated_at = Column(String(19))
+    updated_at = Column(TimestampType)
 
     # リレーションシップ
     debit_account_item = relationship("AccountItem", foreign_keys=[debit_account_item_id], backref="debit_entries")
@@ -387,10 +444,10 @@ class FiscalPeriod(Base):
     organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
     # 会計期間名（例: 2024年度、第5期など）
     name = Column(String(255), nullable=False)
-    # 開始日（YYYY-MM-DD形式）
-    start_date = Column(String(10), nullable=False)
-    # 終了日（YYYY-MM-DD形式）
-    end_date = Column(String(10), nullable=False)
+    # 開始日
+    start_date = Column(DateType, nullable=False)
+    # 終了日
+    end_date = Column(DateType, nullable=False)
     # 事業種別（individual: 個人, corporate: 法人）
     business_type = Column(String(20), nullable=False, default='corporate')
     # ステータス（open: 進行中, closed: 締め済み）
@@ -400,9 +457,9 @@ class FiscalPeriod(Base):
     # 備考
     notes = Column(Text)
     # 作成日時
-    created_at = Column(String(19))  # YYYY-MM-DD HH:MM:SS形式
+    created_at = Column(TimestampType)
     # 更新日時
-    updated_at = Column(String(19))
+    updated_at = Column(TimestampType)
 
     def __repr__(self):
         return f"<FiscalPeriod(name='{self.name}', start_date='{self.start_date}', end_date='{self.end_date}')>"
@@ -447,6 +504,10 @@ class Organization(Base):
 # ========== 取引明細インポート ==========
 class ImportedTransaction(Base):
     __tablename__ = 'imported_transactions'
+    __table_args__ = (
+        # 同じ明細の再インポート防止用
+        Index('uq_imported_transactions_org_fingerprint', 'organization_id', 'fingerprint', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     # 事業所ID
@@ -469,16 +530,33 @@ class ImportedTransaction(Base):
     account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=True)
     # インポート日時
     imported_at = Column(String(19))
+    # 明細のフィンガープリント（import_format_utils.row_fingerprint、ファイル内の出現回数を含む）
+    fingerprint = Column(String(64))
 
     def __repr__(self):
         return f"<ImportedTransaction(account='{self.account_name}', date='{self.transaction_date}', status={self.status})>"
 
 class GeneralLedger(Base):
     __tablename__ = 'general_ledger'
+    __table_args__ = (
+        # 期間指定の集計・仕訳帳のページング用
+        Index('ix_general_ledger_org_date', 'organization_id', 'transaction_date', 'id'),
+        # 総勘定元帳（借方・貸方の勘定科目別）用
+        Index('ix_general_ledger_org_debit_date', 'organization_id', 'debit_account_item_id', 'transaction_date', 'id'),
+        Index('ix_general_ledger_org_credit_date', 'organization_id', 'credit_account_item_id', 'transaction_date', 'id'),
+        # 出納帳・振替伝票などの元データからの検索用
+        Index('ix_general_ledger_source', 'source_type', 'source_id'),
+        # 部門別・取引先別などの内訳集計用
+        Index('ix_general_ledger_org_department_date', 'organization_id', 'department_id', 'transaction_date'),
+        Index('ix_general_ledger_org_counterparty_date', 'organization_id', 'counterparty_id', 'transaction_date'),
+        Index('ix_general_ledger_org_item_date', 'organization_id', 'item_id', 'transaction_date'),
+        Index('ix_general_ledger_org_project_tag_date', 'organization_id', 'project_tag_id', 'transaction_date'),
+        Index('ix_general_ledger_org_memo_tag_date', 'organization_id', 'memo_tag_id', 'transaction_date'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     organization_id = Column(Integer, ForeignKey('organizations.id'))
-    transaction_date = Column(String(10))
+    transaction_date = Column(DateType)
     debit_account_item_id = Column(Integer, ForeignKey('account_items.id'))
     debit_amount = Column(Integer)
     debit_tax_category_id = Column(Integer, ForeignKey('tax_categories.id'), nullable=True)
@@ -489,8 +567,8 @@ class GeneralLedger(Base):
     remarks = Column(String(255), nullable=True)
     source_type = Column(String(50))
     source_id = Column(Integer, nullable=True)
-    created_at = Column(String(19), nullable=True)
-    updated_at = Column(String(19), nullable=True)
+    created_at = Column(TimestampType, nullable=True)
+    updated_at = Column(TimestampType, nullable=True)
     counterparty_id = Column(Integer, ForeignKey('counterparties.id'), nullable=True)
     department_id = Column(Integer, ForeignKey('departments.id'), nullable=True)
     item_id = Column(Integer, ForeignKey('items.id'), nullable=True)
@@ -510,6 +588,70 @@ class GeneralLedger(Base):
         return f"<GeneralLedger(date='{self.transaction_date}', debit={self.debit_amount}, credit={self.credit_amount})>"
 
 
+class LedgerLine(Base):
+    """
+    仕訳明細テーブル（仕訳帳の1仕訳を勘定科目ごとの明細に分けたもの、仕訳帳から同期される）
+
+    通常の仕訳は借方・貸方の2行になる。借方と貸方が同じ勘定科目の仕訳は1行にまとめる
+    """
+    __tablename__ = 'ledger_lines'
+    __table_args__ = (
+        UniqueConstraint('general_ledger_id', 'account_item_id', name='uq_ledger_lines_entry_account'),
+        # 勘定科目別の元帳・残高用（金額まで含めてインデックスだけで合計できるようにする）
+        Index('ix_ledger_lines_org_account_date', 'organization_id', 'account_item_id', 'transaction_date', 'general_ledger_id', 'amount'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    # 仕訳帳ID（仕訳の削除時は同期処理で削除するため外部キー制約は付けない）
+    general_ledger_id = Column(Integer, nullable=False)
+    # 勘定科目ID
+    account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=False)
+    # 相手勘定科目ID
+    counterpart_account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=True)
+    # 取引日
+    transaction_date = Column(DateType)
+    # 借方金額
+    debit_amount = Column(BigInteger, default=0, nullable=False)
+    # 貸方金額
+    credit_amount = Column(BigInteger, default=0, nullable=False)
+    # 符号付き金額（借方金額 - 貸方金額）
+    amount = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<LedgerLine(general_ledger_id={self.general_ledger_id}, account_item_id={self.account_item_id}, amount={self.amount})>"
+
+
+class SearchDocument(Base):
+    """
+    全文検索用の文書テーブル（出納帳・振替伝票・仕訳帳・取引明細の検索対象の文字列をまとめたもの）
+
+    元データの変更に合わせて同期される。SQLite では FTS5（trigram）の仮想テーブル、
+    PostgreSQL では pg_trgm の GIN インデックスを content に作成する（search_utils を参照）
+    """
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        UniqueConstraint('source_type', 'source_id', name='uq_search_documents_source'),
+        Index('ix_search_documents_org_source_type', 'organization_id', 'source_type'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    # 元データの種類（cash_book / journal_entry / general_ledger / imported_transaction）
+    source_type = Column(String(50), nullable=False)
+    # 元データのID（元データの削除時は同期処理で削除するため外部キー制約は付けない）
+    source_id = Column(Integer, nullable=False)
+    # 取引日
+    transaction_date = Column(DateType)
+    # 検索対象の文字列（摘要・取引先・備考などを空白区切りで連結したもの）
+    content = Column(Text, nullable=False, default='')
+
+    def __repr__(self):
+        return f"<SearchDocument(source_type='{self.source_type}', source_id={self.source_id})>"
+
+
 class OpeningBalance(Base):
     """期首残高テーブル"""
     __tablename__ = 'opening_balances'
@@ -537,3 +679,168 @@ class OpeningBalance(Base):
 
     def __repr__(self):
         return f"<OpeningBalance(fiscal_period_id={self.fiscal_period_id}, account_item_id={self.account_item_id}, debit={self.debit_amount}, credit={self.credit_amount})>"
+
+
+class AccountMonthlyBalance(Base):
+    """勘定科目別月次集計テーブル（仕訳帳から増分更新される）"""
+    __tablename__ = 'account_monthly_balances'
+    __table_args__ = (
+        UniqueConstraint('organization_id', 'account_item_id', 'year_month', name='uq_account_monthly_balances'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    # 勘定科目ID
+    account_item_id = Column(Integer, ForeignKey('account_items.id'), nullable=False)
+    # 年月（YYYY-MM形式）
+    year_month = Column(String(7), nullable=False)
+    # 借方合計
+    debit_total = Column(BigInteger, default=0, nullable=False)
+    # 貸方合計
+    credit_total = Column(BigInteger, default=0, nullable=False)
+
+    # リレーションシップ
+    account_item = relationship('AccountItem', foreign_keys=[account_item_id])
+
+    def __repr__(self):
+        return f"<AccountMonthlyBalance(account_item_id={self.account_item_id}, year_month='{self.year_month}', debit={self.debit_total}, credit={self.credit_total})>"
+
+
+class CashBookMonthlyBalance(Base):
+    """出納帳の口座別月次集計テーブル（出納帳から同期される、口座の残高のチェックポイント）"""
+    __tablename__ = 'cash_book_monthly_balances'
+    __table_args__ = (
+        UniqueConstraint('organization_id', 'payment_account', 'year_month', name='uq_cash_book_monthly_balances'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    # 支払口座（出納帳の payment_account、未設定は空文字）
+    payment_account = Column(String(255), nullable=False, default='')
+    # 年月（YYYY-MM形式）
+    year_month = Column(String(7), nullable=False)
+    # 入出金の合計（税込、入金は正・出金は負）
+    net_amount = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<CashBookMonthlyBalance(payment_account='{self.payment_account}', year_month='{self.year_month}', net_amount={self.net_amount})>"
+
+
+class CashBookAccountVersion(Base):
+    """口座（事業所・支払口座）ごとの出納帳バージョン（出納帳APIの ETag に使用）"""
+    __tablename__ = 'cash_book_account_versions'
+
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), primary_key=True)
+    # 支払口座（出納帳の payment_account、未設定は空文字）
+    payment_account = Column(String(255), primary_key=True)
+    # バージョン（口座の出納帳が追加・更新・削除されるたびに加算）
+    version = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<CashBookAccountVersion(payment_account='{self.payment_account}', version={self.version})>"
+
+
+class LedgerVersion(Base):
+    """事業所ごとの仕訳帳バージョン（帳票キャッシュの有効性確認に使用）"""
+    __tablename__ = 'ledger_versions'
+
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), primary_key=True)
+    # バージョン（仕訳帳・期首残高などが変更されるたびに加算）
+    version = Column(BigInteger, default=0, nullable=False)
+    # 仕訳の更新・削除の回数（追加のみの変更では加算しない。列指向キャッシュの差分読み込み可否の判定に使用）
+    rewrite_version = Column(BigInteger, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<LedgerVersion(organization_id={self.organization_id}, version={self.version})>"
+
+
+class BackgroundJob(Base):
+    """バックグラウンドジョブ（帳票エクスポート・インポートなどの非同期実行）"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = (
+        Index('ix_background_jobs_status_id', 'status', 'id'),
+        Index('ix_background_jobs_org_created', 'organization_id', 'created_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'), nullable=False)
+    # 登録したユーザーID
+    user_id = Column(Integer)
+    # ジョブ種別（report_export, import_data, transaction_import など）
+    job_type = Column(String(50), nullable=False)
+    # ステータス（queued: 待機中, running: 実行中, succeeded: 完了, failed: 失敗）
+    status = Column(String(20), nullable=False, default='queued')
+    # パラメータ（JSON）
+    params_json = Column(Text)
+    # 進捗率（0〜100）
+    progress = Column(Integer, nullable=False, default=0)
+    # 進捗メッセージ
+    message = Column(String(255))
+    # アップロードされた入力ファイル（stored_files のID）
+    input_file_id = Column(String(64), ForeignKey('stored_files.id'))
+    # 結果ファイル（stored_files のID）・ダウンロード時のファイル名・MIMEタイプ
+    result_file_id = Column(String(64), ForeignKey('stored_files.id'))
+    result_filename = Column(String(255))
+    result_mimetype = Column(String(100))
+    # 結果（JSON）
+    result_json = Column(Text)
+    # エラー内容
+    error = Column(Text)
+    # 作成日時・開始日時・終了日時（YYYY-MM-DD HH:MM:SS形式）
+    created_at = Column(String(19))
+    started_at = Column(String(19))
+    finished_at = Column(String(19))
+    # 実行中のワーカーが最後に生存を記録した日時（止まったジョブの検出用）
+    heartbeat_at = Column(String(19))
+    # 実行を開始した回数
+    attempts = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<BackgroundJob(id={self.id}, job_type='{self.job_type}', status='{self.status}', progress={self.progress})>"
+
+
+class StoredFile(Base):
+    """
+    アップロード・ジョブの入出力ファイル（内容は stored_file_chunks に分割して保存）
+
+    Webプロセスとワーカープロセスが別のサーバーで動いていても参照できるよう、
+    ローカルディスクではなくデータベースに保存する
+    """
+    __tablename__ = 'stored_files'
+    __table_args__ = (
+        Index('ix_stored_files_expires_at', 'expires_at'),
+    )
+
+    # ID（推測できないランダムな文字列。アップロードのトークンとしても使う）
+    id = Column(String(64), primary_key=True)
+    # 事業所ID
+    organization_id = Column(Integer, ForeignKey('organizations.id'))
+    # 用途（job_input, job_result, import_spool）
+    purpose = Column(String(20), nullable=False)
+    # 元のファイル名
+    filename = Column(String(255))
+    # サイズ（バイト）
+    size = Column(BigInteger, nullable=False, default=0)
+    # 用途ごとの付加情報（JSON）
+    info_json = Column(Text)
+    # 作成日時・有効期限（YYYY-MM-DD HH:MM:SS形式。期限なしは NULL）
+    created_at = Column(String(19))
+    expires_at = Column(String(19))
+
+    def __repr__(self):
+        return f"<StoredFile(id='{self.id}', purpose='{self.purpose}', size={self.size})>"
+
+
+class StoredFileChunk(Base):
+    """保存ファイルの内容（一定サイズごとに分割）"""
+    __tablename__ = 'stored_file_chunks'
+
+    file_id = Column(String(64), ForeignKey('stored_files.id'), primary_key=True)
+    # 先頭からの連番（0始まり）
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,33 @@
+"""
+仕訳明細（ledger_lines）を仕訳帳から作り直すスクリプト
+
+使い方:
+    python rebuild_ledger_lines.py                      # 全事業所
+    python rebuild_ledger_lines.py --organization-id 1  # 指定した事業所のみ
+"""
+
+import argparse
+from db import SessionLocal
+from ledger_line_utils import rebuild_ledger_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='仕訳明細を仕訳帳から作り直す')
+    parser.add_argument('--organization-id', type=int, default=None, help='対象の事業所ID（省略時は全事業所）')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = rebuild_ledger_lines(db, organization_id=args.organization_id)
+        db.commit()
+        print(f"仕訳明細を {count} 件作成しました")
+    except Exception as e:
+        db.rollback()
+        print(f"エラーが発生しました: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
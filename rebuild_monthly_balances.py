@@ -0,0 +1,33 @@
+"""
+勘定科目別月次集計（account_monthly_balances）を仕訳帳から作り直すスクリプト
+
+使い方:
+    python rebuild_monthly_balances.py                      # 全事業所
+    python rebuild_monthly_balances.py --organization-id 1  # 指定した事業所のみ
+"""
+
+import argparse
+from db import SessionLocal
+from balance_utils import rebuild_monthly_balances
+
+
+def main():
+    parser = argparse.ArgumentParser(description='勘定科目別月次集計を仕訳帳から作り直す')
+    parser.add_argument('--organization-id', type=int, default=None, help='対象の事業所ID（省略時は全事業所）')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = rebuild_monthly_balances(db, organization_id=args.organization_id)
+        db.commit()
+        print(f"月次集計を {count} 件作成しました")
+    except Exception as e:
+        db.rollback()
+        print(f"エラーが発生しました: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
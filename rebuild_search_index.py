@@ -0,0 +1,34 @@
+"""
+全文検索用の文書（search_documents）を元データから作り直すスクリプト
+
+使い方:
+    python rebuild_search_index.py                      # 全事業所
+    python rebuild_search_index.py --organization-id 1  # 指定した事業所のみ
+"""
+
+import argparse
+from db import SessionLocal
+from search_utils import create_search_index, rebuild_search_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全文検索用の文書を元データから作り直す')
+    parser.add_argument('--organization-id', type=int, default=None, help='対象の事業所ID（省略時は全事業所）')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        create_search_index(db)
+        count = rebuild_search_documents(db, organization_id=args.organization_id)
+        db.commit()
+        print(f"検索用の文書を {count} 件作成しました")
+    except Exception as e:
+        db.rollback()
+        print(f"エラーが発生しました: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+帳票（試算表・総勘定元帳・仕訳帳）の集計結果キャッシュ
+キャッシュは (事業所ID, 会計期間ID, 帳票種別, パラメータ) をキーに保持し、
+事業所ごとの仕訳帳バージョン（ledger_versions）が一致する場合のみ再利用する
+仕訳帳・期首残高・勘定科目・口座・会計期間の変更時はフラッシュ時にバージョンを加算する
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import event, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from db import SessionLocal
+from models import Account, AccountItem, FiscalPeriod, LedgerVersion, OpeningBalance
+from ledger_utils import register_ledger_change_handler
+
+
+# 変更されると帳票の内容が変わるモデル（仕訳帳以外）
+VERSIONED_MODELS = (OpeningBalance, AccountItem, Account, FiscalPeriod)
+
+
+def get_ledger_version(db, organization_id):
+    """事業所の仕訳帳バージョンを取得（未作成の場合は0）"""
+    version = db.execute(
+        select(LedgerVersion.version).where(LedgerVersion.organization_id == organization_id)
+    ).scalar()
+    return version or 0
+
+
+def get_ledger_rewrite_version(db, organization_id):
+    """事業所の仕訳帳バージョンと更新・削除バージョンを取得（未作成の場合は (0, 0)）"""
+    row = db.execute(
+        select(LedgerVersion.version, LedgerVersion.rewrite_version)
+        .where(LedgerVersion.organization_id == organization_id)
+    ).first()
+    if row is None:
+        return 0, 0
+    return row[0] or 0, row[1] or 0
+
+
+def bump_ledger_version(db, *organization_ids, rewritten=False):
+    """
+    事業所の仕訳帳バージョンを加算（無ければ作成）
+
+    rewritten=True の場合は更新・削除バージョンも加算する
+    """
+    organization_ids = sorted({oid for oid in organization_ids if oid is not None})
+    if not organization_ids:
+        return
+    table = LedgerVersion.__table__
+    connection = db.connection()
+    dialect_name = connection.dialect.name
+    rewrite_increment = 1 if rewritten else 0
+    rows = [
+        {'organization_id': oid, 'version': 1, 'rewrite_version': rewrite_increment}
+        for oid in organization_ids
+    ]
+    values = {'version': table.c.version + 1}
+    if rewritten:
+        values['rewrite_version'] = table.c.rewrite_version + 1
+
+    if dialect_name in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect_name == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['organization_id'],
+            set_=values,
+        )
+        connection.execute(stmt, rows)
+        return
+
+    # その他のDBは UPDATE して対象が無ければ INSERT
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.organization_id == row['organization_id'])
+            .values(**values)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert(), [row])
+
+
+def delete_versioned_rows(db, model, organization_id, *conditions):
+    """
+    期首残高・勘定科目などを事業所単位で一括削除し、削除した場合は仕訳帳バージョンを加算
+
+    Query.delete() はフラッシュを経由せず _bump_version_on_flush で検知できないため、
+    VERSIONED_MODELS の一括削除はこの関数を使う（仕訳帳は ledger_utils.delete_ledger_entries を使う）
+
+    Returns:
+        削除した件数
+    """
+    deleted = db.query(model).filter(
+        model.organization_id == organization_id, *conditions
+    ).delete(synchronize_session=False)
+    if deleted:
+        bump_ledger_version(db, organization_id)
+    return deleted
+
+
+@register_ledger_change_handler
+def bump_version_on_ledger_changes(db, added, removed):
+    """仕訳の変更時に仕訳帳バージョンを加算（更新・削除を含む場合は更新・削除バージョンも加算）"""
+    rewritten_ids = {snapshot['organization_id'] for snapshot in removed}
+    appended_ids = {snapshot['organization_id'] for snapshot in added} - rewritten_ids
+    bump_ledger_version(db, *appended_ids)
+    bump_ledger_version(db, *rewritten_ids, rewritten=True)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _bump_version_on_flush(session, flush_context):
+    """期首残高・勘定科目などの変更時に仕訳帳バージョンを加算"""
+    organization_ids = {
+        obj.organization_id
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, VERSIONED_MODELS)
+    }
+    bump_ledger_version(session, *organization_ids)
+
+
+class ReportCache:
+    """仕訳帳バージョンで検証する LRU キャッシュ"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(organization_id, fiscal_period_id, report_type, params=None):
+        """キャッシュキーを作成（params は辞書）"""
+        return (organization_id, fiscal_period_id, report_type, tuple(sorted((params or {}).items())))
+
+    def get(self, key, version):
+        """バージョンが一致するキャッシュを取得（無ければ None）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, value):
+        """キャッシュを登録し、上限を超えた分を古い順に破棄"""
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """監視用の統計情報"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+report_cache = ReportCache(max_entries=int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', '256')))
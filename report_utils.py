@@ -0,0 +1,1124 @@
+"""
+帳票集計用のユーティリティモジュール
+仕訳帳（general_ledger）の集計をDB側の GROUP BY で行い、
+勘定科目単位のコンパクトな集計結果を試算表などの帳票に渡す
+事業所の仕訳が列指向キャッシュ（ledger_columns）に載る場合は、DB ではなく配列から集計する
+"""
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import and_, exists, func, inspect, literal, or_, select, union_all
+from sqlalchemy.orm import aliased
+from models import Account, AccountItem, Counterparty, Department, GeneralLedger, Item, LedgerLine, MemoTag, OpeningBalance, ProjectTag
+from balance_utils import aggregate_monthly_totals, aggregate_monthly_totals_by_month, year_month_of, year_month_sql
+from ledger_columns import ledger_column_cache
+
+
+# 帳票に渡す勘定科目の値（帳票はキャッシュされるため、セッションに紐づく ORM インスタンスではなく値だけを持つ）
+AccountItemRow = namedtuple("AccountItemRow", [attr.key for attr in inspect(AccountItem).column_attrs])
+
+
+def account_item_row(ai):
+    """勘定科目を帳票用の値（AccountItemRow）に変換"""
+    return AccountItemRow(*(getattr(ai, field) for field in AccountItemRow._fields))
+
+
+def load_account_item_rows(db, account_ids):
+    """勘定科目IDごとの帳票用の値を取得"""
+    return {
+        ai.id: account_item_row(ai)
+        for ai in db.query(AccountItem).filter(AccountItem.id.in_(account_ids)).all()
+    }
+
+
+def normalize_major_category(major_category):
+    """大分類を正規化（'財産' は '負債' として扱う）"""
+    major_category = major_category or ""
+    if major_category == "財産":
+        return "負債"
+    return major_category
+
+
+def calculate_closing_balance(major_category, opening, debit, credit):
+    """大分類に応じて期末残高を計算"""
+    major_category = normalize_major_category(major_category)
+    if major_category in ["收入", "収益"]:
+        # 収益科目: 貸方プラス、借方マイナス
+        return opening - debit + credit
+    if major_category == "資産":
+        # 資産科目: 借方プラス
+        return opening + debit - credit
+    if major_category in ["負債", "純資産"]:
+        # 負債・純資産科目: 貸方プラス
+        return opening - debit + credit
+    # その他（費用・損益など）: 借方プラス
+    return opening + debit - credit
+
+
+# ========== 試算表の分類・並び順 ==========
+
+# P/L のカテゴリの並び順
+PL_CATEGORY_ORDER = {
+    "売上高": 10,
+    # 売上原価の詳細（小分類の値）
+    "期首商品棚卸": 11,
+    "当期商品仕入": 12,
+    "他勘定振替高(商)": 13,
+    "期末商品棚卸": 14,
+    "売上原価": 20,
+    "売上総利益": 30,
+    "販売管理費": 40,
+    "販管費": 40,
+    "販売費及び一般管理費": 40,
+    "営業利益": 50,
+    "営業外収益": 60,
+    "営業外費用": 70,
+    "経常利益": 80,
+    "特別利益": 90,
+    "特別損失": 100,
+    "税引前当期純利益": 110,
+    "法人税等": 120,
+    "法人税等調整額": 130,
+    "当期純利益": 140,
+}
+
+# B/S 大分類の順序
+BS_MAJOR_ORDER = {
+    "資産": 1,
+    "負債": 2,
+    "純資産": 3,
+    "負債及び純資産": 2,
+}
+
+# 中分類の順序（流動性ベース）
+BS_MID_CATEGORY_ORDER = {
+    # 資産：流動資産 → 固定資産 → 繰延資産
+    "流動資産": 1,
+    "固定資産": 2,
+    "繰延資産": 3,
+    # 負債：流動負債 → 固定負債
+    "流動負債": 1,
+    "固定負債": 2,
+    # 純資産：資本金 → 資本剰余金 → 利益剰余金 → 自己株式 → 評価換算差額等 → 新株予約権
+    "資本金": 1,
+    "資本剰余金": 2,
+    "利益剰余金": 3,
+    "自己株式": 4,
+    "評価換算差額等": 5,
+    "新株予約権": 6,
+    # 損益：P/Lの順序
+    "売上高": 1,
+    "売上原価": 2,
+    "販売費及び一般管理費": 3,
+    "営業外収益": 4,
+    "営業外費用": 5,
+    "特別利益": 6,
+    "特別損失": 7,
+    "法人税等": 8,
+    "法人税等調整額": 9,
+}
+
+# 小分類の順序（流動性配列法：流動性が高い順）
+BS_SUB_CATEGORY_ORDER = {
+    # 流動資産：現金化しやすい順
+    "現金及び預金": 1,
+    "売上債権": 2,
+    "有価証券": 3,
+    "棚卸資産": 4,
+    "その他流動資産": 5,
+    # 固定資産
+    "有形固定資産": 1,
+    "無形固定資産": 2,
+    "投資その他の資産": 3,
+    # 繰延資産
+    "繰延資産": 1,
+    # 流動負債
+    "仕入債務": 1,
+    "その他流動負債": 2,
+    # 固定負債
+    "固定負債": 1,
+    # 純資産：資本金
+    "資本金": 1,
+    # 純資産：資本剰余金
+    "新株式申込証拠金": 1,
+    "資本準備金": 2,
+    "その他資本剰余金": 3,
+    # 純資産：利益剰余金
+    "利益準備金": 1,
+    "その他利益剰余金": 2,
+    # 純資産：自己株式
+    "自己株式": 1,
+    "自己株式申込証拠金": 2,
+    # 純資産：評価換算差額等
+    "他有価証券評価差額金": 1,
+    "繰延ヘッジ損益": 2,
+    "土地再評価差額金": 3,
+    # 純資産：新株予約権
+    "新株予約権": 1,
+    # 損益
+    "売上高": 1,
+    "期首商品棚卸": 1,
+    "当期商品仕入": 2,
+    "他勘定振替高(商)": 3,
+    "期末商品棚卸": 4,
+    "販売管理費": 1,
+    "営業外収益": 1,
+    "営業外費用": 1,
+    "特別利益": 1,
+    "特別損失": 1,
+    "法人税等": 1,
+    "法人税等調整額": 1,
+}
+
+
+def get_pl_category(ai):
+    """
+    P/L 上のカテゴリを決めるカラム
+    1. pl_category が入っていればそれを優先
+    2. なければ mid_category（中分類）
+    3. それも無ければ sub_category（小分類）
+    """
+    return (ai.pl_category or ai.mid_category or ai.sub_category or "").strip()
+
+
+def bs_account_sort_key(ai):
+    """B/S の勘定科目の並び順（大分類 → 中分類 → 小分類 → 表示順序 → 科目名）"""
+    major = ai.major_category or ""
+    middle = ai.mid_category or ""
+    small = ai.sub_category or ""
+
+    return (
+        BS_MAJOR_ORDER.get(major, 99),
+        BS_MID_CATEGORY_ORDER.get(middle, 99),
+        BS_SUB_CATEGORY_ORDER.get(small, 99),
+        ai.bs_rank if getattr(ai, "bs_rank", None) is not None
+        else (ai.liquidity_rank if getattr(ai, "liquidity_rank", None) is not None else 9999),
+        ai.account_name,
+    )
+
+
+def pl_account_sort_key(ai):
+    """P/L の勘定科目の並び順（小分類 → 中分類 → カテゴリの優先順位 → 表示順序 → 科目名）"""
+    sub = (ai.sub_category or "").strip()
+    mid = (ai.mid_category or "").strip()
+    cat = get_pl_category(ai)
+
+    # 小分類が PL_CATEGORY_ORDER にあればそれを使用、なければ中分類、最後にカテゴリ
+    order = PL_CATEGORY_ORDER.get(sub, PL_CATEGORY_ORDER.get(mid, PL_CATEGORY_ORDER.get(cat, 999)))
+
+    return (
+        order,
+        ai.pl_rank
+        if getattr(ai, "pl_rank", None) is not None
+        else 9999,
+        ai.account_name or "",
+    )
+
+
+def _ledger_conditions(organization_id, date_from=None, date_to=None, date_before=None):
+    """仕訳帳の絞り込み条件を作成"""
+    conditions = [GeneralLedger.organization_id == organization_id]
+    if date_from is not None:
+        conditions.append(GeneralLedger.transaction_date >= date_from)
+    if date_to is not None:
+        conditions.append(GeneralLedger.transaction_date <= date_to)
+    if date_before is not None:
+        conditions.append(GeneralLedger.transaction_date < date_before)
+    return conditions
+
+
+def aggregate_ledger_totals(db, organization_id, date_from=None, date_to=None, date_before=None):
+    """
+    勘定科目ごとの借方合計・貸方合計をDB側で集計
+
+    借方側・貸方側をそれぞれ GROUP BY し、UNION ALL した結果を
+    勘定科目IDでもう一度 GROUP BY するため、1回のクエリで済む
+
+    Returns:
+        dict: {account_item_id: (借方合計, 貸方合計)}
+    """
+    columns = ledger_column_cache.get(db, organization_id)
+    if columns is not None:
+        return columns.account_totals(date_from, date_to, date_before)
+
+    conditions = _ledger_conditions(organization_id, date_from, date_to, date_before)
+
+    debit_side = (
+        select(
+            GeneralLedger.debit_account_item_id.label("account_item_id"),
+            func.sum(GeneralLedger.debit_amount).label("debit_total"),
+            literal(0).label("credit_total"),
+        )
+        .where(*conditions)
+        .group_by(GeneralLedger.debit_account_item_id)
+    )
+    credit_side = (
+        select(
+            GeneralLedger.credit_account_item_id.label("account_item_id"),
+            literal(0).label("debit_total"),
+            func.sum(GeneralLedger.credit_amount).label("credit_total"),
+        )
+        .where(*conditions)
+        .group_by(GeneralLedger.credit_account_item_id)
+    )
+    sides = union_all(debit_side, credit_side).subquery()
+
+    rows = db.execute(
+        select(
+            sides.c.account_item_id,
+            func.sum(sides.c.debit_total),
+            func.sum(sides.c.credit_total),
+        ).group_by(sides.c.account_item_id)
+    ).all()
+
+    totals = {}
+    for account_item_id, debit_total, credit_total in rows:
+        if account_item_id is None:
+            continue
+        totals[account_item_id] = (debit_total or 0, credit_total or 0)
+    return totals
+
+
+def to_date(value):
+    """文字列または date を date に変換"""
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _next_month_start(value):
+    return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _month_end(value):
+    return _next_month_start(value) - timedelta(days=1)
+
+
+def _merge_totals(*parts):
+    merged = {}
+    for totals in parts:
+        for account_item_id, (debit_total, credit_total) in totals.items():
+            current = merged.get(account_item_id, (0, 0))
+            merged[account_item_id] = (current[0] + debit_total, current[1] + credit_total)
+    return merged
+
+
+def aggregate_account_totals(db, organization_id, date_from=None, date_to=None):
+    """
+    期間内の勘定科目ごとの借方合計・貸方合計を集計
+
+    丸ごと含まれる月は月次集計（account_monthly_balances）から、
+    月の途中で始まる・終わる部分だけを仕訳帳から集計する
+
+    Args:
+        date_from: 開始日（含む、None の場合は最初から）
+        date_to: 終了日（含む、None の場合は最後まで）
+
+    Returns:
+        dict: {account_item_id: (借方合計, 貸方合計)}
+    """
+    date_from = to_date(date_from)
+    date_to = to_date(date_to)
+
+    # 列指向キャッシュがある場合は月次集計を使わずに配列から集計
+    columns = ledger_column_cache.get(db, organization_id)
+    if columns is not None:
+        return columns.account_totals(date_from, date_to)
+
+    # 月次集計で賄える範囲（full_from の月初 〜 full_to の月末）
+    full_from = date_from
+    if date_from is not None and date_from.day != 1:
+        full_from = _next_month_start(date_from)
+    full_to = date_to
+    if date_to is not None and date_to != _month_end(date_to):
+        full_to = date_to.replace(day=1) - timedelta(days=1)
+
+    if full_from is not None and full_to is not None and full_from > full_to:
+        # 丸ごと含まれる月が無い場合は仕訳帳のみで集計
+        return aggregate_ledger_totals(
+            db,
+            organization_id,
+            date_from=date_from,
+            date_to=date_to,
+        )
+
+    parts = [
+        aggregate_monthly_totals(
+            db,
+            organization_id,
+            month_from=year_month_of(full_from),
+            month_to=year_month_of(full_to),
+        )
+    ]
+    if date_from is not None and date_from != full_from:
+        parts.append(aggregate_ledger_totals(
+            db,
+            organization_id,
+            date_from=date_from,
+            date_before=full_from,
+        ))
+    if date_to is not None and date_to != full_to:
+        parts.append(aggregate_ledger_totals(
+            db,
+            organization_id,
+            date_from=full_to + timedelta(days=1),
+            date_to=date_to,
+        ))
+    return _merge_totals(*parts)
+
+
+# 期首残高を貸方プラスで表す大分類（期首残高テーブルの従来の符号。収益・費用などは借方プラス）
+CREDIT_OPENING_CATEGORIES = ["負債", "純資産"]
+
+
+def _opening_amount(value):
+    """期首残高テーブルの金額（Numeric）を仕訳の金額と同じ整数にする（円未満がある場合は float）"""
+    value = float(value or 0)
+    return int(value) if value.is_integer() else value
+
+
+def compute_opening_totals(db, organization_id, fiscal_period):
+    """
+    会計期間の勘定科目ごとの期首残高を借方・貸方の合計で取得
+
+    期首残高テーブルを優先し、登録されていない場合は
+    期首日より前の仕訳の借方合計・貸方合計とする
+
+    Returns:
+        dict: {account_item_id: (借方合計, 貸方合計)}
+    """
+    opening_balances_db = (
+        db.query(OpeningBalance.account_item_id, OpeningBalance.debit_amount, OpeningBalance.credit_amount)
+        .filter(
+            OpeningBalance.organization_id == organization_id,
+            OpeningBalance.fiscal_period_id == fiscal_period.id,
+        )
+        .all()
+    )
+    if not opening_balances_db:
+        # 前期の仕訳から期首残高を計算
+        period_start = to_date(fiscal_period.start_date)
+        return aggregate_account_totals(db, organization_id, date_to=period_start - timedelta(days=1))
+
+    totals = {}
+    for account_item_id, debit_amount, credit_amount in opening_balances_db:
+        debit_total, credit_total = totals.get(account_item_id, (0, 0))
+        totals[account_item_id] = (
+            debit_total + _opening_amount(debit_amount),
+            credit_total + _opening_amount(credit_amount),
+        )
+    return totals
+
+
+def compute_opening_balances(db, organization_id, fiscal_period):
+    """
+    会計期間の勘定科目ごとの期首残高を取得
+
+    期首残高テーブル・期首日より前の仕訳のどちらから求めた場合も、
+    大分類に応じて符号を決める（負債・純資産は貸方プラス、それ以外は借方プラス）
+
+    Returns:
+        dict: {account_item_id: 期首残高}
+    """
+    totals = compute_opening_totals(db, organization_id, fiscal_period)
+    if not totals:
+        return {}
+
+    major_categories = dict(
+        db.query(AccountItem.id, AccountItem.major_category)
+        .filter(AccountItem.id.in_(list(totals)))
+        .all()
+    )
+    opening = {}
+    for account_item_id, (debit_total, credit_total) in totals.items():
+        if normalize_major_category(major_categories.get(account_item_id)) in CREDIT_OPENING_CATEGORIES:
+            opening[account_item_id] = credit_total - debit_total
+        else:
+            opening[account_item_id] = debit_total - credit_total
+    return opening
+
+
+def compute_account_balances(db, organization_id, fiscal_period):
+    """
+    会計期間の勘定科目ごとの期首残高・当期借方・当期貸方を集計
+
+    Returns:
+        dict: {account_item_id: {"account_item", "opening_balance", "current_debit", "current_credit"}}
+    """
+    opening = compute_opening_balances(db, organization_id, fiscal_period)
+
+    current_totals = aggregate_account_totals(
+        db,
+        organization_id,
+        date_from=fiscal_period.start_date,
+        date_to=fiscal_period.end_date,
+    )
+
+    account_ids = set(opening) | set(current_totals)
+    if not account_ids:
+        return {}
+
+    account_items = load_account_item_rows(db, account_ids)
+
+    summary = {}
+    for account_item_id in account_ids:
+        current_debit, current_credit = current_totals.get(account_item_id, (0, 0))
+        summary[account_item_id] = {
+            "account_item": account_items.get(account_item_id),
+            "opening_balance": opening.get(account_item_id, 0),
+            "current_debit": current_debit,
+            "current_credit": current_credit,
+        }
+    return summary
+
+
+# ========== 総勘定元帳（キーセットページング） ==========
+
+
+def account_balance_sign(major_category):
+    """元帳の残高の向き（収入科目は貸方プラス、それ以外は借方プラス）"""
+    return -1 if major_category in ['收入'] else 1
+
+
+def format_ledger_cursor(transaction_date, entry_id):
+    """元帳のカーソル文字列（YYYY-MM-DD_仕訳ID）を作成"""
+    return f"{str(transaction_date)[:10]}_{entry_id}"
+
+
+def parse_ledger_cursor(cursor):
+    """元帳のカーソル文字列を (取引日, 仕訳ID) に変換（不正な場合は None）"""
+    if not cursor:
+        return None
+    try:
+        date_part, id_part = cursor.rsplit('_', 1)
+        return to_date(date_part), int(id_part)
+    except ValueError:
+        return None
+
+
+def _keyset_after(key, date_column=GeneralLedger.transaction_date, id_column=GeneralLedger.id):
+    transaction_date, entry_id = key
+    return or_(
+        date_column > transaction_date,
+        and_(date_column == transaction_date, id_column > entry_id),
+    )
+
+
+def _keyset_before(key, date_column=GeneralLedger.transaction_date, id_column=GeneralLedger.id):
+    transaction_date, entry_id = key
+    return or_(
+        date_column < transaction_date,
+        and_(date_column == transaction_date, id_column < entry_id),
+    )
+
+
+def _line_keyset_after(key):
+    return _keyset_after(key, LedgerLine.transaction_date, LedgerLine.general_ledger_id)
+
+
+def _line_keyset_before(key):
+    return _keyset_before(key, LedgerLine.transaction_date, LedgerLine.general_ledger_id)
+
+
+def ledger_opening_balance(db, organization_id, account_item, fiscal_period):
+    """元帳の期首残高（会計期間開始日より前の仕訳、月次集計を利用）"""
+    period_start = to_date(fiscal_period.start_date)
+    prior_totals = aggregate_account_totals(db, organization_id, date_to=period_start - timedelta(days=1))
+    prior_debit, prior_credit = prior_totals.get(account_item.id, (0, 0))
+    return account_balance_sign(account_item.major_category) * (prior_debit - prior_credit)
+
+
+def _ledger_entry_conditions(organization_id, account_item_id, fiscal_period):
+    """元帳の明細の絞り込み条件（仕訳明細のインデックスの範囲検索になる）"""
+    return [
+        LedgerLine.organization_id == organization_id,
+        LedgerLine.account_item_id == account_item_id,
+        LedgerLine.transaction_date >= fiscal_period.start_date,
+        LedgerLine.transaction_date <= fiscal_period.end_date,
+    ]
+
+
+def select_ledger_entries(organization_id, account_item_id, fiscal_period):
+    """
+    元帳の仕訳を取得する SELECT 文（仕訳明細から取得、並び順は呼び出し側で指定）
+
+    列: id（仕訳帳ID）, transaction_date, summary, debit, credit, counterpart_account_name
+    """
+    counterpart_item = aliased(AccountItem)
+    return (
+        select(
+            LedgerLine.general_ledger_id.label('id'),
+            LedgerLine.transaction_date,
+            GeneralLedger.summary,
+            LedgerLine.debit_amount.label('debit'),
+            LedgerLine.credit_amount.label('credit'),
+            counterpart_item.account_name.label('counterpart_account_name'),
+        )
+        .join(GeneralLedger, GeneralLedger.id == LedgerLine.general_ledger_id)
+        .outerjoin(counterpart_item, counterpart_item.id == LedgerLine.counterpart_account_item_id)
+        .where(*_ledger_entry_conditions(organization_id, account_item_id, fiscal_period))
+    )
+
+
+def fetch_ledger_page(db, organization_id, account_item, fiscal_period, after=None, before=None, per_page=100):
+    """
+    総勘定元帳の1ページ分を取得
+
+    (取引日, 仕訳ID) のキーセットでページングし、ページ先頭の残高は
+    「カーソルより前」の仕訳を集計して求めるため、後ろのページでも
+    先頭ページと同じコストで表示できる
+
+    Args:
+        after: このカーソルより後ろのページを取得
+        before: このカーソルより前のページを取得（after より優先）
+        per_page: 1ページの件数
+
+    Returns:
+        dict: opening_balance, transactions, monthly_totals, next_cursor, prev_cursor
+    """
+    account_item_id = account_item.id
+    sign = account_balance_sign(account_item.major_category)
+    opening_balance = ledger_opening_balance(db, organization_id, account_item, fiscal_period)
+
+    conditions = _ledger_entry_conditions(organization_id, account_item_id, fiscal_period)
+
+    # 当ページの仕訳（相手勘定科目名も同時に取得）
+    query = select_ledger_entries(organization_id, account_item_id, fiscal_period)
+    before_key = parse_ledger_cursor(before)
+    after_key = parse_ledger_cursor(after)
+    if before_key:
+        rows = db.execute(
+            query.where(_line_keyset_before(before_key))
+            .order_by(LedgerLine.transaction_date.desc(), LedgerLine.general_ledger_id.desc())
+            .limit(per_page)
+        ).all()
+        rows.reverse()
+    else:
+        if after_key:
+            query = query.where(_line_keyset_after(after_key))
+        rows = db.execute(
+            query.order_by(LedgerLine.transaction_date, LedgerLine.general_ledger_id).limit(per_page)
+        ).all()
+
+    result = {
+        "opening_balance": opening_balance,
+        "transactions": [],
+        "monthly_totals": [],
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+    if not rows:
+        return result
+
+    first_key = (rows[0].transaction_date, rows[0].id)
+    last_key = (rows[-1].transaction_date, rows[-1].id)
+
+    # ページ先頭までの残高（期首残高 + カーソルより前の当期仕訳、符号付き金額の合計）
+    amount_before = db.execute(
+        select(func.coalesce(func.sum(LedgerLine.amount), 0))
+        .where(*conditions, _line_keyset_before(first_key))
+    ).scalar()
+
+    # 前後のページの有無と、次ページ先頭の仕訳の月
+    has_prev = db.execute(select(exists().where(*conditions, _line_keyset_before(first_key)))).scalar()
+    next_date = db.execute(
+        select(LedgerLine.transaction_date)
+        .where(*conditions, _line_keyset_after(last_key))
+        .order_by(LedgerLine.transaction_date, LedgerLine.general_ledger_id)
+        .limit(1)
+    ).scalar()
+
+    # ページに含まれる月の月次合計（GROUP BY）
+    year_month = year_month_sql(LedgerLine.transaction_date)
+    month_from = to_date(rows[0].transaction_date).replace(day=1)
+    month_to = _month_end(to_date(rows[-1].transaction_date))
+    monthly_rows = db.execute(
+        select(year_month, func.sum(LedgerLine.debit_amount), func.sum(LedgerLine.credit_amount))
+        .where(
+            *conditions,
+            LedgerLine.transaction_date >= month_from,
+            LedgerLine.transaction_date <= month_to,
+        )
+        .group_by(year_month)
+        .order_by(year_month)
+    ).all()
+    monthly_totals = {
+        month: {"month": month, "debit_total": debit_total or 0, "credit_total": credit_total or 0}
+        for month, debit_total, credit_total in monthly_rows
+    }
+
+    running_balance = opening_balance + sign * amount_before
+    transactions = []
+    for index, row in enumerate(rows):
+        running_balance += sign * (row.debit - row.credit)
+
+        # 月の最後の仕訳の後ろに月次合計を表示する
+        month = year_month_of(row.transaction_date)
+        following_date = rows[index + 1].transaction_date if index + 1 < len(rows) else next_date
+        month_total = None
+        if following_date is None or year_month_of(following_date) != month:
+            month_total = monthly_totals.get(month)
+
+        transactions.append(
+            {
+                "id": row.id,
+                "date": str(row.transaction_date),
+                "counterpart_account": row.counterpart_account_name or "",
+                "summary": row.summary or "",
+                "debit": row.debit,
+                "credit": row.credit,
+                "balance": running_balance,
+                "month_total": month_total,
+            }
+        )
+
+    result["transactions"] = transactions
+    result["monthly_totals"] = list(monthly_totals.values())
+    if has_prev:
+        result["prev_cursor"] = format_ledger_cursor(*first_key)
+    if next_date is not None:
+        result["next_cursor"] = format_ledger_cursor(*last_key)
+    return result
+
+
+# ========== 仕訳帳（キーセットページング） ==========
+
+
+def load_account_display_names(db, organization_id):
+    """
+    口座に紐づく勘定科目の表示名（口座名）を一括取得
+
+    Returns:
+        dict: {account_item_id: 口座名}（同じ勘定科目に複数の口座がある場合は最初の口座）
+    """
+    rows = db.execute(
+        select(Account.account_item_id, Account.account_name)
+        .where(Account.organization_id == organization_id, Account.account_item_id.isnot(None))
+        .order_by(Account.id)
+    ).all()
+    names = {}
+    for account_item_id, account_name in rows:
+        names.setdefault(account_item_id, account_name)
+    return names
+
+
+def _journal_entry_conditions(organization_id, fiscal_period=None):
+    conditions = [GeneralLedger.organization_id == organization_id]
+    if fiscal_period is not None:
+        conditions.append(GeneralLedger.transaction_date >= fiscal_period.start_date)
+        conditions.append(GeneralLedger.transaction_date <= fiscal_period.end_date)
+    return conditions
+
+
+def select_journal_entries(organization_id, fiscal_period=None):
+    """仕訳帳の仕訳を勘定科目名付きで取得する SELECT 文（並び順は呼び出し側で指定）"""
+    debit_item = aliased(AccountItem)
+    credit_item = aliased(AccountItem)
+    return (
+        select(
+            GeneralLedger.id,
+            GeneralLedger.transaction_date,
+            GeneralLedger.debit_account_item_id,
+            debit_item.account_name.label('debit_account_name'),
+            GeneralLedger.debit_amount,
+            GeneralLedger.credit_account_item_id,
+            credit_item.account_name.label('credit_account_name'),
+            GeneralLedger.credit_amount,
+            GeneralLedger.summary,
+            GeneralLedger.remarks,
+            GeneralLedger.source_type,
+            GeneralLedger.source_id,
+        )
+        .outerjoin(debit_item, debit_item.id == GeneralLedger.debit_account_item_id)
+        .outerjoin(credit_item, credit_item.id == GeneralLedger.credit_account_item_id)
+        .where(*_journal_entry_conditions(organization_id, fiscal_period))
+    )
+
+
+def fetch_journal_page(db, organization_id, fiscal_period=None, after=None, before=None, per_page=100):
+    """
+    仕訳帳の1ページ分を取得
+
+    勘定科目名は結合して取得し、口座に紐づく勘定科目は口座名で表示する
+    クエリ数は件数によらず一定
+
+    Returns:
+        dict: entries, total_count, next_cursor, prev_cursor
+    """
+    conditions = _journal_entry_conditions(organization_id, fiscal_period)
+    query = select_journal_entries(organization_id, fiscal_period)
+    before_key = parse_ledger_cursor(before)
+    after_key = parse_ledger_cursor(after)
+    if before_key:
+        rows = db.execute(
+            query.where(_keyset_before(before_key))
+            .order_by(GeneralLedger.transaction_date.desc(), GeneralLedger.id.desc())
+            .limit(per_page)
+        ).all()
+        rows.reverse()
+    else:
+        if after_key:
+            query = query.where(_keyset_after(after_key))
+        rows = db.execute(
+            query.order_by(GeneralLedger.transaction_date, GeneralLedger.id).limit(per_page)
+        ).all()
+
+    total_count = db.execute(select(func.count(GeneralLedger.id)).where(*conditions)).scalar() or 0
+    result = {
+        "entries": [],
+        "total_count": total_count,
+        "next_cursor": None,
+        "prev_cursor": None,
+    }
+    if not rows:
+        return result
+
+    account_names = load_account_display_names(db, organization_id)
+    result["entries"] = [
+        {
+            "id": row.id,
+            "transaction_date": str(row.transaction_date),
+            "debit_account_name": account_names.get(row.debit_account_item_id) or row.debit_account_name,
+            "debit_amount": row.debit_amount or 0,
+            "credit_account_name": account_names.get(row.credit_account_item_id) or row.credit_account_name,
+            "credit_amount": row.credit_amount or 0,
+            "summary": row.summary,
+            "remarks": row.remarks,
+            "source_type": row.source_type,
+            "source_id": row.source_id,
+        }
+        for row in rows
+    ]
+
+    first_key = (rows[0].transaction_date, rows[0].id)
+    last_key = (rows[-1].transaction_date, rows[-1].id)
+    has_prev = db.execute(select(exists().where(*conditions, _keyset_before(first_key)))).scalar()
+    has_next = db.execute(select(exists().where(*conditions, _keyset_after(last_key)))).scalar()
+    if has_prev:
+        result["prev_cursor"] = format_ledger_cursor(*first_key)
+    if has_next:
+        result["next_cursor"] = format_ledger_cursor(*last_key)
+    return result
+
+
+# ========== 月次推移表 ==========
+
+
+def fiscal_period_months(fiscal_period):
+    """会計期間に含まれる年月（YYYY-MM）の一覧"""
+    months = []
+    current = to_date(fiscal_period.start_date).replace(day=1)
+    end = to_date(fiscal_period.end_date)
+    while current <= end:
+        months.append(year_month_of(current))
+        current = _next_month_start(current)
+    return months
+
+
+def aggregate_ledger_totals_by_month(db, organization_id, date_from, date_to):
+    """
+    仕訳帳から勘定科目・年月ごとの借方合計・貸方合計をDB側で集計
+
+    Returns:
+        dict: {(account_item_id, 年月): (借方合計, 貸方合計)}
+    """
+    columns = ledger_column_cache.get(db, organization_id)
+    if columns is not None:
+        return columns.account_month_totals(date_from, date_to)
+
+    conditions = _ledger_conditions(organization_id, date_from, date_to)
+    year_month = year_month_sql(GeneralLedger.transaction_date)
+
+    debit_side = (
+        select(
+            GeneralLedger.debit_account_item_id.label("account_item_id"),
+            year_month.label("year_month"),
+            func.sum(GeneralLedger.debit_amount).label("debit_total"),
+            literal(0).label("credit_total"),
+        )
+        .where(*conditions)
+        .group_by(GeneralLedger.debit_account_item_id, year_month)
+    )
+    credit_side = (
+        select(
+            GeneralLedger.credit_account_item_id.label("account_item_id"),
+            year_month.label("year_month"),
+            literal(0).label("debit_total"),
+            func.sum(GeneralLedger.credit_amount).label("credit_total"),
+        )
+        .where(*conditions)
+        .group_by(GeneralLedger.credit_account_item_id, year_month)
+    )
+    sides = union_all(debit_side, credit_side).subquery()
+
+    rows = db.execute(
+        select(
+            sides.c.account_item_id,
+            sides.c.year_month,
+            func.sum(sides.c.debit_total),
+            func.sum(sides.c.credit_total),
+        ).group_by(sides.c.account_item_id, sides.c.year_month)
+    ).all()
+
+    return {
+        (account_item_id, year_month): (debit_total or 0, credit_total or 0)
+        for account_item_id, year_month, debit_total, credit_total in rows
+        if account_item_id is not None
+    }
+
+
+def _aggregate_period_by_month(db, organization_id, fiscal_period):
+    """会計期間の勘定科目・年月ごとの合計（月単位の期間は月次集計、それ以外は仕訳帳から）"""
+    period_start = to_date(fiscal_period.start_date)
+    period_end = to_date(fiscal_period.end_date)
+    columns = ledger_column_cache.get(db, organization_id)
+    if columns is not None:
+        return columns.account_month_totals(period_start, period_end)
+    if period_start.day == 1 and period_end == _month_end(period_end):
+        return aggregate_monthly_totals_by_month(
+            db, organization_id, year_month_of(period_start), year_month_of(period_end)
+        )
+    return aggregate_ledger_totals_by_month(
+        db, organization_id, period_start, period_end
+    )
+
+
+# 収益として貸方をプラスで表示する P/L カテゴリ
+PL_REVENUE_CATEGORIES = ["売上高", "営業外収益", "特別利益"]
+
+
+def _is_pl_revenue(ai):
+    return any(
+        category in PL_REVENUE_CATEGORIES
+        for category in ((ai.sub_category or "").strip(), (ai.mid_category or "").strip(), get_pl_category(ai))
+    )
+
+
+def compute_monthly_trend(db, organization_id, fiscal_period):
+    """
+    月次推移表（勘定科目 × 月）を作成
+
+    勘定科目・年月ごとの合計を1回の GROUP BY（月次集計）で取得し、
+    B/S 科目は期首残高から月次増減の累積和で各月末残高を、
+    P/L 科目は各月の発生額を求める
+    分類・並び順は試算表と同じ
+
+    Returns:
+        dict: months, bs_rows, pl_rows, pl_totals, net_income_total
+    """
+    months = fiscal_period_months(fiscal_period)
+    month_index = {month: index for index, month in enumerate(months)}
+
+    opening = compute_opening_balances(db, organization_id, fiscal_period)
+    monthly = _aggregate_period_by_month(db, organization_id, fiscal_period)
+
+    # 勘定科目 × 月の借方・貸方の密行列
+    debit_matrix = {}
+    credit_matrix = {}
+    for (account_item_id, year_month), (debit_total, credit_total) in monthly.items():
+        index = month_index.get(year_month)
+        if index is None:
+            continue
+        debit_matrix.setdefault(account_item_id, [0] * len(months))[index] += debit_total
+        credit_matrix.setdefault(account_item_id, [0] * len(months))[index] += credit_total
+
+    account_ids = set(opening) | set(debit_matrix) | set(credit_matrix)
+    if not account_ids:
+        return {"months": months, "bs_rows": [], "pl_rows": [], "pl_totals": [0] * len(months), "net_income_total": 0}
+
+    account_items = load_account_item_rows(db, account_ids)
+
+    zeros = [0] * len(months)
+    bs_rows = []
+    pl_rows = []
+    net_income = [0] * len(months)
+    for account_item_id in account_ids:
+        ai = account_items.get(account_item_id)
+        if ai is None:
+            continue
+        debits = debit_matrix.get(account_item_id, zeros)
+        credits = credit_matrix.get(account_item_id, zeros)
+        major_category = normalize_major_category(ai.major_category)
+
+        if major_category == "損益":
+            # P/L: 各月の発生額（収益は貸方プラス、費用は借方プラス）
+            if _is_pl_revenue(ai):
+                amounts = [c - d for d, c in zip(debits, credits)]
+            else:
+                amounts = [d - c for d, c in zip(debits, credits)]
+            net_income = [n + c - d for n, d, c in zip(net_income, debits, credits)]
+            pl_rows.append({"account_item": ai, "amounts": amounts, "total": sum(amounts)})
+        else:
+            # B/S（その他の大分類を含む）: 期首残高 + 月次増減の累積和
+            opening_balance = opening.get(account_item_id, 0)
+            changes = [
+                calculate_closing_balance(major_category, 0, d, c)
+                for d, c in zip(debits, credits)
+            ]
+            balances = [opening_balance + total for total in accumulate(changes)]
+            bs_rows.append({
+                "account_item": ai,
+                "opening_balance": opening_balance,
+                "balances": balances,
+            })
+
+    bs_rows.sort(key=lambda row: bs_account_sort_key(row["account_item"]))
+    pl_rows.sort(key=lambda row: pl_account_sort_key(row["account_item"]))
+
+    return {
+        "months": months,
+        "bs_rows": bs_rows,
+        "pl_rows": pl_rows,
+        "pl_totals": net_income,
+        "net_income_total": sum(net_income),
+    }
+
+
+# ========== 部門別・取引先別などの内訳 ==========
+
+# 集計軸: (表示名, 仕訳帳のカラム, マスターのIDカラム, マスターの名称カラム)
+DIMENSIONS = {
+    "department": ("部門", GeneralLedger.department_id, Department.id, Department.name),
+    "counterparty": ("取引先", GeneralLedger.counterparty_id, Counterparty.id, Counterparty.name),
+    "item": ("品目", GeneralLedger.item_id, Item.id, Item.name),
+    "project_tag": ("案件タグ", GeneralLedger.project_tag_id, ProjectTag.id, ProjectTag.tag_name),
+    "memo_tag": ("メモタグ", GeneralLedger.memo_tag_id, MemoTag.id, MemoTag.name),
+}
+
+
+def aggregate_dimension_totals(db, organization_id, dimension, date_from=None, date_to=None, account_item_id=None):
+    """
+    勘定科目 × 集計軸（部門・取引先など）ごとの借方合計・貸方合計をDB側で集計
+
+    Returns:
+        dict: {(account_item_id, 集計軸の値ID): (借方合計, 貸方合計)}
+    """
+    columns = ledger_column_cache.get(db, organization_id)
+    if columns is not None:
+        return columns.dimension_totals(dimension, date_from, date_to, account_item_id)
+
+    dimension_column = DIMENSIONS[dimension][1]
+    conditions = _ledger_conditions(organization_id, date_from, date_to)
+
+    debit_conditions = list(conditions)
+    credit_conditions = list(conditions)
+    if account_item_id is not None:
+        debit_conditions.append(GeneralLedger.debit_account_item_id == account_item_id)
+        credit_conditions.append(GeneralLedger.credit_account_item_id == account_item_id)
+
+    debit_side = (
+        select(
+            GeneralLedger.debit_account_item_id.label("account_item_id"),
+            dimension_column.label("dimension_id"),
+            func.sum(GeneralLedger.debit_amount).label("debit_total"),
+            literal(0).label("credit_total"),
+        )
+        .where(*debit_conditions)
+        .group_by(GeneralLedger.debit_account_item_id, dimension_column)
+    )
+    credit_side = (
+        select(
+            GeneralLedger.credit_account_item_id.label("account_item_id"),
+            dimension_column.label("dimension_id"),
+            literal(0).label("debit_total"),
+            func.sum(GeneralLedger.credit_amount).label("credit_total"),
+        )
+        .where(*credit_conditions)
+        .group_by(GeneralLedger.credit_account_item_id, dimension_column)
+    )
+    sides = union_all(debit_side, credit_side).subquery()
+
+    rows = db.execute(
+        select(
+            sides.c.account_item_id,
+            sides.c.dimension_id,
+            func.sum(sides.c.debit_total),
+            func.sum(sides.c.credit_total),
+        ).group_by(sides.c.account_item_id, sides.c.dimension_id)
+    ).all()
+
+    return {
+        (account_item_id, dimension_id): (debit_total or 0, credit_total or 0)
+        for account_item_id, dimension_id, debit_total, credit_total in rows
+        if account_item_id is not None
+    }
+
+
+def compute_dimension_breakdown(db, organization_id, fiscal_period, dimension, account_item_id=None):
+    """
+    会計期間の勘定科目ごとの集計軸別内訳（部門別損益・取引先別残高など）を作成
+
+    B/S 科目は期首日より前の仕訳も含めた残高、P/L 科目は期間内の発生額を返す
+    集計軸が未設定の仕訳は「未設定」（ID: None）にまとめる
+
+    Returns:
+        list: [{"account_item", "values": [{"id", "name", "opening", "debit", "credit", "closing"}]}]
+    """
+    label, _, master_id, master_name = DIMENSIONS[dimension]
+    period_start = to_date(fiscal_period.start_date)
+
+    current = aggregate_dimension_totals(
+        db, organization_id, dimension,
+        date_from=fiscal_period.start_date,
+        date_to=fiscal_period.end_date,
+        account_item_id=account_item_id,
+    )
+    prior = aggregate_dimension_totals(
+        db, organization_id, dimension,
+        date_to=period_start - timedelta(days=1),
+        account_item_id=account_item_id,
+    )
+
+    account_ids = {key[0] for key in current} | {key[0] for key in prior}
+    if not account_ids:
+        return []
+    account_items = load_account_item_rows(db, account_ids)
+    dimension_ids = {key[1] for key in current} | {key[1] for key in prior}
+    dimension_names = dict(
+        db.execute(
+            select(master_id, master_name).where(master_id.in_([i for i in dimension_ids if i is not None]))
+        ).all()
+    )
+
+    breakdown = {}
+    for key in set(current) | set(prior):
+        ai = account_items.get(key[0])
+        if ai is None:
+            continue
+        major_category = normalize_major_category(ai.major_category)
+        is_bs = major_category in ["資産", "負債", "純資産"]
+        if not is_bs and key not in current:
+            continue
+
+        debit, credit = current.get(key, (0, 0))
+        prior_debit, prior_credit = prior.get(key, (0, 0)) if is_bs else (0, 0)
+        opening = calculate_closing_balance(major_category, 0, prior_debit, prior_credit)
+        if is_bs:
+            closing = calculate_closing_balance(major_category, opening, debit, credit)
+        elif _is_pl_revenue(ai):
+            closing = credit - debit
+        else:
+            closing = debit - credit
+
+        dimension_id = key[1]
+        breakdown.setdefault(ai.id, {"account_item": ai, "values": []})["values"].append({
+            "id": dimension_id,
+            "name": dimension_names.get(dimension_id, "未設定") if dimension_id is not None else "未設定",
+            "opening": opening,
+            "debit": debit,
+            "credit": credit,
+            "closing": closing,
+        })
+
+    def account_sort_key(row):
+        ai = row["account_item"]
+        if normalize_major_category(ai.major_category) in ["資産", "負債", "純資産"]:
+            return (0, bs_account_sort_key(ai))
+        return (1, pl_account_sort_key(ai))
+
+    rows = sorted(breakdown.values(), key=account_sort_key)
+    for row in rows:
+        # 未設定は最後に、それ以外は名称順
+        row["values"].sort(key=lambda value: (value["id"] is None, value["name"]))
+    return rows
@@ -1,13 +1,19 @@
 # reset_account_items_with_children.py
 
-from app import (
-    SessionLocal,
+from db import SessionLocal
+from models import (
     AccountItem,
     CashBook,         # 現金出納帳
     GeneralLedger,    # 仕訳
     OpeningBalance,   # 期首残高
     Account,          # ★ ここを追加（accounts テーブルに対応するモデル名）
+    AccountMonthlyBalance,     # 勘定科目別月次集計
+    CashBookMonthlyBalance,    # 出納帳の口座別月次集計
+    LedgerLine,                # 勘定科目別の仕訳明細
+    SearchDocument,            # 全文検索用の文書
 )
+from ledger_utils import delete_ledger_entries
+from report_cache import delete_versioned_rows
 
 ORGANIZATION_ID = 1  # ★削除したい組織のID
 
@@ -21,27 +27,35 @@ def reset_account_items_and_related():
         print(f"cash_books: {cb_deleted} 件削除")
 
         # 2) 総勘定元帳（general_ledgers）を削除
-        gl_deleted = db.query(GeneralLedger).filter(
-            GeneralLedger.organization_id == ORGANIZATION_ID
-        ).delete(synchronize_session=False)
+        #    Query.delete() は仕訳の変更ハンドラーを経由しないため delete_ledger_entries を使う
+        gl_deleted = delete_ledger_entries(
+            db, GeneralLedger.organization_id == ORGANIZATION_ID
+        )
         print(f"general_ledgers: {gl_deleted} 件削除")
 
-        # 3) 期首残高（opening_balances）を削除
-        ob_deleted = db.query(OpeningBalance).filter(
-            OpeningBalance.organization_id == ORGANIZATION_ID
+        # 仕訳帳・出納帳から作る集計テーブルも事業所の分をすべて削除
+        # （残高0の月次集計の行も勘定科目を参照しているため、勘定科目より先に削除する）
+        for model in (AccountMonthlyBalance, LedgerLine, CashBookMonthlyBalance):
+            derived_deleted = db.query(model).filter(
+                model.organization_id == ORGANIZATION_ID
+            ).delete(synchronize_session=False)
+            print(f"{model.__tablename__}: {derived_deleted} 件削除")
+        sd_deleted = db.query(SearchDocument).filter(
+            SearchDocument.organization_id == ORGANIZATION_ID,
+            SearchDocument.source_type.in_(['cash_book', 'general_ledger']),
         ).delete(synchronize_session=False)
+        print(f"search_documents: {sd_deleted} 件削除")
+
+        # 3) 期首残高（opening_balances）を削除
+        ob_deleted = delete_versioned_rows(db, OpeningBalance, ORGANIZATION_ID)
         print(f"opening_balances: {ob_deleted} 件削除")
 
         # 4) 口座マスタ（accounts）を削除
-        acc_deleted = db.query(Account).filter(
-            Account.organization_id == ORGANIZATION_ID
-        ).delete(synchronize_session=False)
+        acc_deleted = delete_versioned_rows(db, Account, ORGANIZATION_ID)
         print(f"accounts: {acc_deleted} 件削除")
 
         # 5) 勘定科目（account_items）を削除
-        ai_deleted = db.query(AccountItem).filter(
-            AccountItem.organization_id == ORGANIZATION_ID
-        ).delete(synchronize_session=False)
+        ai_deleted = delete_versioned_rows(db, AccountItem, ORGANIZATION_ID)
         print(f"account_items: {ai_deleted} 件削除")
 
         db.commit()
@@ -0,0 +1,387 @@
+"""
+全文検索ユーティリティモジュール
+出納帳・振替伝票・仕訳帳・取引明細の摘要・取引先・備考などを検索用の文書（search_documents）にまとめ、
+SQLite では FTS5（trigram）、PostgreSQL では pg_trgm のインデックスで部分一致検索する
+日本語は分かち書きせず3文字単位（trigram）で索引するため、単語の途中からでも検索できる
+元データの変更に合わせて同一トランザクション内で同期する
+"""
+
+from sqlalchemy import Date, Integer, cast, column, delete, event, func, literal, select, table, text
+from db import SessionLocal
+from models import CashBook, GeneralLedger, ImportedTransaction, JournalEntry, SearchDocument, coerce_date
+from ledger_utils import register_ledger_change_handler
+
+
+# 1ページの件数
+SEARCH_PER_PAGE = 20
+MAX_SEARCH_PER_PAGE = 100
+
+# 元データの種類 → (モデル, 検索対象のカラム)
+SEARCH_SOURCES = {
+    'cash_book': (CashBook, ('payment_account', 'counterparty', 'item_name', 'department', 'memo_tag', 'remarks')),
+    'journal_entry': (JournalEntry, ('summary', 'remarks')),
+    'general_ledger': (GeneralLedger, ('summary', 'remarks')),
+    'imported_transaction': (ImportedTransaction, ('account_name', 'description')),
+}
+SEARCH_SOURCE_TYPES = list(SEARCH_SOURCES)
+
+# セッションのフラッシュで同期するモデル（仕訳帳は仕訳帳の変更ハンドラーで同期する）
+_FLUSH_SOURCE_TYPES = {
+    model: source_type
+    for source_type, (model, _) in SEARCH_SOURCES.items()
+    if model is not GeneralLedger
+}
+
+# trigram で索引できる最小の文字数（これより短い語は LIKE で絞り込む）
+TRIGRAM_MIN_LENGTH = 3
+
+# 一度に削除する元データIDの数（IN 句のパラメーター数の上限対策）
+DELETE_CHUNK_SIZE = 500
+
+# SQLite の FTS5 仮想テーブル（search_documents を外部コンテンツとして参照し、トリガーで同期する）
+FTS_TABLE = 'search_documents_fts'
+SQLITE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"content, content='search_documents', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    f"CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+)
+# PostgreSQL の trigram インデックス（ILIKE '%語%' に使われる）
+POSTGRESQL_TRGM_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_search_documents_content_trgm "
+    "ON search_documents USING gin (content gin_trgm_ops)",
+)
+
+_fts = table(FTS_TABLE, column('rowid', Integer), column('rank'), column(FTS_TABLE))
+
+# FTS5 の仮想テーブルが存在するか（接続先ごとにキャッシュ）
+_fts_available = {}
+
+
+def build_content(values):
+    """検索対象の値を空白区切りで連結（SQL 側の build_content_sql と同じ結果になる）"""
+    return ' '.join('' if value is None else str(value) for value in values)
+
+
+def build_content_sql(columns):
+    """検索対象のカラムを空白区切りで連結する SQL 式"""
+    expression = func.coalesce(columns[0], '')
+    for col in columns[1:]:
+        expression = expression + literal(' ') + func.coalesce(col, '')
+    return expression
+
+
+def build_search_document(source_type, source):
+    """
+    元データ（モデルのインスタンスまたはスナップショットの辞書）から検索用の文書（辞書）を作成
+
+    事業所が未設定のデータは文書を作らない（None を返す）
+    """
+    _, fields = SEARCH_SOURCES[source_type]
+    if isinstance(source, dict):
+        get = source.get
+    else:
+        def get(field):
+            return getattr(source, field)
+
+    if get('organization_id') is None or get('id') is None:
+        return None
+    return {
+        'organization_id': get('organization_id'),
+        'source_type': source_type,
+        'source_id': get('id'),
+        'transaction_date': coerce_date(get('transaction_date')),
+        'content': build_content(get(field) for field in fields),
+    }
+
+
+def apply_search_document_changes(db, source_type, added=(), removed_ids=()):
+    """
+    元データの変更を検索用の文書に反映（更新は削除してから作り直す）
+
+    Args:
+        added: 追加・更新後の元データ（build_search_document に渡せるもの）のリスト
+        removed_ids: 削除・更新された元データのIDのリスト
+    """
+    documents = [
+        document
+        for document in (build_search_document(source_type, source) for source in added)
+        if document is not None
+    ]
+    source_ids = sorted(set(removed_ids) | {document['source_id'] for document in documents})
+    connection = db.connection()
+    for start in range(0, len(source_ids), DELETE_CHUNK_SIZE):
+        connection.execute(
+            delete(SearchDocument).where(
+                SearchDocument.source_type == source_type,
+                SearchDocument.source_id.in_(source_ids[start:start + DELETE_CHUNK_SIZE]),
+            )
+        )
+    if documents:
+        connection.execute(SearchDocument.__table__.insert(), documents)
+
+
+@register_ledger_change_handler
+def apply_ledger_search_changes(db, added, removed):
+    """仕訳帳の変更を検索用の文書に反映"""
+    apply_search_document_changes(
+        db,
+        'general_ledger',
+        added=added,
+        removed_ids=[snapshot['id'] for snapshot in removed if snapshot['id'] is not None],
+    )
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _collect_search_changes(session, flush_context, instances):
+    """フラッシュ前に更新される元データを記録（フラッシュ後は変更の有無が分からないため）"""
+    session.info['search_dirty'] = {
+        (type(obj), obj.id)
+        for obj in session.dirty
+        if type(obj) in _FLUSH_SOURCE_TYPES
+        and obj.id is not None
+        and session.is_modified(obj, include_collections=False)
+    }
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _sync_search_documents_on_flush(session, flush_context):
+    """出納帳・振替伝票・取引明細の追加・更新・削除を検索用の文書に反映"""
+    dirty = session.info.pop('search_dirty', set())
+    changes = {}
+    for obj in session.new:
+        if type(obj) in _FLUSH_SOURCE_TYPES:
+            changes.setdefault(type(obj), ([], []))[0].append(obj)
+    for obj in session.dirty:
+        if (type(obj), obj.id) in dirty:
+            changes.setdefault(type(obj), ([], []))[0].append(obj)
+    for obj in session.deleted:
+        if type(obj) in _FLUSH_SOURCE_TYPES and obj.id is not None:
+            changes.setdefault(type(obj), ([], []))[1].append(obj.id)
+
+    for model, (added, removed_ids) in changes.items():
+        apply_search_document_changes(session, _FLUSH_SOURCE_TYPES[model], added=added, removed_ids=removed_ids)
+
+
+def _dialect_name(db):
+    return db.get_bind().dialect.name
+
+
+def has_fts_index(db):
+    """SQLite の FTS5 仮想テーブルが使えるか"""
+    bind = db.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return False
+    key = str(bind.url)
+    if key not in _fts_available:
+        _fts_available[key] = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE},
+        ).first() is not None
+    return _fts_available[key]
+
+
+def create_search_index(db):
+    """
+    content の全文検索インデックスを作成（作成済みの場合は何もしない）
+
+    SQLite: FTS5（trigram）の仮想テーブルと同期用のトリガー
+    PostgreSQL: pg_trgm の GIN インデックス（拡張を作成できない場合は LIKE 検索のまま）
+
+    Returns:
+        bool: インデックスを新規に作成した場合 True
+    """
+    dialect_name = _dialect_name(db)
+    if dialect_name == 'sqlite':
+        if has_fts_index(db):
+            return False
+        connection = db.connection()
+        for ddl in SQLITE_FTS_DDL:
+            connection.exec_driver_sql(ddl)
+        # 既存の文書を索引に登録
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        db.commit()
+        _fts_available.pop(str(db.get_bind().url), None)
+        return True
+    if dialect_name == 'postgresql':
+        exists = db.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_search_documents_content_trgm'")
+        ).first()
+        if exists:
+            return False
+        connection = db.connection()
+        for ddl in POSTGRESQL_TRGM_DDL:
+            connection.exec_driver_sql(ddl)
+        db.commit()
+        return True
+    return False
+
+
+def _source_date_sql(model, dialect_name):
+    """元データの取引日（取引明細は文字列で保持しているため PostgreSQL では DATE に変換する）"""
+    if model is ImportedTransaction and dialect_name != 'sqlite':
+        return cast(func.nullif(model.transaction_date, ''), Date)
+    return model.transaction_date
+
+
+def rebuild_search_documents(db, organization_id=None, source_types=None):
+    """
+    元データから検索用の文書を作り直す
+
+    Args:
+        organization_id: 対象の事業所ID（None の場合は全事業所）
+        source_types: 対象の元データの種類（None の場合はすべて）
+
+    Returns:
+        int: 作成した文書の件数
+    """
+    doc_table = SearchDocument.__table__
+    connection = db.connection()
+    dialect_name = _dialect_name(db)
+    created = 0
+    for source_type in source_types or SEARCH_SOURCE_TYPES:
+        model, fields = SEARCH_SOURCES[source_type]
+
+        stmt = delete(doc_table).where(doc_table.c.source_type == source_type)
+        if organization_id is not None:
+            stmt = stmt.where(doc_table.c.organization_id == organization_id)
+        connection.execute(stmt)
+
+        conditions = [model.organization_id.isnot(None)]
+        if organization_id is not None:
+            conditions.append(model.organization_id == organization_id)
+        result = connection.execute(
+            doc_table.insert().from_select(
+                ['organization_id', 'source_type', 'source_id', 'transaction_date', 'content'],
+                select(
+                    model.organization_id,
+                    literal(source_type),
+                    model.id,
+                    _source_date_sql(model, dialect_name),
+                    build_content_sql([getattr(model, field) for field in fields]),
+                ).where(*conditions),
+            )
+        )
+        created += result.rowcount
+    return created
+
+
+def ensure_search_index(db):
+    """全文検索インデックスを作成し、文書が空で元データが存在する場合（テーブル新規作成直後など）に作り直す"""
+    create_search_index(db)
+    has_documents = db.execute(select(SearchDocument.id).limit(1)).first()
+    if has_documents:
+        return False
+    has_sources = any(
+        db.execute(select(model.id).where(model.organization_id.isnot(None)).limit(1)).first()
+        for model, _ in SEARCH_SOURCES.values()
+    )
+    if not has_sources:
+        return False
+    rebuild_search_documents(db)
+    db.commit()
+    return True
+
+
+def split_search_terms(query):
+    """検索語を空白（全角空白を含む）で分割"""
+    return (query or '').replace('　', ' ').split()
+
+
+def _fts_phrase(term):
+    """FTS5 の MATCH 用に語をフレーズとして引用（記号を演算子として解釈させない）"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _search_statement(db, organization_id, terms, source_types=None):
+    """
+    検索条件に一致する文書の SELECT 文と並び順を作成
+
+    すべての語を含む文書を返す（AND 検索）
+    SQLite: 3文字以上の語は FTS5 で検索して bm25 で順位付けし、短い語は LIKE で絞り込む
+    PostgreSQL: ILIKE（pg_trgm のインデックスを使用）で検索し、word_similarity で順位付け
+    その他: LIKE で検索し、取引日の降順
+    """
+    conditions = []
+    if organization_id is not None:
+        conditions.append(SearchDocument.organization_id == organization_id)
+    if source_types:
+        conditions.append(SearchDocument.source_type.in_(source_types))
+
+    stmt = select(SearchDocument)
+    order_by = []
+    dialect_name = _dialect_name(db)
+    fts_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    if dialect_name == 'sqlite' and fts_terms and has_fts_index(db):
+        stmt = stmt.join(_fts, _fts.c.rowid == SearchDocument.id)
+        conditions.append(_fts.c[FTS_TABLE].op('MATCH')(' AND '.join(_fts_phrase(term) for term in fts_terms)))
+        like_terms = [term for term in terms if len(term) < TRIGRAM_MIN_LENGTH]
+        order_by.append(_fts.c.rank)
+    else:
+        like_terms = terms
+        if dialect_name == 'postgresql':
+            order_by.append(func.word_similarity(' '.join(terms), SearchDocument.content).desc())
+
+    for term in like_terms:
+        conditions.append(SearchDocument.content.icontains(term, autoescape=True))
+
+    order_by.extend([SearchDocument.transaction_date.desc(), SearchDocument.id.desc()])
+    return stmt.where(*conditions), order_by
+
+
+def search_documents(db, organization_id, query, source_types=None, page=1, per_page=SEARCH_PER_PAGE):
+    """
+    検索語に一致する文書を関連度順に1ページ分取得
+
+    Args:
+        organization_id: 事業所ID
+        query: 検索語（空白区切りで AND 検索）
+        source_types: 対象の元データの種類のリスト（None の場合はすべて）
+
+    Returns:
+        tuple: (SearchDocument のリスト, 次のページがあるか)
+    """
+    terms = split_search_terms(query)
+    if not terms:
+        return [], False
+    stmt, order_by = _search_statement(db, organization_id, terms, source_types)
+    # 1件多く取得して次のページの有無を判定する（件数の COUNT は行わない）
+    documents = db.execute(
+        stmt.order_by(*order_by).offset((page - 1) * per_page).limit(per_page + 1)
+    ).scalars().all()
+    return documents[:per_page], len(documents) > per_page
+
+
+def matching_source_ids(db, organization_id, source_type, query):
+    """
+    検索語に一致する元データのIDの副問い合わせ（一覧画面の絞り込み用）
+
+    例: CashBook.id.in_(matching_source_ids(db, organization_id, 'cash_book', search_query))
+    """
+    terms = split_search_terms(query)
+    stmt, _ = _search_statement(db, organization_id, terms, [source_type])
+    return stmt.with_only_columns(SearchDocument.source_id)
+
+
+def make_snippet(content, query, width=80):
+    """検索語の周辺を切り出した抜粋"""
+    content = content or ''
+    lowered = content.lower()
+    positions = [
+        position
+        for position in (lowered.find(term.lower()) for term in split_search_terms(query))
+        if position >= 0
+    ]
+    start = max(min(positions) - width // 4, 0) if positions else 0
+    snippet = content[start:start + width]
+    if start > 0:
+        snippet = '…' + snippet
+    if start + width < len(content):
+        snippet += '…'
+    return snippet
@@ -0,0 +1,165 @@
+"""
+テストの共通フィクスチャ
+
+リポジトリのルートで `python -m pytest -q tests` を実行する
+一時ディレクトリの空の SQLite データベースにアプリの起動処理（wsgi の Base.metadata.create_all と
+集計テーブル・全文検索インデックスの作成）でスキーマを作り、テストごとに作成直後のデータベースのコピーに戻す
+（alembic のマイグレーションは仕訳帳などのテーブルを作成しないため、空のデータベースには適用できない）
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TEMP_DIR = tempfile.mkdtemp(prefix='accounting-tests-')
+DATABASE_PATH = os.path.join(_TEMP_DIR, 'test.db')
+TEMPLATE_PATH = os.path.join(_TEMP_DIR, 'template.db')
+
+# db.py がエンジンを作成する前にデータベースを切り替える（バックグラウンドジョブは実行しない）
+os.environ['DATABASE_URL'] = f'sqlite:///{DATABASE_PATH}'
+os.environ['JOB_WORKERS'] = '0'
+sys.path.insert(0, ROOT_DIR)
+
+# テストで作成する勘定科目（勘定科目名, 大分類）
+ACCOUNT_ITEMS = [
+    ('現金', '資産'),
+    ('普通預金', '資産'),
+    ('買掛金', '負債'),
+    ('資本金', '純資産'),
+    ('繰越利益剰余金', '純資産'),
+    ('売上高', '収益'),
+    ('消耗品費', '費用'),
+]
+
+
+def _dispose_engines():
+    """接続プールを破棄（データベースファイルを置き換える前後に呼ぶ）"""
+    from db import engine
+    from app.db import engine as app_engine
+    engine.dispose()
+    app_engine.dispose()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _schema():
+    """アプリを読み込んで空のデータベースにスキーマを作成し、テンプレートとして保存"""
+    # アプリの起動処理（テーブル・インデックスの作成、仕訳帳・出納帳のセッションのリスナーの登録）
+    import wsgi  # noqa: F401
+
+    _dispose_engines()
+    shutil.copyfile(DATABASE_PATH, TEMPLATE_PATH)
+    yield
+    _dispose_engines()
+    shutil.rmtree(_TEMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_database():
+    """テストごとに作成直後のデータベースに戻し、プロセス内のキャッシュを空にする"""
+    from ledger_columns import ledger_column_cache
+    from report_cache import report_cache
+
+    _dispose_engines()
+    shutil.copyfile(TEMPLATE_PATH, DATABASE_PATH)
+    report_cache.clear()
+    ledger_column_cache.clear()
+    yield
+    _dispose_engines()
+
+
+@pytest.fixture
+def db():
+    from db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+@pytest.fixture
+def organization(db):
+    """
+    事業所・会計期間（2024年度と翌期の2025年度）・勘定科目・現金の口座を作成
+
+    Returns:
+        SimpleNamespace: id, fiscal_period_id, next_fiscal_period_id,
+        items（{勘定科目名: 勘定科目ID}）, account_id（現金の口座ID）
+    """
+    from models import Account, AccountItem, FiscalPeriod, Organization
+
+    org = Organization(name='テスト株式会社', business_type='corporate')
+    db.add(org)
+    db.flush()
+    fiscal_period = FiscalPeriod(
+        organization_id=org.id, name='2024年度', start_date=date(2024, 4, 1), end_date=date(2025, 3, 31)
+    )
+    next_period = FiscalPeriod(
+        organization_id=org.id, name='2025年度', start_date=date(2025, 4, 1), end_date=date(2026, 3, 31)
+    )
+    items = [
+        AccountItem(organization_id=org.id, account_name=name, major_category=major_category)
+        for name, major_category in ACCOUNT_ITEMS
+    ]
+    db.add_all([fiscal_period, next_period] + items)
+    db.flush()
+    item_ids = {item.account_name: item.id for item in items}
+    account = Account(
+        organization_id=org.id, account_name='現金', account_type='cash', account_item_id=item_ids['現金']
+    )
+    db.add(account)
+    db.commit()
+    return SimpleNamespace(
+        id=org.id,
+        fiscal_period_id=fiscal_period.id,
+        next_fiscal_period_id=next_period.id,
+        items=item_ids,
+        account_id=account.id,
+    )
+
+
+@pytest.fixture
+def client(organization):
+    """事業所にログインした状態のテストクライアント"""
+    import wsgi
+
+    test_client = wsgi.app.test_client()
+    with test_client.session_transaction() as session:
+        session['user_id'] = 1
+        session['organization_id'] = organization.id
+    return test_client
+
+
+@pytest.fixture
+def post_entry(db, organization):
+    """
+    仕訳帳に仕訳を1件登録してコミットする関数
+
+    post_entry('2024-05-01', '現金', '売上高', 1000) のように借方・貸方の勘定科目名と金額を渡す
+    """
+    from models import GeneralLedger
+
+    def post(transaction_date, debit_name, credit_name, amount, **values):
+        entry = GeneralLedger(
+            organization_id=organization.id,
+            transaction_date=date.fromisoformat(transaction_date),
+            debit_account_item_id=organization.items[debit_name],
+            debit_amount=amount,
+            credit_account_item_id=organization.items[credit_name],
+            credit_amount=amount,
+            source_type=values.pop('source_type', 'manual'),
+            **values,
+        )
+        db.add(entry)
+        db.commit()
+        return entry.id
+
+    return post
@@ -0,0 +1,148 @@
+"""
+出納帳の口座残高（月初からの累計 + 月次合計）が追加・更新・削除で正しく保たれることのテスト
+"""
+
+import random
+from datetime import date
+
+from sqlalchemy import select
+
+from cash_book_balance_utils import attach_running_balances, rebuild_cash_book_balances
+from models import CashBook, CashBookMonthlyBalance
+
+
+def _add(db, organization, transaction_date, amount, payment_account='現金'):
+    cash_book = CashBook(
+        organization_id=organization.id,
+        transaction_date=date.fromisoformat(transaction_date),
+        account_item_id=organization.items['売上高'],
+        payment_account=payment_account,
+        amount_with_tax=amount,
+    )
+    db.add(cash_book)
+    db.commit()
+    return cash_book.id
+
+
+def _rows(db, organization_id):
+    return db.execute(
+        select(CashBook.id, CashBook.payment_account, CashBook.transaction_date, CashBook.amount_with_tax, CashBook.balance)
+        .where(CashBook.organization_id == organization_id)
+    ).all()
+
+
+def _expected_balances(rows):
+    """口座ごとに全履歴を取引日・ID順に累計した残高"""
+    balances = {}
+    totals = {}
+    for row in sorted(rows, key=lambda row: (row.payment_account or '', str(row.transaction_date), row.id)):
+        key = row.payment_account or ''
+        totals[key] = totals.get(key, 0) + row.amount_with_tax
+        balances[row.id] = totals[key]
+    return balances
+
+
+def _stored_state(db, organization_id):
+    monthly = {
+        (row.payment_account, row.year_month): row.net_amount
+        for row in db.query(CashBookMonthlyBalance).filter_by(organization_id=organization_id)
+        if row.net_amount
+    }
+    return monthly, {row.id: row.balance for row in _rows(db, organization_id)}
+
+
+def test_running_balance_matches_full_history(db, organization):
+    for transaction_date, amount in [('2024-05-10', 1000), ('2024-05-01', 500), ('2024-06-03', -300), ('2024-05-10', -200)]:
+        _add(db, organization, transaction_date, amount)
+    _add(db, organization, '2024-05-15', 50, payment_account='普通預金')
+
+    rows = _rows(db, organization.id)
+    balances = attach_running_balances(db, organization.id, rows)
+
+    assert balances == _expected_balances(rows)
+    june = next(row for row in rows if row.transaction_date == date(2024, 6, 3))
+    assert balances[june.id] == 1000
+
+
+def test_back_dated_insert_keeps_later_months(db, organization):
+    for month in (5, 6, 7):
+        _add(db, organization, f'2024-{month:02d}-15', 100)
+    later = {row.id: row.balance for row in _rows(db, organization.id) if row.transaction_date.month > 5}
+
+    _add(db, organization, '2024-05-01', 1000)
+
+    rows = _rows(db, organization.id)
+    # 6月・7月の行の月初からの累計は書き換えない（月次合計で残高がずれる）
+    assert {row.id: row.balance for row in rows if row.transaction_date.month > 5} == later
+    assert attach_running_balances(db, organization.id, rows) == _expected_balances(rows)
+
+
+def test_random_changes_match_rebuild(db, organization):
+    random.seed(18)
+    for step in range(200):
+        operation = random.random()
+        existing = db.query(CashBook).filter_by(organization_id=organization.id).all()
+        if operation < 0.5 or not existing:
+            db.add(CashBook(
+                organization_id=organization.id,
+                transaction_date=date(2024, random.randint(4, 7), random.randint(1, 28)),
+                account_item_id=organization.items['売上高'],
+                payment_account=random.choice(['現金', '普通預金', None]),
+                amount_with_tax=random.randint(-500, 500),
+            ))
+        elif operation < 0.75:
+            db.delete(random.choice(existing))
+        else:
+            cash_book = random.choice(existing)
+            cash_book.amount_with_tax = random.randint(-500, 500)
+            cash_book.transaction_date = date(2024, random.randint(4, 7), random.randint(1, 28))
+            cash_book.payment_account = random.choice(['現金', '普通預金', ''])
+        if step % 7 == 0:
+            db.commit()
+    db.commit()
+
+    rows = _rows(db, organization.id)
+    assert attach_running_balances(db, organization.id, rows) == _expected_balances(rows)
+
+    maintained = _stored_state(db, organization.id)
+    rebuild_cash_book_balances(db, organization.id)
+    db.commit()
+    assert _stored_state(db, organization.id) == maintained
+
+
+def test_batch_insert_updates_balances(db, organization):
+    from cash_book_utils import post_cash_book_batch
+
+    _add(db, organization, '2024-06-01', 100)
+    post_cash_book_batch(db, organization.id, [
+        {
+            'transaction_date': transaction_date,
+            'account_item_id': organization.items['売上高'],
+            'account_id': organization.account_id,
+            'deposit_amount': amount,
+            'tax_category_id': '',
+        }
+        for transaction_date, amount in [('2024-05-20', '300'), ('2024-06-01', '40')]
+    ])
+    db.commit()
+
+    rows = _rows(db, organization.id)
+    assert attach_running_balances(db, organization.id, rows) == _expected_balances(rows)
+
+
+def test_list_api_returns_account_balances(db, organization, client):
+    for day in range(1, 8):
+        _add(db, organization, f'2024-{4 + day % 3:02d}-{day:02d}', day * 100)
+    expected = _expected_balances(_rows(db, organization.id))
+
+    response = client.get(f'/accounting/api/cash-books/list?account_id={organization.account_id}&limit=3')
+    body = response.get_json()
+    assert body['success'] is True
+    entries = body['data']
+    response = client.get(
+        f'/accounting/api/cash-books/list?account_id={organization.account_id}&limit=10&cursor={body["next_cursor"]}'
+    )
+    entries += response.get_json()['data']
+
+    assert len(entries) == 7
+    assert {entry['id']: entry['balance'] for entry in entries} == expected
@@ -0,0 +1,113 @@
+"""
+出納帳の一括登録（/api/cash-books/batch の一括 INSERT による登録）のテスト
+"""
+
+from sqlalchemy import event
+
+from cash_book_utils import post_cash_book_batch
+from models import CashBook, GeneralLedger
+
+
+def _row(organization, item_name, transaction_date='2024-05-01', deposit=None, withdrawal=None, **values):
+    return dict({
+        'transaction_date': transaction_date,
+        'account_item_id': organization.items[item_name],
+        'account_id': organization.account_id,
+        'deposit_amount': deposit,
+        'withdrawal_amount': withdrawal,
+        'tax_category_id': '',
+    }, **values)
+
+
+def _count_statements(db, organization, transactions):
+    """一括登録で発行された SQL の数"""
+    from db import engine
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        post_cash_book_batch(db, organization.id, transactions)
+        db.commit()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def test_batch_creates_cash_books_and_ledger_entries(db, organization, client):
+    response = client.post('/accounting/api/cash-books/batch', json={'transactions': [
+        _row(organization, '売上高', deposit='1000', remarks='売上'),
+        _row(organization, '消耗品費', transaction_date='2024-05-02', withdrawal='300', remarks='文房具'),
+        _row(organization, '消耗品費', transaction_date='2024/05/03', withdrawal='100'),
+    ]})
+
+    body = response.get_json()
+    assert body['success'] is True
+    assert (body['created_count'], body['cashbook_count']) == (2, 2)
+    assert body['errors'] == ['行 3: 取引日の形式が不正です']
+
+    cash_books = {cb.remarks: cb for cb in db.query(CashBook).filter_by(organization_id=organization.id)}
+    assert {remarks: cb.amount_with_tax for remarks, cb in cash_books.items()} == {'売上': 1000, '文房具': -300}
+    assert all(cb.payment_account == '現金' for cb in cash_books.values())
+
+    entries = {
+        entry.source_id: entry
+        for entry in db.query(GeneralLedger).filter_by(organization_id=organization.id, source_type='batch_entry')
+    }
+    sale = entries[cash_books['売上'].id]
+    assert (sale.debit_account_item_id, sale.credit_account_item_id) == (organization.items['現金'], organization.items['売上高'])
+    assert (sale.debit_amount, sale.credit_amount) == (1000, 1000)
+    expense = entries[cash_books['文房具'].id]
+    assert (expense.debit_account_item_id, expense.credit_account_item_id) == (organization.items['消耗品費'], organization.items['現金'])
+    assert (expense.debit_amount, expense.credit_amount) == (300, 300)
+
+
+def test_batch_without_valid_rows_is_rolled_back(db, organization, client):
+    response = client.post('/accounting/api/cash-books/batch', json={'transactions': [
+        _row(organization, '売上高'),
+        _row(organization, '売上高', deposit='abc'),
+        dict(_row(organization, '売上高', deposit='100'), account_id=organization.account_id + 100),
+    ]})
+
+    body = response.get_json()
+    assert body['success'] is False
+    assert body['errors'] == [
+        '行 1: 入金または出金のどちらかが必須です',
+        '行 2: 金額の形式が不正です',
+        '行 3: 口座が見つかりません',
+    ]
+    assert db.query(CashBook).count() == 0
+    assert db.query(GeneralLedger).count() == 0
+
+
+def test_batch_statement_count_does_not_grow_with_rows(db, organization):
+    small = _count_statements(db, organization, [_row(organization, '売上高', deposit='10')] * 3)
+    large = _count_statements(db, organization, [_row(organization, '売上高', deposit='10')] * 300)
+
+    assert large <= small + 2
+    assert db.query(CashBook).count() == 303
+    assert db.query(GeneralLedger).filter_by(source_type='batch_entry').count() == 303
+
+
+def test_batch_entries_are_replaced_when_cash_book_id_is_reused(db, organization):
+    # 削除済みの出納帳のIDで連続仕訳が残っている場合は作り直す
+    db.add(GeneralLedger(
+        organization_id=organization.id,
+        source_type='batch_entry',
+        source_id=1,
+        debit_account_item_id=organization.items['現金'],
+        debit_amount=5,
+        credit_account_item_id=organization.items['売上高'],
+        credit_amount=5,
+    ))
+    db.commit()
+
+    post_cash_book_batch(db, organization.id, [_row(organization, '売上高', deposit='700')])
+    db.commit()
+
+    cash_book_id = db.query(CashBook.id).scalar()
+    assert cash_book_id == 1
+    assert [entry.debit_amount for entry in db.query(GeneralLedger).filter_by(source_id=cash_book_id)] == [700]
@@ -0,0 +1,137 @@
+"""
+会計期間の締め（翌期の期首残高への繰越・損益の振替・締め済みの会計期間への記帳の拒否）のテスト
+"""
+
+import pytest
+
+from closing_utils import ClosedPeriodError
+from models import CashBook, FiscalPeriod, OpeningBalance
+from report_utils import compute_opening_balances
+
+
+def _batch_row(organization, transaction_date, item_name, deposit=None, withdrawal=None):
+    """出納帳の一括登録APIの1行（現金の口座）"""
+    return {
+        'transaction_date': transaction_date,
+        'account_item_id': organization.items[item_name],
+        'account_id': organization.account_id,
+        'deposit_amount': deposit,
+        'withdrawal_amount': withdrawal,
+        'tax_category_id': '',
+    }
+
+
+def _close(client, fiscal_period_id):
+    return client.post(f'/accounting/api/fiscal-periods/{fiscal_period_id}/close')
+
+
+@pytest.fixture
+def closed_year(db, organization, post_entry, client):
+    """2024年度に期首残高と仕訳を登録して締める"""
+    db.add_all([
+        OpeningBalance(
+            organization_id=organization.id,
+            fiscal_period_id=organization.fiscal_period_id,
+            account_item_id=organization.items['現金'],
+            debit_amount=1000,
+            credit_amount=0,
+        ),
+        OpeningBalance(
+            organization_id=organization.id,
+            fiscal_period_id=organization.fiscal_period_id,
+            account_item_id=organization.items['資本金'],
+            debit_amount=0,
+            credit_amount=1000,
+        ),
+    ])
+    db.commit()
+    post_entry('2024-05-01', '現金', '売上高', 1500)
+    post_entry('2024-06-01', '消耗品費', '現金', 300)
+    post_entry('2025-03-31', '消耗品費', '買掛金', 200)
+
+    response = _close(client, organization.fiscal_period_id)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['success'] is True
+    return organization
+
+
+def test_close_carries_balances_into_next_period(db, closed_year):
+    organization = closed_year
+    items = organization.items
+
+    opening_rows = {
+        row.account_item_id: (row.debit_amount, row.credit_amount)
+        for row in db.query(OpeningBalance).filter_by(fiscal_period_id=organization.next_fiscal_period_id)
+    }
+    assert opening_rows == {
+        items['現金']: (2200, 0),
+        items['買掛金']: (0, 200),
+        items['資本金']: (0, 1000),
+        # 当期純利益 1500 - 300 - 200
+        items['繰越利益剰余金']: (0, 1000),
+    }
+
+    next_period = db.get(FiscalPeriod, organization.next_fiscal_period_id)
+    opening = compute_opening_balances(db, organization.id, next_period)
+    assert opening == {
+        items['現金']: 2200,
+        items['買掛金']: 200,
+        items['資本金']: 1000,
+        items['繰越利益剰余金']: 1000,
+    }
+    assert all(type(amount) is int for amount in opening.values())
+    assert db.get(FiscalPeriod, organization.fiscal_period_id).status == 'closed'
+
+
+def test_close_twice_is_rejected(closed_year, client):
+    response = _close(client, closed_year.fiscal_period_id)
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_close_without_next_period_is_rejected(client, organization):
+    response = _close(client, organization.next_fiscal_period_id)
+
+    assert response.status_code == 400
+    assert '翌期の会計期間' in response.get_json()['message']
+
+
+def test_closed_period_rejects_postings(db, closed_year, post_entry):
+    with pytest.raises(ClosedPeriodError):
+        post_entry('2024-12-01', '現金', '売上高', 100)
+    db.rollback()
+
+    # 翌期の仕訳は登録できる
+    assert post_entry('2025-04-01', '現金', '売上高', 100)
+
+
+def test_batch_rejects_closed_rows_and_posts_the_rest(db, closed_year, client):
+    organization = closed_year
+    response = client.post('/accounting/api/cash-books/batch', json={'transactions': [
+        _batch_row(organization, '2024-12-01', '売上高', deposit='100'),
+        _batch_row(organization, '2025-04-01', '売上高', deposit='200'),
+    ]})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['success'] is True
+    assert body['created_count'] == 1
+    assert len(body['errors']) == 1
+    assert body['errors'][0].startswith('行 1: 会計期間「2024年度」は締め済み')
+    assert [row.amount_with_tax for row in db.query(CashBook).filter_by(organization_id=organization.id)] == [200]
+
+
+def test_deleting_closed_cash_book_returns_conflict(db, organization, client):
+    response = client.post('/accounting/api/cash-books/batch', json={'transactions': [
+        _batch_row(organization, '2024-12-01', '売上高', deposit='100'),
+    ]})
+    assert response.get_json()['success'] is True
+    cash_book_id = db.query(CashBook.id).filter_by(organization_id=organization.id).scalar()
+    assert _close(client, organization.fiscal_period_id).status_code == 200
+
+    response = client.post(f'/accounting/api/cash-books/{cash_book_id}/delete')
+
+    assert response.status_code == 409
+    assert '締め済み' in response.get_json()['message']
+    assert db.get(CashBook, cash_book_id) is not None
@@ -0,0 +1,156 @@
+"""
+インポートの重複判定（行のフィンガープリント）と、失敗したインポートの再開のテスト
+"""
+
+import io
+from datetime import date
+
+import pytest
+
+from import_utils import ImportProcessor
+from models import CashBook, ImportedTransaction
+from transaction_import_routes import import_transaction_file
+
+MAPPING = {'date_col': 0, 'amount_col': 1, 'counterparty_col': 2}
+
+
+def _csv(*lines):
+    return ('date,amount,counterparty\n' + ''.join(line + '\n' for line in lines)).encode('utf-8')
+
+
+def _import(organization, content, **options):
+    return ImportProcessor().import_data_stream(
+        io.BytesIO(content), 'csv', MAPPING, organization.id,
+        skip_rows=1, account_item_id=organization.items['消耗品費'], **options
+    )
+
+
+def _failing_second_chunk(processor):
+    """2回目のチャンクのコミットを失敗させる"""
+    commit_chunk = processor._commit_import_chunk
+    calls = []
+
+    def commit(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == 2:
+            processor.errors.append('登録エラー')
+            return False
+        return commit_chunk(*args, **kwargs)
+
+    processor._commit_import_chunk = commit
+
+
+def _cash_book_count(db, organization):
+    return db.query(CashBook).filter_by(organization_id=organization.id).count()
+
+
+def test_reimport_skips_every_row(db, organization):
+    content = _csv('2024-05-01,500,文具店', '2024-05-01,500,文具店', '2024-05-02,800,書店')
+
+    first = _import(organization, content)
+    second = _import(organization, content)
+
+    assert (first['imported_count'], first['warnings']) == (3, [])
+    assert second['imported_count'] == 0
+    assert len(second['warnings']) == 3
+    assert _cash_book_count(db, organization) == 3
+
+
+def test_appended_statement_imports_only_new_rows(db, organization):
+    _import(organization, _csv('2024-05-01,500,文具店'))
+
+    result = _import(organization, _csv('2024-05-01,500,文具店', '2024-05-01,500,文具店', '2024-05-03,200,書店'))
+
+    assert result['imported_count'] == 2
+    assert _cash_book_count(db, organization) == 3
+
+
+def test_manual_entry_counts_as_duplicate(db, organization):
+    db.add(CashBook(
+        organization_id=organization.id,
+        transaction_date=date(2024, 5, 1),
+        account_item_id=organization.items['消耗品費'],
+        counterparty='文具店',
+        amount_with_tax=500,
+    ))
+    db.commit()
+
+    result = _import(organization, _csv('2024-05-01,500,文具店', '2024-05-01,500,文具店'))
+
+    assert result['imported_count'] == 1
+    assert _cash_book_count(db, organization) == 2
+
+
+def test_resumed_stream_import_keeps_identical_rows(db, organization):
+    content = _csv(*['2024-05-01,500,文具店'] * 10)
+    processor = ImportProcessor()
+    _failing_second_chunk(processor)
+    first = processor.import_data_stream(
+        io.BytesIO(content), 'csv', MAPPING, organization.id,
+        skip_rows=1, account_item_id=organization.items['消耗品費'], chunk_size=4,
+    )
+    assert first['imported_count'] < 10
+
+    resumed = _import(organization, content, chunk_size=4, start_row=first['next_row'])
+
+    assert resumed['warnings'] == []
+    assert first['imported_count'] + resumed['imported_count'] == 10
+    assert _cash_book_count(db, organization) == 10
+
+
+def test_resumed_parallel_import_keeps_identical_rows(db, organization, tmp_path):
+    content = _csv(*['2024-05-01,500,文具店'] * 10)
+    path = tmp_path / 'statement.csv'
+    path.write_bytes(content)
+    processor = ImportProcessor()
+    _failing_second_chunk(processor)
+    first = processor.import_data_stream(
+        io.BytesIO(content), 'csv', MAPPING, organization.id,
+        skip_rows=1, account_item_id=organization.items['消耗品費'], chunk_size=4,
+    )
+
+    resumed = ImportProcessor().import_data_parallel(
+        str(path), MAPPING, organization.id, skip_rows=1, account_item_id=organization.items['消耗品費'],
+        chunk_size=4, start_row=first['next_row'], workers=2, chunk_bytes=40,
+    )
+
+    assert resumed['errors'] == []
+    assert first['imported_count'] + resumed['imported_count'] == 10
+    assert _cash_book_count(db, organization) == 10
+
+
+STATEMENT_ROWS = [
+    ('取引日', '摘要', '入金金額', '出金金額'),
+    ('2024/05/01', '振込 テスト商事', 10000, 0),
+    ('2024/05/01', '振込 テスト商事', 10000, 0),
+    ('2024/05/02', '手数料', 0, 220),
+]
+
+
+def _statement(file_ext):
+    """取引明細ファイルの内容（同じ内容の行を2行含む）"""
+    if file_ext == 'csv':
+        return ''.join(','.join(str(value) for value in row) + '\n' for row in STATEMENT_ROWS).encode('utf-8')
+
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    for row in STATEMENT_ROWS:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('file_ext', ['csv', 'xlsx'])
+def test_transaction_statement_reupload_is_skipped(db, organization, file_ext):
+    content = _statement(file_ext)
+
+    first = import_transaction_file(db, organization.id, '普通預金', file_ext, io.BytesIO(content))
+    db.commit()
+    second = import_transaction_file(db, organization.id, '普通預金', file_ext, io.BytesIO(content))
+    db.commit()
+
+    assert first == (3, 0)
+    assert second == (0, 3)
+    assert db.query(ImportedTransaction).filter_by(organization_id=organization.id).count() == 3
@@ -0,0 +1,106 @@
+"""
+総勘定元帳のキーセットページング（ページ先頭の残高・月次合計）のテスト
+"""
+
+import random
+
+import pytest
+
+from models import AccountItem, FiscalPeriod
+from report_utils import fetch_ledger_page
+
+
+@pytest.fixture
+def cash_ledger(db, organization, post_entry):
+    """現金の元帳（前期の仕訳1件と、同じ日付を含む当期の仕訳を取引日順ではない順番で登録）"""
+    post_entry('2024-03-15', '現金', '売上高', 10000)
+
+    random.seed(5)
+    dates = [f'2024-{month:02d}-{day:02d}' for month in (4, 5, 6, 7) for day in (1, 10, 10, 28)]
+    random.shuffle(dates)
+    for index, transaction_date in enumerate(dates):
+        if index % 3 == 0:
+            post_entry(transaction_date, '消耗品費', '現金', 100 + index)
+        else:
+            post_entry(transaction_date, '現金', '売上高', 1000 + index)
+    # 借方・貸方とも現金以外の仕訳は元帳に含まれない
+    post_entry('2024-05-10', '消耗品費', '買掛金', 999)
+
+    account_item = db.get(AccountItem, organization.items['現金'])
+    fiscal_period = db.get(FiscalPeriod, organization.fiscal_period_id)
+    return account_item, fiscal_period
+
+
+def _all_pages(db, organization, account_item, fiscal_period, per_page):
+    """先頭ページから next_cursor をたどってすべてのページを取得"""
+    pages = [fetch_ledger_page(db, organization.id, account_item, fiscal_period, per_page=per_page)]
+    while pages[-1]['next_cursor']:
+        pages.append(fetch_ledger_page(
+            db, organization.id, account_item, fiscal_period, after=pages[-1]['next_cursor'], per_page=per_page
+        ))
+    return pages
+
+
+def test_single_page_running_balance(db, organization, cash_ledger):
+    account_item, fiscal_period = cash_ledger
+    page = fetch_ledger_page(db, organization.id, account_item, fiscal_period, per_page=1000)
+
+    assert page['opening_balance'] == 10000
+    assert page['next_cursor'] is None and page['prev_cursor'] is None
+    transactions = page['transactions']
+    assert len(transactions) == 16
+    assert [(t['date'], t['id']) for t in transactions] == sorted((t['date'], t['id']) for t in transactions)
+
+    balance = 10000
+    for transaction in transactions:
+        balance += transaction['debit'] - transaction['credit']
+        assert transaction['balance'] == balance
+
+
+@pytest.mark.parametrize('per_page', [1, 3, 5, 16])
+def test_pages_match_single_page(db, organization, cash_ledger, per_page):
+    account_item, fiscal_period = cash_ledger
+    expected = fetch_ledger_page(db, organization.id, account_item, fiscal_period, per_page=1000)['transactions']
+
+    pages = _all_pages(db, organization, account_item, fiscal_period, per_page)
+
+    assert all(len(page['transactions']) <= per_page for page in pages)
+    # ページの境界をまたいでも残高・月次合計の位置が変わらない
+    assert [t for page in pages for t in page['transactions']] == expected
+    assert pages[0]['prev_cursor'] is None
+    assert all(page['prev_cursor'] for page in pages[1:])
+
+
+def test_prev_cursor_returns_previous_page(db, organization, cash_ledger):
+    account_item, fiscal_period = cash_ledger
+    pages = _all_pages(db, organization, account_item, fiscal_period, per_page=5)
+
+    for previous, page in zip(pages, pages[1:]):
+        back = fetch_ledger_page(
+            db, organization.id, account_item, fiscal_period, before=page['prev_cursor'], per_page=5
+        )
+        assert back['transactions'] == previous['transactions']
+
+
+def test_monthly_totals_come_from_grouped_query(db, organization, cash_ledger):
+    account_item, fiscal_period = cash_ledger
+    transactions = fetch_ledger_page(db, organization.id, account_item, fiscal_period, per_page=1000)['transactions']
+
+    month_totals = [t['month_total'] for t in transactions if t['month_total']]
+    assert [total['month'] for total in month_totals] == ['2024-04', '2024-05', '2024-06', '2024-07']
+    for total in month_totals:
+        in_month = [t for t in transactions if t['date'].startswith(total['month'])]
+        assert total['debit_total'] == sum(t['debit'] for t in in_month)
+        assert total['credit_total'] == sum(t['credit'] for t in in_month)
+
+
+def test_ledger_view_pages(client, organization, cash_ledger):
+    url = (
+        f'/accounting/ledger?fiscal_period_id={organization.fiscal_period_id}'
+        f'&account_item_id={organization.items["現金"]}'
+    )
+    first = client.get(url)
+    assert first.status_code == 200
+
+    response = client.get(url + '&after=2024-05-10_9999999')
+    assert response.status_code == 200
@@ -0,0 +1,124 @@
+"""
+勘定科目別月次集計（account_monthly_balances）が仕訳帳の変更と同じトランザクションで更新されることのテスト
+"""
+
+from datetime import date
+
+from balance_utils import aggregate_monthly_totals, aggregate_monthly_totals_by_month, rebuild_monthly_balances
+from ledger_utils import delete_ledger_entries
+from models import AccountMonthlyBalance, GeneralLedger, LedgerLine
+
+
+def _monthly_totals(db, organization_id):
+    """月次集計の {(勘定科目ID, 年月): (借方合計, 貸方合計)}（合計が0の行は除く）"""
+    return {
+        key: totals
+        for key, totals in aggregate_monthly_totals_by_month(db, organization_id).items()
+        if totals != (0, 0)
+    }
+
+
+def _rebuilt_totals(db, organization_id):
+    """仕訳帳から作り直した月次集計（作り直した結果はロールバックする）"""
+    rebuild_monthly_balances(db, organization_id)
+    totals = _monthly_totals(db, organization_id)
+    db.rollback()
+    return totals
+
+
+def test_posting_adds_monthly_totals(db, organization, post_entry):
+    items = organization.items
+    post_entry('2024-05-01', '現金', '売上高', 1000)
+    post_entry('2024-05-20', '現金', '売上高', 500)
+    post_entry('2024-06-03', '消耗品費', '現金', 300)
+
+    assert _monthly_totals(db, organization.id) == {
+        (items['現金'], '2024-05'): (1500, 0),
+        (items['売上高'], '2024-05'): (0, 1500),
+        (items['現金'], '2024-06'): (0, 300),
+        (items['消耗品費'], '2024-06'): (300, 0),
+    }
+    assert aggregate_monthly_totals(db, organization.id, month_from='2024-06')[items['現金']] == (0, 300)
+
+
+def test_updates_and_deletes_apply_deltas(db, organization, post_entry):
+    first_id = post_entry('2024-05-01', '現金', '売上高', 1000)
+    second_id = post_entry('2024-05-20', '現金', '売上高', 500)
+    third_id = post_entry('2024-06-03', '消耗品費', '現金', 300)
+
+    # 金額・取引日（別の月へ）・勘定科目の変更
+    first = db.get(GeneralLedger, first_id)
+    first.debit_amount = first.credit_amount = 1200
+    second = db.get(GeneralLedger, second_id)
+    second.transaction_date = date(2024, 7, 1)
+    third = db.get(GeneralLedger, third_id)
+    third.credit_account_item_id = organization.items['普通預金']
+    db.commit()
+    assert _monthly_totals(db, organization.id) == _rebuilt_totals(db, organization.id)
+
+    # ORM の削除と一括削除
+    db.delete(db.get(GeneralLedger, first_id))
+    db.commit()
+    delete_ledger_entries(db, GeneralLedger.id == third_id)
+    db.commit()
+    assert _monthly_totals(db, organization.id) == _rebuilt_totals(db, organization.id)
+    assert _monthly_totals(db, organization.id) == {
+        (organization.items['現金'], '2024-07'): (500, 0),
+        (organization.items['売上高'], '2024-07'): (0, 500),
+    }
+
+
+def test_rollback_discards_monthly_deltas(db, organization, post_entry):
+    post_entry('2024-05-01', '現金', '売上高', 1000)
+
+    db.add(GeneralLedger(
+        organization_id=organization.id,
+        transaction_date=date(2024, 5, 2),
+        debit_account_item_id=organization.items['現金'],
+        debit_amount=700,
+        credit_account_item_id=organization.items['売上高'],
+        credit_amount=700,
+    ))
+    db.flush()
+    db.rollback()
+
+    assert aggregate_monthly_totals(db, organization.id)[organization.items['現金']] == (1000, 0)
+
+
+def test_cash_book_batch_updates_monthly_totals(db, organization):
+    from cash_book_utils import post_cash_book_batch
+
+    post_cash_book_batch(db, organization.id, [
+        {
+            'transaction_date': f'2024-0{month}-10',
+            'account_item_id': organization.items['売上高'],
+            'account_id': organization.account_id,
+            'deposit_amount': str(month * 100),
+            'tax_category_id': '',
+        }
+        for month in (5, 6)
+    ])
+    db.commit()
+
+    assert _monthly_totals(db, organization.id) == {
+        (organization.items['現金'], '2024-05'): (500, 0),
+        (organization.items['売上高'], '2024-05'): (0, 500),
+        (organization.items['現金'], '2024-06'): (600, 0),
+        (organization.items['売上高'], '2024-06'): (0, 600),
+    }
+
+
+def test_reset_script_removes_derived_rows(db, organization, post_entry, monkeypatch):
+    import reset_account_items_with_children
+    from report_cache import get_ledger_version
+
+    post_entry('2024-05-01', '現金', '売上高', 1000)
+    version = get_ledger_version(db, organization.id)
+    db.rollback()
+
+    monkeypatch.setattr(reset_account_items_with_children, 'ORGANIZATION_ID', organization.id)
+    reset_account_items_with_children.reset_account_items_and_related()
+
+    assert db.query(AccountMonthlyBalance).filter_by(organization_id=organization.id).count() == 0
+    assert db.query(LedgerLine).filter_by(organization_id=organization.id).count() == 0
+    assert get_ledger_version(db, organization.id) > version
@@ -0,0 +1,63 @@
+"""
+帳票・出納帳・振替伝票の画面が発行するクエリが全表スキャンにならないことの回帰テスト
+（check_query_plans.py と同じチェックを、統計情報のない空のデータベースで行う）
+"""
+
+from datetime import date
+
+from models import JournalEntry
+
+
+def _seed(db, organization, post_entry):
+    """画面のパラメーターに使う出納帳・振替伝票・仕訳を作成"""
+    from cash_book_utils import post_cash_book_batch
+
+    created, _, errors = post_cash_book_batch(db, organization.id, [
+        {
+            'transaction_date': '2024-05-01',
+            'account_item_id': organization.items['売上高'],
+            'account_id': organization.account_id,
+            'deposit_amount': '1000',
+            'tax_category_id': '',
+            'remarks': '売上',
+        },
+        {
+            'transaction_date': '2024-05-02',
+            'account_item_id': organization.items['消耗品費'],
+            'account_id': organization.account_id,
+            'withdrawal_amount': '300',
+            'tax_category_id': '',
+            'remarks': '文房具',
+        },
+    ])
+    assert (created, errors) == (2, [])
+    db.commit()
+
+    journal_entry = JournalEntry(
+        organization_id=organization.id,
+        transaction_date=date(2024, 6, 1),
+        debit_account_item_id=organization.items['普通預金'],
+        debit_amount=500,
+        credit_account_item_id=organization.items['現金'],
+        credit_amount=500,
+    )
+    db.add(journal_entry)
+    db.commit()
+    post_entry('2024-06-01', '普通預金', '現金', 500, source_type='journal_entry', source_id=journal_entry.id)
+
+
+def test_report_and_cash_book_queries_use_indexes(db, organization, post_entry):
+    import wsgi
+    from check_query_plans import collect_query_plans
+
+    _seed(db, organization, post_entry)
+    results, failed_urls = collect_query_plans(wsgi.app, organization.id)
+
+    assert failed_urls == []
+    assert results
+    full_scans = [
+        (label, sorted(set(scans)), ' '.join(statement.split()))
+        for label, statement, plan, scans in results
+        if scans
+    ]
+    assert full_scans == []
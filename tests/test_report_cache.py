@@ -0,0 +1,116 @@
+"""
+帳票キャッシュ（LRU・仕訳帳バージョンによる検証）と、仕訳帳・期首残高の変更による無効化のテスト
+"""
+
+from flask import template_rendered
+
+from ledger_utils import delete_ledger_entries
+from models import GeneralLedger, OpeningBalance
+from report_cache import ReportCache, delete_versioned_rows, get_ledger_version, report_cache
+
+
+def _trial_balance(client, organization):
+    """
+    試算表の画面を表示して貸借対照表科目の金額を取得
+
+    Returns:
+        dict: {勘定科目名: (期首残高, 借方金額, 貸方金額, 期末残高)}
+    """
+    import wsgi
+
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    with template_rendered.connected_to(record, wsgi.app):
+        response = client.get(f'/accounting/trial-balance?fiscal_period_id={organization.fiscal_period_id}')
+    assert response.status_code == 200
+    return {
+        row['account_item'].account_name: (
+            row['opening_balance'], row['current_debit'], row['current_credit'], row['closing_balance']
+        )
+        for row in contexts[-1]['bs_data']
+    }
+
+
+def test_cache_validates_version_and_evicts_oldest():
+    cache = ReportCache(max_entries=2)
+    first = cache.make_key(1, 1, 'trial_balance')
+    second = cache.make_key(1, 1, 'ledger', {'account_item_id': 3})
+    third = cache.make_key(2, 5, 'trial_balance')
+
+    cache.set(first, 1, 'a')
+    assert cache.get(first, 1) == 'a'
+    # バージョンが変わったキャッシュは使わずに破棄する
+    assert cache.get(first, 2) is None
+    assert cache.get(first, 1) is None
+
+    cache.set(first, 1, 'a')
+    cache.set(second, 1, 'b')
+    cache.get(first, 1)
+    cache.set(third, 1, 'c')
+    assert cache.get(second, 1) is None
+    assert cache.get(first, 1) == 'a'
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 3, 1)
+    assert cache.make_key(1, 1, 'ledger', {'b': 1, 'a': 2}) == cache.make_key(1, 1, 'ledger', {'a': 2, 'b': 1})
+
+
+def test_new_entries_invalidate_trial_balance(client, organization, post_entry):
+    post_entry('2024-05-01', '現金', '売上高', 1000)
+    assert _trial_balance(client, organization)['現金'] == (0, 1000, 0, 1000)
+
+    hits = report_cache.hits
+    assert _trial_balance(client, organization)['現金'] == (0, 1000, 0, 1000)
+    assert report_cache.hits > hits
+
+    post_entry('2024-06-01', '消耗品費', '現金', 300)
+    assert _trial_balance(client, organization)['現金'] == (0, 1000, 300, 700)
+
+
+def test_ledger_bulk_delete_invalidates_trial_balance(db, client, organization, post_entry):
+    post_entry('2024-05-01', '現金', '売上高', 1000)
+    entry_id = post_entry('2024-05-02', '現金', '売上高', 500)
+    assert _trial_balance(client, organization)['現金'] == (0, 1500, 0, 1500)
+
+    delete_ledger_entries(db, GeneralLedger.id == entry_id)
+    db.commit()
+
+    assert _trial_balance(client, organization)['現金'] == (0, 1000, 0, 1000)
+
+
+def test_opening_balance_bulk_delete_invalidates_trial_balance(db, client, organization):
+    db.add_all([
+        OpeningBalance(
+            organization_id=organization.id,
+            fiscal_period_id=organization.fiscal_period_id,
+            account_item_id=organization.items['現金'],
+            debit_amount=500,
+            credit_amount=0,
+        ),
+        OpeningBalance(
+            organization_id=organization.id,
+            fiscal_period_id=organization.fiscal_period_id,
+            account_item_id=organization.items['資本金'],
+            debit_amount=0,
+            credit_amount=500,
+        ),
+    ])
+    db.commit()
+    assert _trial_balance(client, organization)['現金'] == (500, 0, 0, 500)
+
+    version = get_ledger_version(db, organization.id)
+    assert delete_versioned_rows(db, OpeningBalance, organization.id) == 2
+    db.commit()
+
+    assert get_ledger_version(db, organization.id) > version
+    assert _trial_balance(client, organization).get('現金', (0, 0, 0, 0)) == (0, 0, 0, 0)
+
+
+def test_stats_api(client, organization):
+    response = client.get('/accounting/api/report-cache/stats')
+
+    assert response.status_code == 200
+    assert {'entries', 'hits', 'misses', 'evictions', 'hit_rate', 'ledger_columns'} <= set(response.get_json())
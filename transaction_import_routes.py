@@ -7,6 +7,9 @@ from flask import request, render_template, redirect, url_for, flash, jsonify
 from werkzeug.utils import secure_filename
 import openpyxl
 from db import SessionLocal
+from import_format_utils import row_fingerprint
+from import_utils import IMPORT_CHUNK_SIZE
+from job_utils import enqueue_job, register_job_handler
 from models import ImportedTransaction, Account, AccountItem, JournalEntry, Organization
 
 def get_current_organization():
@@ -35,6 +38,205 @@ def transaction_import_page():
     finally:
         db.close()
 
+def _normalize_transaction_date(value):
+    """取引日を YYYY-MM-DD 形式に変換（変換できない場合は None）"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    value = str(value).strip()
+    for date_format in ('%Y-%m-%d', '%Y/%m/%d'):
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def _count_lines(file_obj):
+    """ファイルの行数を数える（ブロック単位で読み、ファイル全体はメモリに読み込まない）"""
+    count = 0
+    for block in iter(lambda: file_obj.read(1024 * 1024), b''):
+        count += block.count(b'\n')
+    file_obj.seek(0)
+    return count
+
+
+def _iter_transaction_rows(file_ext, file_obj):
+    """
+    ファイルから (取引日, 摘要, 入金金額, 出金金額) を順に生成
+
+    Args:
+        file_obj: バイナリモードのファイルオブジェクト（シーク可能なもの）
+
+    Returns:
+        (行のイテラブル, 全行数)
+    """
+    if file_ext == 'csv':
+        # CSVファイルを1行ずつ読み込み（ヘッダー行を除いた行数を進捗の全行数とする）
+        total_rows = max(_count_lines(file_obj) - 1, 0)
+
+        def generate():
+            stream = io.TextIOWrapper(file_obj, encoding='utf-8-sig', newline='')
+            try:
+                for row in csv.DictReader(stream):
+                    transaction_date = (row.get('取引日') or '').strip()
+                    if not transaction_date:
+                        yield None
+                        continue
+                    income_str = (row.get('入金金額') or '0').strip().replace(',', '')
+                    expense_str = (row.get('出金金額') or '0').strip().replace(',', '')
+                    yield (
+                        transaction_date,
+                        (row.get('摘要') or '').strip(),
+                        int(income_str) if income_str else 0,
+                        int(expense_str) if expense_str else 0,
+                    )
+            finally:
+                # 呼び出し元のファイルオブジェクトは閉じない
+                stream.detach()
+        return generate(), total_rows
+
+    if file_ext in ['xlsx', 'xls']:
+        # Excelファイルを読み取り専用モードで開く（シートを先頭から順に読む）
+        workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+        sheet = workbook.active
+        # 読み取り専用モードではシートの範囲情報がない場合がある
+        total_rows = max((sheet.max_row or 0) - 1, 0)
+
+        def generate():
+            try:
+                rows = sheet.iter_rows(values_only=True)
+                # ヘッダー行を取得（1行目）
+                headers = list(next(rows, ()))
+                # データ行を処理（2行目以降）
+                for row in rows:
+                    row_dict = dict(zip(headers, row))
+                    transaction_date = row_dict.get('取引日', '')
+                    if not transaction_date:
+                        yield None
+                        continue
+                    yield (
+                        transaction_date,
+                        str(row_dict.get('摘要', '')).strip(),
+                        int(row_dict.get('入金金額', 0) or 0),
+                        int(row_dict.get('出金金額', 0) or 0),
+                    )
+            finally:
+                workbook.close()
+        return generate(), total_rows
+
+    raise ValueError('CSVまたはExcelファイルを選択してください')
+
+
+def import_transaction_file(db, organization_id, account_name, file_ext, content, progress_callback=None):
+    """
+    取引明細ファイルを読み込んで ImportedTransaction に登録（コミットは呼び出し元で行う）
+
+    IMPORT_CHUNK_SIZE 件ごとにフラッシュして登録済みのオブジェクトをセッションから外す
+    （大きなファイルでも使用メモリが件数に比例して増えない）
+
+    登録済みの明細と同じ行（同じ口座・取引日・金額・摘要）はスキップする。
+    重複判定はフィンガープリントでチャンクごとに1回だけ検索する。
+    同じファイル内の同じ内容の行（同じ日に同じ金額の振込が2回など）は
+    何回目に出てきたかをフィンガープリントに含めるため、別の行として登録する
+
+    Args:
+        file_ext: 'csv' / 'xlsx' / 'xls'
+        content: ファイル内容（bytes またはバイナリモードのファイルオブジェクト）
+        progress_callback: 進捗通知用の関数（処理済み行数, 全行数）（任意）
+
+    Returns:
+        tuple: (登録した件数, 重複のためスキップした件数)
+    """
+    file_obj = io.BytesIO(content) if isinstance(content, bytes) else content
+    rows, total_rows = _iter_transaction_rows(file_ext, file_obj)
+    imported_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    imported_count = 0
+    duplicate_count = 0
+    # 同じ内容の行が出てきた回数（キーは occurrence=0 のフィンガープリント）
+    occurrences = {}
+    pending = []
+
+    def flush_pending():
+        nonlocal imported_count, duplicate_count
+        existing = {
+            fingerprint for (fingerprint,) in db.query(ImportedTransaction.fingerprint).filter(
+                ImportedTransaction.organization_id == organization_id,
+                ImportedTransaction.fingerprint.in_([t.fingerprint for t in pending]),
+            )
+        }
+        transactions = [t for t in pending if t.fingerprint not in existing]
+        db.add_all(transactions)
+        db.flush()
+        for transaction in transactions:
+            db.expunge(transaction)
+        imported_count += len(transactions)
+        duplicate_count += len(pending) - len(transactions)
+        pending.clear()
+
+    for index, row in enumerate(rows, start=1):
+        if progress_callback is not None and index % 100 == 0:
+            progress_callback(index, max(total_rows, index))
+        if row is None:
+            continue
+
+        transaction_date, description, income_amount, expense_amount = row
+        # 日付フォーマットの変換（YYYY-MM-DD形式に統一）
+        transaction_date = _normalize_transaction_date(transaction_date)
+        if transaction_date is None:
+            continue
+
+        amount = (income_amount or 0) - (expense_amount or 0)
+        base = row_fingerprint(organization_id, account_name, transaction_date, amount, description)
+        occurrence = occurrences.get(base, 0)
+        occurrences[base] = occurrence + 1
+
+        # ImportedTransactionを作成
+        pending.append(ImportedTransaction(
+            organization_id=organization_id,
+            account_name=account_name,
+            transaction_date=transaction_date,
+            description=description,
+            income_amount=income_amount,
+            expense_amount=expense_amount,
+            status=0,  # 未処理
+            fingerprint=row_fingerprint(
+                organization_id, account_name, transaction_date, amount, description, occurrence
+            ),
+            imported_at=imported_at
+        ))
+
+        if len(pending) >= IMPORT_CHUNK_SIZE:
+            flush_pending()
+
+    if pending:
+        flush_pending()
+    return imported_count, duplicate_count
+
+
+@register_job_handler('transaction_import')
+def run_transaction_import_job(context):
+    """取引明細インポートのバックグラウンドジョブ"""
+    db = SessionLocal()
+    input_file = context.open_input()
+    try:
+        imported_count, duplicate_count = import_transaction_file(
+            db,
+            context.organization_id,
+            context.params['account_name'],
+            context.params['file_ext'],
+            input_file,
+            progress_callback=lambda done, total: context.update_progress(done * 100 // max(total, 1)),
+        )
+        db.commit()
+        return {'imported_count': imported_count, 'duplicate_count': duplicate_count}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        input_file.close()
+        db.close()
+
+
 def transaction_import_upload():
     """取引明細のアップロード処理"""
     db = SessionLocal()
@@ -56,6 +258,9 @@ def transaction_import_upload():
         # ファイルの拡張子を確認
         filename = secure_filename(file.filename)
         file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if file_ext not in ['csv', 'xlsx', 'xls']:
+            flash('CSVまたはExcelファイルを選択してください', 'error')
+            return redirect(url_for('transaction_import'))
         
         # 現在の事業所を取得
         current_org = get_current_organization()
@@ -63,120 +268,33 @@ def transaction_import_upload():
             flash('事業所が見つかりません', 'error')
             return redirect(url_for('transaction_import'))
         
-        imported_count = 0
+        # アップロードされたファイルは全体をメモリに読み込まず、ストリームのまま渡す
+        # バックグラウンドで実行する場合はジョブを登録してステータス画面へ
+        if request.form.get('background') == '1':
+            job = enqueue_job(
+                db,
+                'transaction_import',
+                current_org.id,
+                params={'account_name': account.account_name, 'file_ext': file_ext},
+                input_file=file.stream,
+            )
+            return redirect(url_for('jobs.job_status', job_id=job.id))
         
-        # CSVファイルの処理
-        if file_ext == 'csv':
-            # CSVファイルを読み込み
-            stream = io.StringIO(file.stream.read().decode('utf-8-sig'), newline=None)
-            csv_reader = csv.DictReader(stream)
-            
-            for row in csv_reader:
-                # 取引日のパース
-                transaction_date = row.get('取引日', '').strip()
-                if not transaction_date:
-                    continue
-                
-                # 日付フォーマットの変換（YYYY-MM-DD形式に統一）
-                try:
-                    date_obj = datetime.strptime(transaction_date, '%Y-%m-%d')
-                    transaction_date = date_obj.strftime('%Y-%m-%d')
-                except:
-                    try:
-                        date_obj = datetime.strptime(transaction_date, '%Y/%m/%d')
-                        transaction_date = date_obj.strftime('%Y-%m-%d')
-                    except:
-                        continue
-                
-                # 摘要
-                description = row.get('摘要', '').strip()
-                
-                # 入金金額
-                income_str = row.get('入金金額', '0').strip().replace(',', '')
-                income_amount = int(income_str) if income_str and income_str != '' else 0
-                
-                # 出金金額
-                expense_str = row.get('出金金額', '0').strip().replace(',', '')
-                expense_amount = int(expense_str) if expense_str and expense_str != '' else 0
-                
-                # ImportedTransactionを作成
-                imported_transaction = ImportedTransaction(
-                    organization_id=current_org.id,
-                    account_name=account.account_name,
-                    transaction_date=transaction_date,
-                    description=description,
-                    income_amount=income_amount,
-                    expense_amount=expense_amount,
-                    status=0,  # 未処理
-                    imported_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-                db.add(imported_transaction)
-                imported_count += 1
-        
-        # Excelファイルの処理
-        elif file_ext in ['xlsx', 'xls']:
-            # Excelファイルを読み込み
-            workbook = openpyxl.load_workbook(file)
-            sheet = workbook.active
-            
-            # ヘッダー行を取得（1行目）
-            headers = [cell.value for cell in sheet[1]]
-            
-            # データ行を処理（2行目以降）
-            for row in sheet.iter_rows(min_row=2, values_only=True):
-                row_dict = dict(zip(headers, row))
-                
-                # 取引日のパース
-                transaction_date = row_dict.get('取引日', '')
-                if not transaction_date:
-                    continue
-                
-                # 日付型の場合はstrftimeで変換
-                if isinstance(transaction_date, datetime):
-                    transaction_date = transaction_date.strftime('%Y-%m-%d')
-                else:
-                    transaction_date = str(transaction_date).strip()
-                    try:
-                        date_obj = datetime.strptime(transaction_date, '%Y-%m-%d')
-                        transaction_date = date_obj.strftime('%Y-%m-%d')
-                    except:
-                        try:
-                            date_obj = datetime.strptime(transaction_date, '%Y/%m/%d')
-                            transaction_date = date_obj.strftime('%Y-%m-%d')
-                        except:
-                            continue
-                
-                # 摘要
-                description = str(row_dict.get('摘要', '')).strip()
-                
-                # 入金金額
-                income_amount = int(row_dict.get('入金金額', 0) or 0)
-                
-                # 出金金額
-                expense_amount = int(row_dict.get('出金金額', 0) or 0)
-                
-                # ImportedTransactionを作成
-                imported_transaction = ImportedTransaction(
-                    organization_id=current_org.id,
-                    account_name=account.account_name,
-                    transaction_date=transaction_date,
-                    description=description,
-                    income_amount=income_amount,
-                    expense_amount=expense_amount,
-                    status=0,  # 未処理
-                    imported_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-                db.add(imported_transaction)
-                imported_count += 1
-        
-        else:
-            flash('CSVまたはExcelファイルを選択してください', 'error')
-            return redirect(url_for('transaction_import'))
+        imported_count, duplicate_count = import_transaction_file(
+            db,
+            current_org.id,
+            account.account_name,
+            file_ext,
+            file.stream,
+        )
         
         # データベースにコミット
         db.commit()
         
-        flash(f'{imported_count}件の取引明細をインポートしました', 'success')
+        message = f'{imported_count}件の取引明細をインポートしました'
+        if duplicate_count:
+            message += f'（登録済みの{duplicate_count}件はスキップしました）'
+        flash(message, 'success')
         return redirect(url_for('imported_transactions_list'))
     
     except Exception as e:
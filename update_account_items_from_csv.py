@@ -8,6 +8,7 @@ import os
 from datetime import datetime
 from db import SessionLocal
 from models import AccountItem, Organization
+from report_cache import delete_versioned_rows
 
 def update_account_items_from_csv(csv_file_path, organization_id=1):
     """
@@ -22,9 +23,7 @@ def update_account_items_from_csv(csv_file_path, organization_id=1):
     try:
         # 既存の勘定科目を削除（organization_idに紐づくもの）
         print(f"既存の勘定科目（organization_id={organization_id}）を削除中...")
-        deleted_count = db.query(AccountItem).filter(
-            AccountItem.organization_id == organization_id
-        ).delete()
+        deleted_count = delete_versioned_rows(db, AccountItem, organization_id)
         print(f"削除した勘定科目数: {deleted_count}")
         
         # CSVファイルを読み込み
@@ -8,6 +8,10 @@ import os
 from datetime import datetime
 import json
 from import_utils import ImportProcessor
+from balance_utils import ensure_monthly_balances
+from ledger_line_utils import ensure_ledger_lines
+from search_utils import ensure_search_index
+from cash_book_balance_utils import ensure_cash_book_balances
 from functools import wraps
 import csv
 import io
@@ -116,6 +120,62 @@ def initialize_default_tax_categories():
 # 起動時に税区分初期データを作成
 initialize_default_tax_categories()
 
+def initialize_monthly_balances():
+    """起動時に勘定科目別月次集計を初期化（未作成の場合のみ仕訳帳から作成）"""
+    db = SessionLocal()
+    try:
+        ensure_monthly_balances(db)
+    except Exception as e:
+        db.rollback()
+        print(f'月次集計初期化エラー: {str(e)}')
+    finally:
+        db.close()
+
+# 起動時に月次集計を初期化
+initialize_monthly_balances()
+
+def initialize_ledger_lines():
+    """起動時に仕訳明細を初期化（未作成の場合のみ仕訳帳から作成）"""
+    db = SessionLocal()
+    try:
+        ensure_ledger_lines(db)
+    except Exception as e:
+        db.rollback()
+        print(f'仕訳明細初期化エラー: {str(e)}')
+    finally:
+        db.close()
+
+# 起動時に仕訳明細を初期化
+initialize_ledger_lines()
+
+def initialize_search_index():
+    """起動時に全文検索インデックスを初期化（未作成の場合のみ元データから作成）"""
+    db = SessionLocal()
+    try:
+        ensure_search_index(db)
+    except Exception as e:
+        db.rollback()
+        print(f'全文検索インデックス初期化エラー: {str(e)}')
+    finally:
+        db.close()
+
+# 起動時に全文検索インデックスを初期化
+initialize_search_index()
+
+def initialize_cash_book_balances():
+    """起動時に出納帳の残高を初期化（未作成の場合のみ出納帳から作成）"""
+    db = SessionLocal()
+    try:
+        ensure_cash_book_balances(db)
+    except Exception as e:
+        db.rollback()
+        print(f'出納帳残高初期化エラー: {str(e)}')
+    finally:
+        db.close()
+
+# 起動時に出納帳の残高を初期化
+initialize_cash_book_balances()
+
 # ========== Blueprintの登録 ==========
 # 会計システムのBlueprints
 from blueprints.home import bp as home_bp
@@ -135,6 +195,9 @@ from blueprints.organizations import bp as organizations_bp
 from blueprints.reports import bp as reports_bp
 from blueprints.import_data import bp as import_data_bp
 from blueprints.templates import bp as templates_bp
+from blueprints.jobs import bp as jobs_bp
+from blueprints.search import bp as search_bp
+from job_utils import JOB_WORKERS_IN_WEB, start_job_workers
 
 # ログインシステムのBlueprints
 try:
@@ -171,6 +234,15 @@ app.register_blueprint(organizations_bp, url_prefix='/accounting')
 app.register_blueprint(reports_bp, url_prefix='/accounting')
 app.register_blueprint(import_data_bp, url_prefix='/accounting')
 app.register_blueprint(templates_bp, url_prefix='/accounting')
+app.register_blueprint(jobs_bp, url_prefix='/accounting')
+app.register_blueprint(search_bp, url_prefix='/accounting')
+
+# バックグラウンドジョブは通常ワーカープロセス（job_worker.py）で実行する
+# JOB_WORKERS_IN_WEB=1 の場合だけWebプロセスでもワーカースレッドを起動する
+if JOB_WORKERS_IN_WEB:
+    start_job_workers()
 
 if __name__ == '__main__':
+    # 開発用サーバーではワーカープロセスなしでジョブを実行する
+    start_job_workers()
     app.run(debug=True)